@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Compares the old ad-hoc tensor (de)serialization of the gRPC peer handle with nidum.networking.grpc.tensor_codec.
+Peak traced allocations are reported as multiples of the tensor size, roughly the number of payload copies.
+
+  python extra/bench_tensor_codec.py --shape 1,128,4096 --iterations 50
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+
+from nidum.networking.grpc import node_service_pb2
+from nidum.networking.grpc.tensor_codec import tensor_from_proto, tensor_to_proto
+
+
+def legacy_round_trip(tensor: np.ndarray) -> np.ndarray:
+  proto = node_service_pb2.Tensor(tensor_data=np.array(tensor).tobytes(), shape=tensor.shape, dtype=str(tensor.dtype))
+  wire = node_service_pb2.Tensor.FromString(proto.SerializeToString())
+  if not wire.tensor_data or not wire.shape or not wire.dtype:
+    return None
+  return np.frombuffer(wire.tensor_data, dtype=np.dtype(wire.dtype)).reshape(wire.shape)
+
+
+def codec_round_trip(tensor: np.ndarray) -> np.ndarray:
+  proto, _ = tensor_to_proto(tensor)
+  wire = node_service_pb2.Tensor.FromString(proto.SerializeToString())
+  return tensor_from_proto(wire)
+
+
+def measure(fn, tensor: np.ndarray, iterations: int):
+  fn(tensor)
+  start = time.perf_counter()
+  for _ in range(iterations):
+    fn(tensor)
+  elapsed = (time.perf_counter() - start)/iterations
+  tracemalloc.start()
+  fn(tensor)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return elapsed, peak/tensor.nbytes
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark gRPC tensor serialization")
+  parser.add_argument("--shape", type=str, default="1,128,4096", help="Comma separated tensor shape")
+  parser.add_argument("--dtype", type=str, default="float32")
+  parser.add_argument("--iterations", type=int, default=50)
+  args = parser.parse_args()
+  shape = tuple(int(dim) for dim in args.shape.split(","))
+  tensor = np.random.default_rng(0).standard_normal(shape).astype(args.dtype)
+  print(f"tensor {shape} {tensor.dtype} ({tensor.nbytes/1024/1024:.1f} MiB)")
+  for name, fn in (("legacy", legacy_round_trip), ("tensor_codec", codec_round_trip)):
+    elapsed, copies = measure(fn, tensor, args.iterations)
+    print(f"{name:>12}: {elapsed*1000:8.3f} ms/round trip, peak allocations {copies:.2f}x tensor size")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Loopback benchmark of the NodeService RPCs a pipeline hop is made of. A GRPCServer around a Node
+with DummyInferenceEngine listens on localhost and a peer handle drives send_tensor, send_result and
+send_opaque_status against it. The receiving node skips inference, so the numbers are the cost of
+the transport alone: p50/p99 latency, throughput and CPU time per message (client and server share
+this process, CPU time covers both sides).
+
+  python extra/bench_transport.py --shapes "1,1;1,128,4096" --dtypes float32,float16 --iterations 200
+  python extra/bench_transport.py --transport shm --baseline bench-transport-1700000000.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+
+from nidum.helpers import find_available_port
+from nidum.inference.dummy_inference_engine import DummyInferenceEngine
+from nidum.inference.shard import Shard
+from nidum.networking.discovery import Discovery
+from nidum.networking.grpc.channels import DEFAULT_MAX_MESSAGE_BYTES
+from nidum.networking.grpc.grpc_peer_handle import GRPCPeerHandle
+from nidum.networking.grpc.grpc_server import GRPCServer
+from nidum.networking.grpc.tensor_chunks import DEFAULT_CHUNK_BYTES
+from nidum.networking.shm.shm_peer_handle import ShmPeerHandle
+from nidum.orchestration.node import Node
+from nidum.topology.device_capabilities import UNKNOWN_DEVICE_CAPABILITIES
+
+TRANSPORTS = ("stream", "unary", "shm")
+SHARD = Shard(model_id="dummy", start_layer=0, end_layer=0, n_layers=8)
+
+
+class NoDiscovery(Discovery):
+  async def start(self) -> None:
+    pass
+
+  async def stop(self) -> None:
+    pass
+
+  async def discover_peers(self, wait_for_peers: int = 0) -> List:
+    return []
+
+
+class SinkNode(Node):
+  """Node that accepts tensors without running them, so the benchmark measures only the hop."""
+  tensors_received = 0
+
+  async def process_tensor(self, base_shard, tensor, request_id=None, inference_state=None, request_metadata=None) -> Optional[np.ndarray]:
+    self.tensors_received += 1
+    return None
+
+
+def parse_shapes(value: str) -> List[tuple]:
+  return [tuple(int(dim) for dim in shape.split(",")) for shape in value.split(";") if shape]
+
+
+def summarize(latencies: List[float], wall: float, cpu: float, payload_bytes: int) -> Dict:
+  latencies_ms = np.array(latencies)*1000
+  count = len(latencies)
+  return {
+    "count": count,
+    "payload_bytes": payload_bytes,
+    "p50_ms": float(np.percentile(latencies_ms, 50)),
+    "p99_ms": float(np.percentile(latencies_ms, 99)),
+    "mean_ms": float(latencies_ms.mean()),
+    "messages_per_s": count/wall,
+    "mb_per_s": payload_bytes*count/wall/1024/1024,
+    "cpu_ms_per_message": cpu*1000/count,
+  }
+
+
+async def measure(send: Callable[[int], Awaitable], iterations: int, warmup: int, payload_bytes: int) -> Dict:
+  for i in range(warmup):
+    await send(i)
+  latencies = []
+  wall_start, cpu_start = time.perf_counter(), time.process_time()
+  for i in range(iterations):
+    start = time.perf_counter()
+    await send(i)
+    latencies.append(time.perf_counter() - start)
+  return summarize(latencies, time.perf_counter() - wall_start, time.process_time() - cpu_start, payload_bytes)
+
+
+def create_peer_handle(transport: str, address: str, args) -> GRPCPeerHandle:
+  kwargs = dict(wire_codec=args.wire_codec, max_message_bytes=args.max_message_mb*1024*1024, chunk_bytes=args.tensor_chunk_mb*1024*1024)
+  if transport == "shm":
+    return ShmPeerHandle("bench-receiver", address, "loopback", UNKNOWN_DEVICE_CAPABILITIES, ring_bytes=args.shm_ring_mb*1024*1024, **kwargs)
+  peer = GRPCPeerHandle("bench-receiver", address, "loopback", UNKNOWN_DEVICE_CAPABILITIES, **kwargs)
+  peer.use_tensor_stream = transport == "stream"
+  return peer
+
+
+async def run(args) -> Dict:
+  port = find_available_port("127.0.0.1")
+  node = SinkNode("bench-receiver", None, DummyInferenceEngine(), NoDiscovery())
+  shm_socket = os.path.join(tempfile.gettempdir(), f"nidum-bench-{port}.sock") if args.transport == "shm" else None
+  server = GRPCServer(node, "127.0.0.1", port, shm_socket=shm_socket, max_message_bytes=args.max_message_mb*1024*1024)
+  node.server = server
+  await server.start()
+  peer = create_peer_handle(args.transport, f"127.0.0.1:{port}", args)
+  await peer.connect()
+  results = []
+  try:
+    rng = np.random.default_rng(0)
+    for dtype in args.dtypes.split(","):
+      for shape in parse_shapes(args.shapes):
+        tensor = rng.standard_normal(shape).astype(dtype)
+        request_id = str(uuid.uuid4())
+        stats = await measure(lambda _: peer.send_tensor(SHARD, tensor, request_id=request_id), args.iterations, args.warmup, tensor.nbytes)
+        results.append({"rpc": "send_tensor", "shape": list(shape), "dtype": dtype, **stats})
+    for tokens in (1, 16):
+      request_id = str(uuid.uuid4())
+      stats = await measure(lambda i: peer.send_result(request_id, list(range(tokens)), False, start_index=i*tokens), args.iterations, args.warmup, tokens*8)
+      results.append({"rpc": "send_result", "tokens": tokens, **stats})
+    status = json.dumps({"type": "node_status", "node_id": "bench-sender", "status": "bench"})
+    stats = await measure(lambda _: peer.send_opaque_status("", status), args.iterations, args.warmup, len(status))
+    results.append({"rpc": "send_opaque_status", **stats})
+  finally:
+    await peer.disconnect()
+    await server.stop()
+  return {
+    "timestamp": time.time(),
+    "host": platform.node(),
+    "platform": platform.platform(),
+    "python": sys.version.split()[0],
+    "args": vars(args),
+    "results": results,
+  }
+
+
+def scenario(result: Dict) -> str:
+  if result["rpc"] == "send_tensor":
+    return f"send_tensor {'x'.join(map(str, result['shape']))} {result['dtype']}"
+  if result["rpc"] == "send_result":
+    return f"send_result {result['tokens']} tokens"
+  return result["rpc"]
+
+
+def report(current: Dict, baseline: Optional[Dict] = None) -> None:
+  before = {scenario(result): result for result in (baseline or {}).get("results", [])}
+  args = current["args"]
+  print(f"transport={args['transport']} wire_codec={args['wire_codec']} iterations={args['iterations']}")
+  print(f"{'scenario':<36} {'p50 ms':>9} {'p99 ms':>9} {'msg/s':>9} {'MB/s':>9} {'cpu ms':>8}")
+  for result in current["results"]:
+    name = scenario(result)
+    line = f"{name:<36} {result['p50_ms']:9.3f} {result['p99_ms']:9.3f} {result['messages_per_s']:9.0f} {result['mb_per_s']:9.1f} {result['cpu_ms_per_message']:8.3f}"
+    if name in before:
+      line += f"  p50 {result['p50_ms']/before[name]['p50_ms']:.2f}x baseline"
+    print(line)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark NodeService RPCs over loopback")
+  parser.add_argument("--transport", choices=TRANSPORTS, default="stream", help="stream: TensorStream, unary: SendTensor per tensor, shm: shared memory ring")
+  parser.add_argument("--shapes", type=str, default="1,1;1,1,4096;1,128,4096;1,1024,4096", help="Semicolon separated tensor shapes, dims separated by commas")
+  parser.add_argument("--dtypes", type=str, default="float32,float16")
+  parser.add_argument("--iterations", type=int, default=200)
+  parser.add_argument("--warmup", type=int, default=10)
+  parser.add_argument("--wire-codec", type=str, default="raw")
+  parser.add_argument("--max-message-mb", type=int, default=DEFAULT_MAX_MESSAGE_BYTES//1024//1024)
+  parser.add_argument("--tensor-chunk-mb", type=int, default=DEFAULT_CHUNK_BYTES//1024//1024)
+  parser.add_argument("--shm-ring-mb", type=int, default=64)
+  parser.add_argument("--output", type=str, default=None, help="Where to save the JSON results, bench-transport-<timestamp>.json by default")
+  parser.add_argument("--baseline", type=str, default=None, help="JSON results of an earlier run to compare against")
+  args = parser.parse_args()
+  results = asyncio.run(run(args))
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+  report(results, baseline)
+  output = args.output or f"bench-transport-{int(results['timestamp'])}.json"
+  with open(output, "w") as f:
+    json.dump(results, f, indent=2)
+  print(f"saved {output}")
+
+
+if __name__ == "__main__":
+  main()
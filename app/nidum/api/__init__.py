@@ -1 +1,2 @@
 from nidum.api.chatgpt_api import ChatGPTAPI as ChatGPTAPI
+from nidum.api.admission import AdmissionController as AdmissionController
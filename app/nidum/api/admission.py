@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
+from nidum import DEBUG
+
+PRIORITIES = ("high", "normal", "low")
+
+
+class AdmissionRejected(Exception):
+  def __init__(self, reason: str, retry_after: float):
+    super().__init__(f"Request rejected: {reason}")
+    self.reason = reason
+    self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+  request_id: str
+  priority: str
+  tokens: int
+  enqueued_at: float
+  admitted_at: Optional[float] = None
+  future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class AdmissionController:
+  """
+  Bounded admission in front of Node.process_prompt.
+
+  At most max_concurrent requests (and max_tokens_in_flight prompt + generation tokens) run at
+  once; the rest wait in a priority queue, FIFO within a priority class. Requests are rejected
+  when the queue is full or when they waited longer than max_queue_time, with a Retry-After
+  estimate derived from recent service times.
+  """
+  def __init__(
+    self,
+    max_concurrent: int = 2,
+    max_queue: int = 32,
+    max_tokens_in_flight: Optional[int] = None,
+    max_queue_time: float = 30.0,
+  ):
+    self.max_concurrent = max(1, max_concurrent)
+    self.max_queue = max_queue
+    self.max_tokens_in_flight = max_tokens_in_flight
+    self.max_queue_time = max_queue_time
+    self.queue: List[Tuple[int, int, Ticket]] = []
+    self.active: Dict[str, Ticket] = {}
+    # fallback releases of tickets whose requests outlived their HTTP response
+    self.held: Dict[str, asyncio.TimerHandle] = {}
+    self.tokens_in_flight = 0
+    self._seq = itertools.count()
+    self.admitted = 0
+    self.rejected = 0
+    self.timed_out = 0
+    self.wait_times: Deque[float] = deque(maxlen=256)
+    self.service_times: Deque[float] = deque(maxlen=64)
+
+  @property
+  def queue_depth(self) -> int:
+    return len(self.queue)
+
+  def _fits(self, ticket: Ticket) -> bool:
+    if len(self.active) >= self.max_concurrent:
+      return False
+    if self.max_tokens_in_flight is None or not self.active:
+      # an oversized request still runs on its own instead of waiting forever
+      return True
+    return self.tokens_in_flight + ticket.tokens <= self.max_tokens_in_flight
+
+  def _admit(self, ticket: Ticket) -> None:
+    ticket.admitted_at = time.perf_counter()
+    self.active[ticket.request_id] = ticket
+    self.tokens_in_flight += ticket.tokens
+    self.admitted += 1
+    self.wait_times.append(ticket.admitted_at - ticket.enqueued_at)
+
+  def _drain(self) -> None:
+    # strict head-of-line order keeps latency predictable; a big request is not overtaken forever
+    while self.queue and self._fits(self.queue[0][2]):
+      _, _, ticket = heapq.heappop(self.queue)
+      if ticket.future.done():
+        continue
+      self._admit(ticket)
+      ticket.future.set_result(None)
+
+  def retry_after(self) -> float:
+    service_time = sum(self.service_times)/len(self.service_times) if self.service_times else 1.0
+    return max(1.0, math.ceil(service_time*(self.queue_depth + 1)/self.max_concurrent))
+
+  def _reject(self, reason: str) -> AdmissionRejected:
+    self.rejected += 1
+    if DEBUG >= 2: print(f"Admission rejected: {reason} active={len(self.active)} queued={self.queue_depth}")
+    return AdmissionRejected(reason, self.retry_after())
+
+  async def acquire(self, request_id: str, priority: str = "normal", tokens: int = 0) -> Ticket:
+    if priority not in PRIORITIES:
+      priority = "normal"
+    ticket = Ticket(request_id, priority, tokens, time.perf_counter())
+    if not self.queue and self._fits(ticket):
+      self._admit(ticket)
+      return ticket
+    if self.queue_depth >= self.max_queue:
+      raise self._reject("queue_full")
+
+    ticket.future = asyncio.get_running_loop().create_future()
+    heapq.heappush(self.queue, (PRIORITIES.index(priority), next(self._seq), ticket))
+    try:
+      await asyncio.wait_for(asyncio.shield(ticket.future), timeout=self.max_queue_time)
+    except asyncio.TimeoutError:
+      self._remove(ticket)
+      if ticket.future.done() and request_id in self.active:
+        return ticket
+      self.timed_out += 1
+      raise self._reject("queue_timeout")
+    except asyncio.CancelledError:
+      self._remove(ticket)
+      if request_id in self.active: self.release(ticket)
+      raise
+    return ticket
+
+  def _remove(self, ticket: Ticket) -> None:
+    if not ticket.future.done():
+      ticket.future.cancel()
+    self.queue = [entry for entry in self.queue if entry[2] is not ticket]
+    heapq.heapify(self.queue)
+
+  def release(self, ticket: Ticket) -> None:
+    held = self.held.pop(ticket.request_id, None)
+    if held is not None:
+      held.cancel()
+    if self.active.pop(ticket.request_id, None) is None:
+      return
+    self.tokens_in_flight -= ticket.tokens
+    self.service_times.append(time.perf_counter() - ticket.admitted_at)
+    self._drain()
+
+  def hold(self, ticket: Ticket, timeout: float) -> None:
+    """
+    Keeps the ticket of a request that still runs after its caller gave up, until finish is called for
+    it or timeout seconds passed, so abandoned requests keep counting against max_concurrent.
+    """
+    if ticket.request_id in self.active and ticket.request_id not in self.held:
+      self.held[ticket.request_id] = asyncio.get_running_loop().call_later(timeout, self.release, ticket)
+
+  def finish(self, request_id: str) -> None:
+    ticket = self.active.get(request_id)
+    if ticket is not None:
+      self.release(ticket)
+
+  @asynccontextmanager
+  async def admit(self, request_id: str, priority: str = "normal", tokens: int = 0):
+    ticket = await self.acquire(request_id, priority, tokens)
+    try:
+      yield ticket
+    finally:
+      self.release(ticket)
+
+  def stats(self) -> Dict:
+    waits = sorted(self.wait_times)
+    queued = {priority: 0 for priority in PRIORITIES}
+    for _, _, ticket in self.queue:
+      queued[ticket.priority] += 1
+    return {
+      "active": len(self.active),
+      "held": len(self.held),
+      "max_concurrent": self.max_concurrent,
+      "queue_depth": self.queue_depth,
+      "queue_depth_by_priority": queued,
+      "max_queue": self.max_queue,
+      "tokens_in_flight": self.tokens_in_flight,
+      "max_tokens_in_flight": self.max_tokens_in_flight,
+      "admitted": self.admitted,
+      "rejected": self.rejected,
+      "timed_out": self.timed_out,
+      "wait_time_mean": sum(waits)/len(waits) if waits else 0.0,
+      "wait_time_p50": waits[len(waits)//2] if waits else 0.0,
+      "wait_time_p99": waits[min(len(waits) - 1, int(len(waits)*0.99))] if waits else 0.0,
+    }
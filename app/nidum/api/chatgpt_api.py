@@ -4,7 +4,6 @@ import asyncio
 import json
 import os
 from pathlib import Path
-from transformers import AutoTokenizer
 from typing import List, Literal, Union, Dict, Optional
 from aiohttp import web
 import aiohttp_cors
@@ -14,19 +13,20 @@ from nidum import DEBUG, VERSION
 from nidum.download.download_progress import RepoProgressEvent
 from nidum.helpers import PrefixDict, shutdown, get_exo_images_dir
 from nidum.inference.tokenizers import resolve_tokenizer
+from nidum.inference.tensor_adapters import adapter_for_engine, to_engine
 from nidum.orchestration import Node
 from nidum.models import build_base_shard, model_cards, get_repo, pretty_name
 from typing import Callable, Optional
-from PIL import Image
 import numpy as np
 import base64
 from io import BytesIO
-import mlx.core as mx
 import tempfile
 from nidum.download.hf.hf_shard_download import HFShardDownloader
 import shutil
 from nidum.download.hf.hf_helpers import get_hf_home, get_repo_root
-from nidum.apputil import create_animation_mp4
+from nidum.api.admission import AdmissionController, AdmissionRejected
+from nidum.networking.activation_codec import wire_stats
+from nidum.networking.rpc_stats import rpc_latency
 
 class Message:
   def __init__(self, role: str, content: Union[str, List[Dict[str, Union[str, Dict[str, str]]]]], tools: Optional[List[Dict]] = None):
@@ -159,6 +159,12 @@ def parse_chat_request(data: dict, default_model: str):
   )
 
 
+def auto_tokenizer():
+  # transformers takes seconds to import, only pay for it once a request needs a tokenizer
+  from transformers import AutoTokenizer
+  return AutoTokenizer
+
+
 class PromptSession:
   def __init__(self, request_id: str, timestamp: int, prompt: str):
     self.request_id = request_id
@@ -166,8 +172,11 @@ class PromptSession:
     self.prompt = prompt
 
 class ChatGPTAPI:
-  def __init__(self, node: Node, inference_engine_classname: str, response_timeout: int = 90, on_chat_completion_request: Callable[[str, ChatCompletionRequest, str], None] = None, default_model: Optional[str] = None, system_prompt: Optional[str] = None):
+  def __init__(self, node: Node, inference_engine_classname: str, response_timeout: int = 90, on_chat_completion_request: Callable[[str, ChatCompletionRequest, str], None] = None, default_model: Optional[str] = None, system_prompt: Optional[str] = None, admission: Optional[AdmissionController] = None):
     self.node = node
+    self.admission = admission or AdmissionController()
+    # a ticket is only released once the ring finished its request, not when the HTTP response ends
+    self.node.on_token.register("chatgpt-api-admission").on_next(lambda request_id, tokens, is_finished: self.admission.finish(request_id) if is_finished else None)
     self.inference_engine_classname = inference_engine_classname
     self.response_timeout = response_timeout
     self.on_chat_completion_request = on_chat_completion_request
@@ -201,6 +210,8 @@ class ChatGPTAPI:
     cors.add(self.app.router.add_post("/create_animation", self.handle_create_animation), {"*": cors_options})
     cors.add(self.app.router.add_post("/download", self.handle_post_download), {"*": cors_options})
     cors.add(self.app.router.add_get("/topology", self.handle_get_topology), {"*": cors_options})
+    cors.add(self.app.router.add_get("/v1/pipeline/stats", self.handle_get_pipeline_stats), {"*": cors_options})
+    cors.add(self.app.router.add_get("/v1/admission/stats", self.handle_get_admission_stats), {"*": cors_options})
 
       
     if "__compiled__" not in globals():
@@ -360,6 +371,16 @@ class ChatGPTAPI:
 
     prompt = build_prompt(tokenizer, chat_request.messages, chat_request.tools)
     request_id = str(uuid.uuid4())
+    priority = request.headers.get("X-Priority", data.get("priority", "normal"))
+    token_cost = len(tokenizer.encode(prompt)) + min(data.get("max_tokens") or self.node.max_generate_tokens, self.node.max_generate_tokens)
+    try:
+      ticket = await self.admission.acquire(request_id, priority, token_cost)
+    except AdmissionRejected as e:
+      return web.json_response(
+        {"detail": f"Server is busy ({e.reason}), retry later"},
+        status=429,
+        headers={"Retry-After": str(int(e.retry_after))},
+      )
     if self.on_chat_completion_request:
       try:
         self.on_chat_completion_request(request_id, chat_request, prompt)
@@ -383,8 +404,10 @@ class ChatGPTAPI:
 
     if DEBUG >= 2: print(f"Sending prompt from ChatGPT api {request_id=} {shard=} {prompt=}")
 
+    prompt_task = None
     try:
-      await asyncio.wait_for(asyncio.shield(asyncio.create_task(self.node.process_prompt(shard, prompt, request_id=request_id))), timeout=self.response_timeout)
+      prompt_task = asyncio.create_task(self.node.process_prompt(shard, prompt, request_id=request_id))
+      await asyncio.wait_for(asyncio.shield(prompt_task), timeout=self.response_timeout)
 
       if DEBUG >= 2: print(f"Waiting for response to finish. timeout={self.response_timeout}s")
 
@@ -400,12 +423,14 @@ class ChatGPTAPI:
         await response.prepare(request)
 
         async def stream_result(_request_id: str, tokens: List[int], is_finished: bool):
+          if _request_id not in self.stream_tasks:
+            return  # the response already finished, do not recreate its state
           prev_last_tokens_len = self.prev_token_lens.get(_request_id, 0)
           self.prev_token_lens[_request_id] = max(prev_last_tokens_len, len(tokens))
           new_tokens = tokens[prev_last_tokens_len:]
           finish_reason = None
           eos_token_id = tokenizer.special_tokens_map.get("eos_token_id") if hasattr(tokenizer, "_tokenizer") and isinstance(tokenizer._tokenizer,
-                                                                                                                             AutoTokenizer) else getattr(tokenizer, "eos_token_id", None)
+                                                                                                                             auto_tokenizer()) else getattr(tokenizer, "eos_token_id", None)
           if len(new_tokens) > 0 and new_tokens[-1] == eos_token_id:
             new_tokens = new_tokens[:-1]
             if is_finished:
@@ -451,7 +476,7 @@ class ChatGPTAPI:
         )
 
         finish_reason = "length"
-        eos_token_id = tokenizer.special_tokens_map.get("eos_token_id") if isinstance(getattr(tokenizer, "_tokenizer", None), AutoTokenizer) else tokenizer.eos_token_id
+        eos_token_id = tokenizer.special_tokens_map.get("eos_token_id") if isinstance(getattr(tokenizer, "_tokenizer", None), auto_tokenizer()) else tokenizer.eos_token_id
         if DEBUG >= 2: print(f"Checking if end of tokens result {tokens[-1]=} is {eos_token_id=}")
         if tokens[-1] == eos_token_id:
           tokens = tokens[:-1]
@@ -464,6 +489,14 @@ class ChatGPTAPI:
       if DEBUG >= 2: traceback.print_exc()
       return web.json_response({"detail": f"Error processing prompt (see logs with DEBUG>=2): {str(e)}"}, status=500)
     finally:
+      failed = prompt_task is None or (prompt_task.done() and (prompt_task.cancelled() or prompt_task.exception() is not None))
+      if failed or self.node.request_state.is_closed(request_id):
+        self.admission.release(ticket)
+      else:
+        # timed out or disconnected, the ring keeps generating and still holds a KV cache for it
+        self.admission.hold(ticket, self.node.request_state.ttl)
+      self.prev_token_lens.pop(request_id, None)
+      self.stream_tasks.pop(request_id, None)
       deregistered_callback = self.node.on_token.deregister(callback_id)
       if DEBUG >= 2: print(f"Deregister {callback_id=} {deregistered_callback=}")
 
@@ -512,6 +545,7 @@ class ChatGPTAPI:
               await response.write(json.dumps({'progress': get_progress_bar((result[0]), (result[1]))}).encode('utf-8') + b'\n')
 
           elif isinstance(result, np.ndarray):
+            from PIL import Image
             im = Image.fromarray(np.array(result))
             images_folder = get_exo_images_dir()
             # Save the image to a file
@@ -634,6 +668,7 @@ class ChatGPTAPI:
       if DEBUG >= 2: print(f"Animation temp directory: {tmp_dir}, output file: {output_path}, directory exists: {tmp_dir.exists()}, directory permissions: {oct(tmp_dir.stat().st_mode)[-3:]}")
 
       # Create the animation
+      from nidum.apputil import create_animation_mp4
       create_animation_mp4(
         replacement_image_path,
         output_path,
@@ -682,6 +717,23 @@ class ChatGPTAPI:
         status=500
       )
 
+  async def handle_get_pipeline_stats(self, request):
+    stats = self.node.pipeline_stats.to_dict()
+    stats["node_id"] = self.node.id
+    stats["pipeline_stages"] = self.node.batch_scheduler.pipeline_stages
+    stats["mean_batch_size"] = self.node.batch_scheduler.mean_batch_size
+    stats["request_state"] = self.node.request_state.stats()
+    stats["status_broadcast"] = self.node.status_broadcaster.stats()
+    stats["peers"] = self.node.peers.to_dict()
+    stats["wire"] = wire_stats.to_dict()
+    stats["rpc_latency"] = rpc_latency.to_dict()
+    if self.node.speculative is not None:
+      stats["speculative"] = self.node.speculative.stats()
+    return web.json_response(stats)
+
+  async def handle_get_admission_stats(self, request):
+    return web.json_response(self.admission.stats())
+
   async def run(self, host: str = "0.0.0.0", port: int = 52415):
     runner = web.AppRunner(self.app)
     await runner.setup()
@@ -692,14 +744,15 @@ class ChatGPTAPI:
     #decode and reshape image
     if base64_string.startswith('data:image'):
         base64_string = base64_string.split(',')[1]
+    from PIL import Image
     image_data = base64.b64decode(base64_string)
     img = Image.open(BytesIO(image_data))
     W, H = (dim - dim % 64 for dim in (img.width, img.height))
     if W != img.width or H != img.height:
         if DEBUG >= 2: print(f"Warning: image shape is not divisible by 64, downsampling to {W}x{H}")
         img = img.resize((W, H), Image.NEAREST)  # use desired downsampling filter
-    img = mx.array(np.array(img))
-    img = (img[:, :, :3].astype(mx.float32) / 255) * 2 - 1
+    img = np.array(img)
+    img = (img[:, :, :3].astype(np.float32) / 255) * 2 - 1
     img = img[None]
-    return img
+    return to_engine(adapter_for_engine(self.node.inference_engine), img)
   
@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+
+from .admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController(unittest.IsolatedAsyncioTestCase):
+  async def test_concurrency_limit_and_priority_order(self):
+    admission = AdmissionController(max_concurrent=1, max_queue=4, max_queue_time=5.0)
+    first = await admission.acquire("first")
+    order = []
+
+    async def wait(request_id, priority):
+      ticket = await admission.acquire(request_id, priority)
+      order.append(request_id)
+      admission.release(ticket)
+
+    tasks = [asyncio.create_task(wait("low", "low")), asyncio.create_task(wait("normal", "normal")), asyncio.create_task(wait("high", "high"))]
+    await asyncio.sleep(0)
+    self.assertEqual(admission.stats()["queue_depth_by_priority"], {"high": 1, "normal": 1, "low": 1})
+    admission.release(first)
+    await asyncio.gather(*tasks)
+    self.assertEqual(order, ["high", "normal", "low"])
+    self.assertEqual(admission.stats()["active"], 0)
+    self.assertEqual(admission.admitted, 4)
+
+  async def test_full_queue_is_rejected_with_retry_after(self):
+    admission = AdmissionController(max_concurrent=1, max_queue=1)
+    await admission.acquire("running")
+    waiting = asyncio.create_task(admission.acquire("waiting"))
+    await asyncio.sleep(0)
+    with self.assertRaises(AdmissionRejected) as ctx:
+      await admission.acquire("rejected")
+    self.assertEqual(ctx.exception.reason, "queue_full")
+    self.assertGreaterEqual(ctx.exception.retry_after, 1.0)
+    waiting.cancel()
+
+  async def test_queue_time_limit(self):
+    admission = AdmissionController(max_concurrent=1, max_queue_time=0.01)
+    await admission.acquire("running")
+    with self.assertRaises(AdmissionRejected) as ctx:
+      await admission.acquire("late")
+    self.assertEqual(ctx.exception.reason, "queue_timeout")
+    self.assertEqual(admission.queue_depth, 0)
+    self.assertEqual(admission.timed_out, 1)
+
+  async def test_token_budget(self):
+    admission = AdmissionController(max_concurrent=4, max_tokens_in_flight=100, max_queue_time=0.01)
+    big = await admission.acquire("big", tokens=80)
+    with self.assertRaises(AdmissionRejected):
+      await admission.acquire("over_budget", tokens=30)
+    await admission.acquire("fits", tokens=20)
+    admission.release(big)
+    self.assertEqual(admission.tokens_in_flight, 20)
+    # an oversized request is still admitted when nothing else runs
+    admission.release(admission.active["fits"])
+    await admission.acquire("huge", tokens=1000)
+
+  async def test_held_ticket_counts_until_the_request_finishes(self):
+    admission = AdmissionController(max_concurrent=1, max_queue_time=0.01)
+    ticket = await admission.acquire("abandoned")
+    admission.hold(ticket, timeout=60)
+    with self.assertRaises(AdmissionRejected):
+      await admission.acquire("next")
+    admission.finish("abandoned")
+    self.assertEqual(admission.stats()["held"], 0)
+    await admission.acquire("next")
+
+  async def test_held_ticket_is_released_after_the_timeout(self):
+    admission = AdmissionController(max_concurrent=1)
+    admission.hold(await admission.acquire("lost"), timeout=0.01)
+    await asyncio.sleep(0.05)
+    self.assertEqual(admission.stats()["active"], 0)
+    self.assertEqual(admission.held, {})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -305,6 +305,18 @@ async def get_interface_priority_and_type(ifname: str) -> Tuple[int, str]:
   # Other physical interfaces
   return (2, "Other")
 
+async def wait_event(event: asyncio.Event, timeout: float) -> bool:
+  """
+  Waits for event at most timeout seconds. Unlike asyncio.wait_for on Python 3.11, a cancel that
+  arrives together with the event is never swallowed, so loops built on it stop promptly.
+  """
+  waiter = asyncio.ensure_future(event.wait())
+  try:
+    await asyncio.wait([waiter], timeout=timeout)
+  finally:
+    waiter.cancel()
+  return event.is_set()
+
 async def shutdown(signal, loop, server):
   """Gracefully shutdown the server and close the asyncio loop."""
   print(f"Received exit signal {signal.name}...")
@@ -5,6 +5,8 @@ from nidum.inference.shard import Shard
 from nidum.inference.tokenizers import DummyTokenizer
 
 class DummyInferenceEngine(InferenceEngine):
+  supports_rollback = True
+
   def __init__(self):
     self.shard = None
     self.vocab_size = 1000
@@ -29,6 +31,9 @@ class DummyInferenceEngine(InferenceEngine):
     await self.ensure_shard(shard)
     return input_data + 1 if self.shard.is_last_layer() else input_data, None
 
+  async def rollback(self, request_id: str, shard: Shard, num_tokens: int) -> bool:
+    return True
+
   async def ensure_shard(self, shard: Shard):
     if self.shard == shard: return
     self.shard = shard
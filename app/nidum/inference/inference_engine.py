@@ -2,13 +2,17 @@ import numpy as np
 import os
 from nidum.helpers import DEBUG  # Make sure to import DEBUG
 
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List
 from abc import ABC, abstractmethod
 from .shard import Shard
 
 
 class InferenceEngine(ABC):
   session = {}
+  # number of per-request KV caches an engine keeps before evicting the least recently used
+  max_cached_requests: int = 2
+  # whether rollback() actually drops cache positions, speculative decoding needs it on every node of the ring
+  supports_rollback: bool = False
 
   @abstractmethod
   async def encode(self, shard: Shard, prompt: str) -> np.ndarray:
@@ -26,6 +30,19 @@ class InferenceEngine(ABC):
   async def infer_tensor(self, request_id: str, shard: Shard, input_data: np.ndarray, inference_state: Optional[dict] = None) -> tuple[np.ndarray, Optional[dict]]:
     pass
 
+  async def infer_tensor_batch(self, request_ids: List[str], shard: Shard, input_datas: List[np.ndarray]) -> List[np.ndarray]:
+    # engines that can run several requests in one forward override this, the default runs them one by one
+    outputs = []
+    for request_id, input_data in zip(request_ids, input_datas):
+      output_data, _ = await self.infer_tensor(request_id, shard, input_data)
+      outputs.append(output_data)
+    return outputs
+
+  async def rollback(self, request_id: str, shard: Shard, num_tokens: int) -> bool:
+    # drops the last num_tokens positions of a request's KV cache, used to discard rejected speculative tokens.
+    # Returns whether the cache was rolled back, engines that can do it override this and set supports_rollback
+    return False
+
   @abstractmethod
   async def load_checkpoint(self, shard: Shard, path: str):
     pass
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import List
 
 import mlx.core as mx
 import mlx.nn as nn
@@ -7,6 +8,7 @@ from mlx_lm.models.base import create_attention_mask
 from mlx_lm.models.llama import TransformerBlock, ModelArgs
 
 from ...shard import Shard
+from ..slot_cache import BatchKVCache
 from .base import IdentityBlock
 
 
@@ -25,6 +27,23 @@ class ModelArgs(ModelArgs):
     self.shard = Shard(**self.shard)
 
 
+def decode_rows(layer: TransformerBlock, x: mx.array, offsets: List[int], mask: mx.array, cache: BatchKVCache) -> mx.array:
+  """TransformerBlock step for one token per cache row, row i at position offsets[i]."""
+  attn = layer.self_attn
+  B, L, _ = x.shape
+  y = layer.input_layernorm(x)
+  queries = attn.q_proj(y).reshape(B, L, attn.n_heads, -1).transpose(0, 2, 1, 3)
+  keys = attn.k_proj(y).reshape(B, L, attn.n_kv_heads, -1).transpose(0, 2, 1, 3)
+  values = attn.v_proj(y).reshape(B, L, attn.n_kv_heads, -1).transpose(0, 2, 1, 3)
+  # mx.fast.rope takes a single offset, rows at different positions are rotated one at a time
+  queries = mx.concatenate([attn.rope(queries[i:i + 1], offset=offset) for i, offset in enumerate(offsets)], axis=0)
+  keys = mx.concatenate([attn.rope(keys[i:i + 1], offset=offset) for i, offset in enumerate(offsets)], axis=0)
+  keys, values = cache.update_rows(offsets, keys, values)
+  out = mx.fast.scaled_dot_product_attention(queries, keys, values, scale=attn.scale, mask=mask)
+  h = x + attn.o_proj(out.transpose(0, 2, 1, 3).reshape(B, L, -1))
+  return h + layer.mlp(layer.post_attention_layernorm(h))
+
+
 class LlamaModel(nn.Module):
   def __init__(self, args: ModelArgs):
     super().__init__()
@@ -67,6 +86,25 @@ class LlamaModel(nn.Module):
       h = self.norm(h)
     return h
 
+  def decode_batch(self, inputs: mx.array, offsets: List[int], cache: List[BatchKVCache]):
+    if self.args.shard.is_first_layer():
+      h = self.embed_tokens(inputs)
+    else:
+      h = inputs
+
+    # row i sees its own cache up to and including offsets[i], stale entries of shorter rows are hidden
+    length = max(offsets) + 1
+    visible = mx.arange(length)[None] <= mx.array(offsets)[:, None]
+    mask = mx.where(visible, 0.0, float("-inf")).astype(h.dtype).reshape(len(offsets), 1, 1, length)
+
+    for layer, c in zip(self.layers, cache):
+      if not isinstance(layer, IdentityBlock):
+        h = decode_rows(layer, h, offsets, mask, c)
+
+    if self.args.shard.is_last_layer():
+      h = self.norm(h)
+    return h
+
 
 class Model(nn.Module):
   def __init__(self, args: ModelArgs):
@@ -83,7 +121,13 @@ class Model(nn.Module):
     inputs: mx.array,
     cache=None,
   ):
-    out = self.model(inputs, cache)
+    return self.logits(self.model(inputs, cache))
+
+  def decode_batch(self, inputs: mx.array, offsets: List[int], cache: List[BatchKVCache]):
+    """One token for every row of the batch cache (rows, 1), row i at position offsets[i]."""
+    return self.logits(self.model.decode_batch(inputs, offsets, cache))
+
+  def logits(self, out: mx.array):
     if self.args.shard.is_last_layer():
       if self.args.tie_word_embeddings:
         out = self.model.embed_tokens.as_linear(out)
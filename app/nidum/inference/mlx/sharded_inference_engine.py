@@ -7,13 +7,14 @@ from ..inference_engine import InferenceEngine
 from .sharded_utils import load_shard, get_image_from_str
 from .losses import loss_fns 
 from ..shard import Shard
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple, List
 from nidum.download.shard_download import ShardDownloader
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from collections import OrderedDict
-from mlx_lm.models.cache import make_prompt_cache
+from mlx_lm.models.cache import make_prompt_cache, trim_prompt_cache
+from .slot_cache import BatchKVCache, SlotKVCache, make_slot_cache
 
 def sample_logits(
   logits: mx.array,
@@ -37,22 +38,59 @@ def sample_logits(
   return token
 
 class MLXDynamicShardInferenceEngine(InferenceEngine):
+  supports_rollback = True
+
   def __init__(self, shard_downloader: ShardDownloader):
     self.shard = None
     self.shard_downloader = shard_downloader
     self.executor = ThreadPoolExecutor(max_workers=1)
     self.caches = OrderedDict()
+    self.batch_cache = None
 
-  async def poll_state(self, request_id: str, max_caches=2):
+  async def poll_state(self, request_id: str):
     if request_id in self.caches:
       self.caches.move_to_end(request_id)
+    elif hasattr(self.model, "decode_batch"):
+      # models that decode many rows in one step keep every request in a row of a shared batch cache
+      if self.batch_cache is None:
+        self.batch_cache = [BatchKVCache() for _ in self.model.layers]
+      rows = self.batch_cache[0].rows
+      free = sorted(set(range(rows)) - {cache[0].slot for cache in self.caches.values()})
+      if free:
+        slot = free[0]
+      elif rows < self.max_cached_requests:
+        slot = rows
+        for c in self.batch_cache:
+          c.rows = rows + 1
+      else:
+        _, evicted = self.caches.popitem(last=False)
+        slot = evicted[0].slot
+      self.caches[request_id] = make_slot_cache(self.batch_cache, slot)
     else:
       newcache = await asyncio.get_running_loop().run_in_executor(self.executor, make_prompt_cache, self.model)
-      if len(self.caches) > max_caches:
+      if len(self.caches) >= self.max_cached_requests:
         self.caches.popitem(last=False)
       self.caches[request_id] = newcache
     return {"cache": self.caches[request_id]}
 
+  def decode_rows(self, request_ids: List[str], input_datas: List[np.ndarray]) -> List[mx.array]:
+    """One decode step for each request, every row of the batch cache goes through one forward at its own position."""
+    rows = {self.caches[request_id][0].slot: mx.array(input_data) for request_id, input_data in zip(request_ids, input_datas)}
+    # idle rows get filler input at their current offset, the entry it leaves there is overwritten by their next write
+    offsets = [0]*self.batch_cache[0].rows
+    for cache in self.caches.values():
+      offsets[cache[0].slot] = cache[0].offset
+    filler = mx.zeros_like(next(iter(rows.values())))
+    out = self.model.decode_batch(mx.concatenate([rows.get(slot, filler) for slot in range(len(offsets))], axis=0), offsets, self.batch_cache)
+    mx.eval(out)
+    outputs = []
+    for request_id in request_ids:
+      for c in self.caches[request_id]:
+        c.offset += 1
+      slot = self.caches[request_id][0].slot
+      outputs.append(out[slot:slot + 1])
+    return outputs
+
   async def sample(self, x, temp: float = 0.0, top_p: float = 1.0) -> np.ndarray:
     y = mx.array(x)
     logits = y[:, -1, :]
@@ -89,6 +127,38 @@ class MLXDynamicShardInferenceEngine(InferenceEngine):
     output_data = np.array(output_data)
     return output_data, inference_state
 
+  async def infer_tensor_batch(self, request_ids: List[str], shard: Shard, input_datas: List[np.ndarray]) -> List[np.ndarray]:
+    await self.ensure_shard(shard)
+    if self.model.model_type == 'StableDiffusionPipeline':
+      return await super().infer_tensor_batch(request_ids, shard, input_datas)
+    states = [await self.poll_state(request_id) for request_id in request_ids]
+
+    def infer_batch():
+      outputs = [None]*len(request_ids)
+      decoding = []
+      for i, (state, input_data) in enumerate(zip(states, input_datas)):
+        cache = state["cache"]
+        if hasattr(self.model, "decode_batch") and isinstance(cache[0], SlotKVCache) and cache[0].offset > 0 and input_data.shape[0:2] == (1, 1):
+          decoding.append(i)
+          continue
+        outputs[i] = self.model(mx.array(input_data), **state)
+      # the first shard decodes token ids and the others hidden states, all inputs of a step share one shape
+      if decoding:
+        decoded = self.decode_rows([request_ids[i] for i in decoding], [input_datas[i] for i in decoding])
+        for i, output in zip(decoding, decoded):
+          outputs[i] = output
+      return [np.array(output) for output in outputs]
+
+    return await asyncio.get_running_loop().run_in_executor(self.executor, infer_batch)
+
+  async def rollback(self, request_id: str, shard: Shard, num_tokens: int) -> bool:
+    if num_tokens <= 0:
+      return True
+    if request_id not in self.caches:
+      return False
+    trimmed = await asyncio.get_running_loop().run_in_executor(self.executor, trim_prompt_cache, self.caches[request_id], num_tokens)
+    return trimmed == num_tokens
+
   async def evaluate(self, request_id: str, shard: Shard, inputs, targets, lengths, loss: str = "length_masked_ce"):
     await self.ensure_shard(shard)
     await self.save_session('loss', loss_fns[loss])
@@ -151,5 +221,6 @@ class MLXDynamicShardInferenceEngine(InferenceEngine):
       self.shard = shard
       self.model = model_shard 
       self.caches = OrderedDict()
+      self.batch_cache = None
       self.session = {}
 
@@ -0,0 +1,73 @@
+from typing import List, Tuple
+import mlx.core as mx
+from mlx_lm.models.cache import _BaseCache
+
+
+class BatchKVCache:
+  """Keys and values of one layer for every cache slot, row i belongs to the request holding slot i."""
+  step = 256
+
+  def __init__(self, rows: int = 0):
+    # rows are added as requests take slots, arrays are reallocated for them on the next write
+    self.rows = rows
+    self.keys = None
+    self.values = None
+
+  def reserve(self, keys: mx.array, values: mx.array, end: int):
+    # all rows grow together, in steps like KVCache, so a decode step can read them as one array
+    if self.keys is not None and end <= self.keys.shape[2] and self.rows == self.keys.shape[0]:
+      return
+    n_steps = (max(end, 0 if self.keys is None else self.keys.shape[2]) + self.step - 1)//self.step
+    _, n_kv_heads, _, k_head_dim = keys.shape
+    new_k = mx.zeros((self.rows, n_kv_heads, n_steps*self.step, k_head_dim), keys.dtype)
+    new_v = mx.zeros((self.rows, n_kv_heads, n_steps*self.step, values.shape[3]), values.dtype)
+    if self.keys is not None:
+      new_k[:self.keys.shape[0], :, :self.keys.shape[2], :] = self.keys
+      new_v[:self.values.shape[0], :, :self.values.shape[2], :] = self.values
+    self.keys, self.values = new_k, new_v
+
+  def write(self, slot: int, offset: int, keys: mx.array, values: mx.array):
+    self.reserve(keys, values, offset + keys.shape[2])
+    self.keys[slot:slot + 1, :, offset:offset + keys.shape[2], :] = keys
+    self.values[slot:slot + 1, :, offset:offset + values.shape[2], :] = values
+
+  def update_rows(self, offsets: List[int], keys: mx.array, values: mx.array) -> Tuple[mx.array, mx.array]:
+    """Writes row i of a one token step at offsets[i] and returns every row up to the furthest of them."""
+    length = max(offsets) + 1
+    self.reserve(keys, values, length)
+    for slot, offset in enumerate(offsets):
+      self.keys[slot:slot + 1, :, offset:offset + 1, :] = keys[slot:slot + 1]
+      self.values[slot:slot + 1, :, offset:offset + 1, :] = values[slot:slot + 1]
+    return self.keys[..., :length, :], self.values[..., :length, :]
+
+
+class SlotKVCache(_BaseCache):
+  """KVCache of one request that lives in its row of a BatchKVCache instead of owning its own arrays."""
+
+  def __init__(self, batch: BatchKVCache, slot: int):
+    self.batch = batch
+    self.slot = slot
+    self.offset = 0
+
+  def update_and_fetch(self, keys: mx.array, values: mx.array) -> Tuple[mx.array, mx.array]:
+    self.batch.write(self.slot, self.offset, keys, values)
+    self.offset += keys.shape[2]
+    return self.state
+
+  @property
+  def state(self):
+    row = slice(self.slot, self.slot + 1)
+    return self.batch.keys[row, :, :self.offset, :], self.batch.values[row, :, :self.offset, :]
+
+  def is_trimmable(self):
+    return True
+
+  def trim(self, n):
+    # attention only reads up to offset, entries past it are overwritten by the next write
+    n = min(self.offset, n)
+    self.offset -= n
+    return n
+
+
+def make_slot_cache(batch_cache: List[BatchKVCache], slot: int) -> List[SlotKVCache]:
+  return [SlotKVCache(c, slot) for c in batch_cache]
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import Mock
+import mlx.core as mx
+import numpy as np
+from mlx_lm.models.cache import KVCache
+
+from nidum.inference.shard import Shard
+from nidum.inference.mlx.models import qwen2
+from nidum.inference.mlx.models.llama import Model, ModelArgs
+from nidum.inference.mlx.sharded_inference_engine import MLXDynamicShardInferenceEngine
+
+SHARD = Shard("tiny", 0, 1, 2)
+
+
+class TestSlotCache(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    mx.random.seed(0)
+    self.model = Model(ModelArgs(
+      model_type="llama", hidden_size=16, num_hidden_layers=2, intermediate_size=32, num_attention_heads=2, rms_norm_eps=1e-5, vocab_size=32, num_key_value_heads=1, shard=SHARD
+    ))
+    self.engine = MLXDynamicShardInferenceEngine(Mock())
+    self.engine.max_cached_requests = 3
+    self.engine.shard, self.engine.model = SHARD, self.model
+
+  def expected(self, tokens):
+    # the whole sequence in one uncached forward, logits of its last position
+    return np.array(self.model(mx.array([tokens])))[:, -1]
+
+  async def test_rows_at_different_positions_match_uncached_forward(self):
+    sequences = {"a": [1, 2, 3], "b": [4, 5, 6, 7, 8]}
+    for request_id, tokens in sequences.items():
+      await self.engine.infer_tensor(request_id, SHARD, np.array([tokens]))
+    self.assertEqual(sorted(cache[0].slot for cache in self.engine.caches.values()), [0, 1])
+    # rows are only added for requests that arrived, not for every cacheable request
+    self.assertEqual(self.engine.batch_cache[0].keys.shape[0], 2)
+
+    for step in range(3):
+      request_ids = ["a", "b"] if step != 1 else ["b"]
+      for request_id in request_ids:
+        sequences[request_id].append(step + 10)
+      outputs = await self.engine.infer_tensor_batch(request_ids, SHARD, [np.array([[sequences[request_id][-1]]]) for request_id in request_ids])
+      for request_id, output in zip(request_ids, outputs):
+        np.testing.assert_allclose(output[:, -1], self.expected(sequences[request_id]), atol=1e-4)
+    self.assertEqual({request_id: cache[0].offset for request_id, cache in self.engine.caches.items()}, {"a": 5, "b": 8})
+
+  async def test_evicted_slot_is_reused_and_rollback_rewinds_the_row(self):
+    for request_id in ("a", "b", "c", "d"):
+      await self.engine.infer_tensor(request_id, SHARD, np.array([[1, 2]]))
+    self.assertEqual({request_id: cache[0].slot for request_id, cache in self.engine.caches.items()}, {"b": 1, "c": 2, "d": 0})
+
+    await self.engine.infer_tensor_batch(["d", "b"], SHARD, [np.array([[9]]), np.array([[9]])])
+    await self.engine.rollback("d", SHARD, 1)
+    outputs = await self.engine.infer_tensor_batch(["d", "c"], SHARD, [np.array([[3]]), np.array([[3]])])
+    for output in outputs:
+      np.testing.assert_allclose(output[:, -1], self.expected([1, 2, 3]), atol=1e-4)
+
+  async def test_models_without_batched_decode_keep_mlx_lm_caches(self):
+    self.engine.model = qwen2.Model(qwen2.ModelArgs(
+      model_type="qwen2", hidden_size=16, num_hidden_layers=2, intermediate_size=32, num_attention_heads=2, rms_norm_eps=1e-5, vocab_size=32, num_key_value_heads=1, shard=SHARD
+    ))
+    for request_id in ("a", "b"):
+      await self.engine.infer_tensor(request_id, SHARD, np.array([[1, 2]]))
+    outputs = await self.engine.infer_tensor_batch(["a", "b"], SHARD, [np.array([[3]]), np.array([[3]])])
+    expected = np.array(self.engine.model(mx.array([[1, 2, 3]])))[:, -1]
+    for output in outputs:
+      np.testing.assert_allclose(output[:, -1], expected, atol=1e-4)
+    self.assertTrue(all(type(c) is KVCache for cache in self.engine.caches.values() for c in cache))
+    self.assertIsNone(self.engine.batch_cache)
+
+
+if __name__ == "__main__":
+  unittest.main()
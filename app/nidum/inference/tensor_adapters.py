@@ -0,0 +1,49 @@
+import importlib
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+import numpy as np
+
+from nidum.inference.inference_engine import inference_engine_classes
+
+
+@dataclass(frozen=True)
+class TensorAdapter:
+  """
+  How the networking layer recognises an engine's tensors and rebuilds them from numpy. Only the
+  module name is kept, the engine library is imported the first time a tensor has to be built.
+  """
+  module: str
+  type_name: str
+  from_numpy: Callable[[Any, np.ndarray], Any]
+
+  def is_tensor(self, value: Any) -> bool:
+    # a tensor of this type cannot exist unless its module was imported, so never import it here
+    module = sys.modules.get(self.module)
+    return module is not None and isinstance(value, getattr(module, self.type_name))
+
+  def to_engine(self, array: np.ndarray) -> Any:
+    return self.from_numpy(importlib.import_module(self.module), array)
+
+
+# inference engine name -> adapter, engines without one get numpy arrays
+TENSOR_ADAPTERS: Dict[str, TensorAdapter] = {
+  "mlx": TensorAdapter("mlx.core", "array", lambda mx, array: mx.array(array)),
+}
+
+
+def register_tensor_adapter(engine_name: str, adapter: TensorAdapter) -> None:
+  TENSOR_ADAPTERS[engine_name] = adapter
+
+
+def is_tensor(value: Any) -> bool:
+  return isinstance(value, np.ndarray) or any(adapter.is_tensor(value) for adapter in TENSOR_ADAPTERS.values())
+
+
+def adapter_for_engine(inference_engine: Any) -> Optional[TensorAdapter]:
+  class_name = type(inference_engine).__name__
+  return next((TENSOR_ADAPTERS.get(name) for name, engine_class in inference_engine_classes.items() if engine_class == class_name), None)
+
+
+def to_engine(adapter: Optional[TensorAdapter], array: np.ndarray) -> Any:
+  return array if adapter is None else adapter.to_engine(array)
@@ -0,0 +1,56 @@
+import sys
+import types
+import unittest
+import numpy as np
+
+from nidum.inference.dummy_inference_engine import DummyInferenceEngine
+from nidum.inference.tensor_adapters import TENSOR_ADAPTERS, TensorAdapter, adapter_for_engine, is_tensor, to_engine
+
+
+class FakeTensor:
+  def __init__(self, array: np.ndarray):
+    self.array = array
+
+
+class FakeEngine:
+  pass
+
+
+class TestTensorAdapters(unittest.TestCase):
+  def setUp(self):
+    self.module = types.ModuleType("fake_engine_lib")
+    self.module.Tensor = FakeTensor
+    self.adapter = TensorAdapter("fake_engine_lib", "Tensor", lambda lib, array: lib.Tensor(array))
+    self.addCleanup(sys.modules.pop, "fake_engine_lib", None)
+
+  def test_numpy_engine(self):
+    self.assertTrue(is_tensor(np.zeros(2)))
+    self.assertFalse(is_tensor([1, 2]))
+    self.assertIsNone(adapter_for_engine(DummyInferenceEngine()))
+    array = np.arange(4)
+    self.assertIs(to_engine(None, array), array)
+
+  def test_recognising_tensors_does_not_import_the_engine(self):
+    self.assertFalse(self.adapter.is_tensor(object()))
+    self.assertNotIn("fake_engine_lib", sys.modules)
+
+  def test_registered_engine(self):
+    sys.modules["fake_engine_lib"] = self.module
+    TENSOR_ADAPTERS["fake"] = self.adapter
+    self.addCleanup(TENSOR_ADAPTERS.pop, "fake")
+    tensor = to_engine(self.adapter, np.arange(3))
+    self.assertIsInstance(tensor, FakeTensor)
+    self.assertTrue(is_tensor(tensor))
+    self.assertFalse(is_tensor(object()))
+
+  def test_adapter_by_engine_class(self):
+    TENSOR_ADAPTERS["fake"] = self.adapter
+    self.addCleanup(TENSOR_ADAPTERS.pop, "fake")
+    from nidum.inference import inference_engine
+    inference_engine.inference_engine_classes["fake"] = "FakeEngine"
+    self.addCleanup(inference_engine.inference_engine_classes.pop, "fake")
+    self.assertIs(adapter_for_engine(FakeEngine()), self.adapter)
+
+
+if __name__ == "__main__":
+  unittest.main()
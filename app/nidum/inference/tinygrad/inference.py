@@ -11,11 +11,11 @@ import numpy as np
 from nidum.inference.tinygrad.tinygrad_helpers import concat_weights, load
 from nidum.download.shard_download import ShardDownloader
 from concurrent.futures import ThreadPoolExecutor
-from .stateful_model import make_prompt_state
+from .stateful_model import grow_batch_cache, make_batch_cache, make_slot_state
 from .losses import length_masked_ce_loss
 from collections import OrderedDict
 import asyncio
-from typing import Optional
+from typing import Optional, List
 Tensor.no_grad = True 
 # default settings
 TEMPERATURE = int(os.getenv("TEMPERATURE", 0.85))
@@ -62,22 +62,53 @@ def build_transformer(model_path: Path, shard: Shard, model_size="8B", device=No
   return model
 
 class TinygradDynamicShardInferenceEngine(InferenceEngine):
+  supports_rollback = True
+
   def __init__(self, shard_downloader: ShardDownloader):
     self.shard = None
     self.shard_downloader = shard_downloader
     self.executor = ThreadPoolExecutor(max_workers=1)
     self.states = OrderedDict()
+    self.batch_cache = None
 
-  def poll_state(self, x, request_id: str, max_states=2):
+  def poll_state(self, x, request_id: str):
     if request_id not in self.states:
-      if len(self.states) >= max_states:
-        self.states.popitem(last=False)
-      self.states[request_id] = make_prompt_state(x, self.model)
+      if self.batch_cache is None:
+        self.batch_cache = make_batch_cache(x, self.model, 1)
+      rows = self.batch_cache[0].shape[1]
+      free = sorted(set(range(rows)) - {state.slot for state in self.states.values()})
+      if free:
+        slot = free[0]
+      elif rows < self.max_cached_requests:
+        slot = rows
+        self.batch_cache = grow_batch_cache(self.batch_cache, rows + 1)
+        # the slot views point into the old cache and the decode jit was captured for fewer rows
+        for state in self.states.values():
+          state.cache = make_slot_state(self.batch_cache, state.slot).cache
+        self.model.decode_jit = TinyJit(self.model.decode_batch_base) if self.model.decode_jit is not None else None
+      else:
+        _, evicted = self.states.popitem(last=False)
+        slot = evicted.slot
+      self.states[request_id] = make_slot_state(self.batch_cache, slot)
     else:
       self.states.move_to_end(request_id)
     state = self.states[request_id]
     return {"start_pos": state.start, "cache": state.cache}
 
+  def decode_rows(self, request_ids: List[str], hs: List[Tensor]) -> List[Tensor]:
+    """One decode step for each request, every cache row goes through the same jitted forward at its own position."""
+    rows = {self.states[request_id].slot: h for request_id, h in zip(request_ids, hs)}
+    # rows not in this step write garbage at their next position, which their own next step overwrites
+    starts = [0]*self.batch_cache[0].shape[1]
+    for state in self.states.values():
+      starts[state.slot] = min(state.start, self.model.max_context - 1)
+    filler = Tensor.zeros(*hs[0].shape, dtype=hs[0].dtype)
+    x = Tensor.cat(*[rows.get(slot, filler) for slot in range(len(starts))], dim=0)
+    out = self.model.decode_batch(x, starts, self.batch_cache).realize()
+    for request_id in request_ids:
+      self.states[request_id].start += 1
+    return [out[self.states[request_id].slot:self.states[request_id].slot + 1] for request_id in request_ids]
+
   async def sample(self, x: np.ndarray, temp=TEMPERATURE, top_p: float = 0.0) -> np.ndarray:
     logits = x[:, -1, :]
     def sample_wrapper():
@@ -105,16 +136,37 @@ class TinygradDynamicShardInferenceEngine(InferenceEngine):
     safe_save(state_dict, path) 
   
   async def infer_tensor(self, request_id: str, shard: Shard, input_data: np.ndarray, inference_state: Optional[dict] = None) -> tuple[np.ndarray, Optional[dict]]:
+    output_data, = await self.infer_tensor_batch([request_id], shard, [input_data])
+    return output_data, inference_state
+
+  async def infer_tensor_batch(self, request_ids: List[str], shard: Shard, input_datas: List[np.ndarray]) -> List[np.ndarray]:
     await self.ensure_shard(shard)
-    def wrap_infer():
-      x = Tensor(input_data)
-      h = self.model.embed(x)
-      state = self.poll_state(h, request_id)
-      out = self.model.forward(h, **state)
-      self.states[request_id].start += x.shape[1]
-      return out.realize()
-    output_data = await asyncio.get_running_loop().run_in_executor(self.executor, wrap_infer)
-    return output_data.numpy(), inference_state
+    def wrap_infer_batch():
+      outputs = [None]*len(request_ids)
+      decoding = []
+      for i, (request_id, input_data) in enumerate(zip(request_ids, input_datas)):
+        h = self.model.embed(Tensor(input_data))
+        state = self.poll_state(h, request_id)
+        if h.shape[0:2] == (1, 1) and state["start_pos"] > 0:
+          decoding.append((i, request_id, h))
+          continue
+        outputs[i] = self.model.forward(h, **state).realize()
+        self.states[request_id].start += h.shape[1]
+      if decoding:
+        for (i, _, _), out in zip(decoding, self.decode_rows([request_id for _, request_id, _ in decoding], [h for _, _, h in decoding])):
+          outputs[i] = out.realize()
+      return outputs
+    outputs = await asyncio.get_running_loop().run_in_executor(self.executor, wrap_infer_batch)
+    return [output.numpy() for output in outputs]
+
+  async def rollback(self, request_id: str, shard: Shard, num_tokens: int) -> bool:
+    # attention only reads the cache up to start, stale entries past it are overwritten by the next forward
+    if num_tokens <= 0:
+      return True
+    if request_id not in self.states or self.states[request_id].start < num_tokens:
+      return False
+    self.states[request_id].start -= num_tokens
+    return True
 
   async def evaluate(self, request_id: str, shard: Shard, inputs, targets, lengths, loss=length_masked_ce_loss):
     def step(x, y, l):
@@ -154,3 +206,5 @@ class TinygradDynamicShardInferenceEngine(InferenceEngine):
       self.tokenizer = await resolve_tokenizer(tokenizer_path)
       self.shard = shard
       self.model = model_shard
+      self.states.clear()
+      self.batch_cache = None
@@ -61,7 +61,7 @@ class Attention:
     self.wv = linear(dim, self.n_kv_heads*self.head_dim, bias=False)
     self.wo = linear(self.n_heads*self.head_dim, dim, bias=False)
 
-  def __call__(self, x: Tensor, start_pos: Union[Variable, int], freqs_cis: Tensor, mask: Optional[Tensor], cache: Optional[Tensor]=None) -> Tensor:
+  def project(self, x: Tensor, freqs_cis: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
     if getenv("WQKV"):
       if not hasattr(self, 'wqkv'): self.wqkv = Tensor.cat(self.wq.weight, self.wk.weight, self.wv.weight)
       xqkv = x @ self.wqkv.T
@@ -74,7 +74,19 @@ class Attention:
     xv = xv.reshape(xv.shape[0], xv.shape[1], self.n_kv_heads, self.head_dim)
 
     xq, xk = apply_rotary_emb(xq, xk, freqs_cis)
+    return xq, xk, xv
+
+  def attend(self, xq: Tensor, keys: Tensor, values: Tensor, mask: Optional[Tensor]) -> Tensor:
     bsz, seqlen, _, _ = xq.shape
+    keys, values = repeat_kv(keys, self.n_rep), repeat_kv(values, self.n_rep)
+    xq, keys, values = xq.transpose(1, 2), keys.transpose(1, 2), values.transpose(1, 2)
+    attn = xq.scaled_dot_product_attention(keys, values, mask).transpose(1, 2)
+    attn = attn.reshape(bsz, seqlen, -1)
+    return self.wo(attn)
+
+  def __call__(self, x: Tensor, start_pos: Union[Variable, int], freqs_cis: Tensor, mask: Optional[Tensor], cache: Optional[Tensor]=None) -> Tensor:
+    xq, xk, xv = self.project(x, freqs_cis)
+    seqlen = xq.shape[1]
 
     if cache is not None:
       # update the cache
@@ -87,11 +99,17 @@ class Attention:
       keys = xk
       values = xv
 
-    keys, values = repeat_kv(keys, self.n_rep), repeat_kv(values, self.n_rep)
-    xq, keys, values = xq.transpose(1, 2), keys.transpose(1, 2), values.transpose(1, 2)
-    attn = xq.scaled_dot_product_attention(keys, values, mask).transpose(1, 2)
-    attn = attn.reshape(bsz, seqlen, -1)
-    return self.wo(attn)
+    return self.attend(xq, keys, values, mask)
+
+  def decode_batch(self, x: Tensor, starts: Tuple[Union[Variable, int], ...], length: Union[Variable, int], freqs_cis: Tensor, mask: Tensor, cache: Tensor) -> Tensor:
+    # one token per row, row i of the cache belongs to one request and is written at that request's own position
+    xq, xk, xv = self.project(x, freqs_cis)
+    for i, start in enumerate(starts):
+      cache.shrink((None, (i, i + 1), (start, start + 1), None, None)).assign(Tensor.stack(xk[i:i + 1], xv[i:i + 1])).realize()
+    # rows shorter than length read stale entries past their position, the mask hides them
+    keys = cache[0].shrink((None, (0, length), None, None))
+    values = cache[1].shrink((None, (0, length), None, None))
+    return self.attend(xq, keys, values, mask)
 
 
 class FeedForward:
@@ -115,6 +133,10 @@ class TransformerBlock:
     h = x + self.attention(self.attention_norm(x), start_pos, freqs_cis, mask, cache=cache)
     return (h + self.feed_forward(self.ffn_norm(h))).contiguous()
 
+  def decode_batch(self, x: Tensor, starts: Tuple[Union[Variable, int], ...], length: Union[Variable, int], freqs_cis: Tensor, mask: Tensor, cache: Tensor):
+    h = x + self.attention.decode_batch(self.attention_norm(x), starts, length, freqs_cis, mask, cache)
+    return (h + self.feed_forward(self.ffn_norm(h))).contiguous()
+
 
 # standard openai sampling
 def sample_logits(logits: Tensor, temp: float, k: int, p: float, af: float, ap: float):
@@ -252,7 +274,9 @@ class TransformerShard:
     self.max_context = base.max_context
     self.null_cache = [None for _ in shardrange] 
     self.freqs_cis = base.freqs_cis
+    self.context_positions = Tensor.arange(self.max_context).contiguous().realize()
     self.forward_jit = TinyJit(self.forward_base) if jit else None
+    self.decode_jit = TinyJit(self.decode_batch_base) if jit else None
 
   def forward_base(self, x: Tensor, start_pos: Union[Variable, int], cache):
     seqlen = x.shape[1]
@@ -270,6 +294,26 @@ class TransformerShard:
       return self.forward_jit(x, Variable("start_pos", 1, self.max_context).bind(start_pos), cache=cache)
     return self.forward_base(x, start_pos, cache=cache)
 
+  def decode_batch_base(self, x: Tensor, positions: Tensor, length: Union[Variable, int], *starts: Union[Variable, int], cache: List[Tensor]):
+    freqs_cis = Tensor.cat(*[self.freqs_cis.shrink((None, (start, start + 1), None, None, None)) for start in starts], dim=0)
+    # row i sees its own cache up to and including positions[i]
+    visible = self.context_positions.shrink(((0, length),)).reshape(1, 1, 1, -1) <= positions.reshape(-1, 1, 1, 1)
+    mask = visible.where(0, float("-100000000")).cast(x.dtype)
+
+    for layer, c in zip(self.layers, cache):
+      x = layer.decode_batch(x, starts, length, freqs_cis, mask, c)
+
+    return self.post(x)
+
+  def decode_batch(self, x: Tensor, starts: List[int], cache: List[Tensor]):
+    """One token for every row of a batched cache (bsz, 1, dim), row i at position starts[i]."""
+    positions = Tensor(starts, dtype=dtypes.int32, device=self.context_positions.device)
+    length = max(starts) + 1
+    if self.decode_jit is not None:
+      starts = [Variable(f"start{i}", 0, self.max_context - 1).bind(start) for i, start in enumerate(starts)]
+      return self.decode_jit(x, positions, Variable("length", 1, self.max_context).bind(length), *starts, cache=cache)
+    return self.decode_batch_base(x, positions, length, *starts, cache=cache)
+
   def __call__(self, x: Tensor, start_pos: Variable, cache: Optional[List[Tensor]] = None):
     # TODO: better way to handle the first call v.s. the rest?
     h = self.embed(x)
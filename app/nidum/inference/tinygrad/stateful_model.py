@@ -1,9 +1,10 @@
 from tinygrad import Tensor, Variable 
+from tinygrad.helpers import getenv
 from collections import OrderedDict
 from typing import List, Optional
 
-def create_kv_cache(x: Tensor, layer):
-  cache_kv = Tensor.zeros(2, x.shape[0], layer.max_context, layer.n_kv_heads, layer.head_dim, dtype=x.dtype).contiguous().realize()
+def create_kv_cache(x: Tensor, layer, rows: Optional[int] = None):
+  cache_kv = Tensor.zeros(2, rows or x.shape[0], layer.max_context, layer.n_kv_heads, layer.head_dim, dtype=x.dtype).contiguous().realize()
   if isinstance(x.device, tuple):
     # TODO: instead of specifying how to shard, it can follow how xk and xv are being sharded
     cache_kv.shard_((x.device), axis=3 if getenv("SHARD_KVCACHE") else None).realize()
@@ -12,11 +13,24 @@ def create_kv_cache(x: Tensor, layer):
 class ModelState:
   cache: List[Tensor]
   start: int 
-  def __init__(self, cache: List[Tensor], start: int = 0):
+  slot: int
+  def __init__(self, cache: List[Tensor], start: int = 0, slot: int = 0):
     self.cache = cache
     self.start = start
+    self.slot = slot
 
 def make_prompt_state(x: Tensor, model):
   cache = [create_kv_cache(x, l.attention) for l in model.layers]
 
   return ModelState(cache)
+
+def make_batch_cache(x: Tensor, model, rows: int) -> List[Tensor]:
+  # one row per cached request, decode steps of all of them run as a single forward over it
+  return [create_kv_cache(x, l.attention, rows) for l in model.layers]
+
+def grow_batch_cache(batch_cache: List[Tensor], rows: int) -> List[Tensor]:
+  # rows are added as requests arrive, so idle nodes only hold the caches they use
+  return [c.cat(Tensor.zeros(2, rows - c.shape[1], *c.shape[2:], dtype=c.dtype, device=c.device), dim=1).contiguous().realize() for c in batch_cache]
+
+def make_slot_state(batch_cache: List[Tensor], slot: int) -> ModelState:
+  return ModelState([c.shrink((None, (slot, slot + 1), None, None, None)) for c in batch_cache], slot=slot)
@@ -0,0 +1,69 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+import numpy as np
+from tinygrad import Tensor
+
+from nidum.inference.shard import Shard
+from nidum.inference.tinygrad.inference import TinygradDynamicShardInferenceEngine
+from nidum.inference.tinygrad.models.llama import Transformer, TransformerShard
+
+SHARD = Shard("tiny", 0, 1, 2)
+ARGS = {"dim": 16, "hidden_dim": 32, "n_heads": 2, "n_kv_heads": 1, "n_layers": 2, "norm_eps": 1e-5, "vocab_size": 32, "max_context": 32}
+
+
+class TestBatchDecode(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    Tensor.manual_seed(0)
+    base = Transformer(**ARGS, shard=SHARD)
+    self.reference = TransformerShard(SHARD, base, jit=False)
+    self.engine = TinygradDynamicShardInferenceEngine(Mock())
+    self.engine.max_cached_requests = 3
+    self.engine.shard, self.engine.model = SHARD, TransformerShard(SHARD, base)
+
+  def expected(self, tokens):
+    # the whole sequence in one uncached forward, logits of its last position
+    return self.reference.forward_base(self.reference.embed(Tensor([tokens])), 0, self.reference.null_cache).numpy()[:, -1]
+
+  async def test_rows_at_different_positions_match_uncached_forward(self):
+    sequences = {"a": [1, 2, 3], "b": [4, 5, 6, 7, 8]}
+    for request_id, tokens in sequences.items():
+      await self.engine.infer_tensor(request_id, SHARD, np.array([tokens]))
+    self.assertEqual(sorted(state.slot for state in self.engine.states.values()), [0, 1])
+    # rows are only added for requests that arrived, not for every cacheable request
+    self.assertEqual(self.engine.batch_cache[0].shape[1], 2)
+
+    # enough steps for the decode jit to capture and replay
+    for step in range(4):
+      request_ids = ["a", "b"] if step != 2 else ["b"]
+      for request_id in request_ids:
+        sequences[request_id].append(step + 10)
+      outputs = await self.engine.infer_tensor_batch(request_ids, SHARD, [np.array([[sequences[request_id][-1]]]) for request_id in request_ids])
+      for request_id, output in zip(request_ids, outputs):
+        np.testing.assert_allclose(output[:, -1], self.expected(sequences[request_id]), atol=1e-3)
+    self.assertEqual({request_id: state.start for request_id, state in self.engine.states.items()}, {"a": 6, "b": 9})
+
+    # a request arriving after the jit captured adds a row, the others keep their caches
+    sequences["c"] = [1, 2]
+    await self.engine.infer_tensor("c", SHARD, np.array([sequences["c"]]))
+    self.assertEqual(self.engine.batch_cache[0].shape[1], 3)
+    for step in range(3):
+      for request_id in ("a", "c"):
+        sequences[request_id].append(step + 20)
+      outputs = await self.engine.infer_tensor_batch(["a", "c"], SHARD, [np.array([[sequences[request_id][-1]]]) for request_id in ("a", "c")])
+      for request_id, output in zip(("a", "c"), outputs):
+        np.testing.assert_allclose(output[:, -1], self.expected(sequences[request_id]), atol=1e-3)
+
+  async def test_evicted_slot_is_reused_and_rollback_rewinds_the_row(self):
+    for request_id in ("a", "b", "c", "d"):
+      await self.engine.infer_tensor(request_id, SHARD, np.array([[1, 2]]))
+    self.assertEqual({request_id: state.slot for request_id, state in self.engine.states.items()}, {"b": 1, "c": 2, "d": 0})
+
+    await self.engine.infer_tensor("d", SHARD, np.array([[9]]))
+    await self.engine.rollback("d", SHARD, 1)
+    output, _ = await self.engine.infer_tensor("d", SHARD, np.array([[3]]))
+    np.testing.assert_allclose(output[:, -1], self.expected([1, 2, 3]), atol=1e-3)
+
+
+if __name__ == "__main__":
+  unittest.main()
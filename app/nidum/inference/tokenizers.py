@@ -3,7 +3,6 @@ from aiofiles import os as aios
 from os import PathLike
 from pathlib import Path
 from typing import Union
-from transformers import AutoTokenizer, AutoProcessor
 import numpy as np
 from nidum.download.hf.hf_helpers import get_local_snapshot_dir
 from nidum.helpers import DEBUG
@@ -40,6 +39,7 @@ async def resolve_tokenizer(model_id: str):
 
 
 async def _resolve_tokenizer(model_id_or_local_path: Union[str, PathLike]):
+  from transformers import AutoTokenizer, AutoProcessor
   try:
     if DEBUG >= 4: print(f"Trying AutoProcessor for {model_id_or_local_path}")
     processor = AutoProcessor.from_pretrained(model_id_or_local_path, use_fast=True if "Mistral-Large" in f"{model_id_or_local_path}" else False, trust_remote_code=True)
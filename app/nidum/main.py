@@ -18,12 +18,18 @@ from nidum.train.dataset import load_dataset, iterate_batches, compose
 from nidum.networking.manual.manual_discovery import ManualDiscovery
 from nidum.networking.manual.network_topology_config import NetworkTopology
 from nidum.orchestration.node import Node
+from nidum.orchestration.request_state import RequestStateTracker
+from nidum.orchestration.speculative import SpeculativeDecoder
 from nidum.networking.grpc.grpc_server import GRPCServer
 from nidum.networking.udp.udp_discovery import UDPDiscovery
+from nidum.networking.multicast.multicast_discovery import DEFAULT_MULTICAST_GROUP, MulticastDiscovery
 from nidum.networking.tailscale.tailscale_discovery import TailscaleDiscovery
 from nidum.networking.grpc.grpc_peer_handle import GRPCPeerHandle
+from nidum.networking.shm.shm_peer_handle import ShmPeerHandle
+from nidum.networking.shm.shm_server import socket_path as shm_socket_path
+from nidum.networking.activation_codec import WireCodec
 from nidum.topology.ring_memory_weighted_partitioning_strategy import RingMemoryWeightedPartitioningStrategy
-from nidum.api import ChatGPTAPI
+from nidum.api import ChatGPTAPI, AdmissionController
 from nidum.download.shard_download import ShardDownloader, RepoProgressEvent, NoopShardDownloader
 from nidum.download.hf.hf_shard_download import HFShardDownloader
 from nidum.helpers import  find_available_port, DEBUG, get_system_info, get_or_create_node_id, get_all_ip_addresses_and_interfaces, terminal_link, shutdown
@@ -54,13 +60,40 @@ parser.add_argument("--download-quick-check", action="store_true", help="Quick c
 parser.add_argument("--max-parallel-downloads", type=int, default=4, help="Max parallel downloads for model shards download")
 parser.add_argument("--prometheus-client-port", type=int, default=None, help="Prometheus client port")
 parser.add_argument("--broadcast-port", type=int, default=5678, help="Broadcast port for discovery")
-parser.add_argument("--discovery-module", type=str, choices=["udp", "tailscale", "manual"], default="udp", help="Discovery module to use")
+parser.add_argument("--discovery-module", type=str, choices=["udp", "multicast", "tailscale", "manual"], default="udp", help="Discovery module to use")
+parser.add_argument("--multicast-group", type=str, default=DEFAULT_MULTICAST_GROUP, help="Multicast group for multicast discovery, announced to and listened on at --listen-port")
+parser.add_argument("--multicast-interfaces", type=str, default=None, help="Comma separated local addresses multicast discovery uses (all by default)")
 parser.add_argument("--discovery-timeout", type=int, default=30, help="Discovery timeout in seconds")
 parser.add_argument("--discovery-config-path", type=str, default=None, help="Path to discovery config json file")
 parser.add_argument("--wait-for-peers", type=int, default=0, help="Number of peers to wait to connect to before starting")
 parser.add_argument("--chatgpt-api-port", type=int, default=52415, help="ChatGPT API port")
 parser.add_argument("--chatgpt-api-response-timeout", type=int, default=90, help="ChatGPT API response timeout in seconds")
+parser.add_argument("--max-concurrent-requests", type=int, default=None, help="Max chat completions running at once (defaults to the number of cached requests per engine)")
+parser.add_argument("--max-queued-requests", type=int, default=32, help="Max chat completions waiting for admission before returning 429")
+parser.add_argument("--max-tokens-in-flight", type=int, default=None, help="Max prompt + generation tokens across running chat completions")
+parser.add_argument("--max-queue-time", type=float, default=30.0, help="Seconds a chat completion may wait for admission before returning 429")
 parser.add_argument("--max-generate-tokens", type=int, default=10000, help="Max tokens to generate in each request")
+parser.add_argument("--max-batch-size", type=int, default=8, help="Max number of concurrent decode steps merged into one batched forward")
+parser.add_argument("--request-state-ttl", type=float, default=900.0, help="Seconds of inactivity after which a request's buffered state is dropped")
+parser.add_argument("--request-state-max-mb", type=int, default=256, help="Memory budget for buffered per-request state in MB")
+parser.add_argument("--micro-batching", action=argparse.BooleanOptionalAction, default=True, help="Split queued decode steps into micro-batches so ring nodes compute concurrently")
+parser.add_argument("--max-cached-requests", type=int, default=None, help="Number of per-request KV caches each inference engine keeps (default 2), batches never hold more requests than this")
+parser.add_argument("--wire-codec", type=str, default="auto", help="Codec for activations sent to peers: auto (lossless, compressed on slow links), raw, fp16, bf16 or int8 (lossy, opt-in), optionally +zstd or +lz4")
+parser.add_argument("--max-message-mb", type=int, default=32, help="Largest gRPC message in MB, the same limit on the sending and receiving side")
+parser.add_argument("--tensor-chunk-mb", type=int, default=4, help="Tensors larger than this many MB are streamed to peers in chunks of this size")
+parser.add_argument("--peer-health-ttl", type=float, default=10.0, help="Seconds a peer counts as healthy after its last successful RPC before discovery probes it again")
+parser.add_argument("--topology-timeout", type=float, default=3.0, help="Deadline in seconds for one round of topology sync with all peers, slower peers catch up on the next round")
+parser.add_argument("--link-probe-interval", type=float, default=5.0, help="Seconds between round trip probes of each peer link, 0 disables link probing")
+parser.add_argument("--link-bandwidth-interval", type=float, default=60.0, help="Seconds between throughput probes of each peer link, skipped while requests are running")
+parser.add_argument("--gossip", action=argparse.BooleanOptionalAction, default=True, help="Detect failed peers with SWIM gossip (one probe per period) instead of health checking every peer")
+parser.add_argument("--gossip-period", type=float, default=1.0, help="Seconds between gossip probes, a failed peer is declared dead within (2n-1) periods plus --suspicion-timeout")
+parser.add_argument("--gossip-ping-timeout", type=float, default=0.5, help="Seconds a gossip ping waits for its ack before other peers are asked to probe")
+parser.add_argument("--suspicion-timeout", type=float, default=5.0, help="Seconds a suspected peer has to refute before it is declared dead")
+parser.add_argument("--shm-transport", action=argparse.BooleanOptionalAction, default=True, help="Send tensors to peers on the same host through shared memory instead of loopback gRPC")
+parser.add_argument("--shm-ring-mb", type=int, default=64, help="Size in MB of the shared memory ring kept per same-host peer")
+parser.add_argument("--prefill-chunk-size", type=int, default=512, help="Prompt tokens per prefill chunk forwarded through the ring (0 sends the whole prompt at once)")
+parser.add_argument("--draft-model", type=str, default=None, help="Small model run on the first node to draft tokens for speculative decoding (e.g. llama-3.2-1b)")
+parser.add_argument("--num-draft-tokens", type=int, default=4, help="Tokens drafted per decode step when --draft-model is set")
 parser.add_argument("--inference-engine", type=str, default=None, help="Inference engine to use (mlx, tinygrad, or dummy)")
 parser.add_argument("--disable-tui", action=argparse.BooleanOptionalAction, help="Disable TUI")
 parser.add_argument("--run-model", type=str, help="Specify a model to run directly")
@@ -68,12 +101,16 @@ parser.add_argument("--prompt", type=str, help="Prompt for the model when using
 parser.add_argument("--default-temp", type=float, help="Default token sampling temperature", default=0.0)
 parser.add_argument("--tailscale-api-key", type=str, default=None, help="Tailscale API key")
 parser.add_argument("--tailnet-name", type=str, default=None, help="Tailnet name")
-parser.add_argument("--node-id-filter", type=str, default=None, help="Comma separated list of allowed node IDs (only for UDP and Tailscale discovery)")
+parser.add_argument("--node-id-filter", type=str, default=None, help="Comma separated list of allowed node IDs (only for UDP, multicast and Tailscale discovery)")
 parser.add_argument("--system-prompt", type=str, default=None, help="System prompt for the ChatGPT API")
 parser.add_argument("--machine-id", type=str, default=None, help="machine id")
 parser.add_argument("--cluster-id", type=str, default=None, help="cluster id")
+parser.add_argument("--target-ips-ttl", type=float, default=10.0, help="Seconds the cluster's target IPs from the API are used before they are revalidated in the background")
 
 args = parser.parse_args()
+if args.wire_codec != "auto": WireCodec.parse(args.wire_codec)
+if args.tensor_chunk_mb >= args.max_message_mb:
+  raise ValueError(f"--tensor-chunk-mb ({args.tensor_chunk_mb}) has to be below --max-message-mb ({args.max_message_mb})")
 print(f"Selected inference engine: {args.inference_engine}")
 
 # print_yellow_exo()
@@ -86,9 +123,20 @@ shard_downloader: ShardDownloader = HFShardDownloader(quick_check=args.download_
 inference_engine_name = args.inference_engine or ("mlx" if system_info == "Apple Silicon Mac" else "tinygrad")
 print(f"Inference engine name after selection: {inference_engine_name}")
 
+if args.max_cached_requests:
+  InferenceEngine.max_cached_requests = args.max_cached_requests
 inference_engine = get_inference_engine(inference_engine_name, shard_downloader)
 print(f"Using inference engine: {inference_engine.__class__.__name__} with shard downloader: {shard_downloader.__class__.__name__}")
 
+speculative = None
+if args.draft_model:
+  draft_base_shard = build_base_shard(args.draft_model, inference_engine.__class__.__name__)
+  if draft_base_shard is None:
+    raise ValueError(f"Draft model {args.draft_model} is not supported by {inference_engine.__class__.__name__}")
+  # the draft model always runs whole on the first node, with an engine of its own
+  draft_shard = Shard(draft_base_shard.model_id, 0, draft_base_shard.n_layers - 1, draft_base_shard.n_layers)
+  speculative = SpeculativeDecoder(get_inference_engine(inference_engine_name, shard_downloader), draft_shard, num_tokens=args.num_draft_tokens)
+
 if args.node_port is None:
   args.node_port = find_available_port(args.node_host)
   if DEBUG >= 1: print(f"Using available port: {args.node_port}")
@@ -104,6 +152,12 @@ if DEBUG >= 0:
   for chatgpt_api_endpoint in chatgpt_api_endpoints:
     print(f" - {terminal_link(chatgpt_api_endpoint)}")
 
+def create_peer_handle(peer_id, address, description, device_capabilities):
+  limits = dict(max_message_bytes=args.max_message_mb*1024*1024, chunk_bytes=args.tensor_chunk_mb*1024*1024, health_ttl=args.peer_health_ttl)
+  if args.shm_transport:
+    return ShmPeerHandle(peer_id, address, description, device_capabilities, wire_codec=args.wire_codec, ring_bytes=args.shm_ring_mb*1024*1024, **limits)
+  return GRPCPeerHandle(peer_id, address, description, device_capabilities, wire_codec=args.wire_codec, **limits)
+
 # Convert node-id-filter to list if provided
 allowed_node_ids = args.node_id_filter.split(',') if args.node_id_filter else None
 
@@ -113,17 +167,29 @@ if args.discovery_module == "udp":
     args.node_port,
     args.listen_port,
     args.broadcast_port,
-    lambda peer_id, address, description, device_capabilities: GRPCPeerHandle(peer_id, address, description, device_capabilities),
+    create_peer_handle,
     discovery_timeout=args.discovery_timeout,
     allowed_node_ids=allowed_node_ids,
     machine_id=args.machine_id,
-    cluster_id=args.cluster_id
+    cluster_id=args.cluster_id,
+    target_ips_ttl=args.target_ips_ttl,
+  )
+elif args.discovery_module == "multicast":
+  discovery = MulticastDiscovery(
+    args.node_id,
+    args.node_port,
+    args.listen_port,
+    create_peer_handle,
+    group=args.multicast_group,
+    discovery_timeout=args.discovery_timeout,
+    allowed_node_ids=allowed_node_ids,
+    interfaces=args.multicast_interfaces.split(",") if args.multicast_interfaces else None,
   )
 elif args.discovery_module == "tailscale":
   discovery = TailscaleDiscovery(
     args.node_id,
     args.node_port,
-    lambda peer_id, address, description, device_capabilities: GRPCPeerHandle(peer_id, address, description, device_capabilities),
+    create_peer_handle,
     discovery_timeout=args.discovery_timeout,
     tailscale_api_key=args.tailscale_api_key,
     tailnet=args.tailnet_name,
@@ -132,7 +198,14 @@ elif args.discovery_module == "tailscale":
 elif args.discovery_module == "manual":
   if not args.discovery_config_path:
     raise ValueError(f"--discovery-config-path is required when using manual discovery. Please provide a path to a config json file.")
-  discovery = ManualDiscovery(args.discovery_config_path, args.node_id, create_peer_handle=lambda peer_id, address, description, device_capabilities: GRPCPeerHandle(peer_id, address, description, device_capabilities))
+  discovery = ManualDiscovery(args.discovery_config_path, args.node_id, create_peer_handle=create_peer_handle)
+if args.gossip:
+  discovery.enable_membership(
+    args.node_id,
+    protocol_period=args.gossip_period,
+    ping_timeout=min(args.gossip_ping_timeout, args.gossip_period),
+    suspicion_timeout=args.suspicion_timeout,
+  )
 topology_viz = TopologyViz(chatgpt_api_endpoints=chatgpt_api_endpoints, web_chat_urls=web_chat_urls) if not args.disable_tui else None
 node = Node(
   args.node_id,
@@ -143,9 +216,18 @@ node = Node(
   max_generate_tokens=args.max_generate_tokens,
   topology_viz=topology_viz,
   shard_downloader=shard_downloader,
-  default_sample_temperature=args.default_temp
+  default_sample_temperature=args.default_temp,
+  max_batch_size=args.max_batch_size,
+  micro_batching=args.micro_batching,
+  request_state=RequestStateTracker(ttl=args.request_state_ttl, max_bytes=args.request_state_max_mb*1024*1024),
+  speculative=speculative,
+  prefill_chunk_size=args.prefill_chunk_size,
+  topology_timeout=args.topology_timeout,
+  link_probe_interval=args.link_probe_interval,
+  link_bandwidth_interval=args.link_bandwidth_interval,
 )
-server = GRPCServer(node, args.node_host, args.node_port)
+shm_socket = shm_socket_path(args.node_id) if args.shm_transport else None
+server = GRPCServer(node, args.node_host, args.node_port, shm_socket=shm_socket, max_message_bytes=args.max_message_mb*1024*1024)
 node.server = server
 api = ChatGPTAPI(
   node,
@@ -153,7 +235,13 @@ api = ChatGPTAPI(
   response_timeout=args.chatgpt_api_response_timeout,
   on_chat_completion_request=lambda req_id, __, prompt: topology_viz.update_prompt(req_id, prompt) if topology_viz else None,
   default_model=args.default_model,
-  system_prompt=args.system_prompt
+  system_prompt=args.system_prompt,
+  admission=AdmissionController(
+    max_concurrent=args.max_concurrent_requests or InferenceEngine.max_cached_requests,
+    max_queue=args.max_queued_requests,
+    max_tokens_in_flight=args.max_tokens_in_flight,
+    max_queue_time=args.max_queue_time,
+  ),
 )
 node.on_token.register("update_topology_viz").on_next(
   lambda req_id, tokens, __: topology_viz.update_prompt_output(req_id, inference_engine.tokenizer.decode(tokens)) if topology_viz and hasattr(inference_engine, "tokenizer") and inference_engine.shard.model_id != 'stable-diffusion-2-1-base' else None
@@ -186,7 +274,7 @@ def throttled_broadcast(shard: Shard, event: RepoProgressEvent):
   current_time = time.time()
   if event.status == "complete" or current_time - last_broadcast_time >= 0.1:
     last_broadcast_time = current_time
-    asyncio.create_task(node.broadcast_opaque_status("", json.dumps({"type": "download_progress", "node_id": node.id, "progress": event.to_dict()})))
+    asyncio.create_task(node.broadcast_opaque_status("", json.dumps({"type": "download_progress", "node_id": node.id, "progress": event.to_dict()}), key="download_progress"))
 
 
 shard_downloader.on_progress.register("broadcast").on_next(throttled_broadcast)
@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+try:
+  import lz4.frame as lz4_frame
+except ImportError:
+  lz4_frame = None
+
+PRECISIONS = ("raw", "fp16", "bf16", "int8")
+# tensors below these sizes (token ids, small states) always go out as they are
+MIN_QUANTIZE_ELEMENTS = 256
+MIN_COMPRESS_BYTES = 4096
+# int8 keeps one scale per hidden channel, worth it only once enough tokens share those scales
+MIN_INT8_TOKENS = 8
+
+
+def available_compressions() -> List[str]:
+  return [name for name, module in (("zstd", zstandard), ("lz4", lz4_frame)) if module is not None]
+
+
+def supported_codecs() -> List[str]:
+  """What this node can decode, advertised to peers in HealthCheck."""
+  return [precision for precision in PRECISIONS if precision != "raw"] + available_compressions()
+
+
+@dataclass(frozen=True)
+class WireCodec:
+  precision: str = "raw"
+  compression: str = ""
+
+  def __str__(self) -> str:
+    return "+".join(part for part in (self.precision, self.compression) if part)
+
+  @classmethod
+  def parse(cls, value: str) -> "WireCodec":
+    precision, _, compression = value.partition("+")
+    if precision not in PRECISIONS or compression not in ("", "zstd", "lz4"):
+      raise ValueError(f"Unknown wire codec {value!r}, expected <{'|'.join(PRECISIONS)}>[+zstd|+lz4]")
+    return cls(precision, compression)
+
+
+RAW = WireCodec()
+
+# preferred codec per link type, the part of a peer description before the interface name.
+# These are all lossless so a cluster returns the same tokens as a single node, slow links only
+# get compressed; reduced precision has to be asked for with --wire-codec.
+LINK_CODECS: Dict[str, WireCodec] = {
+  "Loopback": RAW,
+  "Container Virtual": RAW,
+  "Thunderbolt": RAW,
+  "Ethernet": RAW,
+  "WiFi": WireCodec("raw", "zstd"),
+  "External Virtual": WireCodec("raw", "zstd"),
+  "TS": WireCodec("raw", "zstd"),
+}
+DEFAULT_LINK_CODEC = RAW
+
+
+def link_type(description: Optional[str]) -> str:
+  return (description or "").split(" (")[0]
+
+
+def select_codec(description: Optional[str], peer_codecs: Iterable[str], preferred: Optional[str] = None) -> WireCodec:
+  """Codec for a link: the preferred one (by link type unless given), reduced to what both ends support."""
+  peer_codecs = set(peer_codecs)
+  wanted = WireCodec.parse(preferred) if preferred and preferred != "auto" else LINK_CODECS.get(link_type(description), DEFAULT_LINK_CODEC)
+  precision = wanted.precision if wanted.precision == "raw" or wanted.precision in peer_codecs else "raw"
+  compression = ""
+  if wanted.compression:
+    for candidate in [wanted.compression] + available_compressions():
+      if candidate in peer_codecs and candidate in available_compressions():
+        compression = candidate
+        break
+  return WireCodec(precision, compression)
+
+
+def _to_bf16(x: np.ndarray) -> np.ndarray:
+  bits = np.ascontiguousarray(x, dtype=np.float32).view(np.uint32)
+  # round to nearest even on the dropped 16 bits
+  return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+
+
+def _from_bf16(x: np.ndarray) -> np.ndarray:
+  return (x.astype(np.uint32) << 16).view(np.float32)
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+  if compression == "zstd": return zstandard.ZstdCompressor(level=1).compress(data)
+  if compression == "lz4": return lz4_frame.compress(data)
+  return data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+  if compression == "zstd": return zstandard.ZstdDecompressor().decompress(data)
+  if compression == "lz4": return lz4_frame.decompress(data)
+  return data
+
+
+def encode_activation(tensor: np.ndarray, codec: WireCodec) -> Tuple[bytes, WireCodec, bytes]:
+  """
+  Returns (payload, codec actually applied, int8 scales). Only floating tensors of at least
+  MIN_QUANTIZE_ELEMENTS are reduced in precision. int8 keeps one float32 scale per hidden channel
+  (last axis), so the few outlier channels of LLM hidden states do not flatten the others; with
+  fewer than MIN_INT8_TOKENS tokens the scales would outweigh the payload and fp16 is sent instead.
+  """
+  precision = codec.precision
+  if precision != "raw" and (not np.issubdtype(tensor.dtype, np.floating) or tensor.size < MIN_QUANTIZE_ELEMENTS or tensor.ndim == 0):
+    precision = "raw"
+  if precision == "int8" and tensor.size//tensor.shape[-1] < MIN_INT8_TOKENS:
+    precision = "fp16"
+  scales = b""
+  if precision == "fp16":
+    data = np.ascontiguousarray(tensor, dtype=np.float16).tobytes()
+  elif precision == "bf16":
+    data = _to_bf16(tensor).tobytes()
+  elif precision == "int8":
+    rows = np.asarray(tensor, dtype=np.float32).reshape(-1, tensor.shape[-1])
+    scale = np.abs(rows).max(axis=0, keepdims=True)/127.0
+    scale[scale == 0] = 1.0
+    data = np.clip(np.rint(rows/scale), -127, 127).astype(np.int8).tobytes()
+    scales = scale.astype(np.float32).tobytes()
+  else:
+    data = tensor.tobytes()
+  compression = codec.compression if codec.compression and len(data) >= MIN_COMPRESS_BYTES else ""
+  return _compress(data, compression), WireCodec(precision, compression), scales
+
+
+def decode_activation(data: bytes, shape: Tuple[int, ...], dtype: str, codec: WireCodec, scales: bytes = b"") -> np.ndarray:
+  data = _decompress(data, codec.compression)
+  if codec.precision == "fp16":
+    values = np.frombuffer(data, dtype=np.float16)
+  elif codec.precision == "bf16":
+    values = _from_bf16(np.frombuffer(data, dtype=np.uint16))
+  elif codec.precision == "int8":
+    rows = np.frombuffer(data, dtype=np.int8).reshape(-1, shape[-1])
+    values = rows.astype(np.float32)*np.frombuffer(scales, dtype=np.float32).reshape(1, -1)
+  else:
+    return np.frombuffer(data, dtype=np.dtype(dtype)).reshape(shape)
+  return values.astype(np.dtype(dtype), copy=False).reshape(shape)
+
+
+class WireStats:
+  """Bytes tensors would have taken raw vs what went on the wire, per codec."""
+  def __init__(self):
+    self.raw_bytes: Dict[str, int] = {}
+    self.wire_bytes: Dict[str, int] = {}
+
+  def record(self, codec: WireCodec, raw_bytes: int, wire_bytes: int) -> None:
+    key = str(codec) or "raw"
+    self.raw_bytes[key] = self.raw_bytes.get(key, 0) + raw_bytes
+    self.wire_bytes[key] = self.wire_bytes.get(key, 0) + wire_bytes
+
+  @property
+  def bytes_saved(self) -> int:
+    return sum(self.raw_bytes.values()) - sum(self.wire_bytes.values())
+
+  def to_dict(self) -> Dict:
+    return {
+      "bytes_saved": self.bytes_saved,
+      "codecs": {codec: {"raw_bytes": self.raw_bytes[codec], "wire_bytes": self.wire_bytes[codec]} for codec in self.raw_bytes},
+    }
+
+
+wire_stats = WireStats()
@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Dict, List, Optional
 from .peer_handle import PeerHandle
+from .swim import SwimMembership
 
 
 class Discovery(ABC):
+  # gossip failure detector over the known peers, None health checks every peer instead
+  membership: Optional[SwimMembership] = None
+
   @abstractmethod
   async def start(self) -> None:
     pass
@@ -15,3 +19,28 @@ class Discovery(ABC):
   @abstractmethod
   async def discover_peers(self, wait_for_peers: int = 0) -> List[PeerHandle]:
     pass
+
+  @abstractmethod
+  def peer_handles(self) -> Dict[str, PeerHandle]:
+    """Known peers by id, the set membership probes."""
+    pass
+
+  @abstractmethod
+  def remove_peer(self, peer_id: str) -> None:
+    pass
+
+  def enable_membership(self, node_id: str, **kwargs) -> SwimMembership:
+    """Has known peers judged by SWIM gossip, peers it declares dead are dropped until discovery finds them again."""
+    self.membership = SwimMembership(node_id, self.peer_handles, on_dead=self.remove_peer, **kwargs)
+    return self.membership
+
+  async def peer_healthy(self, peer_handle: PeerHandle) -> bool:
+    if self.membership is not None and self.membership.knows(peer_handle.id()):
+      return self.membership.is_alive(peer_handle.id())
+    return await peer_handle.health_check()
+
+  def start_membership(self) -> None:
+    if self.membership is not None: self.membership.start()
+
+  async def stop_membership(self) -> None:
+    if self.membership is not None: await self.membership.stop()
@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Tuple
+
+from nidum.networking.rpc_stats import CONTROL, DATA
+
+# NodeService methods by the channel they go over. Small, latency sensitive calls must not queue
+# behind multi-megabyte tensors, or health checks time out and loaded peers get dropped.
+RPC_CLASSES: Dict[str, str] = {
+  "HealthCheck": CONTROL,
+  "Gossip": CONTROL,
+  "CollectTopology": CONTROL,
+  "SyncTopology": CONTROL,
+  "SendOpaqueStatus": CONTROL,
+  "SendResult": CONTROL,
+  "GetInferenceResult": CONTROL,
+  "SendPrompt": DATA,
+  "SendTensor": DATA,
+  "TensorStream": DATA,
+  "SendTensorChunks": DATA,
+  "SendExample": DATA,
+  "SendLoss": DATA,
+  "Probe": DATA,
+}
+
+# largest gRPC message either side sends or accepts, tensors above the chunk size are streamed in chunks
+DEFAULT_MAX_MESSAGE_BYTES = 32*1024*1024
+
+# per traffic class: quick keepalives on control so a dead peer is noticed well before the 5s health
+# check timeout, patient ones on data so a link busy with a big transfer is not torn down
+KEEPALIVE_OPTIONS: Dict[str, List[Tuple[str, Any]]] = {
+  CONTROL: [("grpc.keepalive_time_ms", 10_000), ("grpc.keepalive_timeout_ms", 5_000)],
+  DATA: [("grpc.keepalive_time_ms", 30_000), ("grpc.keepalive_timeout_ms", 20_000)],
+}
+
+
+def message_size_options(max_message_bytes: int) -> List[Tuple[str, Any]]:
+  return [
+    ("grpc.max_metadata_size", 32*1024*1024),
+    ("grpc.max_send_message_length", max_message_bytes),
+    ("grpc.max_receive_message_length", max_message_bytes),
+  ]
+
+
+def channel_options(traffic_class: str, max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES) -> List[Tuple[str, Any]]:
+  return message_size_options(max_message_bytes) + KEEPALIVE_OPTIONS[traffic_class] + [
+    # a subchannel (TCP connection) of its own per channel, otherwise gRPC shares one between channels to the same address
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+  ]
+
+
+def server_options(max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES) -> List[Tuple[str, Any]]:
+  return message_size_options(max_message_bytes) + [
+    # accept the client keepalive pings above instead of answering them with GOAWAY
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.min_recv_ping_interval_without_data_ms", 5_000),
+    ("grpc.http2.max_ping_strikes", 0),
+  ]
@@ -0,0 +1,12 @@
+from typing import Iterable, List
+
+from . import node_service_pb2
+from nidum.networking.swim import MemberUpdate
+
+
+def member_updates_to_proto(updates: Iterable[MemberUpdate]) -> List[node_service_pb2.MemberUpdate]:
+  return [node_service_pb2.MemberUpdate(node_id=update.node_id, state=update.state, incarnation=update.incarnation) for update in updates]
+
+
+def member_updates_from_proto(updates: Iterable[node_service_pb2.MemberUpdate]) -> List[MemberUpdate]:
+  return [MemberUpdate(update.node_id, update.state, update.incarnation) for update in updates]
@@ -1,27 +1,70 @@
 import grpc
 import numpy as np
 import asyncio
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List
 
 from . import node_service_pb2
 from . import node_service_pb2_grpc
+from .tensor_stream import TensorStreamClient, TensorStreamUnavailable
+from .tensor_codec import tensor_from_proto, tensor_to_proto
+from .state_cache import SentStateIndex, StateCacheMiss, content_hash
+from .channels import DEFAULT_MAX_MESSAGE_BYTES, RPC_CLASSES, channel_options
+from .tensor_chunks import DEFAULT_CHUNK_BYTES, chunk_payload, iter_chunks
+from .gossip_codec import member_updates_from_proto, member_updates_to_proto
+from .topology_codec import node_records_from_proto, node_records_to_proto
+from nidum.networking.activation_codec import RAW, WireCodec, select_codec, wire_stats
+from nidum.networking.rpc_stats import CONTROL, DATA, rpc_latency
+from nidum.networking.peer_liveness import PeerLiveness
+from nidum.networking.swim import MemberUpdate
 
 from ..peer_handle import PeerHandle
 from nidum.inference.shard import Shard
+from nidum.inference.tensor_adapters import is_tensor
 from nidum.topology.topology import Topology
+from nidum.topology.topology_store import NodeRecord
 from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
 from nidum.helpers import DEBUG
 import json
-import mlx.core as mx
 
 class GRPCPeerHandle(PeerHandle):
-  def __init__(self, _id: str, address: str, desc: str, device_capabilities: DeviceCapabilities):
+  def __init__(
+    self,
+    _id: str,
+    address: str,
+    desc: str,
+    device_capabilities: DeviceCapabilities,
+    wire_codec: str = "auto",
+    max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    health_ttl: float = 10.0,
+  ):
     self._id = _id
     self.address = address
     self.desc = desc
     self._device_capabilities = device_capabilities
+    # control plane (health, topology, status, results) and data plane (prompts, tensors) get
+    # separate channels, so large tensors cannot hold up health checks
     self.channel = None
     self.stub = None
+    self.data_channel = None
+    self.data_stub = None
+    self.tensor_stream: Optional[TensorStreamClient] = None
+    # cleared when the peer turns out not to serve TensorStream, send_tensor then stays unary
+    self.use_tensor_stream = True
+    self.max_message_bytes = max_message_bytes
+    # tensors above chunk_bytes are streamed in chunks through SendTensorChunks, unless the peer predates it
+    self.chunk_bytes = chunk_bytes
+    self.use_tensor_chunks = True
+    # "auto" picks the activation codec from the link type, negotiated against the peer's codecs on connect
+    self.preferred_wire_codec = wire_codec
+    self.peer_codecs: Optional[List[str]] = None
+    self.wire_codec: WireCodec = RAW
+    # HealthCheck answer from connecting, None until negotiated or when the peer did not answer
+    self.peer_health: Optional[node_service_pb2.HealthCheckResponse] = None
+    # inference_state tensors this peer holds per request, unchanged ones are sent by reference
+    self.sent_state = SentStateIndex()
+    # discovery asks for health on every broadcast, answered from recent RPCs instead of a probe each time
+    self.liveness = PeerLiveness(self._probe_health, healthy_ttl=health_ttl)
 
   def id(self) -> str:
     return self._id
@@ -37,31 +80,54 @@ class GRPCPeerHandle(PeerHandle):
 
   async def connect(self):
     if self.channel is None:
-      self.channel = grpc.aio.insecure_channel(self.address, options=[
-        ("grpc.max_metadata_size", 32*1024*1024),
-        ('grpc.max_receive_message_length', 32*1024*1024),
-        ('grpc.max_send_message_length', 32*1024*1024)
-      ])
+      self.channel = grpc.aio.insecure_channel(self.address, options=channel_options(CONTROL, self.max_message_bytes))
       self.stub = node_service_pb2_grpc.NodeServiceStub(self.channel)
-    await self.channel.channel_ready()
+      self.data_channel = grpc.aio.insecure_channel(self.address, options=channel_options(DATA, self.max_message_bytes))
+      self.data_stub = node_service_pb2_grpc.NodeServiceStub(self.data_channel)
+      self.tensor_stream = TensorStreamClient(self.data_stub)
+    await asyncio.gather(self.channel.channel_ready(), self.data_channel.channel_ready())
+    if self.peer_codecs is None:
+      await self.negotiate_wire_codec()
+
+  async def negotiate_wire_codec(self) -> None:
+    try:
+      self.peer_health = await self._call("HealthCheck", node_service_pb2.HealthCheckRequest(), timeout=5)
+      self.peer_codecs = list(self.peer_health.codecs)
+    except Exception as e:
+      if DEBUG >= 1: print(f"Codec negotiation with {self._id}@{self.address} failed, sending raw tensors: {e}")
+      self.peer_codecs = []
+    self.wire_codec = select_codec(self.desc, self.peer_codecs, self.preferred_wire_codec)
+    if DEBUG >= 2: print(f"Wire codec for {self._id}@{self.address} ({self.desc}): {self.wire_codec}")
 
   async def is_connected(self) -> bool:
     return self.channel is not None and self.channel.get_state() == grpc.ChannelConnectivity.READY
 
   async def disconnect(self):
-    if self.channel:
-      await self.channel.close()
+    if self.tensor_stream is not None:
+      await self.tensor_stream.close()
+      self.tensor_stream = None
+    for channel in (self.channel, self.data_channel):
+      if channel:
+        await channel.close()
     self.channel = None
     self.stub = None
+    self.data_channel = None
+    self.data_stub = None
+    self.peer_codecs = None
+    self.peer_health = None
+    self.liveness.invalidate()
 
   async def _ensure_connected(self):
     if not await self.is_connected(): await asyncio.wait_for(self.connect(), timeout=5)
 
   async def health_check(self) -> bool:
+    return await self.liveness.check()
+
+  async def _probe_health(self) -> bool:
     try:
       await self._ensure_connected()
       request = node_service_pb2.HealthCheckRequest()
-      response = await asyncio.wait_for(self.stub.HealthCheck(request), timeout=5)
+      response = await self._call("HealthCheck", request, timeout=5)
       return response.is_healthy
     except asyncio.TimeoutError:
       return False
@@ -72,44 +138,115 @@ class GRPCPeerHandle(PeerHandle):
         traceback.print_exc()
       return False
 
-  async def send_prompt(self, shard: Shard, prompt: str, inference_state: Optional[dict] = None, request_id: Optional[str] = None) -> Optional[np.array]:
-    request = node_service_pb2.PromptRequest(
-      prompt=prompt,
-      shard=node_service_pb2.Shard(
-        model_id=shard.model_id,
-        start_layer=shard.start_layer,
-        end_layer=shard.end_layer,
-        n_layers=shard.n_layers,
-      ),
-      request_id=request_id,
-      inference_state=None if inference_state is None else self.serialize_inference_state(inference_state)
-    )
-    response = await self.stub.SendPrompt(request)
-
-    if not response.tensor_data or not response.shape or not response.dtype:
-      return None
+  async def send_prompt(self, shard: Shard, prompt: str, inference_state: Optional[dict] = None, request_id: Optional[str] = None, request_metadata: Optional[Dict[str, str]] = None) -> Optional[np.array]:
+    async def send(state: Optional[node_service_pb2.InferenceState]) -> node_service_pb2.Tensor:
+      request = node_service_pb2.PromptRequest(
+        prompt=prompt,
+        shard=node_service_pb2.Shard(
+          model_id=shard.model_id,
+          start_layer=shard.start_layer,
+          end_layer=shard.end_layer,
+          n_layers=shard.n_layers,
+        ),
+        request_id=request_id,
+        inference_state=state,
+        request_metadata=request_metadata,
+      )
+      return await self._call("SendPrompt", request)
+    response = await self._send_with_inference_state(request_id, inference_state, send)
 
-    return np.frombuffer(response.tensor_data, dtype=np.dtype(response.dtype)).reshape(response.shape)
+    return tensor_from_proto(response)
 
-  async def send_tensor(self, shard: Shard, tensor: np.ndarray, inference_state: Optional[dict] = None, request_id: Optional[str] = None) -> Optional[np.array]:
-    request = node_service_pb2.TensorRequest(
-      shard=node_service_pb2.Shard(
-        model_id=shard.model_id,
-        start_layer=shard.start_layer,
-        end_layer=shard.end_layer,
-        n_layers=shard.n_layers,
-      ),
-      tensor=node_service_pb2.Tensor(tensor_data=tensor.tobytes(), shape=tensor.shape, dtype=str(tensor.dtype)),
-      request_id=request_id,
-      inference_state=None if inference_state is None else self.serialize_inference_state(inference_state)
-    )
-    response = await self.stub.SendTensor(request)
+  async def send_tensor(self, shard: Shard, tensor: np.ndarray, inference_state: Optional[dict] = None, request_id: Optional[str] = None, request_metadata: Optional[Dict[str, str]] = None) -> Optional[np.array]:
+    chunked = self.use_tensor_chunks and tensor.nbytes > self.chunk_bytes
+    encoded = None if chunked else self.encode_tensor(tensor)
+    async def send(state: Optional[node_service_pb2.InferenceState]) -> node_service_pb2.Tensor:
+      request = node_service_pb2.TensorRequest(
+        shard=node_service_pb2.Shard(
+          model_id=shard.model_id,
+          start_layer=shard.start_layer,
+          end_layer=shard.end_layer,
+          n_layers=shard.n_layers,
+        ),
+        tensor=encoded,
+        request_id=request_id,
+        inference_state=state,
+        request_metadata=request_metadata,
+      )
+      if chunked:
+        return await self._send_tensor_chunks(request, tensor)
+      return await self._send_tensor_request(request)
+    response = await self._send_with_inference_state(request_id, inference_state, send)
 
-    if not response.tensor_data or not response.shape or not response.dtype:
-      return None
+    return tensor_from_proto(response)
 
-    return np.frombuffer(response.tensor_data, dtype=np.dtype(response.dtype)).reshape(response.shape)
+  async def _send_with_inference_state(self, request_id: Optional[str], inference_state: Optional[dict], send):
+    """send(serialized inference_state), once more with the missed tensors in full if the peer no longer holds them."""
+    try:
+      return await send(None if inference_state is None else self.serialize_inference_state(inference_state, request_id))
+    except Exception as e:
+      miss = None if inference_state is None else StateCacheMiss.from_error(e)
+      if miss is None:
+        raise
+      if DEBUG >= 2: print(f"[{request_id}] {self._id}@{self.address} missed inference state {miss.keys}, resending")
+      self.sent_state.forget(request_id, miss.keys)
+      return await send(self.serialize_inference_state(inference_state, request_id))
   
+  async def gossip(self, target_id: str, updates: List[MemberUpdate]) -> Tuple[bool, List[MemberUpdate]]:
+    await self._ensure_connected()
+    request = node_service_pb2.GossipRequest(target_id=target_id, updates=member_updates_to_proto(updates))
+    try:
+      response = await self._call("Gossip", request)
+    except grpc.aio.AioRpcError as e:
+      # a node running without membership still answered, which is all a direct ping asks
+      if e.code() == grpc.StatusCode.UNIMPLEMENTED and not target_id:
+        return True, []
+      raise
+    return response.ack, member_updates_from_proto(response.updates)
+
+  def encode_tensor(self, tensor: np.ndarray) -> node_service_pb2.Tensor:
+    proto, codec = tensor_to_proto(tensor, self.wire_codec)
+    wire_stats.record(codec, tensor.nbytes, len(proto.tensor_data))
+    return proto
+
+  async def _call(self, method: str, request, timeout: Optional[float] = None):
+    traffic_class = RPC_CLASSES[method]
+    stub = self.stub if traffic_class == CONTROL else self.data_stub
+    try:
+      with rpc_latency.timed(traffic_class):
+        response = await asyncio.wait_for(getattr(stub, method)(request), timeout=timeout)
+    except grpc.aio.AioRpcError as e:
+      if e.code() == grpc.StatusCode.UNAVAILABLE: self.liveness.invalidate()
+      raise
+    self.liveness.record_success()
+    return response
+
+  async def _send_tensor_chunks(self, request: node_service_pb2.TensorRequest, tensor: np.ndarray) -> node_service_pb2.Tensor:
+    header, payload, codec = chunk_payload(tensor, self.wire_codec)
+    wire_stats.record(codec, tensor.nbytes, len(payload))
+    request.tensor.CopyFrom(header)
+    try:
+      return await self._call("SendTensorChunks", iter_chunks(request, payload, self.chunk_bytes))
+    except grpc.aio.AioRpcError as e:
+      if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+        raise
+    if DEBUG >= 1: print(f"{self._id}@{self.address} does not serve SendTensorChunks, sending tensors whole")
+    self.use_tensor_chunks = False
+    request.tensor.CopyFrom(self.encode_tensor(tensor))
+    return await self._send_tensor_request(request)
+
+  async def _send_tensor_request(self, request: node_service_pb2.TensorRequest) -> node_service_pb2.Tensor:
+    if self.use_tensor_stream and self.tensor_stream is not None:
+      try:
+        with rpc_latency.timed(DATA):
+          ack = await self.tensor_stream.send(request)
+        self.liveness.record_success()
+        return ack.tensor
+      except TensorStreamUnavailable:
+        if DEBUG >= 1: print(f"{self._id}@{self.address} does not serve TensorStream, falling back to unary SendTensor")
+        self.use_tensor_stream = False
+    return await self._call("SendTensor", request)
+
   async def send_example(self, shard: Shard, example: np.ndarray, target: np.ndarray, length: np.ndarray, train: bool, request_id: Optional[str] = None) -> Optional[np.array]:
     request = node_service_pb2.ExampleRequest(
       shard=node_service_pb2.Shard(
@@ -118,16 +255,16 @@ class GRPCPeerHandle(PeerHandle):
         end_layer=shard.end_layer,
         n_layers=shard.n_layers,
       ),
-      example=node_service_pb2.Tensor(tensor_data=example.tobytes(), shape=example.shape, dtype=str(example.dtype)),
-      target=node_service_pb2.Tensor(tensor_data=target.tobytes(), shape=target.shape, dtype=str(target.dtype)),
-      length=node_service_pb2.Tensor(tensor_data=length.tobytes(), shape=length.shape, dtype=str(length.dtype)),
+      example=tensor_to_proto(example)[0],
+      target=tensor_to_proto(target)[0],
+      length=tensor_to_proto(length)[0],
       train=train,
       request_id=request_id,
     )
-    response = await self.stub.SendExample(request)
+    response = await self._call("SendExample", request)
     loss = response.loss
     if train and not shard.is_first_layer():
-      grads = np.frombuffer(response.grads.tensor_data, dtype=np.dtype(response.grads.dtype)).reshape(response.grads.shape)
+      grads = tensor_from_proto(response.grads)
       return loss, grads
     else:
       return loss
@@ -140,29 +277,26 @@ class GRPCPeerHandle(PeerHandle):
         end_layer=shard.end_layer,
         n_layers=shard.n_layers,
       ),
-      tensor=node_service_pb2.Tensor(tensor_data=tensor.tobytes(), shape=tensor.shape, dtype=str(tensor.dtype)),
+      tensor=tensor_to_proto(tensor)[0],
       request_id=request_id,
     )
-    response = await self.stub.SendLoss(request)
-
-    if not response.tensor_data or not response.shape or not response.dtype:
-      return None
+    response = await self._call("SendLoss", request)
 
-    return np.frombuffer(response.tensor_data, dtype=np.dtype(response.dtype)).reshape(response.shape)
+    return tensor_from_proto(response)
 
   async def get_inference_result(self, request_id: str) -> Tuple[Optional[np.ndarray], bool]:
     request = node_service_pb2.GetInferenceResultRequest(request_id=request_id)
-    response = await self.stub.GetInferenceResult(request)
-    if response.tensor is None:
+    response = await self._call("GetInferenceResult", request)
+    if not response.HasField("tensor"):
       return None, response.is_finished
     return (
-      np.frombuffer(response.tensor.tensor_data, dtype=np.dtype(response.tensor.dtype)).reshape(response.tensor.shape),
+      tensor_from_proto(response.tensor),
       response.is_finished,
     )
 
   async def collect_topology(self, visited: set[str], max_depth: int) -> Topology:
     request = node_service_pb2.CollectTopologyRequest(visited=visited, max_depth=max_depth)
-    response = await self.stub.CollectTopology(request)
+    response = await self._call("CollectTopology", request)
     topology = Topology()
     for node_id, capabilities in response.nodes.items():
       device_capabilities = DeviceCapabilities(
@@ -177,44 +311,53 @@ class GRPCPeerHandle(PeerHandle):
         topology.add_edge(node_id, conn.to_id, conn.description)
     return topology
 
-  async def send_result(self, request_id: str, result: List[int], is_finished: bool) -> None:
+  async def probe(self, payload: bytes, timeout: Optional[float] = None) -> None:
+    await self._ensure_connected()
+    await self._call("Probe", node_service_pb2.ProbeRequest(payload=payload), timeout=timeout)
+
+  async def sync_topology(self, versions: Dict[str, int], records: List[NodeRecord]) -> Tuple[List[NodeRecord], Dict[str, int]]:
+    request = node_service_pb2.TopologySyncRequest(versions=versions, records=node_records_to_proto(records))
+    response = await self._call("SyncTopology", request)
+    return node_records_from_proto(response.records), dict(response.versions)
+
+  async def send_result(self, request_id: str, result: List[int], is_finished: bool, start_index: int = 0, node_id: Optional[str] = None) -> None:
     tensor = None
     if isinstance(result, np.ndarray):
-      tensor = node_service_pb2.Tensor(tensor_data=result.tobytes(), shape=result.shape, dtype=str(result.dtype))
+      tensor = tensor_to_proto(result)[0]
       result = []
-    request = node_service_pb2.SendResultRequest(request_id=request_id, result=result, tensor=tensor, is_finished=is_finished)
-    await self.stub.SendResult(request)
+    request = node_service_pb2.SendResultRequest(request_id=request_id, result=result, tensor=tensor, is_finished=is_finished, start_index=start_index, node_id=node_id)
+    await self._call("SendResult", request)
 
   async def send_opaque_status(self, request_id: str, status: str) -> None:
     request = node_service_pb2.SendOpaqueStatusRequest(request_id=request_id, status=status)
-    await self.stub.SendOpaqueStatus(request)
+    await self._call("SendOpaqueStatus", request)
 
-  def serialize_inference_state(self, inference_state: dict) -> node_service_pb2.InferenceState:
+  def serialize_inference_state(self, inference_state: dict, request_id: Optional[str] = None) -> node_service_pb2.InferenceState:
     proto_inference_state = node_service_pb2.InferenceState()
     other_data = {}
+    sent = self.sent_state.sent(request_id) if request_id else {}
+    hashes = {}
     for k, v in inference_state.items():
-        if isinstance(v, mx.array):
-            np_array = np.array(v)
-            tensor_data = node_service_pb2.Tensor(
-                tensor_data=np_array.tobytes(),
-                shape=list(np_array.shape),
-                dtype=str(np_array.dtype)
-            )
-            proto_inference_state.tensor_data[k].CopyFrom(tensor_data)
-        elif isinstance(v, list) and all(isinstance(item, mx.array) for item in v):
+        is_tensor_list = isinstance(v, list) and all(is_tensor(item) for item in v)
+        if request_id and (is_tensor(v) or is_tensor_list):
+            digest = content_hash(v)
+            if sent.get(k) == digest:
+                proto_inference_state.tensor_refs[k] = digest
+                self.sent_state.refs_sent += 1
+                self.sent_state.bytes_saved += sum(tensor.nbytes for tensor in (v if is_tensor_list else [v]))
+                continue
+            proto_inference_state.tensor_hashes[k] = hashes[k] = digest
+        if is_tensor(v):
+            proto_inference_state.tensor_data[k].CopyFrom(tensor_to_proto(v)[0])
+        elif is_tensor_list:
             tensor_list = node_service_pb2.TensorList()
-            for tensor in v:
-                np_array = np.array(tensor)
-                tensor_data = node_service_pb2.Tensor(
-                    tensor_data=np_array.tobytes(),
-                    shape=list(np_array.shape),
-                    dtype=str(np_array.dtype)
-                )
-                tensor_list.tensors.append(tensor_data)
+            tensor_list.tensors.extend(tensor_to_proto(tensor)[0] for tensor in v)
             proto_inference_state.tensor_list_data[k].CopyFrom(tensor_list)
         else:
             # For non-tensor data, we'll still use JSON
             other_data[k] = v
     if other_data:
       proto_inference_state.other_data_json = json.dumps(other_data)
+    if request_id:
+      self.sent_state.record(request_id, hashes)
     return proto_inference_state
@@ -2,39 +2,57 @@ import grpc
 from concurrent import futures
 import numpy as np
 from asyncio import CancelledError
+from typing import Optional
 
 from . import node_service_pb2
 from . import node_service_pb2_grpc
+from .tensor_stream import serve_tensor_stream
+from .tensor_codec import tensor_from_proto, tensor_to_proto
+from .state_cache import ResidentStateCache, StateCacheMiss
+from .channels import DEFAULT_MAX_MESSAGE_BYTES, server_options
+from .tensor_chunks import assemble_chunks
+from .gossip_codec import member_updates_from_proto, member_updates_to_proto
+from .topology_codec import node_records_from_proto, node_records_to_proto
+from nidum.networking.shm.shm_server import ShmServer
+from nidum.networking.activation_codec import supported_codecs
 from nidum import DEBUG
 from nidum.inference.shard import Shard
+from nidum.inference.tensor_adapters import adapter_for_engine, to_engine
 from nidum.orchestration import Node
+from nidum.orchestration.status_broadcaster import unpack_status_batch
 import json
-import mlx.core as mx
 
 
 class GRPCServer(node_service_pb2_grpc.NodeServiceServicer):
-  def __init__(self, node: Node, host: str, port: int):
+  def __init__(self, node: Node, host: str, port: int, shm_socket: Optional[str] = None, max_message_bytes: int = DEFAULT_MAX_MESSAGE_BYTES):
     self.node = node
     self.host = host
     self.port = port
+    self.max_message_bytes = max_message_bytes
     self.server = None
+    # same-host peers send tensors through shared memory, announced to them in HealthCheck
+    self.shm_server = None if shm_socket is None else ShmServer(self.handle_tensor_request, shm_socket)
+    self.resident_state = ResidentStateCache(node.request_state.store("resident_inference_state"))
 
   async def start(self) -> None:
     self.server = grpc.aio.server(
       futures.ThreadPoolExecutor(max_workers=10),
-      options=[
-        ("grpc.max_metadata_size", 32*1024*1024),
-        ("grpc.max_send_message_length", 128*1024*1024),
-        ("grpc.max_receive_message_length", 128*1024*1024),
-      ],
+      options=server_options(self.max_message_bytes),
     )
     node_service_pb2_grpc.add_NodeServiceServicer_to_server(self, self.server)
     listen_addr = f"{self.host}:{self.port}"
     self.server.add_insecure_port(listen_addr)
     await self.server.start()
     if DEBUG >= 1: print(f"Server started, listening on {listen_addr}")
+    if self.shm_server is not None:
+      try:
+        await self.shm_server.start()
+      except OSError as e:
+        if DEBUG >= 1: print(f"Shared memory transport unavailable: {e}")
 
   async def stop(self) -> None:
+    if self.shm_server is not None:
+      await self.shm_server.stop()
     if self.server:
       try:
         await self.server.stop(grace=5)
@@ -52,28 +70,48 @@ class GRPCServer(node_service_pb2_grpc.NodeServiceServicer):
     )
     prompt = request.prompt
     request_id = request.request_id
-    inference_state = None if request.inference_state is None else self.deserialize_inference_state(request.inference_state)
-    result = await self.node.process_prompt(shard, prompt, request_id, inference_state)
+    try:
+      inference_state = self.deserialize_inference_state(request.inference_state, request_id)
+    except StateCacheMiss as e:
+      await context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+    result = await self.node.process_prompt(shard, prompt, request_id, inference_state, dict(request.request_metadata))
     if DEBUG >= 5: print(f"SendPrompt {shard=} {prompt=} {request_id=} result: {result}")
-    tensor_data = result.tobytes() if result is not None else None
-    return node_service_pb2.Tensor(tensor_data=tensor_data, shape=result.shape, dtype=str(result.dtype)) if result is not None else node_service_pb2.Tensor()
+    return node_service_pb2.Tensor() if result is None else tensor_to_proto(result)[0]
 
   async def SendTensor(self, request, context):
+    try:
+      return await self.handle_tensor_request(request)
+    except StateCacheMiss as e:
+      await context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+
+  async def SendTensorChunks(self, request_iterator, context):
+    request, tensor = await assemble_chunks(request_iterator)
+    try:
+      return await self.handle_tensor_request(request, tensor)
+    except StateCacheMiss as e:
+      await context.abort(grpc.StatusCode.FAILED_PRECONDITION, str(e))
+
+  async def TensorStream(self, request_iterator, context):
+    async for ack in serve_tensor_stream(request_iterator, self.handle_tensor_request):
+      yield ack
+
+  async def handle_tensor_request(self, request, tensor: Optional[np.ndarray] = None) -> node_service_pb2.Tensor:
     shard = Shard(
       model_id=request.shard.model_id,
       start_layer=request.shard.start_layer,
       end_layer=request.shard.end_layer,
       n_layers=request.shard.n_layers,
     )
-    tensor = np.frombuffer(request.tensor.tensor_data, dtype=np.dtype(request.tensor.dtype)).reshape(request.tensor.shape)
+    if tensor is None:
+      tensor = tensor_from_proto(request.tensor)
     request_id = request.request_id
 
-    inference_state = None if request.inference_state is None else self.deserialize_inference_state(request.inference_state)
+    # raises StateCacheMiss before anything runs when the sender referenced state this node no longer holds
+    inference_state = self.deserialize_inference_state(request.inference_state, request_id)
 
-    result = await self.node.process_tensor(shard, tensor, request_id, inference_state)
+    result = await self.node.process_tensor(shard, tensor, request_id, inference_state, dict(request.request_metadata))
     if DEBUG >= 5: print(f"SendTensor tensor {shard=} {tensor=} {request_id=} result: {result}")
-    tensor_data = result.tobytes() if result is not None else None
-    return node_service_pb2.Tensor(tensor_data=tensor_data, shape=result.shape, dtype=str(result.dtype)) if result is not None else node_service_pb2.Tensor()
+    return node_service_pb2.Tensor() if result is None else tensor_to_proto(result)[0]
   
   async def SendExample(self, request, context):
     shard = Shard(
@@ -82,17 +120,15 @@ class GRPCServer(node_service_pb2_grpc.NodeServiceServicer):
       end_layer=request.shard.end_layer,
       n_layers=request.shard.n_layers,
     )
-    example = np.frombuffer(request.example.tensor_data, dtype=np.dtype(request.example.dtype)).reshape(request.example.shape)
-    target = np.frombuffer(request.target.tensor_data, dtype=np.dtype(request.target.dtype)).reshape(request.target.shape)
-    length = np.frombuffer(request.length.tensor_data, dtype=np.dtype(request.length.dtype)).reshape(request.length.shape)
+    example = tensor_from_proto(request.example)
+    target = tensor_from_proto(request.target)
+    length = tensor_from_proto(request.length)
     train = request.train
     request_id = request.request_id
 
     if train and not shard.is_first_layer():
       loss, grad = await self.node.process_example(shard, example, target, length, train, request_id)
-      tensor_data = grad.tobytes()
-      grad_tensor = node_service_pb2.Tensor(tensor_data=tensor_data, shape=grad.shape, dtype=str(grad.dtype))
-      return node_service_pb2.Loss(loss=loss, grads=grad_tensor)
+      return node_service_pb2.Loss(loss=loss, grads=tensor_to_proto(grad)[0])
     else:
       loss = await self.node.process_example(shard, example, target, length, train, request_id)
       return node_service_pb2.Loss(loss=loss, grads=None)
@@ -123,40 +159,57 @@ class GRPCServer(node_service_pb2_grpc.NodeServiceServicer):
     if DEBUG >= 5: print(f"CollectTopology {max_depth=} {visited=} {nodes=} {peer_graph=}")
     return node_service_pb2.Topology(nodes=nodes, peer_graph=peer_graph)
 
+  async def Probe(self, request, context):
+    return node_service_pb2.Empty()
+
+  async def SyncTopology(self, request, context):
+    records, versions = self.node.sync_topology_from_peer(node_records_from_proto(request.records), dict(request.versions))
+    return node_service_pb2.TopologySyncResponse(versions=versions, records=node_records_to_proto(records))
+
+  async def GetInferenceResult(self, request, context):
+    result, is_finished = await self.node.get_inference_result(request.request_id)
+    tensor = None if result is None else tensor_to_proto(result)[0]
+    return node_service_pb2.InferenceResult(tensor=tensor, is_finished=is_finished)
+
   async def SendResult(self, request, context):
     request_id = request.request_id
     result = request.result
     is_finished = request.is_finished
-    img = request.tensor
-    if DEBUG >= 5: print(f"Received SendResult request: {request_id=} {result=} {is_finished=}")
-    result = list(result)
-    if len(img.tensor_data) > 0:
-      result=np.frombuffer(img.tensor_data, dtype=np.dtype(img.dtype)).reshape(img.shape)
-    self.node.on_token.trigger_all(request_id, result, is_finished)
+    img = tensor_from_proto(request.tensor)
+    if DEBUG >= 5: print(f"Received SendResult request: {request_id=} {result=} {is_finished=} start_index={request.start_index}")
+    result = list(result) if img is None else img
+    self.node.receive_result(request_id, result, is_finished, request.start_index, request.node_id if request.HasField("node_id") else None)
     return node_service_pb2.Empty()
 
   async def SendOpaqueStatus(self, request, context):
     request_id = request.request_id
     status = request.status
     if DEBUG >= 8: print(f"Received SendOpaqueStatus request: {request_id=} {status=}")
-    self.node.on_opaque_status.trigger_all(request_id, status)
+    for event_request_id, event_status in unpack_status_batch(request_id, status):
+      self.node.on_opaque_status.trigger_all(event_request_id, event_status)
     return node_service_pb2.Empty()
 
   async def HealthCheck(self, request, context):
-    return node_service_pb2.HealthCheckResponse(is_healthy=True)
+    shm = self.shm_server if self.shm_server is not None and self.shm_server.is_serving else None
+    return node_service_pb2.HealthCheckResponse(
+      is_healthy=True,
+      codecs=supported_codecs(),
+      shm_socket=shm.path if shm else "",
+      shm_probe=shm.probe_name if shm else "",
+    )
+
+  async def Gossip(self, request, context):
+    membership = self.node.discovery.membership
+    if membership is None:
+      await context.abort(grpc.StatusCode.UNIMPLEMENTED, "gossip membership is not enabled on this node")
+    ack, updates = await membership.handle_gossip(request.target_id, member_updates_from_proto(request.updates))
+    return node_service_pb2.GossipResponse(ack=ack, updates=member_updates_to_proto(updates))
 
-  def deserialize_inference_state(self,inference_state_proto: node_service_pb2.InferenceState) -> dict:
+  def deserialize_inference_state(self,inference_state_proto: node_service_pb2.InferenceState, request_id: Optional[str] = None) -> dict:
     inference_state = {}
-    
-    for k, tensor_data in inference_state_proto.tensor_data.items():
-        np_array = np.frombuffer(tensor_data.tensor_data, dtype=tensor_data.dtype).reshape(tensor_data.shape)
-        inference_state[k] = mx.array(np_array)
-    
-    for k, tensor_list in inference_state_proto.tensor_list_data.items():
-        inference_state[k] = [
-            mx.array(np.frombuffer(tensor.tensor_data, dtype=tensor.dtype).reshape(tensor.shape))
-            for tensor in tensor_list.tensors
-        ]
+    adapter = adapter_for_engine(self.node.inference_engine)
+    for k, value in self.resident_state.resolve(request_id, inference_state_proto).items():
+        inference_state[k] = [to_engine(adapter, tensor) for tensor in value] if isinstance(value, list) else to_engine(adapter, value)
     
     if inference_state_proto.other_data_json:
         other_data = json.loads(inference_state_proto.other_data_json)
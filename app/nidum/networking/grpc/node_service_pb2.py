@@ -24,71 +24,121 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n&exo/networking/grpc/node_service.proto\x12\x0cnode_service\"S\n\x05Shard\x12\x10\n\x08model_id\x18\x01 \x01(\t\x12\x13\n\x0bstart_layer\x18\x02 \x01(\x05\x12\x11\n\tend_layer\x18\x03 \x01(\x05\x12\x10\n\x08n_layers\x18\x04 \x01(\x05\"\xbb\x01\n\rPromptRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12\x0e\n\x06prompt\x18\x02 \x01(\t\x12\x17\n\nrequest_id\x18\x03 \x01(\tH\x00\x88\x01\x01\x12:\n\x0finference_state\x18\x04 \x01(\x0b\x32\x1c.node_service.InferenceStateH\x01\x88\x01\x01\x42\r\n\x0b_request_idB\x12\n\x10_inference_state\"\xd1\x01\n\rTensorRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12$\n\x06tensor\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor\x12\x17\n\nrequest_id\x18\x03 \x01(\tH\x00\x88\x01\x01\x12:\n\x0finference_state\x18\x04 \x01(\x0b\x32\x1c.node_service.InferenceStateH\x01\x88\x01\x01\x42\r\n\x0b_request_idB\x12\n\x10_inference_state\"\xde\x01\n\x0e\x45xampleRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12%\n\x07\x65xample\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor\x12$\n\x06target\x18\x03 \x01(\x0b\x32\x14.node_service.Tensor\x12$\n\x06length\x18\x04 \x01(\x0b\x32\x14.node_service.Tensor\x12\r\n\x05train\x18\x05 \x01(\x08\x12\x17\n\nrequest_id\x18\x06 \x01(\tH\x00\x88\x01\x01\x42\r\n\x0b_request_id\"H\n\x04Loss\x12\x0c\n\x04loss\x18\x01 \x01(\x02\x12(\n\x05grads\x18\x02 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x42\x08\n\x06_grads\"/\n\x19GetInferenceResultRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\"\\\n\x0fInferenceResult\x12)\n\x06tensor\x18\x01 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x12\x13\n\x0bis_finished\x18\x02 \x01(\x08\x42\t\n\x07_tensor\";\n\x06Tensor\x12\x13\n\x0btensor_data\x18\x01 \x01(\x0c\x12\r\n\x05shape\x18\x02 \x03(\x05\x12\r\n\x05\x64type\x18\x03 \x01(\t\"3\n\nTensorList\x12%\n\x07tensors\x18\x01 \x03(\x0b\x32\x14.node_service.Tensor\"\xd2\x02\n\x0eInferenceState\x12\x41\n\x0btensor_data\x18\x01 \x03(\x0b\x32,.node_service.InferenceState.TensorDataEntry\x12J\n\x10tensor_list_data\x18\x02 \x03(\x0b\x32\x30.node_service.InferenceState.TensorListDataEntry\x12\x17\n\x0fother_data_json\x18\x03 \x01(\t\x1aG\n\x0fTensorDataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12#\n\x05value\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor:\x02\x38\x01\x1aO\n\x13TensorListDataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\'\n\x05value\x18\x02 \x01(\x0b\x32\x18.node_service.TensorList:\x02\x38\x01\"<\n\x16\x43ollectTopologyRequest\x12\x0f\n\x07visited\x18\x01 \x03(\t\x12\x11\n\tmax_depth\x18\x02 \x01(\x05\"\x98\x02\n\x08Topology\x12\x30\n\x05nodes\x18\x01 \x03(\x0b\x32!.node_service.Topology.NodesEntry\x12\x39\n\npeer_graph\x18\x02 \x03(\x0b\x32%.node_service.Topology.PeerGraphEntry\x1aN\n\nNodesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12/\n\x05value\x18\x02 \x01(\x0b\x32 .node_service.DeviceCapabilities:\x02\x38\x01\x1aO\n\x0ePeerGraphEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12,\n\x05value\x18\x02 \x01(\x0b\x32\x1d.node_service.PeerConnections:\x02\x38\x01\"I\n\x0ePeerConnection\x12\r\n\x05to_id\x18\x01 \x01(\t\x12\x18\n\x0b\x64\x65scription\x18\x02 \x01(\tH\x00\x88\x01\x01\x42\x0e\n\x0c_description\"D\n\x0fPeerConnections\x12\x31\n\x0b\x63onnections\x18\x01 \x03(\x0b\x32\x1c.node_service.PeerConnection\"7\n\x0b\x44\x65viceFlops\x12\x0c\n\x04\x66p32\x18\x01 \x01(\x01\x12\x0c\n\x04\x66p16\x18\x02 \x01(\x01\x12\x0c\n\x04int8\x18\x03 \x01(\x01\"k\n\x12\x44\x65viceCapabilities\x12\r\n\x05model\x18\x01 \x01(\t\x12\x0c\n\x04\x63hip\x18\x02 \x01(\t\x12\x0e\n\x06memory\x18\x03 \x01(\x05\x12(\n\x05\x66lops\x18\x04 \x01(\x0b\x32\x19.node_service.DeviceFlops\"\x82\x01\n\x11SendResultRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06result\x18\x02 \x03(\x05\x12)\n\x06tensor\x18\x03 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x12\x13\n\x0bis_finished\x18\x04 \x01(\x08\x42\t\n\x07_tensor\"=\n\x17SendOpaqueStatusRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\"\x14\n\x12HealthCheckRequest\")\n\x13HealthCheckResponse\x12\x12\n\nis_healthy\x18\x01 \x01(\x08\"\x07\n\x05\x45mpty2\xf7\x04\n\x0bNodeService\x12\x41\n\nSendPrompt\x12\x1b.node_service.PromptRequest\x1a\x14.node_service.Tensor\"\x00\x12\x41\n\nSendTensor\x12\x1b.node_service.TensorRequest\x1a\x14.node_service.Tensor\"\x00\x12\x41\n\x0bSendExample\x12\x1c.node_service.ExampleRequest\x1a\x12.node_service.Loss\"\x00\x12^\n\x12GetInferenceResult\x12\'.node_service.GetInferenceResultRequest\x1a\x1d.node_service.InferenceResult\"\x00\x12Q\n\x0f\x43ollectTopology\x12$.node_service.CollectTopologyRequest\x1a\x16.node_service.Topology\"\x00\x12\x44\n\nSendResult\x12\x1f.node_service.SendResultRequest\x1a\x13.node_service.Empty\"\x00\x12P\n\x10SendOpaqueStatus\x12%.node_service.SendOpaqueStatusRequest\x1a\x13.node_service.Empty\"\x00\x12T\n\x0bHealthCheck\x12 .node_service.HealthCheckRequest\x1a!.node_service.HealthCheckResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n&exo/networking/grpc/node_service.proto\x12\x0cnode_service\"S\n\x05Shard\x12\x10\n\x08model_id\x18\x01 \x01(\t\x12\x13\n\x0bstart_layer\x18\x02 \x01(\x05\x12\x11\n\tend_layer\x18\x03 \x01(\x05\x12\x10\n\x08n_layers\x18\x04 \x01(\x05\"\xbf\x02\n\rPromptRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12\x0e\n\x06prompt\x18\x02 \x01(\t\x12\x17\n\nrequest_id\x18\x03 \x01(\tH\x00\x88\x01\x01\x12:\n\x0finference_state\x18\x04 \x01(\x0b\x32\x1c.node_service.InferenceStateH\x01\x88\x01\x01\x12J\n\x10request_metadata\x18\x05 \x03(\x0b\x32\x30.node_service.PromptRequest.RequestMetadataEntry\x1a\x36\n\x14RequestMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\x42\r\n\x0b_request_idB\x12\n\x10_inference_state\"\xd5\x02\n\rTensorRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12$\n\x06tensor\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor\x12\x17\n\nrequest_id\x18\x03 \x01(\tH\x00\x88\x01\x01\x12:\n\x0finference_state\x18\x04 \x01(\x0b\x32\x1c.node_service.InferenceStateH\x01\x88\x01\x01\x12J\n\x10request_metadata\x18\x05 \x03(\x0b\x32\x30.node_service.TensorRequest.RequestMetadataEntry\x1a\x36\n\x14RequestMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\x42\r\n\x0b_request_idB\x12\n\x10_inference_state\"H\n\x0bTensorFrame\x12\x0b\n\x03seq\x18\x01 \x01(\x04\x12,\n\x07request\x18\x02 \x01(\x0b\x32\x1b.node_service.TensorRequest\"^\n\x0bTensorChunk\x12,\n\x07request\x18\x01 \x01(\x0b\x32\x1b.node_service.TensorRequest\x12\x13\n\x0btotal_bytes\x18\x02 \x01(\x04\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\"l\n\tTensorAck\x12\x0b\n\x03seq\x18\x01 \x01(\x04\x12)\n\x06tensor\x18\x02 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x12\x12\n\x05\x65rror\x18\x03 \x01(\tH\x01\x88\x01\x01\x42\t\n\x07_tensorB\x08\n\x06_error\"\xde\x01\n\x0e\x45xampleRequest\x12\"\n\x05shard\x18\x01 \x01(\x0b\x32\x13.node_service.Shard\x12%\n\x07\x65xample\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor\x12$\n\x06target\x18\x03 \x01(\x0b\x32\x14.node_service.Tensor\x12$\n\x06length\x18\x04 \x01(\x0b\x32\x14.node_service.Tensor\x12\r\n\x05train\x18\x05 \x01(\x08\x12\x17\n\nrequest_id\x18\x06 \x01(\tH\x00\x88\x01\x01\x42\r\n\x0b_request_id\"H\n\x04Loss\x12\x0c\n\x04loss\x18\x01 \x01(\x02\x12(\n\x05grads\x18\x02 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x42\x08\n\x06_grads\"/\n\x19GetInferenceResultRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\"\\\n\x0fInferenceResult\x12)\n\x06tensor\x18\x01 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x12\x13\n\x0bis_finished\x18\x02 \x01(\x08\x42\t\n\x07_tensor\"\xa6\x01\n\x06Tensor\x12\x13\n\x0btensor_data\x18\x01 \x01(\x0c\x12\r\n\x05shape\x18\x02 \x03(\x05\x12\r\n\x05\x64type\x18\x03 \x01(\t\x12\r\n\x05\x63odec\x18\x04 \x01(\t\x12\x0e\n\x06scales\x18\x05 \x01(\x0c\x12\'\n\ndtype_enum\x18\x06 \x01(\x0e\x32\x13.node_service.DType\x12!\n\x03shm\x18\x07 \x01(\x0b\x32\x14.node_service.ShmRef\")\n\x06ShmRef\x12\x0f\n\x07segment\x18\x01 \x01(\t\x12\x0e\n\x06offset\x18\x02 \x01(\x04\"3\n\nTensorList\x12%\n\x07tensors\x18\x01 \x03(\x0b\x32\x14.node_service.Tensor\"\xc4\x04\n\x0eInferenceState\x12\x41\n\x0btensor_data\x18\x01 \x03(\x0b\x32,.node_service.InferenceState.TensorDataEntry\x12J\n\x10tensor_list_data\x18\x02 \x03(\x0b\x32\x30.node_service.InferenceState.TensorListDataEntry\x12\x17\n\x0fother_data_json\x18\x03 \x01(\t\x12\x45\n\rtensor_hashes\x18\x04 \x03(\x0b\x32..node_service.InferenceState.TensorHashesEntry\x12\x41\n\x0btensor_refs\x18\x05 \x03(\x0b\x32,.node_service.InferenceState.TensorRefsEntry\x1aG\n\x0fTensorDataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12#\n\x05value\x18\x02 \x01(\x0b\x32\x14.node_service.Tensor:\x02\x38\x01\x1aO\n\x13TensorListDataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\'\n\x05value\x18\x02 \x01(\x0b\x32\x18.node_service.TensorList:\x02\x38\x01\x1a\x33\n\x11TensorHashesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\x1a\x31\n\x0fTensorRefsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"<\n\x16\x43ollectTopologyRequest\x12\x0f\n\x07visited\x18\x01 \x03(\t\x12\x11\n\tmax_depth\x18\x02 \x01(\x05\"\x98\x02\n\x08Topology\x12\x30\n\x05nodes\x18\x01 \x03(\x0b\x32!.node_service.Topology.NodesEntry\x12\x39\n\npeer_graph\x18\x02 \x03(\x0b\x32%.node_service.Topology.PeerGraphEntry\x1aN\n\nNodesEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12/\n\x05value\x18\x02 \x01(\x0b\x32 .node_service.DeviceCapabilities:\x02\x38\x01\x1aO\n\x0ePeerGraphEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12,\n\x05value\x18\x02 \x01(\x0b\x32\x1d.node_service.PeerConnections:\x02\x38\x01\"\xb4\x01\n\x13TopologySyncRequest\x12\x41\n\x08versions\x18\x01 \x03(\x0b\x32/.node_service.TopologySyncRequest.VersionsEntry\x12)\n\x07records\x18\x02 \x03(\x0b\x32\x18.node_service.NodeRecord\x1a/\n\rVersionsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\"\xb6\x01\n\x14TopologySyncResponse\x12\x42\n\x08versions\x18\x01 \x03(\x0b\x32\x30.node_service.TopologySyncResponse.VersionsEntry\x12)\n\x07records\x18\x02 \x03(\x0b\x32\x18.node_service.NodeRecord\x1a/\n\rVersionsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x03:\x02\x38\x01\"\x93\x01\n\nNodeRecord\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x0f\n\x07version\x18\x02 \x01(\x03\x12\x36\n\x0c\x63\x61pabilities\x18\x03 \x01(\x0b\x32 .node_service.DeviceCapabilities\x12+\n\x05\x65\x64ges\x18\x04 \x03(\x0b\x32\x1c.node_service.PeerConnection\"\x99\x01\n\x0ePeerConnection\x12\r\n\x05to_id\x18\x01 \x01(\t\x12\x18\n\x0b\x64\x65scription\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x13\n\x06rtt_ms\x18\x03 \x01(\x01H\x01\x88\x01\x01\x12\x1b\n\x0e\x62\x61ndwidth_mbps\x18\x04 \x01(\x01H\x02\x88\x01\x01\x42\x0e\n\x0c_descriptionB\t\n\x07_rtt_msB\x11\n\x0f_bandwidth_mbps\"D\n\x0fPeerConnections\x12\x31\n\x0b\x63onnections\x18\x01 \x03(\x0b\x32\x1c.node_service.PeerConnection\"7\n\x0b\x44\x65viceFlops\x12\x0c\n\x04\x66p32\x18\x01 \x01(\x01\x12\x0c\n\x04\x66p16\x18\x02 \x01(\x01\x12\x0c\n\x04int8\x18\x03 \x01(\x01\"k\n\x12\x44\x65viceCapabilities\x12\r\n\x05model\x18\x01 \x01(\t\x12\x0c\n\x04\x63hip\x18\x02 \x01(\t\x12\x0e\n\x06memory\x18\x03 \x01(\x05\x12(\n\x05\x66lops\x18\x04 \x01(\x0b\x32\x19.node_service.DeviceFlops\"\xb9\x01\n\x11SendResultRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06result\x18\x02 \x03(\x05\x12)\n\x06tensor\x18\x03 \x01(\x0b\x32\x14.node_service.TensorH\x00\x88\x01\x01\x12\x13\n\x0bis_finished\x18\x04 \x01(\x08\x12\x13\n\x0bstart_index\x18\x05 \x01(\x05\x12\x14\n\x07node_id\x18\x06 \x01(\tH\x01\x88\x01\x01\x42\t\n\x07_tensorB\n\n\x08_node_id\"=\n\x17SendOpaqueStatusRequest\x12\x12\n\nrequest_id\x18\x01 \x01(\t\x12\x0e\n\x06status\x18\x02 \x01(\t\"\x14\n\x12HealthCheckRequest\"`\n\x13HealthCheckResponse\x12\x12\n\nis_healthy\x18\x01 \x01(\x08\x12\x0e\n\x06\x63odecs\x18\x02 \x03(\t\x12\x12\n\nshm_socket\x18\x03 \x01(\t\x12\x11\n\tshm_probe\x18\x04 \x01(\t\"O\n\rGossipRequest\x12\x11\n\ttarget_id\x18\x01 \x01(\t\x12+\n\x07updates\x18\x02 \x03(\x0b\x32\x1a.node_service.MemberUpdate\"J\n\x0eGossipResponse\x12\x0b\n\x03\x61\x63k\x18\x01 \x01(\x08\x12+\n\x07updates\x18\x02 \x03(\x0b\x32\x1a.node_service.MemberUpdate\"\x90\x01\n\x0cMemberUpdate\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12/\n\x05state\x18\x02 \x01(\x0e\x32 .node_service.MemberUpdate.State\x12\x13\n\x0bincarnation\x18\x03 \x01(\x03\")\n\x05State\x12\t\n\x05\x41LIVE\x10\x00\x12\x0b\n\x07SUSPECT\x10\x01\x12\x08\n\x04\x44\x45\x41\x44\x10\x02\"\x1f\n\x0cProbeRequest\x12\x0f\n\x07payload\x18\x01 \x01(\x0c\"\x07\n\x05\x45mpty*\xcd\x01\n\x05\x44Type\x12\x15\n\x11\x44TYPE_UNSPECIFIED\x10\x00\x12\x11\n\rDTYPE_FLOAT32\x10\x01\x12\x11\n\rDTYPE_FLOAT16\x10\x02\x12\x11\n\rDTYPE_FLOAT64\x10\x03\x12\x0f\n\x0b\x44TYPE_INT64\x10\x04\x12\x0f\n\x0b\x44TYPE_INT32\x10\x05\x12\x0f\n\x0b\x44TYPE_INT16\x10\x06\x12\x0e\n\nDTYPE_INT8\x10\x07\x12\x0f\n\x0b\x44TYPE_UINT8\x10\x08\x12\x10\n\x0c\x44TYPE_UINT32\x10\t\x12\x0e\n\nDTYPE_BOOL\x10\n2\xe6\x07\n\x0bNodeService\x12\x41\n\nSendPrompt\x12\x1b.node_service.PromptRequest\x1a\x14.node_service.Tensor\"\x00\x12\x41\n\nSendTensor\x12\x1b.node_service.TensorRequest\x1a\x14.node_service.Tensor\"\x00\x12H\n\x0cTensorStream\x12\x19.node_service.TensorFrame\x1a\x17.node_service.TensorAck\"\x00(\x01\x30\x01\x12G\n\x10SendTensorChunks\x12\x19.node_service.TensorChunk\x1a\x14.node_service.Tensor\"\x00(\x01\x12\x41\n\x0bSendExample\x12\x1c.node_service.ExampleRequest\x1a\x12.node_service.Loss\"\x00\x12^\n\x12GetInferenceResult\x12\'.node_service.GetInferenceResultRequest\x1a\x1d.node_service.InferenceResult\"\x00\x12Q\n\x0f\x43ollectTopology\x12$.node_service.CollectTopologyRequest\x1a\x16.node_service.Topology\"\x00\x12W\n\x0cSyncTopology\x12!.node_service.TopologySyncRequest\x1a\".node_service.TopologySyncResponse\"\x00\x12\x44\n\nSendResult\x12\x1f.node_service.SendResultRequest\x1a\x13.node_service.Empty\"\x00\x12P\n\x10SendOpaqueStatus\x12%.node_service.SendOpaqueStatusRequest\x1a\x13.node_service.Empty\"\x00\x12T\n\x0bHealthCheck\x12 .node_service.HealthCheckRequest\x1a!.node_service.HealthCheckResponse\"\x00\x12\x45\n\x06Gossip\x12\x1b.node_service.GossipRequest\x1a\x1c.node_service.GossipResponse\"\x00\x12:\n\x05Probe\x12\x1a.node_service.ProbeRequest\x1a\x13.node_service.Empty\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'nidum.networking.grpc.node_service_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
+  _globals['_PROMPTREQUEST_REQUESTMETADATAENTRY']._loaded_options = None
+  _globals['_PROMPTREQUEST_REQUESTMETADATAENTRY']._serialized_options = b'8\001'
+  _globals['_TENSORREQUEST_REQUESTMETADATAENTRY']._loaded_options = None
+  _globals['_TENSORREQUEST_REQUESTMETADATAENTRY']._serialized_options = b'8\001'
   _globals['_INFERENCESTATE_TENSORDATAENTRY']._loaded_options = None
   _globals['_INFERENCESTATE_TENSORDATAENTRY']._serialized_options = b'8\001'
   _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._loaded_options = None
   _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._serialized_options = b'8\001'
+  _globals['_INFERENCESTATE_TENSORHASHESENTRY']._loaded_options = None
+  _globals['_INFERENCESTATE_TENSORHASHESENTRY']._serialized_options = b'8\001'
+  _globals['_INFERENCESTATE_TENSORREFSENTRY']._loaded_options = None
+  _globals['_INFERENCESTATE_TENSORREFSENTRY']._serialized_options = b'8\001'
   _globals['_TOPOLOGY_NODESENTRY']._loaded_options = None
   _globals['_TOPOLOGY_NODESENTRY']._serialized_options = b'8\001'
   _globals['_TOPOLOGY_PEERGRAPHENTRY']._loaded_options = None
   _globals['_TOPOLOGY_PEERGRAPHENTRY']._serialized_options = b'8\001'
+  _globals['_TOPOLOGYSYNCREQUEST_VERSIONSENTRY']._loaded_options = None
+  _globals['_TOPOLOGYSYNCREQUEST_VERSIONSENTRY']._serialized_options = b'8\001'
+  _globals['_TOPOLOGYSYNCRESPONSE_VERSIONSENTRY']._loaded_options = None
+  _globals['_TOPOLOGYSYNCRESPONSE_VERSIONSENTRY']._serialized_options = b'8\001'
+  _globals['_DTYPE']._serialized_start=4350
+  _globals['_DTYPE']._serialized_end=4555
   _globals['_SHARD']._serialized_start=56
   _globals['_SHARD']._serialized_end=139
   _globals['_PROMPTREQUEST']._serialized_start=142
-  _globals['_PROMPTREQUEST']._serialized_end=329
-  _globals['_TENSORREQUEST']._serialized_start=332
-  _globals['_TENSORREQUEST']._serialized_end=541
-  _globals['_EXAMPLEREQUEST']._serialized_start=544
-  _globals['_EXAMPLEREQUEST']._serialized_end=766
-  _globals['_LOSS']._serialized_start=768
-  _globals['_LOSS']._serialized_end=840
-  _globals['_GETINFERENCERESULTREQUEST']._serialized_start=842
-  _globals['_GETINFERENCERESULTREQUEST']._serialized_end=889
-  _globals['_INFERENCERESULT']._serialized_start=891
-  _globals['_INFERENCERESULT']._serialized_end=983
-  _globals['_TENSOR']._serialized_start=985
-  _globals['_TENSOR']._serialized_end=1044
-  _globals['_TENSORLIST']._serialized_start=1046
-  _globals['_TENSORLIST']._serialized_end=1097
-  _globals['_INFERENCESTATE']._serialized_start=1100
-  _globals['_INFERENCESTATE']._serialized_end=1438
-  _globals['_INFERENCESTATE_TENSORDATAENTRY']._serialized_start=1286
-  _globals['_INFERENCESTATE_TENSORDATAENTRY']._serialized_end=1357
-  _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._serialized_start=1359
-  _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._serialized_end=1438
-  _globals['_COLLECTTOPOLOGYREQUEST']._serialized_start=1440
-  _globals['_COLLECTTOPOLOGYREQUEST']._serialized_end=1500
-  _globals['_TOPOLOGY']._serialized_start=1503
-  _globals['_TOPOLOGY']._serialized_end=1783
-  _globals['_TOPOLOGY_NODESENTRY']._serialized_start=1624
-  _globals['_TOPOLOGY_NODESENTRY']._serialized_end=1702
-  _globals['_TOPOLOGY_PEERGRAPHENTRY']._serialized_start=1704
-  _globals['_TOPOLOGY_PEERGRAPHENTRY']._serialized_end=1783
-  _globals['_PEERCONNECTION']._serialized_start=1785
-  _globals['_PEERCONNECTION']._serialized_end=1858
-  _globals['_PEERCONNECTIONS']._serialized_start=1860
-  _globals['_PEERCONNECTIONS']._serialized_end=1928
-  _globals['_DEVICEFLOPS']._serialized_start=1930
-  _globals['_DEVICEFLOPS']._serialized_end=1985
-  _globals['_DEVICECAPABILITIES']._serialized_start=1987
-  _globals['_DEVICECAPABILITIES']._serialized_end=2094
-  _globals['_SENDRESULTREQUEST']._serialized_start=2097
-  _globals['_SENDRESULTREQUEST']._serialized_end=2227
-  _globals['_SENDOPAQUESTATUSREQUEST']._serialized_start=2229
-  _globals['_SENDOPAQUESTATUSREQUEST']._serialized_end=2290
-  _globals['_HEALTHCHECKREQUEST']._serialized_start=2292
-  _globals['_HEALTHCHECKREQUEST']._serialized_end=2312
-  _globals['_HEALTHCHECKRESPONSE']._serialized_start=2314
-  _globals['_HEALTHCHECKRESPONSE']._serialized_end=2355
-  _globals['_EMPTY']._serialized_start=2357
-  _globals['_EMPTY']._serialized_end=2364
-  _globals['_NODESERVICE']._serialized_start=2367
-  _globals['_NODESERVICE']._serialized_end=2998
+  _globals['_PROMPTREQUEST']._serialized_end=461
+  _globals['_PROMPTREQUEST_REQUESTMETADATAENTRY']._serialized_start=372
+  _globals['_PROMPTREQUEST_REQUESTMETADATAENTRY']._serialized_end=426
+  _globals['_TENSORREQUEST']._serialized_start=464
+  _globals['_TENSORREQUEST']._serialized_end=805
+  _globals['_TENSORREQUEST_REQUESTMETADATAENTRY']._serialized_start=372
+  _globals['_TENSORREQUEST_REQUESTMETADATAENTRY']._serialized_end=426
+  _globals['_TENSORFRAME']._serialized_start=807
+  _globals['_TENSORFRAME']._serialized_end=879
+  _globals['_TENSORCHUNK']._serialized_start=881
+  _globals['_TENSORCHUNK']._serialized_end=975
+  _globals['_TENSORACK']._serialized_start=977
+  _globals['_TENSORACK']._serialized_end=1085
+  _globals['_EXAMPLEREQUEST']._serialized_start=1088
+  _globals['_EXAMPLEREQUEST']._serialized_end=1310
+  _globals['_LOSS']._serialized_start=1312
+  _globals['_LOSS']._serialized_end=1384
+  _globals['_GETINFERENCERESULTREQUEST']._serialized_start=1386
+  _globals['_GETINFERENCERESULTREQUEST']._serialized_end=1433
+  _globals['_INFERENCERESULT']._serialized_start=1435
+  _globals['_INFERENCERESULT']._serialized_end=1527
+  _globals['_TENSOR']._serialized_start=1530
+  _globals['_TENSOR']._serialized_end=1696
+  _globals['_SHMREF']._serialized_start=1698
+  _globals['_SHMREF']._serialized_end=1739
+  _globals['_TENSORLIST']._serialized_start=1741
+  _globals['_TENSORLIST']._serialized_end=1792
+  _globals['_INFERENCESTATE']._serialized_start=1795
+  _globals['_INFERENCESTATE']._serialized_end=2375
+  _globals['_INFERENCESTATE_TENSORDATAENTRY']._serialized_start=2119
+  _globals['_INFERENCESTATE_TENSORDATAENTRY']._serialized_end=2190
+  _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._serialized_start=2192
+  _globals['_INFERENCESTATE_TENSORLISTDATAENTRY']._serialized_end=2271
+  _globals['_INFERENCESTATE_TENSORHASHESENTRY']._serialized_start=2273
+  _globals['_INFERENCESTATE_TENSORHASHESENTRY']._serialized_end=2324
+  _globals['_INFERENCESTATE_TENSORREFSENTRY']._serialized_start=2326
+  _globals['_INFERENCESTATE_TENSORREFSENTRY']._serialized_end=2375
+  _globals['_COLLECTTOPOLOGYREQUEST']._serialized_start=2377
+  _globals['_COLLECTTOPOLOGYREQUEST']._serialized_end=2437
+  _globals['_TOPOLOGY']._serialized_start=2440
+  _globals['_TOPOLOGY']._serialized_end=2720
+  _globals['_TOPOLOGY_NODESENTRY']._serialized_start=2561
+  _globals['_TOPOLOGY_NODESENTRY']._serialized_end=2639
+  _globals['_TOPOLOGY_PEERGRAPHENTRY']._serialized_start=2641
+  _globals['_TOPOLOGY_PEERGRAPHENTRY']._serialized_end=2720
+  _globals['_TOPOLOGYSYNCREQUEST']._serialized_start=2723
+  _globals['_TOPOLOGYSYNCREQUEST']._serialized_end=2903
+  _globals['_TOPOLOGYSYNCREQUEST_VERSIONSENTRY']._serialized_start=2856
+  _globals['_TOPOLOGYSYNCREQUEST_VERSIONSENTRY']._serialized_end=2903
+  _globals['_TOPOLOGYSYNCRESPONSE']._serialized_start=2906
+  _globals['_TOPOLOGYSYNCRESPONSE']._serialized_end=3088
+  _globals['_TOPOLOGYSYNCRESPONSE_VERSIONSENTRY']._serialized_start=2856
+  _globals['_TOPOLOGYSYNCRESPONSE_VERSIONSENTRY']._serialized_end=2903
+  _globals['_NODERECORD']._serialized_start=3091
+  _globals['_NODERECORD']._serialized_end=3238
+  _globals['_PEERCONNECTION']._serialized_start=3241
+  _globals['_PEERCONNECTION']._serialized_end=3394
+  _globals['_PEERCONNECTIONS']._serialized_start=3396
+  _globals['_PEERCONNECTIONS']._serialized_end=3464
+  _globals['_DEVICEFLOPS']._serialized_start=3466
+  _globals['_DEVICEFLOPS']._serialized_end=3521
+  _globals['_DEVICECAPABILITIES']._serialized_start=3523
+  _globals['_DEVICECAPABILITIES']._serialized_end=3630
+  _globals['_SENDRESULTREQUEST']._serialized_start=3633
+  _globals['_SENDRESULTREQUEST']._serialized_end=3818
+  _globals['_SENDOPAQUESTATUSREQUEST']._serialized_start=3820
+  _globals['_SENDOPAQUESTATUSREQUEST']._serialized_end=3881
+  _globals['_HEALTHCHECKREQUEST']._serialized_start=3883
+  _globals['_HEALTHCHECKREQUEST']._serialized_end=3903
+  _globals['_HEALTHCHECKRESPONSE']._serialized_start=3905
+  _globals['_HEALTHCHECKRESPONSE']._serialized_end=4001
+  _globals['_GOSSIPREQUEST']._serialized_start=4003
+  _globals['_GOSSIPREQUEST']._serialized_end=4082
+  _globals['_GOSSIPRESPONSE']._serialized_start=4084
+  _globals['_GOSSIPRESPONSE']._serialized_end=4158
+  _globals['_MEMBERUPDATE']._serialized_start=4161
+  _globals['_MEMBERUPDATE']._serialized_end=4305
+  _globals['_MEMBERUPDATE_STATE']._serialized_start=4264
+  _globals['_MEMBERUPDATE_STATE']._serialized_end=4305
+  _globals['_PROBEREQUEST']._serialized_start=4307
+  _globals['_PROBEREQUEST']._serialized_end=4338
+  _globals['_EMPTY']._serialized_start=4340
+  _globals['_EMPTY']._serialized_end=4347
+  _globals['_NODESERVICE']._serialized_start=4558
+  _globals['_NODESERVICE']._serialized_end=5556
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,100 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, MutableMapping, Optional
+import grpc
+import numpy as np
+
+from . import node_service_pb2
+from .tensor_codec import tensor_from_proto, to_numpy
+
+CACHE_MISS_PREFIX = "inference state cache miss: "
+
+
+def content_hash(value: Any) -> str:
+  """Digest of a tensor, or a list of tensors, over dtype, shape and contents."""
+  digest = hashlib.blake2b(digest_size=16)
+  for tensor in (value if isinstance(value, list) else [value]):
+    array = np.ascontiguousarray(to_numpy(tensor))
+    digest.update(f"{array.dtype}{array.shape}".encode())
+    digest.update(memoryview(array.reshape(-1)).cast("B"))
+  return digest.hexdigest()
+
+
+class StateCacheMiss(Exception):
+  """The receiver does not hold (the referenced version of) these inference_state keys, the hop has to be resent in full."""
+  def __init__(self, keys: Iterable[str]):
+    self.keys = sorted(keys)
+    super().__init__(CACHE_MISS_PREFIX + ",".join(self.keys))
+
+  @classmethod
+  def from_error(cls, error: Exception) -> Optional["StateCacheMiss"]:
+    """The miss a failed send reported, whether it came back as a unary call status or a TensorStream error ack."""
+    message = error.details() if isinstance(error, grpc.aio.AioRpcError) else str(error)
+    _, found, keys = (message or "").partition(CACHE_MISS_PREFIX)
+    return cls(keys.split(",")) if found else None
+
+
+class SentStateIndex:
+  """
+  Sender side: content hashes of the inference_state tensors one peer was sent, per request. Keys
+  whose hash did not change since are sent as references. Only the max_requests most recently
+  used requests are remembered; anything forgotten is simply sent in full again.
+  """
+  def __init__(self, max_requests: int = 256):
+    self.max_requests = max_requests
+    self.requests: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+    self.refs_sent = 0
+    self.bytes_saved = 0
+
+  def sent(self, request_id: str) -> Dict[str, str]:
+    if request_id not in self.requests:
+      return {}
+    self.requests.move_to_end(request_id)
+    return self.requests[request_id]
+
+  def record(self, request_id: str, hashes: Dict[str, str]) -> None:
+    if not hashes:
+      return
+    self.requests.setdefault(request_id, {}).update(hashes)
+    self.requests.move_to_end(request_id)
+    while len(self.requests) > self.max_requests:
+      self.requests.popitem(last=False)
+
+  def forget(self, request_id: str, keys: Optional[Iterable[str]] = None) -> None:
+    if keys is None:
+      self.requests.pop(request_id, None)
+      return
+    for key in keys:
+      self.requests.get(request_id, {}).pop(key, None)
+
+
+class ResidentStateCache:
+  """
+  Receiver side: the last inference_state tensors each request carried, with their content hashes,
+  so later hops only need to carry what changed. Entries live in a request state store and go away
+  with the rest of the request's state.
+  """
+  def __init__(self, store: MutableMapping[str, Dict[str, tuple]]):
+    self.store = store
+    self.hits = 0
+    self.misses = 0
+
+  def resolve(self, request_id: Optional[str], proto: node_service_pb2.InferenceState) -> Dict[str, Any]:
+    """numpy tensors (lists) of an InferenceState by key, references filled in from the cache."""
+    cached = (self.store.get(request_id) or {}) if request_id else {}
+    missing = [key for key, digest in proto.tensor_refs.items() if key not in cached or cached[key][0] != digest]
+    if missing:
+      self.misses += len(missing)
+      raise StateCacheMiss(missing)
+    values: Dict[str, Any] = {key: cached[key][1] for key in proto.tensor_refs}
+    self.hits += len(values)
+    for key, tensor in proto.tensor_data.items():
+      values[key] = tensor_from_proto(tensor)
+    for key, tensor_list in proto.tensor_list_data.items():
+      values[key] = [tensor_from_proto(tensor) for tensor in tensor_list.tensors]
+    if request_id and proto.tensor_hashes:
+      self.store[request_id] = {**cached, **{key: (digest, values[key]) for key, digest in proto.tensor_hashes.items() if key in values}}
+    return values
+
+  def stats(self) -> Dict[str, int]:
+    return {"requests": len(self.store), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,59 @@
+from typing import AsyncIterator, Iterator, Tuple, Union
+import numpy as np
+
+from . import node_service_pb2
+from .tensor_codec import aligned_empty, dtype_from_proto, dtype_to_proto, to_numpy
+from nidum.networking.activation_codec import RAW, WireCodec, decode_activation, encode_activation
+
+# tensors with a larger payload go out through SendTensorChunks instead of a single message
+DEFAULT_CHUNK_BYTES = 4*1024*1024
+
+
+def chunk_payload(value, codec: WireCodec = RAW) -> Tuple[node_service_pb2.Tensor, Union[bytes, memoryview], WireCodec]:
+  """
+  Tensor header (no tensor_data) and payload of a tensor to stream. Raw payloads are a view of the
+  array, so each chunk is copied only when it is sent and the first one goes out right away.
+  """
+  array = to_numpy(value)
+  if codec == RAW:
+    payload, applied, scales = memoryview(np.ascontiguousarray(array).reshape(-1)).cast("B"), RAW, b""
+  else:
+    payload, applied, scales = encode_activation(array, codec)
+  header = node_service_pb2.Tensor(
+    shape=array.shape,
+    dtype=str(array.dtype),
+    dtype_enum=dtype_to_proto(array.dtype),
+    codec="" if applied == RAW else str(applied),
+    scales=scales,
+  )
+  return header, payload, applied
+
+
+def iter_chunks(request: node_service_pb2.TensorRequest, payload: Union[bytes, memoryview], chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Iterator[node_service_pb2.TensorChunk]:
+  payload = memoryview(payload)
+  yield node_service_pb2.TensorChunk(request=request, total_bytes=len(payload), data=bytes(payload[:chunk_bytes]))
+  for offset in range(chunk_bytes, len(payload), chunk_bytes):
+    yield node_service_pb2.TensorChunk(data=bytes(payload[offset:offset + chunk_bytes]))
+
+
+async def assemble_chunks(chunks: AsyncIterator[node_service_pb2.TensorChunk]) -> Tuple[node_service_pb2.TensorRequest, np.ndarray]:
+  """Request and tensor of a chunk stream, chunks are copied into one aligned buffer as they arrive."""
+  request, buffer, offset = None, None, 0
+  async for chunk in chunks:
+    if request is None:
+      request = chunk.request
+      buffer = aligned_empty((chunk.total_bytes,), np.uint8)
+    data = chunk.data
+    if offset + len(data) > len(buffer):
+      raise ValueError(f"Tensor chunks exceed the announced {len(buffer)} bytes")
+    buffer[offset:offset + len(data)] = np.frombuffer(data, dtype=np.uint8)
+    offset += len(data)
+  if request is None:
+    raise ValueError("Empty tensor chunk stream")
+  if offset != len(buffer):
+    raise ValueError(f"Tensor chunk stream ended after {offset} of {len(buffer)} bytes")
+  tensor = request.tensor
+  dtype, shape = dtype_from_proto(tensor), tuple(tensor.shape)
+  if tensor.codec:
+    return request, decode_activation(buffer, shape, dtype, WireCodec.parse(tensor.codec), tensor.scales)
+  return request, buffer.view(dtype).reshape(shape)
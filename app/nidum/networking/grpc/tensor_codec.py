@@ -0,0 +1,103 @@
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+import numpy as np
+
+from . import node_service_pb2
+from nidum.networking.activation_codec import RAW, WireCodec, decode_activation, encode_activation
+
+# receivers hand buffers to engines that vectorize over them, keep copies we make cache line aligned
+ALIGNMENT = 64
+
+_DTYPES = {
+  node_service_pb2.DTYPE_FLOAT32: np.dtype(np.float32),
+  node_service_pb2.DTYPE_FLOAT16: np.dtype(np.float16),
+  node_service_pb2.DTYPE_FLOAT64: np.dtype(np.float64),
+  node_service_pb2.DTYPE_INT64: np.dtype(np.int64),
+  node_service_pb2.DTYPE_INT32: np.dtype(np.int32),
+  node_service_pb2.DTYPE_INT16: np.dtype(np.int16),
+  node_service_pb2.DTYPE_INT8: np.dtype(np.int8),
+  node_service_pb2.DTYPE_UINT8: np.dtype(np.uint8),
+  node_service_pb2.DTYPE_UINT32: np.dtype(np.uint32),
+  node_service_pb2.DTYPE_BOOL: np.dtype(np.bool_),
+}
+_DTYPE_ENUMS = {dtype: enum for enum, dtype in _DTYPES.items()}
+
+
+@lru_cache(maxsize=None)
+def _parse_dtype(name: str) -> np.dtype:
+  return np.dtype(name)
+
+
+def dtype_from_proto(tensor: node_service_pb2.Tensor) -> np.dtype:
+  return _DTYPES[tensor.dtype_enum] if tensor.dtype_enum in _DTYPES else _parse_dtype(tensor.dtype)
+
+
+def dtype_to_proto(dtype: np.dtype) -> int:
+  return _DTYPE_ENUMS.get(np.dtype(dtype), node_service_pb2.DTYPE_UNSPECIFIED)
+
+
+def to_numpy(value: Any) -> np.ndarray:
+  """
+  numpy view of an engine array. numpy arrays pass through and anything exposing the buffer
+  protocol (mx.array) is wrapped without a copy; other arrays fall back to np.array.
+  """
+  if isinstance(value, np.ndarray):
+    return value
+  try:
+    return np.asarray(memoryview(value))
+  except (TypeError, ValueError):
+    return np.array(value)
+
+
+def aligned_empty(shape: Tuple[int, ...], dtype: np.dtype, alignment: int = ALIGNMENT) -> np.ndarray:
+  dtype = np.dtype(dtype)
+  nbytes = int(np.prod(shape, dtype=np.int64))*dtype.itemsize
+  buffer = np.empty(nbytes + alignment, dtype=np.uint8)
+  offset = -buffer.ctypes.data % alignment
+  return buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+def from_buffer(data: bytes, dtype: np.dtype, shape: Tuple[int, ...], writable: bool = False) -> np.ndarray:
+  """
+  Array over received bytes. Without writable this is a read-only view sharing memory with data;
+  with it, data is copied exactly once, into an aligned buffer.
+  """
+  view = np.frombuffer(data, dtype=dtype).reshape(shape)
+  if not writable:
+    return view
+  array = aligned_empty(view.shape, view.dtype)
+  np.copyto(array, view)
+  return array
+
+
+def tensor_to_proto(value: Any, codec: WireCodec = RAW) -> Tuple[node_service_pb2.Tensor, WireCodec]:
+  """Tensor message for an engine array; the payload is copied once into the bytes protobuf requires."""
+  array = to_numpy(value)
+  if codec == RAW:
+    data, applied, scales = np.ascontiguousarray(array).tobytes(), RAW, b""
+  else:
+    data, applied, scales = encode_activation(array, codec)
+  tensor = node_service_pb2.Tensor(
+    tensor_data=data,
+    shape=array.shape,
+    dtype=str(array.dtype),
+    dtype_enum=dtype_to_proto(array.dtype),
+    codec="" if applied == RAW else str(applied),
+    scales=scales,
+  )
+  return tensor, applied
+
+
+def tensor_from_proto(tensor: node_service_pb2.Tensor, writable: bool = False) -> Optional[np.ndarray]:
+  """
+  Array for a Tensor message, None for an empty one. upb hands out a fresh bytes copy on every
+  access to tensor_data, so it is read exactly once and raw payloads are viewed in place.
+  """
+  data = tensor.tensor_data
+  if not data:
+    return None
+  dtype = dtype_from_proto(tensor)
+  shape = tuple(tensor.shape)
+  if tensor.codec:
+    return decode_activation(data, shape, dtype, WireCodec.parse(tensor.codec), tensor.scales)
+  return from_buffer(data, dtype, shape, writable=writable)
@@ -0,0 +1,137 @@
+import asyncio
+import traceback
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+import grpc
+
+from . import node_service_pb2
+from nidum import DEBUG
+
+
+class TensorStreamUnavailable(Exception):
+  """The peer does not serve TensorStream, the frame was not processed."""
+
+
+class TensorStreamClient:
+  """
+  One long-lived TensorStream call to a peer that all send_tensor traffic is multiplexed over.
+
+  Frames are written in the order send() is called and acked by sequence number once the peer has
+  processed them, so callers keep the unary SendTensor semantics without paying call setup per
+  token hop. At most max_in_flight frames are unacked at a time; further sends wait for a slot.
+  When the call breaks, pending sends fail and the next send opens a new call.
+  """
+  def __init__(self, stub, max_in_flight: int = 32):
+    self.stub = stub
+    self.max_in_flight = max_in_flight
+    self.window = asyncio.Semaphore(max_in_flight)
+    self.write_lock = asyncio.Lock()
+    self.call = None
+    self.reader: Optional[asyncio.Task] = None
+    self.pending: Dict[int, asyncio.Future] = {}
+    self.seq = 0
+    self.frames_sent = 0
+
+  @property
+  def in_flight(self) -> int:
+    return len(self.pending)
+
+  def _open(self) -> None:
+    self.call = self.stub.TensorStream()
+    self.reader = asyncio.create_task(self._read(self.call))
+
+  async def _read(self, call) -> None:
+    error: Exception = ConnectionError("TensorStream closed")
+    try:
+      while True:
+        ack = await call.read()
+        if ack is grpc.aio.EOF:
+          break
+        future = self.pending.pop(ack.seq, None)
+        if future is not None and not future.done():
+          future.set_result(ack)
+    except grpc.aio.AioRpcError as e:
+      error = TensorStreamUnavailable(e.details()) if e.code() == grpc.StatusCode.UNIMPLEMENTED else e
+    except asyncio.CancelledError:
+      pass
+    except Exception as e:
+      error = e
+      if DEBUG >= 1: traceback.print_exc()
+    if self.call is call:
+      self.call = None
+    for future in self.pending.values():
+      if not future.done(): future.set_exception(error)
+    self.pending.clear()
+
+  async def send(self, request: node_service_pb2.TensorRequest) -> node_service_pb2.TensorAck:
+    async with self.window:
+      future = asyncio.get_running_loop().create_future()
+      async with self.write_lock:
+        if self.call is None:
+          self._open()
+        self.seq += 1
+        seq = self.seq
+        self.pending[seq] = future
+        try:
+          await self.call.write(node_service_pb2.TensorFrame(seq=seq, request=request))
+        except Exception as e:
+          # a failed write means the call is gone, its reader fails the pending frames with the reason
+          if self.reader is not None:
+            await asyncio.wait([self.reader])
+          if not future.done():
+            self.pending.pop(seq, None)
+            future.set_exception(e)
+        else:
+          self.frames_sent += 1
+      ack = await future
+    if ack.HasField("error"):
+      raise RuntimeError(f"TensorStream frame {ack.seq} failed on peer: {ack.error}")
+    return ack
+
+  async def close(self) -> None:
+    call, self.call = self.call, None
+    if call is not None:
+      call.cancel()
+    if self.reader is not None:
+      await asyncio.wait([self.reader])
+      self.reader = None
+
+
+async def serve_tensor_stream(
+  request_iterator: AsyncIterator[node_service_pb2.TensorFrame],
+  handle_request: Callable[[node_service_pb2.TensorRequest], Awaitable[node_service_pb2.Tensor]],
+) -> AsyncIterator[node_service_pb2.TensorAck]:
+  """
+  Server side of TensorStream. Frames of one request run one after another in arrival order,
+  frames of different requests run concurrently. Acks go out as frames finish.
+  """
+  acks: asyncio.Queue = asyncio.Queue()
+  lanes: Dict[str, asyncio.Task] = {}
+
+  async def handle(frame: node_service_pb2.TensorFrame, previous: Optional[asyncio.Task]) -> None:
+    if previous is not None and not previous.done():
+      await asyncio.wait([previous])
+    try:
+      tensor = await handle_request(frame.request)
+      await acks.put(node_service_pb2.TensorAck(seq=frame.seq, tensor=tensor))
+    except Exception as e:
+      if DEBUG >= 1: traceback.print_exc()
+      await acks.put(node_service_pb2.TensorAck(seq=frame.seq, error=str(e)))
+
+  async def read() -> None:
+    try:
+      async for frame in request_iterator:
+        request_id = frame.request.request_id
+        task = asyncio.create_task(handle(frame, lanes.get(request_id)))
+        lanes[request_id] = task
+        task.add_done_callback(lambda t, request_id=request_id: lanes.pop(request_id, None) if lanes.get(request_id) is t else None)
+      if lanes:
+        await asyncio.wait(list(lanes.values()))
+    finally:
+      await acks.put(None)
+
+  reader = asyncio.create_task(read())
+  try:
+    while (ack := await acks.get()) is not None:
+      yield ack
+  finally:
+    reader.cancel()
@@ -0,0 +1,56 @@
+import asyncio
+import time
+import unittest
+import grpc
+import numpy as np
+
+from . import node_service_pb2
+from . import node_service_pb2_grpc
+from .channels import RPC_CLASSES, channel_options, server_options
+from nidum.helpers import find_available_port
+from nidum.networking.rpc_stats import CONTROL, DATA
+
+
+class SlowTensorServicer(node_service_pb2_grpc.NodeServiceServicer):
+  async def SendTensor(self, request, context):
+    await asyncio.sleep(0.2)
+    return node_service_pb2.Tensor()
+
+  async def HealthCheck(self, request, context):
+    return node_service_pb2.HealthCheckResponse(is_healthy=True)
+
+
+class TestChannels(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    port = find_available_port("127.0.0.1")
+    self.server = grpc.aio.server(options=server_options())
+    node_service_pb2_grpc.add_NodeServiceServicer_to_server(SlowTensorServicer(), self.server)
+    self.server.add_insecure_port(f"127.0.0.1:{port}")
+    await self.server.start()
+    self.channels = {traffic_class: grpc.aio.insecure_channel(f"127.0.0.1:{port}", options=channel_options(traffic_class)) for traffic_class in (CONTROL, DATA)}
+
+  async def asyncTearDown(self):
+    for channel in self.channels.values():
+      await channel.close()
+    await self.server.stop(grace=None)
+
+  def test_every_method_has_a_traffic_class(self):
+    methods = node_service_pb2.DESCRIPTOR.services_by_name["NodeService"].methods_by_name
+    self.assertLessEqual(set(methods), set(RPC_CLASSES))
+
+  async def test_health_checks_do_not_wait_for_tensors(self):
+    control = node_service_pb2_grpc.NodeServiceStub(self.channels[CONTROL])
+    data = node_service_pb2_grpc.NodeServiceStub(self.channels[DATA])
+    await control.HealthCheck(node_service_pb2.HealthCheckRequest())
+    tensor = np.zeros((4, 1024, 1024), dtype=np.float32)
+    request = node_service_pb2.TensorRequest(tensor=node_service_pb2.Tensor(tensor_data=tensor.tobytes(), shape=tensor.shape, dtype="float32"))
+    sends = [asyncio.ensure_future(data.SendTensor(request)) for _ in range(3)]
+    start = time.perf_counter()
+    response = await control.HealthCheck(node_service_pb2.HealthCheckRequest())
+    self.assertTrue(response.is_healthy)
+    self.assertLess(time.perf_counter() - start, 0.2)
+    await asyncio.gather(*sends)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+
+from . import node_service_pb2
+from .state_cache import ResidentStateCache, SentStateIndex, StateCacheMiss, content_hash
+from .tensor_codec import tensor_to_proto
+from nidum.orchestration.request_state import RequestStateTracker
+
+
+def state_proto(tensors=None, refs=None) -> node_service_pb2.InferenceState:
+  proto = node_service_pb2.InferenceState()
+  for key, value in (tensors or {}).items():
+    if isinstance(value, list):
+      proto.tensor_list_data[key].tensors.extend(tensor_to_proto(tensor)[0] for tensor in value)
+    else:
+      proto.tensor_data[key].CopyFrom(tensor_to_proto(value)[0])
+    proto.tensor_hashes[key] = content_hash(value)
+  for key, value in (refs or {}).items():
+    proto.tensor_refs[key] = content_hash(value)
+  return proto
+
+
+class TestStateCache(unittest.TestCase):
+  def setUp(self):
+    self.tracker = RequestStateTracker()
+    self.cache = ResidentStateCache(self.tracker.store("resident_inference_state"))
+    self.conditioning = np.random.default_rng(0).standard_normal((2, 77, 64)).astype(np.float32)
+    self.residual = [np.ones((1, 8), dtype=np.float16), np.zeros((1, 4), dtype=np.float16)]
+
+  def test_content_hash(self):
+    self.assertEqual(content_hash(self.conditioning), content_hash(self.conditioning.copy()))
+    self.assertNotEqual(content_hash(self.conditioning), content_hash(self.conditioning.astype(np.float16)))
+    self.assertNotEqual(content_hash(np.zeros((2, 3))), content_hash(np.zeros((3, 2))))
+    self.assertNotEqual(content_hash(self.residual), content_hash(self.residual[:1]))
+
+  def test_references_resolve_from_the_cache(self):
+    self.cache.resolve("r", state_proto({"conditioning": self.conditioning, "residual": self.residual}))
+    x_t = np.full((1, 4), 3.0, dtype=np.float32)
+    values = self.cache.resolve("r", state_proto({"x_t_prev": x_t}, refs={"conditioning": self.conditioning, "residual": self.residual}))
+    np.testing.assert_array_equal(values["conditioning"], self.conditioning)
+    np.testing.assert_array_equal(values["residual"][0], self.residual[0])
+    np.testing.assert_array_equal(values["x_t_prev"], x_t)
+    self.assertEqual(self.cache.stats()["hits"], 2)
+
+  def test_miss_lists_unresolved_keys(self):
+    self.cache.resolve("r", state_proto({"conditioning": self.conditioning}))
+    changed = self.conditioning + 1
+    with self.assertRaises(StateCacheMiss) as miss:
+      self.cache.resolve("r", state_proto(refs={"conditioning": changed, "mask": self.conditioning}))
+    self.assertEqual(miss.exception.keys, ["conditioning", "mask"])
+    with self.assertRaises(StateCacheMiss):
+      self.cache.resolve("other", state_proto(refs={"conditioning": self.conditioning}))
+
+  def test_cache_goes_away_with_the_request(self):
+    self.cache.resolve("r", state_proto({"conditioning": self.conditioning}))
+    self.assertGreaterEqual(self.tracker.nbytes(), self.conditioning.nbytes)
+    self.tracker.evict("r", "ttl")
+    with self.assertRaises(StateCacheMiss):
+      self.cache.resolve("r", state_proto(refs={"conditioning": self.conditioning}))
+
+  def test_miss_survives_the_wire(self):
+    error = RuntimeError(f"TensorStream frame 3 failed on peer: {StateCacheMiss(['mask', 'conditioning'])}")
+    self.assertEqual(StateCacheMiss.from_error(error).keys, ["conditioning", "mask"])
+    self.assertIsNone(StateCacheMiss.from_error(RuntimeError("boom")))
+
+  def test_sent_index_is_bounded(self):
+    index = SentStateIndex(max_requests=2)
+    for request_id in ("a", "b", "c"):
+      index.record(request_id, {"conditioning": request_id})
+    self.assertEqual(index.sent("a"), {})
+    self.assertEqual(index.sent("c"), {"conditioning": "c"})
+    index.forget("c", ["conditioning"])
+    self.assertEqual(index.sent("c"), {})
+
+
+if __name__ == "__main__":
+  unittest.main()
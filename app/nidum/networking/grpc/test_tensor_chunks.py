@@ -0,0 +1,83 @@
+import unittest
+import grpc
+import numpy as np
+
+from . import node_service_pb2
+from . import node_service_pb2_grpc
+from .channels import channel_options, server_options
+from .tensor_chunks import assemble_chunks, chunk_payload, iter_chunks
+from .tensor_codec import tensor_to_proto
+from nidum.helpers import find_available_port
+from nidum.networking.activation_codec import WireCodec
+from nidum.networking.rpc_stats import DATA
+
+MAX_MESSAGE_BYTES = 1024*1024
+CHUNK_BYTES = 256*1024
+
+
+async def iterate(items):
+  for item in items:
+    yield item
+
+
+class ChunkServicer(node_service_pb2_grpc.NodeServiceServicer):
+  async def SendTensorChunks(self, request_iterator, context):
+    request, tensor = await assemble_chunks(request_iterator)
+    self.request_id, self.tensor = request.request_id, tensor
+    return tensor_to_proto(tensor.sum(keepdims=True))[0]
+
+
+class TestTensorChunks(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    port = find_available_port("127.0.0.1")
+    self.servicer = ChunkServicer()
+    self.server = grpc.aio.server(options=server_options(MAX_MESSAGE_BYTES))
+    node_service_pb2_grpc.add_NodeServiceServicer_to_server(self.servicer, self.server)
+    self.server.add_insecure_port(f"127.0.0.1:{port}")
+    await self.server.start()
+    self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{port}", options=channel_options(DATA, MAX_MESSAGE_BYTES))
+    self.stub = node_service_pb2_grpc.NodeServiceStub(self.channel)
+    self.hidden = np.random.default_rng(0).standard_normal((1, 1024, 1024)).astype(np.float32)
+
+  async def asyncTearDown(self):
+    await self.channel.close()
+    await self.server.stop(grace=None)
+
+  async def send(self, tensor: np.ndarray, codec: WireCodec = WireCodec()) -> node_service_pb2.Tensor:
+    header, payload, _ = chunk_payload(tensor, codec)
+    request = node_service_pb2.TensorRequest(tensor=header, request_id="r")
+    return await self.stub.SendTensorChunks(iter_chunks(request, payload, CHUNK_BYTES))
+
+  async def test_tensor_above_the_message_limit(self):
+    self.assertGreater(self.hidden.nbytes, MAX_MESSAGE_BYTES)
+    with self.assertRaises(grpc.aio.AioRpcError) as error:
+      await self.stub.SendTensor(node_service_pb2.TensorRequest(tensor=tensor_to_proto(self.hidden)[0]))
+    self.assertEqual(error.exception.code(), grpc.StatusCode.RESOURCE_EXHAUSTED)
+    response = await self.send(self.hidden)
+    self.assertEqual(self.servicer.request_id, "r")
+    np.testing.assert_array_equal(self.servicer.tensor, self.hidden)
+    self.assertTrue(self.servicer.tensor.flags.writeable)
+    self.assertAlmostEqual(np.frombuffer(response.tensor_data, dtype=np.float32)[0], self.hidden.sum(), places=0)
+
+  async def test_codec_applies_to_chunked_tensors(self):
+    await self.send(self.hidden, WireCodec("fp16"))
+    self.assertEqual(self.servicer.tensor.dtype, np.float32)
+    np.testing.assert_allclose(self.servicer.tensor, self.hidden, atol=1e-2)
+
+  async def test_chunks_are_produced_lazily(self):
+    header, payload, _ = chunk_payload(self.hidden)
+    self.assertIsInstance(payload, memoryview)
+    chunks = iter_chunks(node_service_pb2.TensorRequest(tensor=header), payload, CHUNK_BYTES)
+    first = next(chunks)
+    self.assertEqual((first.total_bytes, len(first.data)), (self.hidden.nbytes, CHUNK_BYTES))
+    self.assertEqual(sum(1 for _ in chunks), self.hidden.nbytes//CHUNK_BYTES - 1)
+
+  async def test_truncated_stream(self):
+    header, payload, _ = chunk_payload(self.hidden)
+    chunks = list(iter_chunks(node_service_pb2.TensorRequest(tensor=header), payload, CHUNK_BYTES))[:-1]
+    with self.assertRaises(ValueError):
+      await assemble_chunks(iterate(chunks))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,62 @@
+import array
+import unittest
+import numpy as np
+
+from . import node_service_pb2
+from .tensor_codec import ALIGNMENT, dtype_from_proto, from_buffer, tensor_from_proto, tensor_to_proto, to_numpy
+from nidum.networking.activation_codec import WireCodec
+
+
+class TestTensorCodec(unittest.TestCase):
+  def test_round_trip_all_dtypes(self):
+    for dtype in (np.float32, np.float16, np.float64, np.int64, np.int32, np.int16, np.int8, np.uint8, np.uint32, np.bool_):
+      with self.subTest(dtype=dtype):
+        tensor = (np.arange(24) % 3).astype(dtype).reshape(2, 3, 4)
+        proto, _ = tensor_to_proto(tensor)
+        self.assertNotEqual(proto.dtype_enum, node_service_pb2.DTYPE_UNSPECIFIED)
+        decoded = tensor_from_proto(node_service_pb2.Tensor.FromString(proto.SerializeToString()))
+        self.assertEqual(decoded.dtype, tensor.dtype)
+        np.testing.assert_array_equal(decoded, tensor)
+
+  def test_dtype_string_fallback_for_older_peers(self):
+    tensor = np.ones((2, 2), dtype=np.float16)
+    legacy = node_service_pb2.Tensor(tensor_data=tensor.tobytes(), shape=tensor.shape, dtype=str(tensor.dtype))
+    self.assertEqual(dtype_from_proto(legacy), np.float16)
+    np.testing.assert_array_equal(tensor_from_proto(legacy), tensor)
+    self.assertIsNone(tensor_from_proto(node_service_pb2.Tensor()))
+
+  def test_received_tensor_is_a_view(self):
+    data = np.arange(16, dtype=np.float32).tobytes()
+    view = from_buffer(data, np.dtype(np.float32), (4, 4))
+    self.assertFalse(view.flags.owndata)
+    self.assertFalse(view.flags.writeable)
+    base = view
+    while isinstance(base, np.ndarray): base = base.base
+    self.assertIs(base, data)
+
+  def test_writable_copy_is_aligned(self):
+    data = np.arange(16, dtype=np.float32).tobytes()
+    copy = from_buffer(data, np.dtype(np.float32), (4, 4), writable=True)
+    self.assertTrue(copy.flags.writeable)
+    self.assertEqual(copy.ctypes.data % ALIGNMENT, 0)
+    copy[0, 0] = 42
+    self.assertEqual(np.frombuffer(data, dtype=np.float32)[0], 0)
+
+  def test_buffer_protocol_inputs_are_not_copied(self):
+    values = array.array("f", [1.0, 2.0, 3.0])
+    wrapped = to_numpy(values)
+    self.assertEqual(wrapped.dtype, np.float32)
+    wrapped[0] = 5.0
+    self.assertEqual(values[0], 5.0)
+
+  def test_codec_applied(self):
+    hidden = np.random.default_rng(0).standard_normal((1, 4, 512)).astype(np.float32)
+    proto, applied = tensor_to_proto(hidden, WireCodec("fp16"))
+    self.assertEqual((applied, proto.codec, proto.dtype_enum), (WireCodec("fp16"), "fp16", node_service_pb2.DTYPE_FLOAT32))
+    decoded = tensor_from_proto(proto)
+    self.assertEqual(decoded.dtype, np.float32)
+    np.testing.assert_allclose(decoded, hidden, atol=1e-2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import unittest
+import grpc
+import numpy as np
+
+from . import node_service_pb2
+from . import node_service_pb2_grpc
+from .tensor_stream import TensorStreamClient, TensorStreamUnavailable, serve_tensor_stream
+from nidum.helpers import find_available_port
+
+
+def make_request(request_id: str, value: int) -> node_service_pb2.TensorRequest:
+  tensor = np.array([[value]], dtype=np.int64)
+  return node_service_pb2.TensorRequest(
+    shard=node_service_pb2.Shard(model_id="model", start_layer=0, end_layer=0, n_layers=1),
+    tensor=node_service_pb2.Tensor(tensor_data=tensor.tobytes(), shape=tensor.shape, dtype=str(tensor.dtype)),
+    request_id=request_id,
+  )
+
+
+def value_of(tensor: node_service_pb2.Tensor) -> int:
+  return int(np.frombuffer(tensor.tensor_data, dtype=np.dtype(tensor.dtype))[0])
+
+
+class StreamServicer(node_service_pb2_grpc.NodeServiceServicer):
+  def __init__(self):
+    self.processed = []
+    self.running = 0
+    self.max_running = 0
+
+  async def handle(self, request):
+    value = value_of(request.tensor)
+    if value < 0:
+      raise ValueError("negative")
+    self.running += 1
+    self.max_running = max(self.max_running, self.running)
+    # the first frames of a request take longest, later ones would overtake them if not ordered
+    await asyncio.sleep(0.02 if value == 0 else 0.001)
+    self.running -= 1
+    self.processed.append((request.request_id, value))
+    return node_service_pb2.Tensor(tensor_data=request.tensor.tensor_data, shape=request.tensor.shape, dtype=request.tensor.dtype)
+
+  async def TensorStream(self, request_iterator, context):
+    async for ack in serve_tensor_stream(request_iterator, self.handle):
+      yield ack
+
+
+class TestTensorStream(unittest.IsolatedAsyncioTestCase):
+  async def start_server(self, servicer) -> node_service_pb2_grpc.NodeServiceStub:
+    port = find_available_port("127.0.0.1")
+    self.server = grpc.aio.server()
+    node_service_pb2_grpc.add_NodeServiceServicer_to_server(servicer, self.server)
+    self.server.add_insecure_port(f"127.0.0.1:{port}")
+    await self.server.start()
+    self.channel = grpc.aio.insecure_channel(f"127.0.0.1:{port}")
+    return node_service_pb2_grpc.NodeServiceStub(self.channel)
+
+  async def asyncTearDown(self):
+    await self.channel.close()
+    await self.server.stop(grace=None)
+
+  async def test_frames_of_a_request_are_processed_in_order(self):
+    servicer = StreamServicer()
+    client = TensorStreamClient(await self.start_server(servicer))
+    sends = [client.send(make_request(request_id, value)) for value in range(5) for request_id in ("a", "b")]
+    acks = await asyncio.gather(*sends)
+    self.assertEqual([value_of(ack.tensor) for ack in acks], [value for value in range(5) for _ in range(2)])
+    for request_id in ("a", "b"):
+      self.assertEqual([v for r, v in servicer.processed if r == request_id], list(range(5)))
+    # different requests were multiplexed concurrently over the one call
+    self.assertGreater(servicer.max_running, 1)
+    self.assertEqual(client.frames_sent, 10)
+    await client.close()
+
+  async def test_in_flight_frames_are_bounded(self):
+    servicer = StreamServicer()
+    client = TensorStreamClient(await self.start_server(servicer), max_in_flight=2)
+    await asyncio.gather(*[client.send(make_request(f"r{i}", 0)) for i in range(6)])
+    self.assertLessEqual(servicer.max_running, 2)
+    await client.close()
+
+  async def test_failed_frame_does_not_break_the_stream(self):
+    client = TensorStreamClient(await self.start_server(StreamServicer()))
+    with self.assertRaises(RuntimeError):
+      await client.send(make_request("a", -1))
+    ack = await client.send(make_request("a", 3))
+    self.assertEqual(value_of(ack.tensor), 3)
+    await client.close()
+
+  async def test_peer_without_tensor_stream(self):
+    client = TensorStreamClient(await self.start_server(node_service_pb2_grpc.NodeServiceServicer()))
+    with self.assertRaises(TensorStreamUnavailable):
+      await client.send(make_request("a", 1))
+    await client.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,60 @@
+from typing import Iterable, List, Optional
+
+from . import node_service_pb2
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+from nidum.topology.topology import LinkQuality
+from nidum.topology.topology_store import NodeRecord
+
+
+def capabilities_to_proto(capabilities: DeviceCapabilities) -> node_service_pb2.DeviceCapabilities:
+  return node_service_pb2.DeviceCapabilities(
+    model=capabilities.model,
+    chip=capabilities.chip,
+    memory=capabilities.memory,
+    flops=node_service_pb2.DeviceFlops(fp32=capabilities.flops.fp32, fp16=capabilities.flops.fp16, int8=capabilities.flops.int8),
+  )
+
+
+def capabilities_from_proto(capabilities: node_service_pb2.DeviceCapabilities) -> DeviceCapabilities:
+  return DeviceCapabilities(
+    model=capabilities.model,
+    chip=capabilities.chip,
+    memory=capabilities.memory,
+    flops=DeviceFlops(fp32=capabilities.flops.fp32, fp16=capabilities.flops.fp16, int8=capabilities.flops.int8),
+  )
+
+
+def edge_to_proto(to_id: str, description: Optional[str], link: Optional[LinkQuality]) -> node_service_pb2.PeerConnection:
+  link = link or LinkQuality()
+  return node_service_pb2.PeerConnection(to_id=to_id, description=description, rtt_ms=link.rtt_ms, bandwidth_mbps=link.bandwidth_mbps)
+
+
+def link_from_proto(edge: node_service_pb2.PeerConnection) -> Optional[LinkQuality]:
+  if not edge.HasField("rtt_ms") and not edge.HasField("bandwidth_mbps"):
+    return None
+  return LinkQuality(edge.rtt_ms if edge.HasField("rtt_ms") else None, edge.bandwidth_mbps if edge.HasField("bandwidth_mbps") else None)
+
+
+def node_records_to_proto(records: Iterable[NodeRecord]) -> List[node_service_pb2.NodeRecord]:
+  return [
+    node_service_pb2.NodeRecord(
+      node_id=record.node_id,
+      version=record.version,
+      capabilities=capabilities_to_proto(record.device_capabilities),
+      edges=[edge_to_proto(to_id, description, record.links.get(to_id)) for to_id, description in record.edges.items()],
+    )
+    for record in records
+  ]
+
+
+def node_records_from_proto(records: Iterable[node_service_pb2.NodeRecord]) -> List[NodeRecord]:
+  return [
+    NodeRecord(
+      record.node_id,
+      record.version,
+      capabilities_from_proto(record.capabilities),
+      {edge.to_id: edge.description if edge.HasField("description") else None for edge in record.edges},
+      {edge.to_id: link for edge in record.edges if (link := link_from_proto(edge)) is not None},
+    )
+    for record in records
+  ]
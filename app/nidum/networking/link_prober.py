@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, Optional
+from nidum.helpers import DEBUG
+from nidum.networking.peer_handle import PeerHandle
+from nidum.topology.topology import LinkQuality
+
+
+class LinkStats:
+  def __init__(self):
+    self.rtt_ms: Optional[float] = None
+    self.bandwidth_mbps: Optional[float] = None
+    self.last_bandwidth_probe = float("-inf")
+    self.probes = 0
+    self.failures = 0
+
+
+class LinkProber:
+  """
+  Measures the links to peers over their gRPC data channel. Every interval a probe_bytes payload is
+  timed for round trip time, and every bandwidth_interval a bandwidth_bytes payload for throughput
+  (its time less the round trip). Both are smoothed, and published only when one moves by more than
+  publish_threshold, since each published change bumps this node's topology record.
+  """
+  def __init__(
+    self,
+    peers: Callable[[], Iterable[PeerHandle]],
+    interval: float = 5.0,
+    bandwidth_interval: float = 60.0,
+    probe_bytes: int = 64,
+    bandwidth_bytes: int = 1024*1024,
+    timeout: float = 5.0,
+    smoothing: float = 0.3,
+    publish_threshold: float = 0.2,
+    busy: Optional[Callable[[], bool]] = None,
+    clock: Callable[[], float] = time.perf_counter,
+  ):
+    self.peers = peers
+    self.interval = interval
+    self.bandwidth_interval = bandwidth_interval
+    self.probe_payload = bytes(probe_bytes)
+    self.bandwidth_payload = bytes(bandwidth_bytes)
+    self.timeout = timeout
+    self.smoothing = smoothing
+    self.publish_threshold = publish_threshold
+    # large probes would queue behind (and in front of) activations, skip them while requests run
+    self.busy = busy or (lambda: False)
+    self.clock = clock
+    self.stats: Dict[str, LinkStats] = {}
+    self.published: Dict[str, LinkQuality] = {}
+    self.task: Optional[asyncio.Task] = None
+
+  def start(self) -> None:
+    if self.task is None and self.interval > 0:
+      self.task = asyncio.create_task(self.run())
+
+  async def stop(self) -> None:
+    if self.task is not None:
+      self.task.cancel()
+      await asyncio.gather(self.task, return_exceptions=True)
+      self.task = None
+
+  async def run(self) -> None:
+    while True:
+      try:
+        await self.probe_all()
+      except Exception as e:
+        print(f"Error probing links: {e}")
+      await asyncio.sleep(self.interval)
+
+  async def probe_all(self) -> None:
+    peers = list(self.peers())
+    peer_ids = {peer.id() for peer in peers}
+    for peer_id in [peer_id for peer_id in self.stats if peer_id not in peer_ids]:
+      del self.stats[peer_id]
+      self.published.pop(peer_id, None)
+    await asyncio.gather(*[self.probe_peer(peer) for peer in peers])
+
+  async def timed_probe(self, peer: PeerHandle, payload: bytes) -> float:
+    start = self.clock()
+    await peer.probe(payload, timeout=self.timeout)
+    return self.clock() - start
+
+  async def probe_peer(self, peer: PeerHandle) -> None:
+    stats = self.stats.setdefault(peer.id(), LinkStats())
+    try:
+      rtt = await self.timed_probe(peer, self.probe_payload)
+      stats.rtt_ms = self.smooth(stats.rtt_ms, rtt*1000)
+      if self.clock() - stats.last_bandwidth_probe >= self.bandwidth_interval and not self.busy():
+        elapsed = await self.timed_probe(peer, self.bandwidth_payload)
+        stats.last_bandwidth_probe = self.clock()
+        mbps = len(self.bandwidth_payload)*8/1e6/max(elapsed - rtt, 1e-6)
+        stats.bandwidth_mbps = self.smooth(stats.bandwidth_mbps, mbps)
+      stats.probes += 1
+    except Exception as e:
+      stats.failures += 1
+      if DEBUG >= 2: print(f"Link probe to {peer.id()} failed: {e!r}")
+      return
+    self.publish(peer.id(), stats)
+
+  def smooth(self, previous: Optional[float], sample: float) -> float:
+    return sample if previous is None else previous + self.smoothing*(sample - previous)
+
+  def publish(self, peer_id: str, stats: LinkStats) -> None:
+    current = self.published.get(peer_id)
+    if current is None or moved(current.rtt_ms, stats.rtt_ms, self.publish_threshold) or moved(current.bandwidth_mbps, stats.bandwidth_mbps, self.publish_threshold):
+      self.published[peer_id] = LinkQuality(round_metric(stats.rtt_ms), round_metric(stats.bandwidth_mbps))
+      if DEBUG >= 2: print(f"Link to {peer_id}: {self.published[peer_id]}")
+
+  def links(self) -> Dict[str, LinkQuality]:
+    return dict(self.published)
+
+  def to_dict(self) -> Dict:
+    return {
+      peer_id: {"rtt_ms": stats.rtt_ms, "bandwidth_mbps": stats.bandwidth_mbps, "probes": stats.probes, "failures": stats.failures}
+      for peer_id, stats in self.stats.items()
+    }
+
+
+def moved(published: Optional[float], current: Optional[float], threshold: float) -> bool:
+  if current is None:
+    return False
+  if published is None:
+    return True
+  return abs(current - published) > threshold*max(abs(published), 1e-9)
+
+
+def round_metric(value: Optional[float]) -> Optional[float]:
+  return None if value is None else round(value, 3)
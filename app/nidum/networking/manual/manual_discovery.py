@@ -30,8 +30,10 @@ class ManualDiscovery(Discovery):
 
   async def start(self) -> None:
     self.listen_task = asyncio.create_task(self.task_find_peers_from_config())
+    self.start_membership()
 
   async def stop(self) -> None:
+    await self.stop_membership()
     if self.listen_task: self.listen_task.cancel()
     self._file_executor.shutdown(wait=True)
 
@@ -43,6 +45,14 @@ class ManualDiscovery(Discovery):
     if DEBUG_DISCOVERY >= 2: print(f"Discovered peers: {[peer.id() for peer in self.known_peers.values()]}")
     return list(self.known_peers.values())
 
+  def peer_handles(self) -> Dict[str, PeerHandle]:
+    return dict(self.known_peers)
+
+  def remove_peer(self, peer_id: str) -> None:
+    # rebuilt from the config every second, the next pass health checks it again to let it back in
+    if peer_id in self.known_peers:
+      self.known_peers = {known_id: peer for known_id, peer in self.known_peers.items() if known_id != peer_id}
+
   async def task_find_peers_from_config(self):
     if DEBUG_DISCOVERY >= 2: print("Starting task to find peers from config...")
     while True:
@@ -55,7 +65,7 @@ class ManualDiscovery(Discovery):
           if not peer:
             if DEBUG_DISCOVERY >= 2: print(f"{peer_id=} not found in known peers. Adding.")
             peer = self.create_peer_handle(peer_id, f"{peer_config.address}:{peer_config.port}", "MAN", peer_config.device_capabilities)
-          is_healthy = await peer.health_check()
+          is_healthy = await self.peer_healthy(peer)
           if is_healthy:
             if DEBUG_DISCOVERY >= 2: print(f"{peer_id=} at {peer_config.address}:{peer_config.port} is healthy.")
             new_known_peers[peer_id] = peer
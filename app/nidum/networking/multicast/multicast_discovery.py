@@ -0,0 +1,155 @@
+import asyncio
+import json
+import random
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from nidum.networking.peer_handle import PeerHandle
+from nidum.networking.udp.udp_discovery import ListenProtocol, UDPDiscovery
+from nidum.topology.device_capabilities import DeviceCapabilities, UNKNOWN_DEVICE_CAPABILITIES
+from nidum.helpers import DEBUG_DISCOVERY, wait_event
+
+# administratively scoped (RFC 2365), stays inside the site
+DEFAULT_MULTICAST_GROUP = "239.255.77.77"
+
+
+class MulticastDiscovery(UDPDiscovery):
+  """
+  UDPDiscovery for a LAN without the cluster API: presence goes to a multicast group every node joins.
+  The first announce goes out on start, later ones at a jittered interval so nodes started together
+  do not stay in lockstep, and an announce from a node not seen before is answered right away, so a
+  cold cluster forms within a round trip instead of an interval.
+  """
+  def __init__(
+    self,
+    node_id: str,
+    node_port: int,
+    port: int,
+    create_peer_handle: Callable[[str, str, str, DeviceCapabilities], PeerHandle],
+    group: str = DEFAULT_MULTICAST_GROUP,
+    multicast_ttl: int = 1,
+    broadcast_interval: float = 2.5,
+    jitter: float = 0.25,
+    min_announce_gap: float = 0.05,
+    discovery_timeout: int = 30,
+    device_capabilities: DeviceCapabilities = UNKNOWN_DEVICE_CAPABILITIES,
+    allowed_node_ids: List[str] = None,
+    interfaces: Optional[List[str]] = None,
+  ):
+    super().__init__(
+      node_id,
+      node_port,
+      port,
+      port,
+      create_peer_handle,
+      machine_id=None,
+      cluster_id=None,
+      broadcast_interval=broadcast_interval,
+      discovery_timeout=discovery_timeout,
+      device_capabilities=device_capabilities,
+      allowed_node_ids=allowed_node_ids,
+    )
+    self.group = group
+    self.multicast_ttl = multicast_ttl
+    self.jitter = jitter
+    self.min_announce_gap = min_announce_gap
+    # local addresses to announce and listen on, all of them when None
+    self.interfaces = interfaces
+    self.listen_transport: Optional[asyncio.DatagramTransport] = None
+    self.joined: Set[str] = set()
+    self.announce_now = asyncio.Event()
+    # when each not yet known node was last answered, so an unhealthy node cannot keep us announcing
+    self.answered: Dict[str, float] = {}
+
+  async def stop(self):
+    await super().stop()
+    if self.listen_transport is not None:
+      self.listen_transport.close()
+      self.listen_transport = None
+    self.joined.clear()
+
+  def presence_targets(self) -> List[str]:
+    return [self.group]
+
+  def local_interfaces(self) -> List[Tuple[str, str]]:
+    interfaces = super().local_interfaces()
+    if self.interfaces is None:
+      return interfaces
+    return [(addr, name) for addr, name in interfaces if addr in self.interfaces]
+
+  def next_interval(self) -> float:
+    return self.broadcast_interval*random.uniform(1 - self.jitter, 1 + self.jitter)
+
+  async def task_broadcast_presence(self):
+    if DEBUG_DISCOVERY >= 2: print(f"Starting multicast presence on {self.group}:{self.broadcast_port}")
+
+    while True:
+      self.announce_now.clear()
+      try:
+        self.join_group()
+        await self.broadcast_presence()
+      except Exception as e:
+        print(f"Error in multicast presence: {e}")
+      await asyncio.sleep(self.min_announce_gap)
+      await wait_event(self.announce_now, max(0.0, self.next_interval() - self.min_announce_gap))
+
+  async def open_broadcast_socket(self, addr: str) -> asyncio.DatagramTransport:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+      sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+      # other nodes on this host listen on the same group
+      sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+      sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(addr))
+      sock.bind((addr, 0))
+    except OSError:
+      sock.close()
+      raise
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(asyncio.DatagramProtocol, sock=sock)
+    return transport
+
+  async def task_listen_for_peers(self):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # every node on this host binds the group port
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+      sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", self.listen_port))
+    self.listen_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: ListenProtocol(self.on_listen_message), sock=sock)
+    self.join_group()
+    if DEBUG_DISCOVERY >= 2: print(f"Listening on multicast group {self.group}:{self.listen_port}")
+
+  def join_group(self) -> None:
+    """Joins the group on local addresses that appeared since the last call."""
+    if self.listen_transport is None:
+      return
+    sock = self.listen_transport.get_extra_info("socket")
+    for addr, _ in self.local_interfaces():
+      if addr in self.joined:
+        continue
+      self.joined.add(addr)
+      try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton(addr)))
+      except OSError as e:
+        if DEBUG_DISCOVERY >= 1: print(f"Could not join {self.group} on {addr}: {e}")
+
+  async def on_listen_message(self, data, addr):
+    peer_id = self.unknown_peer(data)
+    if peer_id is not None and time.monotonic() - self.answered.get(peer_id, float("-inf")) >= self.broadcast_interval:
+      self.answered[peer_id] = time.monotonic()
+      self.announce_now.set()
+    await super().on_listen_message(data, addr)
+
+  def unknown_peer(self, data: bytes) -> Optional[str]:
+    try:
+      message = json.loads(data)
+    except ValueError:
+      return None
+    if not isinstance(message, dict) or message.get("type") != "discovery":
+      return None
+    peer_id = message.get("node_id")
+    if peer_id == self.node_id or peer_id in self.known_peers:
+      return None
+    if self.allowed_node_ids and peer_id not in self.allowed_node_ids:
+      return None
+    return peer_id
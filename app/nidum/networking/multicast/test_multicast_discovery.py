@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+from nidum.helpers import find_available_port
+from nidum.networking.multicast.multicast_discovery import MulticastDiscovery
+from nidum.topology.device_capabilities import UNKNOWN_DEVICE_CAPABILITIES
+
+
+class TestMulticastDiscovery(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    # device_capabilities() probes the accelerator, which is beside the point here
+    patcher = mock.patch("nidum.networking.udp.udp_discovery.device_capabilities", return_value=UNKNOWN_DEVICE_CAPABILITIES)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.port = find_available_port("127.0.0.1")
+    self.discoveries = []
+
+  async def asyncTearDown(self):
+    await asyncio.gather(*[discovery.stop() for discovery in self.discoveries])
+
+  def create(self, node_id: str, **kwargs) -> MulticastDiscovery:
+    discovery = MulticastDiscovery(
+      node_id,
+      50051 + len(self.discoveries),
+      self.port,
+      lambda peer_id, address, description, device_capabilities: mock.AsyncMock(addr=mock.Mock(return_value=address)),
+      group="239.255.77.78",
+      interfaces=["127.0.0.1"],
+      **kwargs,
+    )
+    self.discoveries.append(discovery)
+    return discovery
+
+  async def test_cold_cluster_forms_within_a_second(self):
+    # a long interval leaves only the startup announce and the answers to it
+    nodes = [self.create(f"node{i}", broadcast_interval=30) for i in range(3)]
+    start = time.monotonic()
+    for node in nodes:
+      await node.start()
+      await asyncio.sleep(0.05)
+    await asyncio.wait_for(asyncio.gather(*[node.discover_peers(wait_for_peers=2) for node in nodes]), timeout=1.0)
+    self.assertLess(time.monotonic() - start, 1.0)
+    self.assertEqual(set(nodes[0].known_peers), {"node1", "node2"})
+    self.assertTrue(all(address.startswith("127.0.0.1:") for address in (peer.addr() for peer, *_ in nodes[0].known_peers.values())))
+
+  async def test_announces_carry_the_grpc_port(self):
+    node = self.create("node0")
+    listener = self.create("listener")
+    received = []
+    original = listener.on_listen_message
+
+    async def on_listen_message(data, addr):
+      received.append(json.loads(data))
+      await original(data, addr)
+
+    listener.on_listen_message = on_listen_message
+    await listener.start()
+    await asyncio.sleep(0.05)
+    await node.start()
+    await asyncio.wait_for(listener.discover_peers(wait_for_peers=1), timeout=1.0)
+    message = next(message for message in received if message["node_id"] == "node0")
+    self.assertEqual((message["grpc_port"], message["interface_name"]), (50051, "lo"))
+
+  def test_jittered_interval(self):
+    node = self.create("node0", broadcast_interval=2.0, jitter=0.25)
+    intervals = [node.next_interval() for _ in range(100)]
+    self.assertTrue(all(1.5 <= interval <= 2.5 for interval in intervals))
+    self.assertGreater(len(set(intervals)), 1)
+
+  def test_only_unknown_nodes_are_answered(self):
+    node = self.create("node0")
+    announce = json.dumps({"type": "discovery", "node_id": "node1"}).encode()
+    self.assertEqual(node.unknown_peer(announce), "node1")
+    self.assertIsNone(node.unknown_peer(json.dumps({"type": "discovery", "node_id": "node0"}).encode()))
+    self.assertIsNone(node.unknown_peer(b"not json"))
+    node.known_peers["node1"] = (mock.Mock(), 0, 0, 0)
+    self.assertIsNone(node.unknown_peer(announce))
+
+
+if __name__ == "__main__":
+  unittest.main()
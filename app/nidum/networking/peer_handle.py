@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List
 import numpy as np
 from nidum.inference.shard import Shard
 from nidum.topology.device_capabilities import DeviceCapabilities
 from nidum.topology.topology import Topology
+from nidum.topology.topology_store import NodeRecord
+from nidum.networking.swim import MemberUpdate
 
 
 class PeerHandle(ABC):
@@ -40,15 +42,19 @@ class PeerHandle(ABC):
     pass
 
   @abstractmethod
-  async def send_prompt(self, shard: Shard, prompt: str, request_id: Optional[str] = None) -> Optional[np.array]:
+  async def gossip(self, target_id: str, updates: List[MemberUpdate]) -> Tuple[bool, List[MemberUpdate]]:
     pass
 
   @abstractmethod
-  async def send_tensor(self, shard: Shard, tensor: np.array, request_id: Optional[str] = None) -> Optional[np.array]:
+  async def send_prompt(self, shard: Shard, prompt: str, request_id: Optional[str] = None, request_metadata: Optional[Dict[str, str]] = None) -> Optional[np.array]:
     pass
 
   @abstractmethod
-  async def send_result(self, request_id: str, result: List[int], is_finished: bool) -> None:
+  async def send_tensor(self, shard: Shard, tensor: np.array, request_id: Optional[str] = None, request_metadata: Optional[Dict[str, str]] = None) -> Optional[np.array]:
+    pass
+
+  @abstractmethod
+  async def send_result(self, request_id: str, result: List[int], is_finished: bool, start_index: int = 0, node_id: Optional[str] = None) -> None:
     pass
 
   @abstractmethod
@@ -58,3 +64,11 @@ class PeerHandle(ABC):
   @abstractmethod
   async def collect_topology(self, visited: set[str], max_depth: int) -> Topology:
     pass
+
+  @abstractmethod
+  async def probe(self, payload: bytes, timeout: Optional[float] = None) -> None:
+    pass
+
+  @abstractmethod
+  async def sync_topology(self, versions: Dict[str, int], records: List[NodeRecord]) -> Tuple[List[NodeRecord], Dict[str, int]]:
+    pass
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class PeerLiveness:
+  """
+  Cached health of one peer. Any successful RPC to the peer proves it is alive, an explicit probe
+  is only sent once it has been quiet for healthy_ttl seconds (failed probes are trusted for
+  unhealthy_ttl seconds). Concurrent checks while a probe is running wait for that probe.
+  """
+  def __init__(
+    self,
+    probe: Callable[[], Awaitable[bool]],
+    healthy_ttl: float = 10.0,
+    unhealthy_ttl: float = 1.0,
+    clock: Callable[[], float] = time.monotonic,
+  ):
+    self.probe = probe
+    self.healthy_ttl = healthy_ttl
+    self.unhealthy_ttl = unhealthy_ttl
+    self.clock = clock
+    self.healthy: Optional[bool] = None
+    self.checked_at = 0.0
+    self.inflight: Optional[asyncio.Future] = None
+    self.probes_sent = 0
+    self.cache_hits = 0
+
+  def record_success(self) -> None:
+    self.healthy = True
+    self.checked_at = self.clock()
+
+  def invalidate(self) -> None:
+    """The connection broke, the next check probes instead of trusting older evidence."""
+    self.healthy = None
+
+  def is_fresh(self) -> bool:
+    if self.healthy is None:
+      return False
+    return self.clock() - self.checked_at < (self.healthy_ttl if self.healthy else self.unhealthy_ttl)
+
+  async def check(self) -> bool:
+    if self.is_fresh():
+      self.cache_hits += 1
+      return self.healthy
+    if self.inflight is None:
+      self.inflight = asyncio.ensure_future(self._probe())
+    return await asyncio.shield(self.inflight)
+
+  async def _probe(self) -> bool:
+    self.probes_sent += 1
+    try:
+      healthy = await self.probe()
+    except Exception:
+      healthy = False
+    finally:
+      self.inflight = None
+    self.healthy = healthy
+    self.checked_at = self.clock()
+    return healthy
+
+  def to_dict(self) -> Dict:
+    return {
+      "healthy": self.healthy,
+      "age": self.clock() - self.checked_at if self.healthy is not None else None,
+      "probes_sent": self.probes_sent,
+      "cache_hits": self.cache_hits,
+    }
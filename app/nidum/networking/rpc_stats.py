@@ -0,0 +1,75 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# traffic classes peer RPCs are split into, each gets its own channel
+CONTROL = "control"
+DATA = "data"
+TRAFFIC_CLASSES = (CONTROL, DATA)
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+  """Fixed bucket histogram of latencies in seconds, the last bucket catches everything above the largest bound."""
+  def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+    self.buckets = buckets
+    self.counts = [0]*(len(buckets) + 1)
+    self.count = 0
+    self.sum = 0.0
+
+  def observe(self, seconds: float) -> None:
+    self.counts[bisect_left(self.buckets, seconds)] += 1
+    self.count += 1
+    self.sum += seconds
+
+  def quantile(self, q: float) -> float:
+    """Upper bound of the bucket the q-th observation falls in, inf when it is above every bucket."""
+    if self.count == 0:
+      return 0.0
+    rank, seen = q*self.count, 0
+    for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+      seen += count
+      if seen >= rank:
+        return bound
+    return float("inf")
+
+  def to_dict(self) -> Dict:
+    cumulative, buckets = 0, {}
+    for bound, count in zip(self.buckets, self.counts):
+      cumulative += count
+      buckets[str(bound)] = cumulative
+    return {
+      "count": self.count,
+      "mean": self.sum/self.count if self.count else 0.0,
+      "p50": self.quantile(0.5),
+      "p99": self.quantile(0.99),
+      "buckets": buckets,
+    }
+
+
+class RpcLatency:
+  """Latency of RPCs to peers per traffic class. Listeners (the prometheus exporter) see every observation."""
+  def __init__(self):
+    self.histograms: Dict[str, LatencyHistogram] = {traffic_class: LatencyHistogram() for traffic_class in TRAFFIC_CLASSES}
+    self.listeners: List[Callable[[str, float], None]] = []
+
+  def observe(self, traffic_class: str, seconds: float) -> None:
+    self.histograms[traffic_class].observe(seconds)
+    for listener in self.listeners:
+      listener(traffic_class, seconds)
+
+  @contextmanager
+  def timed(self, traffic_class: str):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(traffic_class, time.perf_counter() - start)
+
+  def to_dict(self) -> Dict:
+    return {traffic_class: histogram.to_dict() for traffic_class, histogram in self.histograms.items()}
+
+
+rpc_latency = RpcLatency()
@@ -0,0 +1,52 @@
+import asyncio
+import struct
+from typing import Optional
+import grpc
+
+from nidum.networking.grpc import node_service_pb2
+
+_LENGTH = struct.Struct("!I")
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[bytes]:
+  """One length prefixed message, None once the other end closed the connection."""
+  try:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+  except (asyncio.IncompleteReadError, ConnectionError):
+    return None
+
+
+def write_message(writer: asyncio.StreamWriter, data: bytes) -> None:
+  writer.write(_LENGTH.pack(len(data)) + data)
+
+
+class UnixTensorStreamCall:
+  """A TensorStream call over the unix socket control channel, with the read/write/cancel surface of a grpc.aio call."""
+  def __init__(self, path: str):
+    self.connection = asyncio.ensure_future(asyncio.open_unix_connection(path))
+
+  async def write(self, frame: node_service_pb2.TensorFrame) -> None:
+    _, writer = await self.connection
+    write_message(writer, frame.SerializeToString())
+    await writer.drain()
+
+  async def read(self):
+    reader, _ = await self.connection
+    data = await read_message(reader)
+    return grpc.aio.EOF if data is None else node_service_pb2.TensorAck.FromString(data)
+
+  def cancel(self) -> None:
+    if not self.connection.done():
+      self.connection.cancel()
+    elif not self.connection.cancelled() and self.connection.exception() is None:
+      self.connection.result()[1].close()
+
+
+class UnixTensorStreamStub:
+  """Stands in for the gRPC stub of a TensorStreamClient so frames go over a peer's control socket."""
+  def __init__(self, path: str):
+    self.path = path
+
+  def TensorStream(self) -> UnixTensorStreamCall:
+    return UnixTensorStreamCall(self.path)
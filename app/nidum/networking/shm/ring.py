@@ -0,0 +1,126 @@
+import os
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Deque, Dict, Optional, Set
+import numpy as np
+
+from nidum.networking.grpc import node_service_pb2
+from nidum.networking.grpc.tensor_codec import ALIGNMENT, aligned_empty, dtype_from_proto, dtype_to_proto
+
+
+# segments created by this process, their tracker registration belongs to the creator
+_created: Set[str] = set()
+
+
+def create_segment(size: int, name: Optional[str] = None) -> SharedMemory:
+  shm = SharedMemory(name=name or f"nidum-{uuid.uuid4().hex[:16]}", create=True, size=size)
+  _created.add(shm.name)
+  return shm
+
+
+def attach(name: str) -> SharedMemory:
+  """Attach to a segment another process owns, without letting our resource tracker unlink it at exit."""
+  try:
+    return SharedMemory(name=name, track=False)
+  except TypeError:  # python < 3.13
+    shm = SharedMemory(name=name)
+    if os.name == "posix" and name not in _created:
+      resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def same_host(probe: str, socket_path: str) -> bool:
+  """True when the peer's probe segment is visible to us and holds its socket path, i.e. we share its memory."""
+  if not probe or not socket_path:
+    return False
+  try:
+    shm = attach(probe)
+  except (OSError, ValueError):
+    return False
+  try:
+    return bytes(shm.buf[:len(socket_path.encode())]) == socket_path.encode()
+  finally:
+    shm.close()
+
+
+@dataclass
+class ShmSlot:
+  offset: int
+  end: int
+  released: bool = False
+
+
+class ShmRing:
+  """
+  Tensor buffers in one shared memory segment, handed out in FIFO order. Only the sending process
+  allocates and releases; the receiver attaches by name and copies a tensor out before acking it,
+  so a slot is free again as soon as its send completes. Slots are ALIGNMENT aligned.
+  """
+  def __init__(self, size: int, name: Optional[str] = None):
+    self.shm = create_segment(size, name)
+    self.size = size
+    # monotonic byte counts, head - tail is what is in use
+    self.head = 0
+    self.tail = 0
+    self.slots: Deque[ShmSlot] = deque()
+
+  @property
+  def name(self) -> str:
+    return self.shm.name
+
+  @property
+  def in_use(self) -> int:
+    return self.head - self.tail
+
+  def allocate(self, nbytes: int) -> Optional[ShmSlot]:
+    nbytes = max(ALIGNMENT, -(-nbytes // ALIGNMENT)*ALIGNMENT)
+    offset = self.head % self.size
+    # a slot never wraps, the rest of the segment is skipped instead
+    padding = self.size - offset if offset + nbytes > self.size else 0
+    if nbytes > self.size or self.in_use + padding + nbytes > self.size:
+      return None
+    self.head += padding + nbytes
+    slot = ShmSlot(0 if padding else offset, self.head)
+    self.slots.append(slot)
+    return slot
+
+  def write(self, array: np.ndarray) -> Optional[ShmSlot]:
+    slot = self.allocate(array.nbytes)
+    if slot is not None:
+      np.copyto(np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=slot.offset), array)
+    return slot
+
+  def release(self, slot: ShmSlot) -> None:
+    slot.released = True
+    while self.slots and self.slots[0].released:
+      self.tail = self.slots.popleft().end
+
+  def tensor(self, array: np.ndarray, slot: ShmSlot) -> node_service_pb2.Tensor:
+    return node_service_pb2.Tensor(
+      shape=array.shape,
+      dtype=str(array.dtype),
+      dtype_enum=dtype_to_proto(array.dtype),
+      shm=node_service_pb2.ShmRef(segment=self.name, offset=slot.offset),
+    )
+
+  def close(self) -> None:
+    self.shm.close()
+    _created.discard(self.shm.name)
+    try:
+      self.shm.unlink()
+    except FileNotFoundError:
+      pass
+
+
+def read_tensor(segments: Dict[str, SharedMemory], tensor: node_service_pb2.Tensor) -> np.ndarray:
+  """Copy a tensor out of the sender's ring into private aligned memory, attaching to the segment on first use."""
+  if tensor.shm.segment not in segments:
+    segments[tensor.shm.segment] = attach(tensor.shm.segment)
+  dtype = dtype_from_proto(tensor)
+  shape = tuple(tensor.shape)
+  array = aligned_empty(shape, dtype)
+  np.copyto(array, np.ndarray(shape, dtype=dtype, buffer=segments[tensor.shm.segment].buf, offset=tensor.shm.offset))
+  return array
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Dict, Optional
+import numpy as np
+
+from .control import UnixTensorStreamStub
+from .ring import ShmRing, same_host
+from nidum.networking.grpc import node_service_pb2
+from nidum.networking.grpc.grpc_peer_handle import GRPCPeerHandle
+from nidum.networking.grpc.tensor_codec import tensor_from_proto
+from nidum.networking.grpc.tensor_stream import TensorStreamClient
+from nidum.networking.rpc_stats import DATA, rpc_latency
+from nidum.inference.shard import Shard
+from nidum.helpers import DEBUG
+
+
+class ShmPeerHandle(GRPCPeerHandle):
+  """
+  GRPCPeerHandle that moves send_tensor payloads through a shared memory ring when the peer runs on
+  this host. Frames go over the peer's unix socket control channel and only say where in the ring
+  the tensor sits. Everything else, and tensors that do not fit the ring, still go over gRPC.
+  """
+  def __init__(self, *args, ring_bytes: int = 64*1024*1024, shm_ack_timeout: float = 30.0, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.ring_bytes = ring_bytes
+    self.shm_ack_timeout = shm_ack_timeout
+    # slots of cancelled sends, freed once the peer answers their frames
+    self.unanswered = set()
+    self.ring: Optional[ShmRing] = None
+    self.shm_stream: Optional[TensorStreamClient] = None
+    self.shm_checked = False
+    self.shm_sends = 0
+    self.shm_fallbacks = 0
+
+  async def connect(self):
+    await super().connect()
+    if not self.shm_checked and self.peer_health is not None:
+      self.shm_checked = True
+      self.open_shm(self.peer_health.shm_socket, self.peer_health.shm_probe)
+
+  def open_shm(self, socket_path: str, probe: str) -> None:
+    if not same_host(probe, socket_path):
+      return
+    try:
+      self.ring = ShmRing(self.ring_bytes)
+    except OSError as e:
+      if DEBUG >= 1: print(f"Could not create shared memory ring for {self._id}@{self.address}, staying on gRPC: {e}")
+      return
+    self.shm_stream = TensorStreamClient(UnixTensorStreamStub(socket_path))
+    if DEBUG >= 1: print(f"Sending tensors to {self._id}@{self.address} through shared memory ({socket_path})")
+
+  async def close_shm(self) -> None:
+    if self.shm_stream is not None:
+      await self.shm_stream.close()
+      self.shm_stream = None
+    if self.ring is not None:
+      self.ring.close()
+      self.ring = None
+
+  async def release_when_answered(self, ring: ShmRing, slot, frame: asyncio.Future) -> None:
+    """Frees the slot of a send whose caller was cancelled once the peer answered its frame, it may still be copying it."""
+    try:
+      await asyncio.wait_for(asyncio.shield(frame), timeout=self.shm_ack_timeout)
+    except asyncio.TimeoutError:
+      # no answer, closing the stream ends the frame on the peer before the slot can be written again
+      if self.ring is ring:
+        if DEBUG >= 1: print(f"Shared memory frame to {self._id}@{self.address} was never answered, closing the stream")
+        await self.close_shm()
+    except Exception:
+      pass
+    finally:
+      ring.release(slot)
+
+  async def disconnect(self):
+    await self.close_shm()
+    self.shm_checked = False
+    await super().disconnect()
+
+  async def send_tensor(self, shard: Shard, tensor: np.ndarray, inference_state: Optional[dict] = None, request_id: Optional[str] = None, request_metadata: Optional[Dict[str, str]] = None) -> Optional[np.array]:
+    ring, stream = self.ring, self.shm_stream
+    array = np.ascontiguousarray(tensor) if ring is not None else None
+    slot = ring.write(array) if ring is not None else None
+    if slot is None:
+      if ring is not None: self.shm_fallbacks += 1
+      return await super().send_tensor(shard, tensor, inference_state, request_id, request_metadata)
+
+    answering = None
+
+    async def send(state: Optional[node_service_pb2.InferenceState]) -> node_service_pb2.Tensor:
+      nonlocal answering
+      request = node_service_pb2.TensorRequest(
+        shard=node_service_pb2.Shard(
+          model_id=shard.model_id,
+          start_layer=shard.start_layer,
+          end_layer=shard.end_layer,
+          n_layers=shard.n_layers,
+        ),
+        tensor=ring.tensor(array, slot),
+        request_id=request_id,
+        inference_state=state,
+        request_metadata=request_metadata,
+      )
+      frame = asyncio.ensure_future(stream.send(request))
+      try:
+        with rpc_latency.timed(DATA):
+          ack = await asyncio.shield(frame)
+      except asyncio.CancelledError:
+        answering = asyncio.create_task(self.release_when_answered(ring, slot, frame))
+        self.unanswered.add(answering)
+        answering.add_done_callback(self.unanswered.discard)
+        raise
+      self.liveness.record_success()
+      return ack.tensor
+
+    try:
+      response = await self._send_with_inference_state(request_id, inference_state, send)
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+      # the peer no longer serves its control socket (restarted or stopped), the frame never left
+      if DEBUG >= 1: print(f"Shared memory transport to {self._id}@{self.address} failed, falling back to gRPC: {e}")
+      await self.close_shm()
+      return await super().send_tensor(shard, tensor, inference_state, request_id, request_metadata)
+    finally:
+      # a cancelled send hands its slot over to release_when_answered
+      if answering is None: ring.release(slot)
+    self.shm_sends += 1
+    return tensor_from_proto(response)
@@ -0,0 +1,111 @@
+import asyncio
+import os
+import socket
+import stat
+import tempfile
+import traceback
+from multiprocessing.shared_memory import SharedMemory
+from typing import Awaitable, Callable, Dict, Optional
+import numpy as np
+
+from .control import read_message, write_message
+from .ring import create_segment, read_tensor
+from nidum.networking.grpc import node_service_pb2
+from nidum.networking.grpc.tensor_stream import serve_tensor_stream
+from nidum import DEBUG
+
+
+def socket_path(node_id: str) -> str:
+  """Control socket of a node, in a directory only the current user can enter."""
+  runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+  if not runtime_dir and hasattr(os, "getuid"):
+    runtime_dir = os.path.join(tempfile.gettempdir(), f"nidum-{os.getuid()}")
+    os.makedirs(runtime_dir, mode=0o700, exist_ok=True)
+    if os.stat(runtime_dir).st_uid != os.getuid():
+      raise PermissionError(f"{runtime_dir} belongs to another user")
+  return os.path.join(runtime_dir or tempfile.gettempdir(), f"nidum-{node_id}.sock")
+
+
+def is_live_socket(path: str) -> bool:
+  """True when something accepts connections on the unix socket at path."""
+  with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+    try:
+      sock.connect(path)
+    except OSError:
+      return False
+  return True
+
+
+class ShmServer:
+  """
+  Receiving end of the shared memory transport. Peers on this host send TensorStream frames over a
+  unix socket, each frame's tensor sits in the sender's ring and is copied out before the frame is
+  handled. A small probe segment holding the socket path lets peers check they share our memory.
+  """
+  def __init__(self, handle_request: Callable[[node_service_pb2.TensorRequest, np.ndarray], Awaitable[node_service_pb2.Tensor]], path: str):
+    self.handle_request = handle_request
+    self.path = path
+    self.server: Optional[asyncio.AbstractServer] = None
+    self.probe: Optional[SharedMemory] = None
+    self.frames_received = 0
+
+  @property
+  def is_serving(self) -> bool:
+    return self.server is not None
+
+  @property
+  def probe_name(self) -> str:
+    return self.probe.name if self.probe is not None else ""
+
+  async def start(self) -> None:
+    if not hasattr(socket, "AF_UNIX"):
+      if DEBUG >= 1: print("Unix sockets are not available, shared memory transport disabled")
+      return
+    if os.path.lexists(self.path):
+      if not stat.S_ISSOCK(os.lstat(self.path).st_mode) or is_live_socket(self.path):
+        print(f"{self.path} is in use by another process, shared memory transport disabled")
+        return
+      # left behind by a node that did not shut down cleanly
+      os.unlink(self.path)
+    self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+    path = self.path.encode()
+    self.probe = create_segment(len(path))
+    self.probe.buf[:len(path)] = path
+    if DEBUG >= 1: print(f"Shared memory transport listening on {self.path}")
+
+  async def stop(self) -> None:
+    if self.server is not None:
+      self.server.close()
+      await self.server.wait_closed()
+      self.server = None
+      if os.path.exists(self.path):
+        os.unlink(self.path)
+    if self.probe is not None:
+      self.probe.close()
+      self.probe.unlink()
+      self.probe = None
+
+  async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # segments of this sender, released when it disconnects
+    segments: Dict[str, SharedMemory] = {}
+
+    async def frames():
+      while (data := await read_message(reader)) is not None:
+        self.frames_received += 1
+        yield node_service_pb2.TensorFrame.FromString(data)
+
+    async def handle(request: node_service_pb2.TensorRequest) -> node_service_pb2.Tensor:
+      return await self.handle_request(request, read_tensor(segments, request.tensor))
+
+    try:
+      async for ack in serve_tensor_stream(frames(), handle):
+        write_message(writer, ack.SerializeToString())
+        await writer.drain()
+    except ConnectionError:
+      pass
+    except Exception:
+      if DEBUG >= 1: traceback.print_exc()
+    finally:
+      writer.close()
+      for shm in segments.values():
+        shm.close()
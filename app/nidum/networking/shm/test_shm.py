@@ -0,0 +1,155 @@
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+import uuid
+import numpy as np
+
+from .control import UnixTensorStreamStub
+from .ring import ShmRing, same_host
+from .shm_peer_handle import ShmPeerHandle
+from .shm_server import ShmServer, socket_path
+from nidum.networking.grpc import node_service_pb2
+from nidum.networking.grpc.tensor_codec import ALIGNMENT, tensor_to_proto
+from nidum.networking.grpc.tensor_stream import TensorStreamClient
+from nidum.inference.shard import Shard
+from nidum.topology.device_capabilities import UNKNOWN_DEVICE_CAPABILITIES
+
+
+class TestShmRing(unittest.TestCase):
+  def setUp(self):
+    self.ring = ShmRing(4*ALIGNMENT)
+
+  def tearDown(self):
+    self.ring.close()
+
+  def test_slots_are_reused_in_order(self):
+    a = self.ring.allocate(ALIGNMENT)
+    b = self.ring.allocate(2*ALIGNMENT)
+    self.assertEqual((a.offset, b.offset), (0, ALIGNMENT))
+    self.assertIsNone(self.ring.allocate(2*ALIGNMENT))
+    # releasing out of order frees nothing until the oldest slot is done
+    self.ring.release(b)
+    self.assertEqual(self.ring.in_use, 3*ALIGNMENT)
+    self.ring.release(a)
+    self.assertEqual(self.ring.in_use, 0)
+
+  def test_slots_do_not_wrap(self):
+    first = self.ring.allocate(3*ALIGNMENT)
+    self.ring.release(first)
+    wrapped = self.ring.allocate(2*ALIGNMENT)
+    self.assertEqual(wrapped.offset, 0)
+    self.assertEqual(self.ring.in_use, 3*ALIGNMENT)
+    self.assertIsNone(self.ring.allocate(5*ALIGNMENT))
+
+
+class TestShmTransport(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    self.received = []
+    self.gate = asyncio.Event()
+    self.gate.set()
+
+    async def handle(request, tensor):
+      await self.gate.wait()
+      self.received.append((request.request_id, tensor))
+      return tensor_to_proto(tensor*2)[0]
+
+    self.path = os.path.join(tempfile.gettempdir(), f"nidum-test-{uuid.uuid4().hex[:8]}.sock")
+    self.server = ShmServer(handle, self.path)
+    await self.server.start()
+    self.ring = ShmRing(1024*1024)
+    self.client = TensorStreamClient(UnixTensorStreamStub(self.path))
+
+  async def asyncTearDown(self):
+    await self.client.close()
+    self.ring.close()
+    await self.server.stop()
+
+  async def send(self, request_id: str, tensor: np.ndarray) -> node_service_pb2.TensorAck:
+    slot = self.ring.write(tensor)
+    try:
+      return await self.client.send(node_service_pb2.TensorRequest(tensor=self.ring.tensor(tensor, slot), request_id=request_id))
+    finally:
+      self.ring.release(slot)
+
+  async def test_tensors_travel_through_shared_memory(self):
+    tensors = [np.random.default_rng(i).standard_normal((1, 3, 256)).astype(np.float32) for i in range(4)]
+    acks = await asyncio.gather(*[self.send(f"r{i}", tensor) for i, tensor in enumerate(tensors)])
+    for tensor, ack, (_, received) in zip(tensors, acks, sorted(self.received, key=lambda r: r[0])):
+      np.testing.assert_array_equal(received, tensor)
+      self.assertTrue(received.flags.writeable)
+      np.testing.assert_array_equal(np.frombuffer(ack.tensor.tensor_data, dtype=np.float32).reshape(tensor.shape), tensor*2)
+    self.assertEqual(self.server.frames_received, 4)
+    self.assertEqual(self.ring.in_use, 0)
+
+  async def test_probe_proves_same_host(self):
+    self.assertTrue(same_host(self.server.probe_name, self.path))
+    self.assertFalse(same_host(self.server.probe_name, self.path + ".other"))
+    self.assertFalse(same_host("nidum-missing-probe", self.path))
+
+  async def test_live_socket_is_not_taken_over(self):
+    other = ShmServer(self.server.handle_request, self.path)
+    await other.start()
+    self.assertFalse(other.is_serving)
+    await other.stop()
+    ack = await self.send("r", np.ones((2, 2), dtype=np.float32))
+    self.assertEqual(ack.tensor.shape, [2, 2])
+
+  async def test_stale_socket_is_replaced(self):
+    await self.client.close()
+    await self.server.stop()
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(self.path)
+    stale.close()
+    self.server = ShmServer(self.server.handle_request, self.path)
+    await self.server.start()
+    self.assertTrue(self.server.is_serving)
+    self.client = TensorStreamClient(UnixTensorStreamStub(self.path))
+    ack = await self.send("r", np.ones((2, 2), dtype=np.float32))
+    self.assertEqual(ack.tensor.shape, [2, 2])
+
+  async def test_cancelled_send_keeps_its_slot_until_answered(self):
+    peer = ShmPeerHandle("peer", "localhost:1", "test", UNKNOWN_DEVICE_CAPABILITIES)
+    peer.ring, peer.shm_stream = self.ring, self.client
+    self.gate.clear()
+    send = asyncio.create_task(peer.send_tensor(Shard("m", 0, 0, 1), np.ones((2, 2), dtype=np.float32), request_id="r"))
+    while self.server.frames_received == 0:
+      await asyncio.sleep(0.01)
+    send.cancel()
+    with self.assertRaises(asyncio.CancelledError):
+      await send
+    # the peer has not copied the tensor out yet, so the slot must not be handed out again
+    self.assertGreater(self.ring.in_use, 0)
+    self.gate.set()
+    await asyncio.gather(*peer.unanswered)
+    self.assertEqual(self.ring.in_use, 0)
+    self.assertEqual(len(self.received), 1)
+
+  async def test_unanswered_frame_closes_the_stream_before_freeing_its_slot(self):
+    peer = ShmPeerHandle("peer", "localhost:1", "test", UNKNOWN_DEVICE_CAPABILITIES, shm_ack_timeout=0.05)
+    ring = ShmRing(1024*1024)
+    peer.ring, peer.shm_stream = ring, TensorStreamClient(UnixTensorStreamStub(self.path))
+    self.gate.clear()
+    send = asyncio.create_task(peer.send_tensor(Shard("m", 0, 0, 1), np.ones((2, 2), dtype=np.float32), request_id="r"))
+    while self.server.frames_received == 0:
+      await asyncio.sleep(0.01)
+    send.cancel()
+    await asyncio.gather(send, return_exceptions=True)
+    await asyncio.gather(*peer.unanswered)
+    self.assertEqual(ring.in_use, 0)
+    self.assertIsNone(peer.shm_stream)
+    self.gate.set()
+
+  def test_socket_path_is_per_node(self):
+    self.assertNotEqual(socket_path("node-a"), socket_path("node-b"))
+    self.assertIn("node-a", os.path.basename(socket_path("node-a")))
+
+  async def test_closed_control_socket(self):
+    await self.server.stop()
+    with self.assertRaises(FileNotFoundError):
+      await self.send("r", np.ones((2, 2), dtype=np.float32))
+
+
+if __name__ == "__main__":
+  unittest.main()
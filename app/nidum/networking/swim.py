@@ -0,0 +1,266 @@
+import asyncio
+import math
+import random
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+from nidum.helpers import DEBUG_DISCOVERY
+
+if TYPE_CHECKING:
+  from nidum.networking.peer_handle import PeerHandle
+
+# member states, ordered so the numbers match the MemberState enum in node_service.proto
+ALIVE = 0
+SUSPECT = 1
+DEAD = 2
+STATE_NAMES = {ALIVE: "alive", SUSPECT: "suspect", DEAD: "dead"}
+
+
+class MemberUpdate(NamedTuple):
+  node_id: str
+  state: int
+  incarnation: int
+
+
+def supersedes(update: MemberUpdate, state: int, incarnation: int) -> bool:
+  """SWIM precedence: a higher incarnation wins, at the same incarnation suspect beats alive and dead beats both."""
+  if update.incarnation != incarnation:
+    return update.incarnation > incarnation
+  return update.state > state
+
+
+class Member:
+  def __init__(self, node_id: str, state: int = ALIVE, incarnation: int = 0, since: float = 0.0):
+    self.node_id = node_id
+    self.state = state
+    self.incarnation = incarnation
+    self.since = since
+
+
+class SwimMembership:
+  """
+  SWIM failure detector over the peers a Discovery found. Every protocol_period one peer is pinged in
+  round robin order. When it does not ack within ping_timeout, indirect_probes other peers are asked to
+  ping it on our behalf. Without any ack it becomes suspect, and dead once suspicion_timeout passes
+  without it refuting (gossiping alive with a higher incarnation). State changes ride along on pings
+  and acks a few times each (retransmit_mult*log(n)), so each node probes one peer per period instead
+  of health checking all of them. Connecting to a peer is not part of the ack deadline, it gets
+  connect_timeout of its own.
+  """
+  def __init__(
+    self,
+    node_id: str,
+    peers: Callable[[], Dict[str, "PeerHandle"]],
+    on_dead: Optional[Callable[[str], None]] = None,
+    protocol_period: float = 1.0,
+    ping_timeout: float = 0.5,
+    connect_timeout: float = 5.0,
+    indirect_probes: int = 3,
+    suspicion_timeout: float = 5.0,
+    retransmit_mult: int = 3,
+    max_piggyback: int = 8,
+    clock: Callable[[], float] = time.monotonic,
+    rng: Optional[random.Random] = None,
+  ):
+    self.node_id = node_id
+    self.peers = peers
+    self.on_dead = on_dead
+    self.protocol_period = protocol_period
+    self.ping_timeout = ping_timeout
+    self.connect_timeout = connect_timeout
+    self.indirect_probes = indirect_probes
+    self.suspicion_timeout = suspicion_timeout
+    self.retransmit_mult = retransmit_mult
+    self.max_piggyback = max_piggyback
+    self.clock = clock
+    self.rng = rng or random.Random()
+    # starts from the wall clock so a restarted node outranks what the cluster remembers of its last run
+    self.incarnation = int(time.time()*1000)
+    self.members: Dict[str, Member] = {}
+    # last incarnation seen of peers no longer tracked (dead or dropped by discovery), rumours about
+    # them up to that incarnation are older than discovery finding them again
+    self.last_incarnations: Dict[str, int] = {}
+    self.pending: Dict[str, Tuple[MemberUpdate, int]] = {}
+    self.probe_order: List[str] = []
+    self.task: Optional[asyncio.Task] = None
+    self.pings_sent = 0
+    self.indirect_pings_sent = 0
+    self.suspicions = 0
+    self.deaths = 0
+    self.refutations = 0
+
+  def start(self) -> None:
+    if self.task is None:
+      self.task = asyncio.create_task(self.run())
+
+  async def stop(self) -> None:
+    if self.task is not None:
+      self.task.cancel()
+      await asyncio.gather(self.task, return_exceptions=True)
+      self.task = None
+
+  async def run(self) -> None:
+    while True:
+      start = self.clock()
+      try:
+        await self.probe_round()
+      except Exception as e:
+        print(f"Error in gossip probe round: {e}")
+      await asyncio.sleep(max(0.0, self.protocol_period - (self.clock() - start)))
+
+  def knows(self, node_id: str) -> bool:
+    return node_id in self.members
+
+  def is_alive(self, node_id: str) -> bool:
+    """Suspects still count as alive, they have until suspicion_timeout to refute."""
+    member = self.members.get(node_id)
+    return member is not None and member.state != DEAD
+
+  def detection_bound(self) -> float:
+    """Worst case seconds from a peer failing to this node declaring it dead, with no help from gossip."""
+    n = max(1, len(self.members))
+    return (2*n - 1)*self.protocol_period + self.suspicion_timeout
+
+  def sync(self) -> None:
+    """Tracks peers discovery added as alive and forgets the ones it dropped."""
+    peers = self.peers()
+    for node_id in peers:
+      if node_id not in self.members:
+        # discovery saw it just now, apply() ignores rumours up to the incarnation it was last known by
+        self.members[node_id] = Member(node_id, incarnation=self.last_incarnations.get(node_id, 0), since=self.clock())
+        self.pending.pop(node_id, None)
+    for node_id in [node_id for node_id in self.members if node_id not in peers]:
+      self.last_incarnations[node_id] = self.members.pop(node_id).incarnation
+
+  def next_target(self) -> Optional[str]:
+    """Round robin over a shuffled order, so every member is probed at least once every 2n-1 periods."""
+    while self.probe_order:
+      node_id = self.probe_order.pop()
+      if self.is_alive(node_id):
+        return node_id
+    self.probe_order = list(self.members)
+    self.rng.shuffle(self.probe_order)
+    return self.probe_order.pop() if self.probe_order else None
+
+  async def probe_round(self) -> None:
+    self.sync()
+    target = self.next_target()
+    if target is not None and not await self.ping(target) and not await self.indirect_ping(target):
+      self.suspect(target)
+    self.expire_suspicions()
+
+  async def ping(self, node_id: str) -> bool:
+    peer = self.peers().get(node_id)
+    if peer is None:
+      return False
+    self.pings_sent += 1
+    try:
+      if not await peer.is_connected():
+        await asyncio.wait_for(peer.connect(), self.connect_timeout)
+      ack, updates = await asyncio.wait_for(peer.gossip("", self.piggyback()), self.ping_timeout)
+    except Exception as e:
+      if DEBUG_DISCOVERY >= 2: print(f"Gossip ping to {node_id} failed: {e!r}")
+      return False
+    self.apply(updates)
+    return ack
+
+  async def indirect_ping(self, node_id: str) -> bool:
+    helpers = [other for other in self.members if other != node_id and self.is_alive(other)]
+    helpers = self.rng.sample(helpers, min(self.indirect_probes, len(helpers)))
+    peers = self.peers()
+    requests = [asyncio.ensure_future(self.ping_req(peers[helper], node_id)) for helper in helpers if helper in peers]
+    if not requests:
+      return False
+    self.indirect_pings_sent += len(requests)
+    try:
+      for request in asyncio.as_completed(requests, timeout=max(self.protocol_period - self.ping_timeout, self.ping_timeout)):
+        if await request:
+          return True
+    except asyncio.TimeoutError:
+      pass
+    finally:
+      for request in requests:
+        request.cancel()
+    return False
+
+  async def ping_req(self, helper: "PeerHandle", node_id: str) -> bool:
+    try:
+      ack, updates = await helper.gossip(node_id, self.piggyback())
+    except Exception:
+      return False
+    self.apply(updates)
+    return ack
+
+  async def handle_gossip(self, target_id: str, updates: List[MemberUpdate]) -> Tuple[bool, List[MemberUpdate]]:
+    """Answers a ping (empty target_id) directly, a ping request by pinging the target first."""
+    self.apply(updates)
+    if target_id and target_id != self.node_id:
+      return await self.ping(target_id), self.piggyback()
+    return True, self.piggyback()
+
+  def suspect(self, node_id: str) -> None:
+    member = self.members.get(node_id)
+    if member is None or member.state != ALIVE:
+      return
+    if DEBUG_DISCOVERY >= 1: print(f"Suspecting {node_id}, no ack within {self.protocol_period}s")
+    self.suspicions += 1
+    self.set_state(member, SUSPECT, member.incarnation)
+
+  def expire_suspicions(self) -> None:
+    now = self.clock()
+    for member in list(self.members.values()):
+      if member.state == SUSPECT and now - member.since >= self.suspicion_timeout:
+        self.set_state(member, DEAD, member.incarnation)
+
+  def set_state(self, member: Member, state: int, incarnation: int) -> None:
+    member.state, member.incarnation, member.since = state, incarnation, self.clock()
+    self.queue(MemberUpdate(member.node_id, state, incarnation))
+    if state == DEAD:
+      self.deaths += 1
+      if DEBUG_DISCOVERY >= 1: print(f"Declaring {member.node_id} dead")
+      # forgotten right away, the rumour keeps spreading and discovery has to find the peer again to rejoin it
+      self.members.pop(member.node_id, None)
+      self.last_incarnations[member.node_id] = incarnation
+      if self.on_dead is not None:
+        self.on_dead(member.node_id)
+
+  def apply(self, updates: List[MemberUpdate]) -> None:
+    for update in updates:
+      if update.node_id == self.node_id:
+        # someone suspects (or buried) us, outrank the rumour, our own record goes out with every message
+        if update.state != ALIVE and update.incarnation >= self.incarnation:
+          self.incarnation = update.incarnation + 1
+          self.refutations += 1
+        continue
+      member = self.members.get(update.node_id)
+      # only peers discovery handed us are tracked, the rest is for their own neighbours to judge
+      if member is None or not supersedes(update, member.state, member.incarnation):
+        continue
+      if update.state != ALIVE and update.incarnation <= self.last_incarnations.get(update.node_id, -1):
+        continue
+      self.set_state(member, update.state, update.incarnation)
+
+  def queue(self, update: MemberUpdate) -> None:
+    transmits = self.retransmit_mult*max(1, math.ceil(math.log(len(self.members) + 2)))
+    self.pending[update.node_id] = (update, transmits)
+
+  def piggyback(self) -> List[MemberUpdate]:
+    """Our own record, then the freshest updates, each sent retransmit_mult*log(n) times before it is dropped."""
+    chosen = sorted(self.pending.items(), key=lambda item: -item[1][1])[:self.max_piggyback]
+    for node_id, (update, transmits) in chosen:
+      if transmits <= 1:
+        del self.pending[node_id]
+      else:
+        self.pending[node_id] = (update, transmits - 1)
+    return [MemberUpdate(self.node_id, ALIVE, self.incarnation)] + [update for _, (update, _) in chosen]
+
+  def to_dict(self) -> Dict:
+    return {
+      "incarnation": self.incarnation,
+      "members": {node_id: STATE_NAMES[member.state] for node_id, member in self.members.items()},
+      "detection_bound": self.detection_bound(),
+      "pings_sent": self.pings_sent,
+      "indirect_pings_sent": self.indirect_pings_sent,
+      "suspicions": self.suspicions,
+      "deaths": self.deaths,
+      "refutations": self.refutations,
+    }
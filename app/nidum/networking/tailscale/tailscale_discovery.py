@@ -44,6 +44,7 @@ class TailscaleDiscovery(Discovery):
     self.discovery_task = asyncio.create_task(self.task_discover_peers())
     self.cleanup_task = asyncio.create_task(self.task_cleanup_peers())
     self.update_task = asyncio.create_task(self.task_update_device_posture_attributes())
+    self.start_membership()
 
   async def task_update_device_posture_attributes(self):
     while True:
@@ -103,7 +104,7 @@ class TailscaleDiscovery(Discovery):
               current_time,
             )
           else:
-            if not await self.known_peers[peer_id][0].health_check():
+            if not await self.peer_healthy(self.known_peers[peer_id][0]):
               if DEBUG >= 1: print(f"Peer {peer_id} at {peer_host}:{peer_port} is not healthy. Removing.")
               if peer_id in self.known_peers: del self.known_peers[peer_id]
               continue
@@ -116,6 +117,7 @@ class TailscaleDiscovery(Discovery):
         await asyncio.sleep(self.discovery_interval)
 
   async def stop(self):
+    await self.stop_membership()
     if self.discovery_task:
       self.discovery_task.cancel()
     if self.cleanup_task:
@@ -133,6 +135,12 @@ class TailscaleDiscovery(Discovery):
         await asyncio.sleep(0.1)
     return [peer_handle for peer_handle, _, _ in self.known_peers.values()]
 
+  def peer_handles(self) -> Dict[str, PeerHandle]:
+    return {peer_id: peer_handle for peer_id, (peer_handle, _, _) in self.known_peers.items()}
+
+  def remove_peer(self, peer_id: str) -> None:
+    if self.known_peers.pop(peer_id, None) is not None and DEBUG_DISCOVERY >= 2: print(f"Removed peer {peer_id}, gossip declared it dead.")
+
   async def task_cleanup_peers(self):
     while True:
       try:
@@ -148,7 +156,7 @@ class TailscaleDiscovery(Discovery):
         if DEBUG_DISCOVERY >= 2:
           print(
             "Peer statuses:", {
-              peer_handle.id(): f"is_connected={await peer_handle.is_connected()}, health_check={await peer_handle.health_check()}, connected_at={connected_at}, last_seen={last_seen}"
+              peer_handle.id(): f"is_connected={await peer_handle.is_connected()}, healthy={await self.peer_healthy(peer_handle)}, connected_at={connected_at}, last_seen={last_seen}"
               for peer_handle, connected_at, last_seen in self.known_peers.values()
             }
           )
@@ -169,7 +177,7 @@ class TailscaleDiscovery(Discovery):
 
     try:
       is_connected = await peer_handle.is_connected()
-      health_ok = await peer_handle.health_check()
+      health_ok = await self.peer_healthy(peer_handle)
     except Exception as e:
       if DEBUG_DISCOVERY >= 2: print(f"Error checking peer {peer_id}: {e}")
       return True
@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+
+from nidum.networking.activation_codec import RAW, WireCodec, WireStats, available_compressions, decode_activation, encode_activation, select_codec, supported_codecs
+
+OUTLIER_CHANNELS = [5, 77, 901]
+
+
+def round_trip(tensor: np.ndarray, codec: WireCodec):
+  data, applied, scales = encode_activation(tensor, codec)
+  return decode_activation(data, tensor.shape, str(tensor.dtype), applied, scales), data, applied
+
+
+class TestActivationCodec(unittest.TestCase):
+  def setUp(self):
+    self.hidden = np.random.default_rng(0).standard_normal((1, 32, 1024)).astype(np.float32)
+
+  def test_precisions_round_trip_within_tolerance(self):
+    for precision, tolerance, ratio in (("raw", 0, 1), ("fp16", 2e-3, 2), ("bf16", 2e-2, 2), ("int8", 5e-2, 3.5)):
+      with self.subTest(precision=precision):
+        decoded, data, applied = round_trip(self.hidden, WireCodec(precision))
+        self.assertEqual(applied.precision, precision)
+        self.assertEqual((decoded.shape, decoded.dtype), (self.hidden.shape, self.hidden.dtype))
+        np.testing.assert_allclose(decoded, self.hidden, atol=tolerance*np.abs(self.hidden).max())
+        self.assertGreaterEqual(self.hidden.nbytes/len(data), ratio)
+
+  def test_token_ids_and_small_tensors_stay_raw(self):
+    tokens = np.array([[1, 2, 3]], dtype=np.int64)
+    decoded, _, applied = round_trip(tokens, WireCodec("int8"))
+    self.assertEqual(applied, RAW)
+    np.testing.assert_array_equal(decoded, tokens)
+    _, _, applied = round_trip(np.ones((1, 1, 8), dtype=np.float32), WireCodec("fp16"))
+    self.assertEqual(applied, RAW)
+
+  def test_int8_falls_back_to_fp16_for_few_tokens(self):
+    decoded, _, applied = round_trip(self.hidden[:, :1], WireCodec("int8"))
+    self.assertEqual(applied.precision, "fp16")
+    np.testing.assert_allclose(decoded, self.hidden[:, :1], atol=2e-3*np.abs(self.hidden).max())
+
+  def test_top1_drift_with_outlier_channels(self):
+    # hidden states of LLMs carry a few channels two orders of magnitude larger than the rest,
+    # which the final norm scales back down before the vocabulary projection
+    rng = np.random.default_rng(1)
+    hidden = rng.standard_normal((1, 64, 2048)).astype(np.float32)
+    hidden[..., OUTLIER_CHANNELS] *= 80
+    norm_weight = np.ones(hidden.shape[-1], dtype=np.float32)
+    norm_weight[OUTLIER_CHANNELS] = 0.01
+    head = rng.standard_normal((hidden.shape[-1], 8192)).astype(np.float32)/np.sqrt(hidden.shape[-1])
+    def logits(x):
+      return (x/np.sqrt(np.mean(x**2, axis=-1, keepdims=True) + 1e-5)*norm_weight) @ head
+    reference = logits(hidden)
+    for precision, min_top1, max_drift in (("fp16", 1.0, 1e-3), ("bf16", 0.98, 1e-2), ("int8", 0.9, 2e-2)):
+      with self.subTest(precision=precision):
+        decoded, _, applied = round_trip(hidden, WireCodec(precision))
+        self.assertEqual(applied.precision, precision)
+        out = logits(decoded)
+        self.assertGreaterEqual(np.mean(out.argmax(-1) == reference.argmax(-1)), min_top1)
+        self.assertLessEqual(np.abs(out - reference).max()/np.abs(reference).max(), max_drift)
+
+  @unittest.skipUnless(available_compressions(), "no zstd or lz4 installed")
+  def test_compression_round_trip(self):
+    codec = WireCodec("int8", available_compressions()[0])
+    zeros = np.zeros((1, 8, 1024), dtype=np.float16)
+    decoded, data, applied = round_trip(zeros, codec)
+    self.assertEqual(applied, codec)
+    self.assertLess(len(data), zeros.nbytes/100)
+    np.testing.assert_array_equal(decoded, zeros)
+
+  def test_codec_selection_by_link_type(self):
+    everything = supported_codecs()
+    self.assertEqual(select_codec("Thunderbolt (bridge0)", everything), RAW)
+    # lossy precisions are never picked automatically, whatever the link
+    self.assertEqual(select_codec("Ethernet (eth0)", everything), RAW)
+    self.assertEqual(select_codec("MAN", everything), RAW)
+    self.assertEqual(select_codec("WiFi (en0)", everything).precision, "raw")
+    self.assertEqual(select_codec("WiFi (en0)", everything, preferred="int8").precision, "int8")
+    # peers that did not advertise codecs (older nodes) only get raw tensors
+    self.assertEqual(select_codec("WiFi (en0)", []), RAW)
+    self.assertEqual(select_codec("Thunderbolt (bridge0)", everything, preferred="bf16"), WireCodec("bf16"))
+    with self.assertRaises(ValueError):
+      WireCodec.parse("int4")
+
+  def test_bytes_saved(self):
+    stats = WireStats()
+    stats.record(WireCodec("fp16"), 1000, 500)
+    stats.record(RAW, 10, 10)
+    self.assertEqual(stats.bytes_saved, 500)
+    self.assertEqual(stats.to_dict()["codecs"]["fp16"], {"raw_bytes": 1000, "wire_bytes": 500})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+from nidum.networking.link_prober import LinkProber
+from nidum.networking.peer_handle import PeerHandle
+from nidum.topology.topology import LinkQuality
+from nidum.testing import FakeClock
+
+
+class FakeLink:
+  """A peer whose probes take rtt plus payload size over bandwidth, on the fake clock."""
+  def __init__(self, clock: FakeClock, peer_id: str, rtt: float, mbps: float):
+    self.clock = clock
+    self.rtt = rtt
+    self.mbps = mbps
+    self.fail = False
+    self.payloads = []
+    self.peer = Mock(spec=PeerHandle)
+    self.peer.id.return_value = peer_id
+    self.peer.probe.side_effect = self.probe
+
+  async def probe(self, payload, timeout=None):
+    if self.fail: raise ConnectionError("link down")
+    self.payloads.append(len(payload))
+    self.clock.now += self.rtt + len(payload)*8/1e6/self.mbps
+
+
+class TestLinkProber(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+    self.links = {"b": FakeLink(self.clock, "b", 0.002, 800), "c": FakeLink(self.clock, "c", 0.020, 50)}
+    self.busy = False
+    self.prober = LinkProber(lambda: [link.peer for link in self.links.values()], bandwidth_interval=60.0, busy=lambda: self.busy, clock=self.clock)
+
+  async def test_measures_round_trip_and_throughput(self):
+    await self.prober.probe_all()
+    links = self.prober.links()
+    self.assertAlmostEqual(links["b"].rtt_ms, 2.0, delta=0.01)
+    self.assertAlmostEqual(links["b"].bandwidth_mbps, 800, delta=1)
+    self.assertAlmostEqual(links["c"].rtt_ms, 20.0, delta=0.1)
+    self.assertAlmostEqual(links["c"].bandwidth_mbps, 50, delta=0.1)
+
+  async def test_large_probes_wait_for_their_interval_and_an_idle_node(self):
+    self.busy = True
+    await self.prober.probe_all()
+    self.assertEqual(self.links["b"].payloads, [64])
+    self.assertIsNone(self.prober.links()["b"].bandwidth_mbps)
+    self.busy = False
+    await self.prober.probe_all()
+    await self.prober.probe_all()
+    self.assertEqual(self.links["b"].payloads, [64, 64, 1024*1024, 64])
+    self.clock.now += 60
+    await self.prober.probe_all()
+    self.assertEqual(self.links["b"].payloads[-1], 1024*1024)
+
+  async def test_small_changes_are_not_published(self):
+    await self.prober.probe_all()
+    published = self.prober.links()["b"]
+    self.links["b"].rtt = 0.0022
+    await self.prober.probe_all()
+    self.assertIs(self.prober.links()["b"], published)
+    self.links["b"].rtt = 0.010
+    for _ in range(3):
+      await self.prober.probe_all()
+    self.assertGreater(self.prober.links()["b"].rtt_ms, 2.4)
+
+  async def test_failures_keep_the_last_measurement_and_departed_peers_are_dropped(self):
+    await self.prober.probe_all()
+    published = self.prober.links()["c"]
+    self.links["c"].fail = True
+    await self.prober.probe_all()
+    self.assertEqual(self.prober.links()["c"], published)
+    self.assertEqual(self.prober.stats["c"].failures, 1)
+    del self.links["c"]
+    await self.prober.probe_all()
+    self.assertEqual(set(self.prober.links()), {"b"})
+
+  async def test_disabled_with_zero_interval(self):
+    prober = LinkProber(lambda: [], interval=0)
+    prober.start()
+    self.assertIsNone(prober.task)
+    await prober.stop()
+
+
+if __name__ == "__main__":
+  unittest.main()
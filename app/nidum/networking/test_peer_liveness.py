@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+
+from nidum.networking.peer_liveness import PeerLiveness
+from nidum.testing import FakeClock
+
+
+class TestPeerLiveness(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+    self.healthy = True
+    self.probes = 0
+    self.release = None
+
+  async def probe(self) -> bool:
+    self.probes += 1
+    if self.release is not None: await self.release.wait()
+    return self.healthy
+
+  def liveness(self, **kwargs) -> PeerLiveness:
+    return PeerLiveness(self.probe, healthy_ttl=10.0, unhealthy_ttl=1.0, clock=self.clock, **kwargs)
+
+  async def test_healthy_answer_is_cached(self):
+    liveness = self.liveness()
+    self.assertTrue(await liveness.check())
+    self.clock.now += 9
+    self.assertTrue(await liveness.check())
+    self.assertEqual((self.probes, liveness.cache_hits), (1, 1))
+    self.clock.now += 2
+    await liveness.check()
+    self.assertEqual(self.probes, 2)
+
+  async def test_successful_rpc_replaces_probe(self):
+    liveness = self.liveness()
+    for _ in range(5):
+      self.clock.now += 5
+      liveness.record_success()
+      self.assertTrue(await liveness.check())
+    self.assertEqual(self.probes, 0)
+
+  async def test_concurrent_checks_share_one_probe(self):
+    liveness = self.liveness()
+    self.release = asyncio.Event()
+    checks = [asyncio.create_task(liveness.check()) for _ in range(10)]
+    await asyncio.sleep(0)
+    self.release.set()
+    self.assertEqual(await asyncio.gather(*checks), [True]*10)
+    self.assertEqual(self.probes, 1)
+
+  async def test_unhealthy_answer_expires_quickly(self):
+    liveness = self.liveness()
+    self.healthy = False
+    self.assertFalse(await liveness.check())
+    self.assertFalse(await liveness.check())
+    self.assertEqual(self.probes, 1)
+    self.healthy = True
+    self.clock.now += 1.5
+    self.assertTrue(await liveness.check())
+    self.assertEqual(self.probes, 2)
+
+  async def test_failing_probe_and_invalidate(self):
+    liveness = self.liveness()
+
+    async def broken() -> bool:
+      raise ConnectionError("gone")
+
+    liveness.probe = broken
+    self.assertFalse(await liveness.check())
+    liveness.probe = self.probe
+    liveness.record_success()
+    liveness.invalidate()
+    self.assertTrue(await liveness.check())
+    self.assertEqual(self.probes, 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
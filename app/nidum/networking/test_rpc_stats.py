@@ -0,0 +1,31 @@
+import unittest
+
+from nidum.networking.rpc_stats import CONTROL, DATA, LatencyHistogram, RpcLatency
+
+
+class TestRpcStats(unittest.TestCase):
+  def test_histogram_quantiles(self):
+    histogram = LatencyHistogram(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005,)*98 + (0.5, 3.0):
+      histogram.observe(seconds)
+    self.assertEqual(histogram.quantile(0.5), 0.01)
+    self.assertEqual(histogram.quantile(0.99), 1.0)
+    self.assertEqual(histogram.quantile(1.0), float("inf"))
+    self.assertEqual(histogram.to_dict()["buckets"], {"0.01": 98, "0.1": 98, "1.0": 99})
+    self.assertEqual(LatencyHistogram().quantile(0.5), 0.0)
+
+  def test_latency_per_traffic_class(self):
+    latency = RpcLatency()
+    observed = []
+    latency.listeners.append(lambda traffic_class, seconds: observed.append(traffic_class))
+    with latency.timed(CONTROL):
+      pass
+    with self.assertRaises(ValueError):
+      with latency.timed(DATA):
+        raise ValueError()
+    self.assertEqual(observed, [CONTROL, DATA])
+    self.assertEqual({traffic_class: stats["count"] for traffic_class, stats in latency.to_dict().items()}, {CONTROL: 1, DATA: 1})
+
+
+if __name__ == "__main__":
+  unittest.main()
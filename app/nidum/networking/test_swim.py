@@ -0,0 +1,181 @@
+import asyncio
+import random
+import unittest
+from unittest import mock
+
+from nidum.networking.manual.manual_discovery import ManualDiscovery
+from nidum.networking.swim import ALIVE, DEAD, SUSPECT, MemberUpdate, SwimMembership, supersedes
+from nidum.testing import FakeClock
+
+
+class FakePeer:
+  """Delivers gossip straight to another in-memory membership, unless the link or the node is down."""
+  def __init__(self, cluster: "Cluster", from_id: str, to_id: str, connect_delay: float = 0.0):
+    self.cluster = cluster
+    self.from_id = from_id
+    self.to_id = to_id
+    self.connect_delay = connect_delay
+    self.connected = False
+
+  def id(self) -> str:
+    return self.to_id
+
+  async def is_connected(self) -> bool:
+    return self.connected
+
+  async def connect(self) -> None:
+    await asyncio.sleep(self.connect_delay)
+    self.connected = True
+
+  async def gossip(self, target_id, updates):
+    if self.to_id in self.cluster.down or (self.from_id, self.to_id) in self.cluster.cut:
+      await asyncio.sleep(10)
+    return await self.cluster.nodes[self.to_id].handle_gossip(target_id, updates)
+
+
+class Cluster:
+  def __init__(self, node_ids, clock, **kwargs):
+    self.down = set()
+    self.cut = set()
+    self.dead = {node_id: [] for node_id in node_ids}
+    self.peers = {node_id: {other: FakePeer(self, node_id, other) for other in node_ids if other != node_id} for node_id in node_ids}
+    self.nodes = {
+      node_id: SwimMembership(
+        node_id,
+        lambda node_id=node_id: self.peers[node_id],
+        on_dead=lambda peer_id, node_id=node_id: self.remove(node_id, peer_id),
+        protocol_period=0.05,
+        ping_timeout=0.02,
+        suspicion_timeout=1.0,
+        clock=clock,
+        rng=random.Random(0),
+        **kwargs,
+      )
+      for node_id in node_ids
+    }
+    for node in self.nodes.values():
+      node.sync()
+
+  def remove(self, node_id, peer_id):
+    self.dead[node_id].append(peer_id)
+    self.peers[node_id].pop(peer_id, None)
+
+  async def rounds(self, count: int, nodes=None):
+    for _ in range(count):
+      await asyncio.gather(*[self.nodes[node_id].probe_round() for node_id in (nodes or self.nodes) if node_id not in self.down])
+
+
+class TestSwimMembership(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+
+  def test_precedence(self):
+    self.assertTrue(supersedes(MemberUpdate("a", ALIVE, 2), SUSPECT, 1))
+    self.assertTrue(supersedes(MemberUpdate("a", SUSPECT, 1), ALIVE, 1))
+    self.assertTrue(supersedes(MemberUpdate("a", DEAD, 1), SUSPECT, 1))
+    self.assertFalse(supersedes(MemberUpdate("a", ALIVE, 1), SUSPECT, 1))
+    self.assertFalse(supersedes(MemberUpdate("a", DEAD, 0), ALIVE, 1))
+
+  async def test_every_member_is_probed_within_the_bound(self):
+    cluster = Cluster([f"n{i}" for i in range(5)], self.clock)
+    node = cluster.nodes["n0"]
+    targets = [node.next_target() for _ in range(2*4 - 1)]
+    self.assertEqual(set(targets), {"n1", "n2", "n3", "n4"})
+    self.assertEqual(node.detection_bound(), (2*4 - 1)*0.05 + 1.0)
+
+  async def test_indirect_probe_saves_a_peer_behind_a_broken_link(self):
+    cluster = Cluster(["a", "b", "c", "d"], self.clock)
+    cluster.cut.add(("a", "b"))
+    a = cluster.nodes["a"]
+    self.assertFalse(await a.ping("b"))
+    self.assertTrue(await a.indirect_ping("b"))
+    for _ in range(3):
+      await cluster.rounds(1, ["a"])
+    self.assertEqual(a.suspicions, 0)
+    self.assertTrue(a.is_alive("b"))
+
+  async def test_unreachable_peer_is_suspected_then_declared_dead_everywhere(self):
+    cluster = Cluster(["a", "b", "c", "d"], self.clock)
+    cluster.down.add("d")
+    await cluster.rounds(3)
+    self.assertTrue(any(node.members["d"].state == SUSPECT for node_id, node in cluster.nodes.items() if node_id != "d"))
+    self.assertTrue(all(node.is_alive("d") for node_id, node in cluster.nodes.items() if node_id != "d"))
+    self.clock.now += 1.0
+    await cluster.rounds(3)
+    for node_id in ("a", "b", "c"):
+      self.assertFalse(cluster.nodes[node_id].is_alive("d"))
+      self.assertEqual(cluster.dead[node_id], ["d"])
+
+  async def test_suspected_node_refutes_with_a_higher_incarnation(self):
+    cluster = Cluster(["a", "b", "c"], self.clock)
+    a, c = cluster.nodes["a"], cluster.nodes["c"]
+    incarnation = c.incarnation
+    # learns c's incarnation from its ack, suspicion carries it
+    self.assertTrue(await a.ping("c"))
+    a.suspect("c")
+    self.assertEqual(a.members["c"].state, SUSPECT)
+    self.assertTrue(await a.ping("c"))
+    self.assertGreater(c.incarnation, incarnation)
+    self.assertEqual(c.refutations, 1)
+    self.assertEqual((a.members["c"].state, a.members["c"].incarnation), (ALIVE, c.incarnation))
+    self.clock.now += 2.0
+    a.expire_suspicions()
+    self.assertTrue(a.is_alive("c"))
+
+  async def test_updates_ride_along_a_bounded_number_of_times(self):
+    cluster = Cluster(["a", "b", "c"], self.clock, retransmit_mult=2, max_piggyback=1)
+    a = cluster.nodes["a"]
+    a.suspect("b")
+    a.suspect("c")
+    sent = [a.piggyback() for _ in range(10)]
+    self.assertTrue(all(len(updates) == 2 and updates[0] == MemberUpdate("a", ALIVE, a.incarnation) for updates in sent[:4]))
+    self.assertEqual(sum(update.node_id != "a" for updates in sent for update in updates), 2*2*2)
+    self.assertEqual(a.pending, {})
+
+  async def test_rejoined_peer_is_not_buried_by_stale_rumours(self):
+    cluster = Cluster(["a", "b"], self.clock)
+    a, b = cluster.nodes["a"], cluster.nodes["b"]
+    # a knows b's real incarnation from an ack, the rumour that buries b carries it
+    self.assertTrue(await a.ping("b"))
+    stale = b.incarnation
+    a.apply([MemberUpdate("b", DEAD, stale)])
+    self.assertEqual(cluster.dead["a"], ["b"])
+    cluster.peers["a"]["b"] = FakePeer(cluster, "a", "b")
+    a.sync()
+    self.assertTrue(a.is_alive("b"))
+    for state in (SUSPECT, DEAD):
+      a.apply([MemberUpdate("b", state, stale)])
+      self.assertTrue(a.is_alive("b"))
+    self.assertTrue(await a.ping("b"))
+    # rumours about a later incarnation still count
+    a.apply([MemberUpdate("b", DEAD, stale + 1)])
+    self.assertFalse(a.is_alive("b"))
+
+  async def test_slow_connect_does_not_count_against_the_ack(self):
+    cluster = Cluster(["a", "b"], self.clock)
+    a = cluster.nodes["a"]
+    cluster.peers["a"]["b"] = FakePeer(cluster, "a", "b", connect_delay=5*a.ping_timeout)
+    self.assertTrue(await a.ping("b"))
+    a.connect_timeout = a.ping_timeout
+    cluster.peers["a"]["b"] = FakePeer(cluster, "a", "b", connect_delay=5*a.ping_timeout)
+    self.assertFalse(await a.ping("b"))
+
+  async def test_discovery_answers_from_membership(self):
+    discovery = ManualDiscovery("/nonexistent.json", "a", create_peer_handle=mock.Mock())
+    peer = mock.Mock(id=mock.Mock(return_value="b"), health_check=mock.AsyncMock(return_value=True))
+    discovery.known_peers = {"b": peer}
+    membership = discovery.enable_membership("a", clock=self.clock)
+    self.assertTrue(await discovery.peer_healthy(peer))
+    peer.health_check.assert_awaited_once()
+    membership.sync()
+    membership.suspect("b")
+    self.assertTrue(await discovery.peer_healthy(peer))
+    self.clock.now += membership.suspicion_timeout
+    membership.expire_suspicions()
+    self.assertEqual(discovery.known_peers, {})
+    self.assertEqual(peer.health_check.await_count, 1)
+    discovery._file_executor.shutdown()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+import aiohttp
+
+from nidum.helpers import DEBUG_DISCOVERY, wait_event
+
+BASE_API_URL = "https://apiv3.chain.nidum.ai/api/device/v3/cluster"
+
+
+def target_ips_url(cluster_id: str, machine_id: str) -> str:
+  return f"{BASE_API_URL}/{cluster_id}/{machine_id}"
+
+
+class TargetIPCache:
+  """
+  Addresses presence is unicast to, as listed by the cluster API. Readers always get the last known
+  list right away, once it is older than ttl a refresh runs in the background and revalidates it with
+  the ETag of the previous answer. Failed refreshes keep the last good list and back off, so a slow or
+  unreachable API never holds up broadcasting.
+  """
+  def __init__(
+    self,
+    api_url: str,
+    ttl: float = 10.0,
+    timeout: float = 5.0,
+    retry_delay: float = 2.0,
+    max_retry_delay: float = 60.0,
+    clock: Callable[[], float] = time.monotonic,
+  ):
+    self.api_url = api_url
+    self.ttl = ttl
+    self.timeout = timeout
+    self.retry_delay = retry_delay
+    self.max_retry_delay = max_retry_delay
+    self.clock = clock
+    self.ips: List[str] = []
+    self.etag: Optional[str] = None
+    self.cluster_state: Optional[str] = None
+    self.next_refresh = 0.0
+    self.failures = 0
+    self.requests = 0
+    self.not_modified = 0
+    self.session: Optional[aiohttp.ClientSession] = None
+    self.refresh_task: Optional[asyncio.Task] = None
+    # set whenever the list changes, so new targets hear from this node without waiting a full interval
+    self.changed = asyncio.Event()
+
+  def current(self) -> List[str]:
+    if self.clock() >= self.next_refresh and (self.refresh_task is None or self.refresh_task.done()):
+      self.refresh_task = asyncio.create_task(self.refresh())
+    return self.ips
+
+  async def wait_changed(self, timeout: float) -> None:
+    await wait_event(self.changed, timeout)
+    self.changed.clear()
+
+  async def refresh(self) -> None:
+    if self.session is None:
+      self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+    headers = {"If-None-Match": self.etag} if self.etag else {}
+    self.requests += 1
+    try:
+      async with self.session.get(self.api_url, headers=headers) as response:
+        if response.status == 304:
+          self.not_modified += 1
+        elif response.status == 200:
+          data = await response.json()
+          self.etag = response.headers.get("ETag")
+          self.update(data.get("clusterState"), data.get("ips", []))
+        else:
+          raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status, message=f"HTTP {response.status}")
+    except Exception as e:
+      self.failures += 1
+      self.next_refresh = self.clock() + min(self.max_retry_delay, self.retry_delay*2**(self.failures - 1))
+      if DEBUG_DISCOVERY >= 1 or self.failures == 1: print(f"Error fetching target IPs from {self.api_url}, keeping {len(self.ips)} known: {e}")
+      return
+    self.failures = 0
+    self.next_refresh = self.clock() + self.ttl
+
+  def update(self, cluster_state: Optional[str], ips: List[str]) -> None:
+    if cluster_state != self.cluster_state and cluster_state != "completed":
+      print(f"Cluster state is not completed: {cluster_state}")
+    self.cluster_state = cluster_state
+    ips = list(ips) if cluster_state == "completed" else []
+    if ips != self.ips:
+      if DEBUG_DISCOVERY >= 1: print(f"Target IPs changed: {self.ips} -> {ips}")
+      self.ips = ips
+      self.changed.set()
+
+  async def close(self) -> None:
+    if self.refresh_task is not None:
+      self.refresh_task.cancel()
+      await asyncio.gather(self.refresh_task, return_exceptions=True)
+      self.refresh_task = None
+    if self.session is not None:
+      await self.session.close()
+      self.session = None
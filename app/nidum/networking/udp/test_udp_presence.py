@@ -0,0 +1,159 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+from aiohttp import web
+
+from nidum.helpers import find_available_port
+from nidum.networking.udp.target_ips import TargetIPCache
+from nidum.networking.udp.udp_discovery import UDPDiscovery
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+from nidum.testing import FakeClock
+
+
+class ClusterAPI:
+  def __init__(self):
+    self.body = {"clusterState": "completed", "ips": ["10.0.0.2", "10.0.0.3"]}
+    self.status = 200
+    self.delay = 0.0
+    self.requests = 0
+    self.revalidations = 0
+
+  async def handle(self, request):
+    self.requests += 1
+    await asyncio.sleep(self.delay)
+    if self.status != 200:
+      return web.Response(status=self.status)
+    etag = f'"{hash(json.dumps(self.body)) & 0xffff}"'
+    if request.headers.get("If-None-Match") == etag:
+      self.revalidations += 1
+      return web.Response(status=304, headers={"ETag": etag})
+    return web.json_response(self.body, headers={"ETag": etag})
+
+
+class TestTargetIPCache(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    self.api = ClusterAPI()
+    app = web.Application()
+    app.router.add_get("/cluster/c/m", self.api.handle)
+    self.runner = web.AppRunner(app)
+    await self.runner.setup()
+    port = find_available_port("127.0.0.1")
+    await web.TCPSite(self.runner, "127.0.0.1", port).start()
+    self.clock = FakeClock()
+    self.cache = TargetIPCache(f"http://127.0.0.1:{port}/cluster/c/m", ttl=10.0, timeout=1.0, clock=self.clock)
+
+  async def asyncTearDown(self):
+    await self.cache.close()
+    await self.runner.cleanup()
+
+  async def settle(self):
+    if self.cache.refresh_task is not None:
+      await self.cache.refresh_task
+
+  async def test_refreshes_in_background_and_revalidates(self):
+    self.assertEqual(self.cache.current(), [])
+    await self.settle()
+    self.assertEqual(self.cache.current(), ["10.0.0.2", "10.0.0.3"])
+    self.assertTrue(self.cache.changed.is_set())
+    for _ in range(5):
+      self.cache.current()
+      await self.settle()
+    self.assertEqual(self.api.requests, 1)
+    self.clock.now += 11
+    self.cache.current()
+    await self.settle()
+    self.assertEqual((self.api.requests, self.api.revalidations), (2, 1))
+    self.assertEqual(self.cache.ips, ["10.0.0.2", "10.0.0.3"])
+
+  async def test_failures_keep_the_last_list_and_back_off(self):
+    self.cache.current()
+    await self.settle()
+    self.api.status = 500
+    self.clock.now += 11
+    self.cache.current()
+    await self.settle()
+    self.assertEqual(self.cache.ips, ["10.0.0.2", "10.0.0.3"])
+    self.clock.now += 1
+    self.cache.current()
+    await self.settle()
+    self.assertEqual(self.api.requests, 2)
+    self.clock.now += 1.5
+    self.cache.current()
+    await self.settle()
+    self.assertEqual((self.api.requests, self.cache.failures), (3, 2))
+
+  async def test_slow_api_does_not_block_readers(self):
+    self.api.delay = 0.5
+    start = asyncio.get_running_loop().time()
+    for _ in range(3):
+      self.assertEqual(self.cache.current(), [])
+    self.assertLess(asyncio.get_running_loop().time() - start, 0.1)
+    await self.settle()
+    self.assertEqual(self.api.requests, 1)
+
+  async def test_incomplete_cluster_has_no_targets(self):
+    self.api.body = {"clusterState": "pending", "ips": ["10.0.0.2"]}
+    self.cache.current()
+    await self.settle()
+    self.assertEqual(self.cache.ips, [])
+
+
+class Receiver(asyncio.DatagramProtocol):
+  def __init__(self):
+    self.datagrams = []
+
+  def datagram_received(self, data, addr):
+    self.datagrams.append(data)
+
+
+class TestPresenceBroadcast(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    port = find_available_port("127.0.0.1")
+    self.receiver = Receiver()
+    self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: self.receiver, local_addr=("127.0.0.1", port))
+    self.discovery = UDPDiscovery("node1", 50051, 0, port, create_peer_handle=mock.Mock(), machine_id="m", cluster_id="c")
+    self.discovery.target_ips.ips = ["127.0.0.1"]
+    self.discovery.target_ips.next_refresh = float("inf")
+    patcher = mock.patch("nidum.networking.udp.udp_discovery.get_all_ip_addresses_and_interfaces", return_value=[("127.0.0.1", "lo")])
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  async def asyncTearDown(self):
+    await self.discovery.stop()
+    self.transport.close()
+
+  async def receive(self, count: int):
+    for _ in range(100):
+      if len(self.receiver.datagrams) >= count: return
+      await asyncio.sleep(0.01)
+
+  async def test_socket_and_payload_are_reused(self):
+    await self.discovery.broadcast_presence()
+    socket, payload = self.discovery.broadcast_sockets["127.0.0.1"], self.discovery.presence_payloads[("127.0.0.1", "lo")]
+    await self.discovery.broadcast_presence()
+    self.assertIs(self.discovery.broadcast_sockets["127.0.0.1"], socket)
+    self.assertIs(self.discovery.presence_payloads[("127.0.0.1", "lo")], payload)
+    await self.receive(2)
+    self.assertEqual(self.receiver.datagrams, [payload, payload])
+    message = json.loads(payload)
+    self.assertEqual((message["node_id"], message["grpc_port"], message["interface_type"]), ("node1", 50051, "Loopback"))
+
+  async def test_payload_follows_capabilities(self):
+    await self.discovery.broadcast_presence()
+    self.discovery.device_capabilities = DeviceCapabilities(model="m", chip="c", memory=1024, flops=DeviceFlops(fp32=1, fp16=2, int8=4))
+    await self.discovery.broadcast_presence()
+    message = json.loads(self.discovery.presence_payloads[("127.0.0.1", "lo")])
+    self.assertEqual(message["device_capabilities"]["memory"], 1024)
+
+  async def test_vanished_interface_closes_its_socket(self):
+    await self.discovery.broadcast_presence()
+    socket = self.discovery.broadcast_sockets["127.0.0.1"]
+    with mock.patch("nidum.networking.udp.udp_discovery.get_all_ip_addresses_and_interfaces", return_value=[]):
+      await self.discovery.broadcast_presence()
+    self.assertEqual(self.discovery.broadcast_sockets, {})
+    self.assertTrue(socket.is_closing())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -3,51 +3,12 @@ import json
 import socket
 import time
 import traceback
-from typing import List, Dict, Callable, Tuple, Coroutine
+from typing import List, Dict, Callable, Optional, Tuple, Coroutine
 from nidum.networking.discovery import Discovery
+from nidum.networking.udp.target_ips import TargetIPCache, target_ips_url
 from nidum.networking.peer_handle import PeerHandle
 from nidum.topology.device_capabilities import DeviceCapabilities, device_capabilities, UNKNOWN_DEVICE_CAPABILITIES
 from nidum.helpers import DEBUG, DEBUG_DISCOVERY, get_all_ip_addresses_and_interfaces, get_interface_priority_and_type
-import aiohttp
-
-BASE_API_URL = "https://apiv3.chain.nidum.ai/api/device/v3/cluster"
-
-async def get_target_ips_from_api(cluster_id: str, machine_id: str) -> List[str]:
-    retry_attempts = 5
-    retry_delay = 2  # seconds
-
-    # Construct the dynamic URL with cluster_id and machine_id
-    machine_id = machine_id[0]
-    api_url = f"{BASE_API_URL}/{cluster_id}/{machine_id}"
-    
-    # Set the Authorization header
- 
-
-    for attempt in range(retry_attempts):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(api_url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        # print(data)
-                        # Check if the cluster state is "completed"
-                        if data.get("clusterState") == "completed":
-                            return data.get("ips", [])
-                        else:
-                            print(f"Cluster state is not completed: {data.get('clusterState')}")
-                            return []
-                    else:
-                        print(f"Failed to fetch data: HTTP {response.status}")
-                        return []
-        except Exception as e:
-            print(f"Error connecting to API server: {e}")
-            if attempt < retry_attempts - 1:
-                await asyncio.sleep(retry_delay)
-                retry_delay *= 2
-            else:
-                traceback.print_exc()
-                return []
-
 
 class ListenProtocol(asyncio.DatagramProtocol):
   def __init__(self, on_message: Callable[[bytes, Tuple[str, int]], Coroutine]):
@@ -61,18 +22,6 @@ class ListenProtocol(asyncio.DatagramProtocol):
   def datagram_received(self, data, addr):
     asyncio.create_task(self.on_message(data, addr))
 
-class BroadcastProtocol(asyncio.DatagramProtocol):
-    def __init__(self, message: str, target_ips: List[str], broadcast_port: int):
-        self.message = message
-        self.target_ips = target_ips
-        self.broadcast_port = broadcast_port
-
-    def connection_made(self, transport):
-        for ip in self.target_ips:
-            transport.sendto(self.message.encode("utf-8"), (ip, self.broadcast_port))
-
-
-
 class UDPDiscovery(Discovery):
   def __init__(
     self,
@@ -87,6 +36,7 @@ class UDPDiscovery(Discovery):
     discovery_timeout: int = 30,
     device_capabilities: DeviceCapabilities = UNKNOWN_DEVICE_CAPABILITIES,
     allowed_node_ids: List[str] = None,
+    target_ips_ttl: float = 10.0,
   ):
     self.node_id = node_id
     self.node_port = node_port
@@ -101,22 +51,33 @@ class UDPDiscovery(Discovery):
     self.broadcast_task = None
     self.listen_task = None
     self.cleanup_task = None
-    self.machine_id = machine_id,
+    self.machine_id = machine_id
     self.cluster_id = cluster_id
+    self.target_ips = TargetIPCache(target_ips_url(cluster_id, machine_id), ttl=target_ips_ttl)
+    # one socket per local address for the lifetime of discovery, and the presence message per
+    # (address, interface) serialized once, again only when the device capabilities change
+    self.broadcast_sockets: Dict[str, asyncio.DatagramTransport] = {}
+    self.presence_payloads: Dict[Tuple[str, str], bytes] = {}
+    self.payload_capabilities: Optional[DeviceCapabilities] = None
 
   async def start(self):
     self.device_capabilities = device_capabilities()
     self.broadcast_task = asyncio.create_task(self.task_broadcast_presence())
     self.listen_task = asyncio.create_task(self.task_listen_for_peers())
     self.cleanup_task = asyncio.create_task(self.task_cleanup_peers())
-    
-    
+    self.start_membership()
+
   async def stop(self):
+    await self.stop_membership()
     if self.broadcast_task: self.broadcast_task.cancel()
     if self.listen_task: self.listen_task.cancel()
     if self.cleanup_task: self.cleanup_task.cancel()
     if self.broadcast_task or self.listen_task or self.cleanup_task:
       await asyncio.gather(self.broadcast_task, self.listen_task, self.cleanup_task, return_exceptions=True)
+    for transport in self.broadcast_sockets.values():
+      transport.close()
+    self.broadcast_sockets.clear()
+    await self.target_ips.close()
 
   async def discover_peers(self, wait_for_peers: int = 0) -> List[PeerHandle]:
     if wait_for_peers > 0:
@@ -125,34 +86,79 @@ class UDPDiscovery(Discovery):
         await asyncio.sleep(0.1)
     return [peer_handle for peer_handle, _, _, _ in self.known_peers.values()]
 
+  def peer_handles(self) -> Dict[str, PeerHandle]:
+    return {peer_id: peer_handle for peer_id, (peer_handle, _, _, _) in self.known_peers.items()}
+
+  def remove_peer(self, peer_id: str) -> None:
+    if self.known_peers.pop(peer_id, None) is not None and DEBUG_DISCOVERY >= 2: print(f"Removed peer {peer_id}, gossip declared it dead.")
+
   async def task_broadcast_presence(self):
     if DEBUG_DISCOVERY >= 2: print("Starting task_broadcast_presence...")
 
     while True:
-        target_ips = await get_target_ips_from_api(self.cluster_id, self.machine_id)
-        for addr, interface_name in get_all_ip_addresses_and_interfaces():
-            interface_priority, interface_type = await get_interface_priority_and_type(interface_name)
-            message = json.dumps({
-                "type": "discovery",
-                "node_id": self.node_id,
-                "grpc_port": self.node_port,
-                "device_capabilities": self.device_capabilities.to_dict(),
-                "priority": interface_priority,
-                "interface_name": interface_name,
-                "interface_type": interface_type,
-            })
-            try:
-                transport, _ = await asyncio.get_event_loop().create_datagram_endpoint(
-                    lambda: BroadcastProtocol(message, target_ips, self.broadcast_port),
-                    local_addr=(addr, 0),
-                    family=socket.AF_INET
-                )
-            except Exception as e:
-                print(f"Error in unicast presence: {e}")
-            finally:
-                if transport:
-                    transport.close()
-        await asyncio.sleep(self.broadcast_interval)
+      try:
+        await self.broadcast_presence()
+      except Exception as e:
+        print(f"Error in unicast presence: {e}")
+        if DEBUG_DISCOVERY >= 2: traceback.print_exc()
+      await self.target_ips.wait_changed(self.broadcast_interval)
+
+  def presence_targets(self) -> List[str]:
+    return self.target_ips.current()
+
+  def local_interfaces(self) -> List[Tuple[str, str]]:
+    return get_all_ip_addresses_and_interfaces()
+
+  async def broadcast_presence(self) -> None:
+    target_ips = self.presence_targets()
+    await self.update_presence_payloads()
+    addresses = {addr for addr, _ in self.presence_payloads}
+    for addr in [addr for addr in self.broadcast_sockets if addr not in addresses]:
+      self.broadcast_sockets.pop(addr).close()
+    if not target_ips:
+      return
+    for (addr, _), payload in self.presence_payloads.items():
+      transport = await self.broadcast_socket(addr)
+      if transport is None:
+        continue
+      for ip in target_ips:
+        transport.sendto(payload, (ip, self.broadcast_port))
+
+  async def update_presence_payloads(self) -> None:
+    interfaces = set(self.local_interfaces())
+    if self.device_capabilities != self.payload_capabilities:
+      self.presence_payloads.clear()
+      self.payload_capabilities = self.device_capabilities
+    for key in [key for key in self.presence_payloads if key not in interfaces]:
+      del self.presence_payloads[key]
+    for addr, interface_name in interfaces - self.presence_payloads.keys():
+      interface_priority, interface_type = await get_interface_priority_and_type(interface_name)
+      self.presence_payloads[(addr, interface_name)] = json.dumps({
+        "type": "discovery",
+        "node_id": self.node_id,
+        "grpc_port": self.node_port,
+        "device_capabilities": self.device_capabilities.to_dict(),
+        "priority": interface_priority,
+        "interface_name": interface_name,
+        "interface_type": interface_type,
+      }).encode("utf-8")
+
+  async def broadcast_socket(self, addr: str) -> Optional[asyncio.DatagramTransport]:
+    transport = self.broadcast_sockets.get(addr)
+    if transport is not None and not transport.is_closing():
+      return transport
+    try:
+      transport = await self.open_broadcast_socket(addr)
+    except OSError as e:
+      if DEBUG_DISCOVERY >= 1: print(f"Could not open presence socket on {addr}: {e}")
+      self.broadcast_sockets.pop(addr, None)
+      return None
+    self.broadcast_sockets[addr] = transport
+    return transport
+
+  async def open_broadcast_socket(self, addr: str) -> asyncio.DatagramTransport:
+    transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(asyncio.DatagramProtocol, local_addr=(addr, 0), family=socket.AF_INET)
+    return transport
 
   async def on_listen_message(self, data, addr):
     if not data:
@@ -203,7 +209,7 @@ class UDPDiscovery(Discovery):
         if DEBUG >= 1: print(f"Adding {peer_id=} at {peer_host}:{peer_port}. Replace existing peer_id: {peer_id in self.known_peers}")
         self.known_peers[peer_id] = (new_peer_handle, time.time(), time.time(), peer_prio)
       else:
-        if not await self.known_peers[peer_id][0].health_check():
+        if not await self.peer_healthy(self.known_peers[peer_id][0]):
           if DEBUG >= 1: print(f"Peer {peer_id} at {peer_host}:{peer_port} is not healthy. Removing.")
           if peer_id in self.known_peers: del self.known_peers[peer_id]
           return
@@ -228,7 +234,7 @@ class UDPDiscovery(Discovery):
         if DEBUG_DISCOVERY >= 2:
           print(
             "Peer statuses:", {
-              peer_handle.id(): f"is_connected={await peer_handle.is_connected()}, health_check={await peer_handle.health_check()}, connected_at={connected_at}, last_seen={last_seen}, prio={prio}"
+              peer_handle.id(): f"is_connected={await peer_handle.is_connected()}, healthy={await self.peer_healthy(peer_handle)}, connected_at={connected_at}, last_seen={last_seen}, prio={prio}"
               for peer_handle, connected_at, last_seen, prio in self.known_peers.values()
             }
           )
@@ -240,8 +246,8 @@ class UDPDiscovery(Discovery):
       except Exception as e:
         print(f"Error in cleanup peers: {e}")
         print(traceback.format_exc())
-      finally:
-        await asyncio.sleep(self.broadcast_interval)
+      # not in a finally, a stop() landing mid-check would otherwise wait out a whole interval
+      await asyncio.sleep(self.broadcast_interval)
 
   async def check_peer(self, peer_id: str, current_time: float) -> bool:
     peer_handle, connected_at, last_seen, prio = self.known_peers.get(peer_id, (None, None, None, None))
@@ -249,7 +255,7 @@ class UDPDiscovery(Discovery):
 
     try:
       is_connected = await peer_handle.is_connected()
-      health_ok = await peer_handle.health_check()
+      health_ok = await self.peer_healthy(peer_handle)
     except Exception as e:
       if DEBUG_DISCOVERY >= 2: print(f"Error checking peer {peer_id}: {e}")
       return True
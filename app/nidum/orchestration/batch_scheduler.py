@@ -0,0 +1,120 @@
+import asyncio
+import math
+import traceback
+import numpy as np
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from nidum import DEBUG
+from nidum.inference.inference_engine import InferenceEngine
+from nidum.inference.shard import Shard
+from nidum.orchestration.pipeline_stats import PipelineStats
+
+
+@dataclass
+class PendingStep:
+  request_id: str
+  tensor: np.ndarray
+  future: asyncio.Future
+
+
+class BatchScheduler:
+  """
+  Continuous batching at the Node/engine boundary.
+
+  Single-token decode steps for the same shard are queued while the engine is busy and
+  run together as one batched forward as soon as it frees up. Anything that is not a
+  plain decode step (prefill, requests carrying inference_state) goes straight to the engine.
+
+  With pipeline_stages > 1 the active requests are split into micro-batches of roughly
+  1/pipeline_stages of them, so the first micro-batch is forwarded to the next node
+  while this node computes the second one and the stages of the ring overlap.
+  """
+  def __init__(
+    self,
+    get_inference_engine: Callable[[], InferenceEngine],
+    max_batch_size: int = 8,
+    stats: Optional[PipelineStats] = None,
+    micro_batching: bool = True,
+    get_active_requests: Optional[Callable[[], int]] = None,
+  ):
+    self.get_inference_engine = get_inference_engine
+    self.max_batch_size = max_batch_size
+    self.stats = stats or PipelineStats(lambda: 0, lambda: self.queue_depth)
+    self.micro_batching = micro_batching
+    # requests currently moving through the ring, not just the ones queued here
+    self.get_active_requests = get_active_requests
+    self.pipeline_stages = 1
+    self.pending: Dict[Shard, List[PendingStep]] = {}
+    self.worker: Optional[asyncio.Task] = None
+    self.batches_run = 0
+    self.steps_run = 0
+
+  def is_batchable(self, tensor: np.ndarray, inference_state: Optional[dict]) -> bool:
+    return not inference_state and tensor.ndim >= 2 and tensor.shape[0] == 1 and tensor.shape[1] == 1
+
+  @property
+  def queue_depth(self) -> int:
+    return sum(len(steps) for steps in self.pending.values())
+
+  @property
+  def mean_batch_size(self) -> float:
+    return self.steps_run/self.batches_run if self.batches_run else 0.0
+
+  def effective_batch_size(self) -> int:
+    return max(1, min(self.max_batch_size, self.get_inference_engine().max_cached_requests))
+
+  def micro_batch_size(self, queued_requests: int) -> int:
+    batch_size = self.effective_batch_size()
+    if not self.micro_batching or self.pipeline_stages <= 1:
+      return batch_size
+    active_requests = max(queued_requests, self.get_active_requests() if self.get_active_requests else 0)
+    return max(1, min(batch_size, math.ceil(active_requests/self.pipeline_stages)))
+
+  async def infer_tensor(self, request_id: str, shard: Shard, tensor: np.ndarray, inference_state: Optional[dict] = None) -> Tuple[np.ndarray, Optional[dict]]:
+    if self.max_batch_size <= 1 or not self.is_batchable(tensor, inference_state):
+      with self.stats.computing():
+        return await self.get_inference_engine().infer_tensor(request_id, shard, tensor, inference_state)
+
+    future = asyncio.get_running_loop().create_future()
+    self.pending.setdefault(shard, []).append(PendingStep(request_id, tensor, future))
+    if self.worker is None or self.worker.done():
+      self.worker = asyncio.create_task(self._run())
+    return await future, inference_state
+
+  def _next_batch(self) -> Tuple[Shard, List[PendingStep]]:
+    shard = next(iter(self.pending))
+    steps = self.pending[shard]
+    batch_size = self.micro_batch_size(len({step.request_id for step in steps}))
+    batch, deferred, seen = [], [], set()
+    for step in steps:
+      # a request can only occupy one slot per forward, its cache is advanced in place
+      if len(batch) < batch_size and step.request_id not in seen:
+        batch.append(step)
+        seen.add(step.request_id)
+      else:
+        deferred.append(step)
+    if deferred:
+      # rotate so shards take turns when several are waiting
+      del self.pending[shard]
+      self.pending[shard] = deferred
+    else:
+      del self.pending[shard]
+    return shard, batch
+
+  async def _run(self) -> None:
+    while self.pending:
+      shard, batch = self._next_batch()
+      self.batches_run += 1
+      self.steps_run += len(batch)
+      if DEBUG >= 2: print(f"Running batched decode step for {shard}: batch_size={len(batch)} queued={self.queue_depth}")
+      try:
+        with self.stats.computing():
+          outputs = await self.get_inference_engine().infer_tensor_batch([s.request_id for s in batch], shard, [s.tensor for s in batch])
+        for step, output in zip(batch, outputs):
+          if not step.future.done(): step.future.set_result(output)
+      except Exception as e:
+        if DEBUG >= 1: traceback.print_exc()
+        for step in batch:
+          if not step.future.done(): step.future.set_exception(e)
+      # let the completed micro-batch be forwarded before the next one occupies the engine
+      await asyncio.sleep(0)
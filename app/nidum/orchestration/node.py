@@ -4,10 +4,11 @@ import asyncio
 import uuid
 import time
 import traceback
-from typing import List, Dict, Optional, Tuple, Union, Set
+from typing import List, Dict, Hashable, Optional, Tuple, Union, Set
 from nidum.networking import Discovery, PeerHandle, Server
 from nidum.inference.inference_engine import InferenceEngine, Shard
 from nidum.topology.topology import Topology
+from nidum.topology.topology_store import NodeRecord, TopologyStore
 from nidum.topology.device_capabilities import device_capabilities
 from nidum.topology.partitioning_strategy import Partition, PartitioningStrategy, map_partitions_to_shards
 from nidum import DEBUG
@@ -16,6 +17,16 @@ from nidum.viz.topology_viz import TopologyViz
 from nidum.download.hf.hf_helpers import RepoProgressEvent
 from nidum.inference.inference_engine import get_inference_engine, InferenceEngine
 from nidum.download.hf.hf_shard_download import HFShardDownloader
+from nidum.orchestration.batch_scheduler import BatchScheduler
+from nidum.orchestration.partition_plan import PartitionPlan
+from nidum.orchestration.pipeline_stats import PipelineStats
+from nidum.orchestration.request_state import RequestStateStore, RequestStateTracker
+from nidum.orchestration.status_broadcaster import StatusBroadcaster
+from nidum.orchestration.result_assembly import ResultAssembly
+from nidum.orchestration.peer_registry import PeerRegistry
+from nidum.orchestration.ring_state import split_ring_state, with_ring_state
+from nidum.networking.link_prober import LinkProber
+from nidum.orchestration.speculative import SpeculativeDecoder, is_speculative_step, verify_draft
 
 class Node:
   def __init__(
@@ -29,19 +40,41 @@ class Node:
     default_sample_temperature: float = 0.0,
     topology_viz: Optional[TopologyViz] = None,
     shard_downloader: Optional[HFShardDownloader] = None,
+    max_batch_size: int = 8,
+    micro_batching: bool = True,
+    request_state: Optional[RequestStateTracker] = None,
+    speculative: Optional[SpeculativeDecoder] = None,
+    prefill_chunk_size: int = 512,
+    topology_timeout: float = 3.0,
+    link_probe_interval: float = 5.0,
+    link_bandwidth_interval: float = 60.0,
   ):
     self.id = _id
     self.inference_engine = inference_engine
     self.server = server
     self.discovery = discovery
     self.partitioning_strategy = partitioning_strategy
-    self.peers: List[PeerHandle] = {}
+    self._peers = PeerRegistry()
+    self._refresh_peers_task: Optional[asyncio.Task] = None
     self.topology: Topology = Topology()
+    self.topology_store = TopologyStore(self.id)
+    self.topology_generation = 0
+    self.topology_timeout = topology_timeout
+    self._partition_plan: Optional[PartitionPlan] = None
     self.device_capabilities = device_capabilities()
-    self.buffered_token_output: Dict[str, Tuple[List[int], bool]] = {}
-    self.buffered_logits: Dict[str, List[np.ndarray]] = {}
-    self.buffered_inputs: Dict[str, List[np.ndarray]] = {}
-    self.buffered_partials: Dict[str, List[np.ndarray]] = {}
+    self.request_state = request_state or RequestStateTracker()
+    self.buffered_token_output: RequestStateStore = self.request_state.store("buffered_token_output")
+    self.buffered_logits: RequestStateStore = self.request_state.store("buffered_logits")
+    self.buffered_inputs: RequestStateStore = self.request_state.store("buffered_inputs")
+    self.buffered_partials: RequestStateStore = self.request_state.store("buffered_partials")
+    self.request_metadata: RequestStateStore = self.request_state.store("request_metadata")
+    self.result_assembly: RequestStateStore = self.request_state.store("result_assembly")
+    self.result_gap_timeout = 1.0
+    self.speculative = speculative
+    self.prefill_chunk_size = prefill_chunk_size
+    self.forward_chains: Dict[str, asyncio.Task] = {}
+    if self.speculative is not None:
+      self.speculative.requests = self.request_state.store("speculative")
     self.checkpoints: Dict[str, Dict[str, int]] = {}
     
     self.max_generate_tokens = max_generate_tokens
@@ -50,20 +83,31 @@ class Node:
     self._on_token = AsyncCallbackSystem[str, Tuple[str, List[int], bool]]()
     self._on_opaque_status = AsyncCallbackSystem[str, Tuple[str, str]]()
     self._on_opaque_status.register("node_status").on_next(self.on_node_status)
+    self._on_token.register("request_state").on_next(self.on_request_token)
+    self.status_broadcaster = StatusBroadcaster(self.id, lambda: self.peers, self._on_opaque_status.trigger_all)
     self.node_download_progress: Dict[str, RepoProgressEvent] = {}
     self.topology_inference_engines_pool: List[List[str]] = []
+    # node id -> whether its engine can roll back its KV cache, as announced with its supported engines
+    self.rollback_support: Dict[str, bool] = {}
     self.shard_downloader = shard_downloader
-    self.outstanding_requests = {}
+    self.outstanding_requests: RequestStateStore = self.request_state.store("outstanding_requests")
+    self.pipeline_stats = PipelineStats(lambda: len(self.outstanding_requests), lambda: self.batch_scheduler.queue_depth)
+    self.batch_scheduler = BatchScheduler(lambda: self.inference_engine, max_batch_size=max_batch_size, stats=self.pipeline_stats, micro_batching=micro_batching,
+      get_active_requests=lambda: len(self.outstanding_requests))
+    self.link_prober = LinkProber(lambda: self.peers, interval=link_probe_interval, bandwidth_interval=link_bandwidth_interval, busy=lambda: len(self.outstanding_requests) > 0)
 
   async def start(self, wait_for_peers: int = 0) -> None:
     await self.server.start()
     await self.discovery.start()
     await self.update_peers(wait_for_peers)
-    await self.collect_topology(set())
-    if DEBUG >= 2: print(f"Collected topology: {self.topology}")
+    await self.sync_topology()
+    if DEBUG >= 2: print(f"Synced topology: {self.topology}")
     asyncio.create_task(self.periodic_topology_collection(2.0))
+    self.link_prober.start()
 
   async def stop(self) -> None:
+    await self.status_broadcaster.flush()
+    await self.link_prober.stop()
     await self.discovery.stop()
     await self.server.stop()
 
@@ -74,6 +118,7 @@ class Node:
         node_id = status_data.get("node_id")
         engines = status_data.get("engines", [])
         self.topology_inference_engines_pool.append(engines)
+        self.rollback_support[node_id] = status_data.get("rollback", False)
       if status_data.get("type", "") == "node_status":
         if status_data.get("status", "").startswith("start_"):
           self.current_topology.active_node_id = status_data.get("node_id")
@@ -86,7 +131,7 @@ class Node:
         download_progress = RepoProgressEvent.from_dict(status_data.get('progress'))
         self.node_download_progress[status_data.get('node_id')] = download_progress
       if self.topology_viz:
-        self.topology_viz.update_visualization(self.topology, self.partitioning_strategy.partition(self.topology), self.id, self.node_download_progress)
+        self.topology_viz.update_visualization(self.topology, self.get_partition_plan().partitions, self.id, self.node_download_progress)
     except Exception as e:
       if DEBUG >= 1: print(f"Error updating visualization: {e}")
       if DEBUG >= 1: traceback.print_exc()
@@ -101,11 +146,18 @@ class Node:
     return supported_engine_names
 
   async def broadcast_supported_engines(self, supported_engines_names: List[str]):
-    status_message = json.dumps({"type": "supported_inference_engines", "node_id": self.id, "engines": supported_engines_names})
+    status_message = json.dumps({"type": "supported_inference_engines", "node_id": self.id, "engines": supported_engines_names, "rollback": self.inference_engine.supports_rollback})
     await self.broadcast_opaque_status("", status_message)
 
   def get_topology_inference_engines(self) -> List[List[str]]:
     return self.topology_inference_engines_pool
+
+  def ring_supports_rollback(self) -> bool:
+    """Speculative steps roll back the cache of every node, nodes that never announced it are assumed unable to."""
+    return all(
+      self.inference_engine.supports_rollback if partition.node_id == self.id else self.rollback_support.get(partition.node_id, False)
+      for partition in self.get_partition_plan().partitions
+    )
   
   async def process_inference_result(
     self,
@@ -114,19 +166,37 @@ class Node:
     request_id: Optional[str] = None,
     inference_state: Optional[dict] = None,
   ):
+    ring_state, inference_state = split_ring_state(inference_state)
+    if "prefill_chunk" in ring_state and shard.is_last_layer():
+      # a prompt chunk only extends the KV caches along the ring, the first token comes from the last chunk
+      self.outstanding_requests[request_id] = "waiting"
+      return None
     if shard.model_id != 'stable-diffusion-2-1-base':
       if request_id not in self.buffered_token_output:
         self.buffered_token_output[request_id] = ([], False)
       is_finished = len(self.buffered_token_output[request_id][0]) >= self.max_generate_tokens
       if shard.is_last_layer() and not is_finished:
-        token = await self.inference_engine.sample(result, temp=self.default_sample_temperature)
+        draft = ring_state.get("draft")
+        if draft:
+          new_tokens, accepted = verify_draft(result, draft, temp=self.default_sample_temperature)
+          if DEBUG >= 2: print(f"[{request_id}] accepted {accepted}/{len(draft)} drafted tokens")
+          # every node drops the rejected positions from its cache before the next step
+          ring_state = {"rollback": len(draft) - accepted, "accepted": accepted}
+        else:
+          token = await self.inference_engine.sample(result, temp=self.default_sample_temperature)
+          new_tokens = [token.item()]
+          ring_state = {}
         await self.inference_engine.ensure_shard(shard)
-        self.buffered_token_output[request_id][0].append(token.item())
-        is_finished = token.item() == self.inference_engine.tokenizer.eos_token_id or is_finished or len(self.buffered_token_output[request_id][0]) >= self.max_generate_tokens
-        if DEBUG >= 2: print(f"[{request_id}] result size: {result.size}, is finished: {is_finished}, buffered tokens: {len(self.buffered_token_output[request_id][0])}")
-        asyncio.create_task(self.broadcast_result(request_id, *self.buffered_token_output[request_id]))
-        forward = token.reshape(1, -1)
-        intermediate_result = self.buffered_token_output[request_id][0]
+        tokens = self.buffered_token_output[request_id][0]
+        start_index = len(tokens)
+        for token in new_tokens:
+          tokens.append(token)
+          is_finished = token == self.inference_engine.tokenizer.eos_token_id or len(tokens) >= self.max_generate_tokens
+          if is_finished: break
+        if DEBUG >= 2: print(f"[{request_id}] result size: {result.size}, is finished: {is_finished}, buffered tokens: {len(tokens)}")
+        asyncio.create_task(self.send_result_to_origin(request_id, tokens[start_index:], is_finished, start_index=start_index))
+        forward = np.array([tokens[-1:]])
+        intermediate_result = tokens
       else:
         forward = result
     else:
@@ -136,15 +206,16 @@ class Node:
       forward = result
     if shard.is_last_layer():
       self.trigger_on_token_callbacks(request_id, intermediate_result, is_finished)
-      asyncio.create_task(self.broadcast_result(request_id, intermediate_result, is_finished))
+      if shard.model_id == 'stable-diffusion-2-1-base':
+        asyncio.create_task(self.send_result_to_origin(request_id, intermediate_result, is_finished))
 
     if is_finished:
       if shard.model_id != 'stable-diffusion-2-1-base':
         self.buffered_token_output[request_id] = (self.buffered_token_output[request_id][0], True)
-      self.outstanding_requests.pop(request_id)
+      self.finish_request(request_id)
     else:
       self.outstanding_requests[request_id] = "waiting"
-      asyncio.create_task(self.forward_tensor(shard, forward, request_id, self.get_partition_index(offset = 1), inference_state))
+      self.schedule_forward(request_id, self.forward_tensor(shard, forward, request_id, self.get_partition_index(offset = 1), with_ring_state(inference_state, ring_state)))
 
     return  np.array(self.buffered_token_output[request_id][0]) if shard.model_id != 'stable-diffusion-2-1-base' else intermediate_result
 
@@ -155,7 +226,11 @@ class Node:
     prompt: str,
     request_id: Optional[str] = None,
     inference_state: Optional[dict] = {},
+    request_metadata: Optional[Dict[str, str]] = None,
   ) -> Optional[np.ndarray]:
+    if request_id is None:
+      request_id = str(uuid.uuid4())
+    self.update_request_metadata(request_id, request_metadata)
     shard = self.get_current_shard(base_shard)
     asyncio.create_task(
       self.broadcast_opaque_status(
@@ -166,7 +241,7 @@ class Node:
           "status": "start_process_prompt",
           "base_shard": base_shard.to_dict(),
           "shard": shard.to_dict(),
-          "prompt": prompt,
+          "prompt_length": len(prompt),
           "request_id": request_id,
         }),
       )
@@ -184,7 +259,7 @@ class Node:
           "status": "end_process_prompt",
           "base_shard": base_shard.to_dict(),
           "shard": shard.to_dict(),
-          "prompt": prompt,
+          "prompt_length": len(prompt),
           "request_id": request_id,
           "elapsed_time_ns": elapsed_time_ns,
           "result_size": resp.size if resp is not None else 0,
@@ -206,10 +281,47 @@ class Node:
       return None
     else:
       self.outstanding_requests[request_id] = "processing"
-      result, inference_state = await self.inference_engine.infer_prompt(request_id, shard, prompt, inference_state)
+      if self.prefill_chunk_size > 0 and not shard.is_last_layer() and shard.model_id != 'stable-diffusion-2-1-base':
+        result, inference_state = await self.prefill_in_chunks(shard, prompt, request_id, inference_state)
+      else:
+        with self.pipeline_stats.computing():
+          result, inference_state = await self.inference_engine.infer_prompt(request_id, shard, prompt, inference_state)
+      if self.speculative is not None and self.ring_supports_rollback() and await self.speculative.supports(shard, getattr(self.inference_engine, "tokenizer", None)):
+        self.speculative.start_prefill(request_id, prompt)
       ret = await self.process_inference_result(shard, result, request_id, inference_state)
       return result
 
+  async def prefill_in_chunks(self, shard: Shard, prompt: str, request_id: str, inference_state: Optional[dict] = None) -> Tuple[np.ndarray, Optional[dict]]:
+    """
+    Runs the prompt through the first shard prefill_chunk_size tokens at a time. Every chunk but the
+    last is forwarded as soon as it is computed, so the next nodes extend their KV caches while this
+    one works on the following chunk. The last chunk is returned and goes down the usual path.
+    """
+    tokens = (await self.inference_engine.encode(shard, prompt)).reshape(1, -1)
+    chunks = [tokens[:, start:start + self.prefill_chunk_size] for start in range(0, tokens.shape[1], self.prefill_chunk_size)]
+    if DEBUG >= 2: print(f"[{request_id}] prefilling {tokens.shape[1]} tokens in {len(chunks)} chunks")
+    for index, chunk in enumerate(chunks):
+      with self.pipeline_stats.computing():
+        result, inference_state = await self.inference_engine.infer_tensor(request_id, shard, chunk, inference_state)
+      if index < len(chunks) - 1:
+        ring_state = {"prefill_chunk": index}
+        self.schedule_forward(request_id, self.forward_tensor(shard, result, request_id, self.get_partition_index(offset = 1), with_ring_state(inference_state, ring_state)))
+    return result, inference_state
+
+  def schedule_forward(self, request_id: str, forward) -> asyncio.Task:
+    """Forwards of one request leave in order, so prompt chunks reach the next node in the order they were computed."""
+    previous = self.forward_chains.get(request_id)
+
+    async def run():
+      if previous is not None and not previous.done():
+        await asyncio.wait([previous])
+      await forward
+
+    task = asyncio.create_task(run())
+    self.forward_chains[request_id] = task
+    task.add_done_callback(lambda t: self.forward_chains.pop(request_id, None) if self.forward_chains.get(request_id) is t else None)
+    return task
+
   async def enqueue_example(
     self,
     base_shard: Shard,
@@ -353,10 +465,16 @@ class Node:
     tensor: np.ndarray,
     request_id: Optional[str] = None,
     inference_state: Optional[dict] = None,
+    request_metadata: Optional[Dict[str, str]] = None,
   ) -> Optional[np.ndarray]:
+    if request_id is None:
+      request_id = str(uuid.uuid4())
+    self.update_request_metadata(request_id, request_metadata)
     shard = self.get_current_shard(base_shard)
-    asyncio.create_task(
-      self.broadcast_opaque_status(
+    # decode steps only feed the per-request summary, everything else gets start/end events
+    is_decode_step = self.batch_scheduler.is_batchable(tensor, inference_state) or is_speculative_step(split_ring_state(inference_state)[0])
+    if not is_decode_step:
+      self.status_broadcaster.emit(
         request_id,
         json.dumps({
           "type": "node_status",
@@ -368,14 +486,16 @@ class Node:
           "tensor_shape": tensor.shape,
           "request_id": request_id,
         }),
+        key=("process_tensor", request_id),
       )
-    )
     start_time = time.perf_counter_ns()
     resp = await self._process_tensor(shard, tensor, request_id, inference_state)
     end_time = time.perf_counter_ns()
     elapsed_time_ns = end_time - start_time
-    asyncio.create_task(
-      self.broadcast_opaque_status(
+    if is_decode_step:
+      self.status_broadcaster.record_decode_step(request_id, base_shard.to_dict(), shard.to_dict(), elapsed_time_ns, resp.size if resp is not None else 0)
+    else:
+      self.status_broadcaster.emit(
         request_id,
         json.dumps({
           "type": "node_status",
@@ -387,8 +507,8 @@ class Node:
           "elapsed_time_ns": elapsed_time_ns,
           "result_size": resp.size if resp is not None else 0,
         }),
+        key=("process_tensor", request_id),
       )
-    )
     return resp
 
   async def _process_tensor(
@@ -402,14 +522,27 @@ class Node:
       request_id = str(uuid.uuid4())
     shard = self.get_current_shard(base_shard)
 
+    if self.request_state.drop_late_update(request_id):
+      return None
+
     if DEBUG >= 1: print(f"[{request_id}] process_tensor: {tensor.size=} {tensor.shape=}")
     try:
       self.outstanding_requests[request_id] = "processing"
-      result, inference_state = await self.inference_engine.infer_tensor(request_id, shard, tensor, inference_state)
-      ret = await self.process_inference_result(shard, result, request_id, inference_state) 
+      ring_state, inference_state = split_ring_state(inference_state)
+      if ring_state.get("rollback") and not await self.inference_engine.rollback(request_id, shard, ring_state["rollback"]):
+        print(f"[{request_id}] Could not roll back {ring_state['rollback']} rejected draft tokens, the KV cache still holds them")
+      if shard.is_first_layer() and self.speculative is not None and self.speculative.is_active(request_id) and tensor.shape == (1, 1):
+        draft = await self.speculative.propose(request_id, int(tensor[0, 0]), ring_state.pop("accepted", None))
+        if draft:
+          # the whole ring verifies the token and its drafts in one multi-token pass
+          tensor = np.concatenate([tensor, np.array([draft], dtype=tensor.dtype)], axis=1)
+          ring_state["draft"] = draft
+      result, inference_state = await self.batch_scheduler.infer_tensor(request_id, shard, tensor, inference_state)
+      ret = await self.process_inference_result(shard, result, request_id, with_ring_state(inference_state, ring_state))
       return ret
     except Exception as e:
-      self.outstanding_requests.pop(request_id)
+      self.outstanding_requests.pop(request_id, None)
+      self.pipeline_stats.mark()
       print(f"Error processing tensor for shard {shard}: {e}")
       traceback.print_exc()
       return None
@@ -425,14 +558,15 @@ class Node:
     target_index: int,
   ) -> None:
     if DEBUG >= 1: print(f"target partition index: {target_index}")
-    target_id = self.partitioning_strategy.partition(self.topology)[target_index].node_id
+    plan = self.get_partition_plan()
+    target_id = plan.node_id_at(target_index)
     target_shard = self.get_current_shard(base_shard, target_index)
     if DEBUG >= 2: print(f"computed target from: {base_shard} {target_index}, {self.topology}. target shard: {target_shard}")
-    target_peer = next((p for p in self.peers if p.id() == target_id), None)
+    target_peer = self.get_target_peer(plan, target_index, target_id)
     if not target_peer:
       raise ValueError(f"peer for {target_index} not found")
     if DEBUG >= 1: print(f"sending example to {target_peer.id()}: {step} => {target} ({length})")
-    resp = await target_peer.send_example(target_shard, step, target, length, request_id=request_id, train=train)
+    resp = await self.send_to_peer(target_peer, target_peer.send_example(target_shard, step, target, length, request_id=request_id, train=train))
     return resp
 
   async def forward_prompt(
@@ -444,17 +578,18 @@ class Node:
     inference_state: Optional[dict] = None,
   ) -> None:
     if DEBUG >= 1: print(f"target partition index: {target_index}")
-    target_id = self.partitioning_strategy.partition(self.topology)[target_index].node_id
+    plan = self.get_partition_plan()
+    target_id = plan.node_id_at(target_index)
     next_shard = self.get_current_shard(base_shard, target_index)
     if DEBUG >= 2: print(f"Computed target from: {base_shard} {target_index}, {self.topology}. next shard: {next_shard}")
     if target_id == self.id:
       await self.process_prompt(next_shard, prompt, request_id, inference_state)
     else:
-      target_peer = next((p for p in self.peers if p.id() == target_id), None)
+      target_peer = self.get_target_peer(plan, target_index, target_id)
       if not target_peer:
         raise ValueError(f"Peer for {target_index} not found")
       if DEBUG >= 1: print(f"Sending prompt to {target_peer.id()}: {prompt}")
-      await target_peer.send_prompt(next_shard, prompt, request_id=request_id, inference_state=inference_state)
+      await self.send_to_peer(target_peer, target_peer.send_prompt(next_shard, prompt, request_id=request_id, inference_state=inference_state, request_metadata=self.request_metadata.get(request_id)))
   
   async def forward_tensor(
     self,
@@ -465,43 +600,75 @@ class Node:
     inference_state: Optional[dict] = None,
   ) -> None:
     if DEBUG >= 1: print(f"target partition index: {target_index}")
-    target_id = self.partitioning_strategy.partition(self.topology)[target_index].node_id
+    plan = self.get_partition_plan()
+    target_id = plan.node_id_at(target_index)
     next_shard = self.get_current_shard(base_shard, target_index)
     if DEBUG >= 2: print(f"Computed target from: {base_shard} {target_index}, {self.topology}. target shard: {next_shard}")
     if target_id == self.id:
       await self.process_tensor(next_shard, tensor, request_id, inference_state)
     else:
-      target_peer = next((p for p in self.peers if p.id() == target_id), None)
+      target_peer = self.get_target_peer(plan, target_index, target_id)
       if not target_peer:
         raise ValueError(f"Peer for {target_index} not found")
       if DEBUG >= 1: print(f"Sending tensor to {target_peer.id()}: {tensor}")
-      await target_peer.send_tensor(next_shard, tensor, request_id=request_id, inference_state=inference_state)
+      await self.send_to_peer(target_peer, target_peer.send_tensor(next_shard, tensor, request_id=request_id, inference_state=inference_state, request_metadata=self.request_metadata.get(request_id)))
+
+  def get_partition_plan(self) -> PartitionPlan:
+    plan = self._partition_plan
+    if plan is None or not plan.is_current(self.topology, self.peers):
+      plan = PartitionPlan.build(self.id, self.topology, self.partitioning_strategy.partition(self.topology), self.peers)
+      self._partition_plan = plan
+      self.batch_scheduler.pipeline_stages = max(1, len(plan.partitions))
+      if DEBUG >= 2: print(f"Rebuilt partition plan for topology version {plan.topology_version}: {plan.partitions}")
+    return plan
+
+  def get_target_peer(self, plan: PartitionPlan, target_index: int, target_id: str) -> Optional[PeerHandle]:
+    if target_index == plan.next_index and plan.next_peer is not None and self.peers.is_available(target_id):
+      return plan.next_peer
+    return self.peers.get(target_id)
+
+  async def send_to_peer(self, peer: PeerHandle, send):
+    """Runs one RPC against a peer, keeping its registry state and RTT current."""
+    start = time.perf_counter()
+    try:
+      resp = await send
+    except Exception:
+      self.peers.record_failure(peer.id())
+      # refresh peers right away instead of waiting for the next periodic collection
+      if self._refresh_peers_task is None or self._refresh_peers_task.done():
+        self._refresh_peers_task = asyncio.create_task(self.refresh_peers())
+      raise
+    self.peers.record_success(peer.id(), time.perf_counter() - start)
+    return resp
+
+  async def refresh_peers(self) -> None:
+    try:
+      if await self.update_peers():
+        await self.sync_topology()
+    except Exception as e:
+      if DEBUG >= 1: print(f"Error refreshing peers: {e}")
 
   def get_partition_index(self, offset: int = 0):
     if not self.partitioning_strategy:
       if DEBUG >= 1: print("No partitioning strategy found. Skipping forward.")
       return None
-    partitions = self.partitioning_strategy.partition(self.topology)
-    current_partition_index = next((i for i, p in enumerate(partitions) if p.node_id == self.id), None)
-    if current_partition_index is None:
+    plan = self.get_partition_plan()
+    if plan.node_index is None:
       raise ValueError(f"No current partition found for node: {self.id}")
-    return (current_partition_index + offset) % len(partitions)
+    return (plan.node_index + offset) % len(plan.partitions)
 
   def get_current_shard(self, base_shard: Shard, index: Optional[int] = None) -> Shard:
     if index is None:
       index = self.get_partition_index()
-    partitions = self.partitioning_strategy.partition(self.topology)
-    shards = map_partitions_to_shards(partitions, base_shard.n_layers, base_shard.model_id)
-    return shards[index]
+    return self.get_partition_plan().shards_for(base_shard)[index]
 
   async def update_peers(self, wait_for_peers: int = 0) -> bool:
     next_peers = await self.discovery.discover_peers(wait_for_peers)
-    current_peer_ids = {peer.id() for peer in self.peers}
     next_peer_ids = {peer.id() for peer in next_peers}
-    peers_added = [peer for peer in next_peers if peer.id() not in current_peer_ids]
+    peers_added = [peer for peer in next_peers if peer.id() not in self.peers]
     peers_removed = [peer for peer in self.peers if peer.id() not in next_peer_ids]
-    peers_updated = [peer for peer in next_peers if peer.id() in current_peer_ids and any(p.addr() != peer.addr() for p in self.peers if p.id() == peer.id())]
-    peers_unchanged = [peer for peer in next_peers if peer.id() in current_peer_ids and all(p.addr() == peer.addr() for p in self.peers if p.id() == peer.id())]
+    peers_updated = [peer for peer in next_peers if peer.id() in self.peers and self.peers.get(peer.id()).addr() != peer.addr()]
+    peers_unchanged = [peer for peer in next_peers if peer.id() in self.peers and self.peers.get(peer.id()).addr() == peer.addr()]
     peers_to_disconnect = [peer for peer in peers_removed if await peer.is_connected()]
     peers_to_connect = [peer for peer in peers_added + peers_updated + peers_unchanged if not await peer.is_connected()]
 
@@ -543,23 +710,30 @@ class Node:
       if failed_connects: print(f"Failed to connect peers: {_pretty(failed_connects)}")
 
     self.peers = next_peers
+    for peer in peers_removed: self.topology_store.forget_peer(peer.id())
+    for peer in successful_connects: self.peers.mark_connected(peer.id(), True)
+    for peer in failed_connects: self.peers.record_failure(peer.id())
+    for peer in peers_unchanged + peers_updated:
+      if peer not in peers_to_connect: self.peers.mark_connected(peer.id(), True)
     return len(peers_added) > 0 or len(peers_removed) > 0 or len(peers_updated) > 0
 
   async def select_best_inference_engine(self):
-    if self.inference_engine.__class__.__name__ == 'DummyInferenceEngine': return
     supported_engines = self.get_supported_inference_engines()
     await self.broadcast_supported_engines(supported_engines)
+    if self.inference_engine.__class__.__name__ == 'DummyInferenceEngine': return
     if len(self.get_topology_inference_engines()):
       self.inference_engine = get_inference_engine(supported_engines[0], self.shard_downloader)
 
   async def periodic_topology_collection(self, interval: int):
     while True:
       await asyncio.sleep(interval)
+      self.request_state.sweep()
       try:
         did_peers_change = await self.update_peers()
         if DEBUG >= 2: print(f"{did_peers_change=}")
+        # cheap when nothing changed, versions go out and no records come back
+        await self.sync_topology()
         if did_peers_change:
-          await self.collect_topology(set())
           await self.select_best_inference_engine()
       except Exception as e:
         print(f"Error collecting topology: {e}")
@@ -570,39 +744,53 @@ class Node:
       return None, False
     return np.array(self.buffered_token_output[request_id][0]), self.buffered_token_output[request_id][1]
 
-  async def collect_topology(self, visited: set[str], max_depth: int = 4) -> Topology:
-    next_topology = Topology()
-    next_topology.update_node(self.id, self.device_capabilities)
-
-    if DEBUG >= 2: print(f"Collecting topology {max_depth=} {visited=}")
-
-    prev_visited = visited.copy()
-    visited.add(self.id)
-    visited.update(p.id() for p in self.peers)
-
+  async def sync_topology(self) -> Topology:
+    """
+    Exchanges record versions with every peer at once under a single deadline, each side sending only
+    the records the other is missing. A slow peer catches up on a later round instead of holding this one.
+    """
+    self.update_topology_record()
+    self.topology_store.prune()
+    tasks = [asyncio.create_task(self.sync_topology_with(peer)) for peer in self.peers]
+    if tasks:
+      _, pending = await asyncio.wait(tasks, timeout=self.topology_timeout)
+      for task in pending: task.cancel()
+      if pending and DEBUG >= 1: print(f"Topology sync: {len(pending)}/{len(tasks)} peers missed the {self.topology_timeout}s deadline")
+    return self.rebuild_topology()
+
+  async def sync_topology_with(self, peer: PeerHandle) -> None:
+    try:
+      records, versions = await peer.sync_topology(self.topology_store.versions(), self.topology_store.outgoing(peer.id()))
+    except Exception as e:
+      if DEBUG >= 1: print(f"Error syncing topology with {peer.id()}: {e!r}")
+      return
+    self.topology_store.record_peer_versions(peer.id(), versions)
+    self.topology_store.apply(records)
+
+  def sync_topology_from_peer(self, records: List[NodeRecord], versions: Dict[str, int]) -> Tuple[List[NodeRecord], Dict[str, int]]:
+    """The serving side of sync_topology: takes the caller's records and answers with the ones its versions lack."""
+    changed = self.update_topology_record()
+    if self.topology_store.apply(records) or changed: self.rebuild_topology()
+    return self.topology_store.deltas(versions), self.topology_store.versions()
+
+  def update_topology_record(self) -> bool:
+    edges = {peer.id(): peer.description() for peer in self.peers}
+    return self.topology_store.update_local(self.device_capabilities, edges, self.link_prober.links())
+
+  def rebuild_topology(self) -> Topology:
+    if self.topology_store.generation == self.topology_generation:
+      return self.topology
+    next_topology = self.topology_store.to_topology()
+    # peers without a record yet (or on a version without SyncTopology) count with what discovery told us
     for peer in self.peers:
-      next_topology.update_node(peer.id(), peer.device_capabilities())
-      next_topology.add_edge(self.id, peer.id(), peer.description())
-
-      if peer.id() in prev_visited:
-        continue
-
-      if max_depth <= 0:
-        if DEBUG >= 2: print("Max depth reached. Skipping...")
-        continue
-
-      try:
-        other_topology = await asyncio.wait_for(peer.collect_topology(visited, max_depth=max_depth - 1), timeout=5.0)
-        if DEBUG >= 2: print(f"Collected topology from: {peer.id()}: {other_topology}")
-        next_topology.merge(peer.id(), other_topology)
-      except Exception as e:
-        print(f"Error collecting topology from {peer.id()}: {e}")
-        traceback.print_exc()
-
+      if peer.id() not in next_topology.nodes:
+        next_topology.update_node(peer.id(), peer.device_capabilities())
     next_topology.active_node_id = self.topology.active_node_id
+    next_topology.version = self.topology.version + 1
     self.topology = next_topology
+    self.topology_generation = self.topology_store.generation
     if self.topology_viz:
-      self.topology_viz.update_visualization(self.topology, self.partitioning_strategy.partition(self.topology), self.id)
+      self.topology_viz.update_visualization(self.topology, self.get_partition_plan().partitions, self.id)
     return self.topology
 
   @property
@@ -613,37 +801,107 @@ class Node:
   def on_opaque_status(self) -> AsyncCallbackSystem[str, Tuple[str, str]]:
     return self._on_opaque_status
 
+  def on_request_token(self, request_id: str, tokens: List[int], is_finished: bool) -> None:
+    if is_finished: self.finish_request(request_id)
+
+  def finish_request(self, request_id: str) -> None:
+    # the origin and intermediate nodes only learn about completion through the result broadcast
+    self.outstanding_requests.pop(request_id, None)
+    self.request_state.finish(request_id)
+    self.status_broadcaster.finish_request(request_id)
+    self.pipeline_stats.mark()
+
   def trigger_on_token_callbacks(self, request_id: str, tokens: List[int], is_finished: bool) -> None:
     if DEBUG >= 2: print(f"Triggering all on_token callbacks with {request_id=} num_tokens={len(tokens)} {is_finished=}")
     self.on_token.trigger_all(request_id, tokens, is_finished)
   
-  async def broadcast_result(self, request_id: str, result: List[int], is_finished: bool) -> None:
-    async def send_result_to_peer(peer):
+  def update_request_metadata(self, request_id: str, request_metadata: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    metadata = {**(self.request_metadata.get(request_id) or {}), **(request_metadata or {})}
+    # a request without an origin entered the ring here, through the API or the CLI
+    metadata.setdefault("origin_node_id", self.id)
+    self.request_metadata[request_id] = metadata
+    return metadata
+
+  def get_peer(self, node_id: str) -> Optional[PeerHandle]:
+    return self.peers.get(node_id)
+
+  async def send_result_to_origin(self, request_id: str, result: Union[List[int], np.ndarray], is_finished: bool, start_index: int = 0) -> None:
+    origin_id = (self.request_metadata.get(request_id) or {}).get("origin_node_id", self.id)
+    if origin_id != self.id:
+      origin = self.get_peer(origin_id)
+      if origin is None:
+        if DEBUG >= 2: print(f"[{request_id}] Origin node {origin_id} is not a peer, dropping result")
+      else:
+        try:
+          await asyncio.wait_for(origin.send_result(request_id, result, is_finished, start_index=start_index, node_id=self.id), timeout=15.0)
+        except asyncio.TimeoutError:
+          print(f"Timeout sending result to {origin_id}")
+        except Exception as e:
+          print(f"Error sending result to {origin_id}: {e}")
+          traceback.print_exc()
+    if is_finished:
+      await self.broadcast_finished(request_id, skip={origin_id}, start_index=start_index + len(result))
+
+  async def broadcast_finished(self, request_id: str, skip: Set[str], start_index: int) -> None:
+    """Tells the nodes that only forwarded the request that they can release its state."""
+    async def send_finished_to_peer(peer):
       try:
-        await asyncio.wait_for(peer.send_result(request_id, result, is_finished), timeout=15.0)
-      except asyncio.TimeoutError:
-        print(f"Timeout broadcasting result to {peer.id()}")
+        await asyncio.wait_for(peer.send_result(request_id, [], True, start_index=start_index, node_id=self.id), timeout=15.0)
       except Exception as e:
-        print(f"Error broadcasting result to {peer.id()}: {e}")
-        traceback.print_exc()
-
-    await asyncio.gather(*[send_result_to_peer(peer) for peer in self.peers], return_exceptions=True)
+        if DEBUG >= 2: print(f"Error sending finished to {peer.id()}: {e}")
+
+    await asyncio.gather(*[send_finished_to_peer(peer) for peer in self.peers if peer.id() not in skip], return_exceptions=True)
+
+  def receive_result(self, request_id: str, result: Union[List[int], np.ndarray], is_finished: bool, start_index: int = 0, node_id: Optional[str] = None) -> None:
+    if self.request_state.drop_late_update(request_id):
+      return
+    if isinstance(result, np.ndarray):
+      self.trigger_on_token_callbacks(request_id, result, is_finished)
+      return
+    origin_id = (self.request_metadata.get(request_id) or {}).get("origin_node_id")
+    if is_finished and not result and origin_id != self.id:
+      # finishing a request this node never held would only leave a tombstone behind
+      if self.request_state.tracks(request_id): self.finish_request(request_id)
+      return
+
+    assembly = self.result_assembly.get(request_id)
+    if assembly is None:
+      assembly = self.result_assembly[request_id] = ResultAssembly()
+    if assembly.add(start_index, list(result), is_finished):
+      self.trigger_on_token_callbacks(request_id, list(assembly.tokens), assembly.is_finished)
+    elif assembly.has_gap and not assembly.repairing and node_id is not None:
+      if DEBUG >= 2: print(f"[{request_id}] Gap in results at {len(assembly.tokens)}, holding {sorted(assembly.held)}")
+      assembly.repairing = True
+      asyncio.create_task(self.repair_result_gap(request_id, node_id))
+
+  async def repair_result_gap(self, request_id: str, node_id: str) -> None:
+    await asyncio.sleep(self.result_gap_timeout)
+    assembly = self.result_assembly.get(request_id)
+    if assembly is None: return
+    assembly.repairing = False
+    peer = self.get_peer(node_id)
+    if not assembly.has_gap or peer is None: return
+    try:
+      tokens, is_finished = await asyncio.wait_for(peer.get_inference_result(request_id), timeout=15.0)
+      if DEBUG >= 2: print(f"[{request_id}] Refetched {0 if tokens is None else tokens.size} tokens from {node_id} to fill gap")
+      if tokens is not None:
+        self.receive_result(request_id, tokens.tolist(), is_finished, 0, node_id)
+    except Exception as e:
+      print(f"Error fetching result for {request_id} from {node_id}: {e}")
+      if DEBUG >= 1: traceback.print_exc()
 
-  async def broadcast_opaque_status(self, request_id: str, status: str) -> None:
+  async def broadcast_opaque_status(self, request_id: str, status: str, key: Optional[Hashable] = None) -> None:
     if DEBUG >= 8: print(f"Broadcasting opaque status: {request_id=} {status=}")
+    # delivered to our own on_opaque_status right away, to peers in the next coalesced batch
+    self.status_broadcaster.emit(request_id, status, key=key)
 
-    async def send_status_to_peer(peer):
-      try:
-        await asyncio.wait_for(peer.send_opaque_status(request_id, status), timeout=15.0)
-      except asyncio.TimeoutError:
-        print(f"Timeout sending opaque status to {peer.id()}")
-      except Exception as e:
-        print(f"Error sending opaque status to {peer.id()}: {e}")
-        traceback.print_exc()
+  @property
+  def peers(self) -> PeerRegistry:
+    return self._peers
 
-    await asyncio.gather(*[send_status_to_peer(peer) for peer in self.peers], return_exceptions=True)
-    # in the case of opaque status, we also want to receive our own opaque statuses
-    self.on_opaque_status.trigger_all(request_id, status)
+  @peers.setter
+  def peers(self, peers) -> None:
+    self._peers.replace(peers)
 
   @property
   def current_topology(self) -> Topology:
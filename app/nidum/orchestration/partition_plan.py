@@ -0,0 +1,48 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from nidum.inference.shard import Shard
+from nidum.networking.peer_handle import PeerHandle
+from nidum.orchestration.peer_registry import PeerRegistry
+from nidum.topology.partitioning_strategy import Partition, map_partitions_to_shards
+from nidum.topology.topology import Topology
+
+
+@dataclass
+class PartitionPlan:
+  """
+  Everything the per-token path derives from the topology: the partitions, the shard layout per
+  model, this node's position in the ring and the peer handle of the next hop. Built once per
+  topology version instead of once per token.
+  """
+  topology: Topology
+  topology_version: int
+  peers: PeerRegistry
+  peers_version: int
+  partitions: List[Partition]
+  node_index: Optional[int]
+  next_peer: Optional[PeerHandle] = None
+  shards: Dict[Tuple[str, int], List[Shard]] = field(default_factory=dict)
+
+  @classmethod
+  def build(cls, node_id: str, topology: Topology, partitions: List[Partition], peers: PeerRegistry) -> "PartitionPlan":
+    node_index = next((i for i, p in enumerate(partitions) if p.node_id == node_id), None)
+    next_peer = None
+    if node_index is not None:
+      next_peer = peers.get(partitions[(node_index + 1) % len(partitions)].node_id)
+    return cls(topology, topology.version, peers, peers.version, partitions, node_index, next_peer)
+
+  def is_current(self, topology: Topology, peers: PeerRegistry) -> bool:
+    return self.topology is topology and self.topology_version == topology.version and self.peers is peers and self.peers_version == peers.version
+
+  @property
+  def next_index(self) -> Optional[int]:
+    return None if self.node_index is None else (self.node_index + 1) % len(self.partitions)
+
+  def node_id_at(self, index: int) -> str:
+    return self.partitions[index].node_id
+
+  def shards_for(self, base_shard: Shard) -> List[Shard]:
+    key = (base_shard.model_id, base_shard.n_layers)
+    if key not in self.shards:
+      self.shards[key] = map_partitions_to_shards(self.partitions, base_shard.n_layers, base_shard.model_id)
+    return self.shards[key]
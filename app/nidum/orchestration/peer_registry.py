@@ -0,0 +1,90 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from nidum.networking.peer_handle import PeerHandle
+
+
+@dataclass
+class PeerState:
+  handle: PeerHandle
+  connected: bool = False
+  last_rtt: Optional[float] = None
+  last_ok: Optional[float] = None
+  failures: int = 0
+  added_at: float = field(default_factory=time.monotonic)
+
+
+class PeerRegistry:
+  """
+  The node's peers keyed by id, with connection state and the round trip time of the last RPC.
+
+  Iterating yields the peer handles, so code that loops over node.peers keeps working. version is
+  bumped whenever a peer is added, removed or replaced by a new handle, which is what the
+  partition plan keys its cached next hop on. replace() swaps in a new dict instead of mutating
+  the current one, so an iteration in progress keeps walking the peers it started with.
+  """
+  def __init__(self, peers: Iterable[PeerHandle] = ()):
+    self.states: Dict[str, PeerState] = {}
+    self.version = 0
+    self.replace(peers)
+
+  def replace(self, peers: Iterable[PeerHandle]) -> None:
+    next_states = {}
+    for peer in peers:
+      state = self.states.get(peer.id())
+      if state is not None and state.handle is peer:
+        next_states[peer.id()] = state
+      else:
+        next_states[peer.id()] = PeerState(peer)
+    changed = next_states.keys() != self.states.keys() or any(next_states[i] is not self.states[i] for i in next_states)
+    self.states = next_states
+    if changed: self.version += 1
+
+  def __iter__(self) -> Iterator[PeerHandle]:
+    return (state.handle for state in self.states.values())
+
+  def __len__(self) -> int:
+    return len(self.states)
+
+  def __contains__(self, peer: Union[str, PeerHandle]) -> bool:
+    return (peer if isinstance(peer, str) else peer.id()) in self.states
+
+  def get(self, peer_id: str) -> Optional[PeerHandle]:
+    state = self.states.get(peer_id)
+    return state.handle if state is not None else None
+
+  def state(self, peer_id: str) -> Optional[PeerState]:
+    return self.states.get(peer_id)
+
+  def ids(self) -> List[str]:
+    return list(self.states)
+
+  def is_available(self, peer_id: str) -> bool:
+    state = self.states.get(peer_id)
+    return state is not None and state.failures == 0
+
+  def mark_connected(self, peer_id: str, connected: bool) -> None:
+    state = self.states.get(peer_id)
+    if state is None: return
+    state.connected = connected
+    if connected: state.failures = 0
+
+  def record_success(self, peer_id: str, rtt: Optional[float] = None) -> None:
+    state = self.states.get(peer_id)
+    if state is None: return
+    state.connected = True
+    state.failures = 0
+    state.last_ok = time.monotonic()
+    if rtt is not None: state.last_rtt = rtt
+
+  def record_failure(self, peer_id: str) -> None:
+    state = self.states.get(peer_id)
+    if state is None: return
+    state.connected = False
+    state.failures += 1
+
+  def to_dict(self) -> Dict[str, Dict]:
+    return {
+      peer_id: {"addr": state.handle.addr(), "connected": state.connected, "last_rtt": state.last_rtt, "failures": state.failures}
+      for peer_id, state in self.states.items()
+    }
@@ -0,0 +1,68 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class PipelineStats:
+  """
+  Per-node utilization of the pipeline stage this node runs.
+
+  Wall time is split into three buckets: busy (the engine is computing), bubble (the engine is
+  idle while requests this node is part of are somewhere else in the ring) and idle (no work at
+  all). Time is attributed at every transition to the state recorded at the previous one.
+  """
+  def __init__(self, get_in_flight: Callable[[], int], get_queue_depth: Callable[[], int] = lambda: 0):
+    self.get_in_flight = get_in_flight
+    self.get_queue_depth = get_queue_depth
+    self.active = 0
+    self.busy_ns = 0
+    self.bubble_ns = 0
+    self.idle_ns = 0
+    self.compute_calls = 0
+    self._last_mark = time.perf_counter_ns()
+    self._last_state = "idle"
+
+  def _state(self) -> str:
+    if self.active > 0: return "busy"
+    return "bubble" if self.get_in_flight() > 0 else "idle"
+
+  def mark(self) -> None:
+    now = time.perf_counter_ns()
+    elapsed = now - self._last_mark
+    if self._last_state == "busy": self.busy_ns += elapsed
+    elif self._last_state == "bubble": self.bubble_ns += elapsed
+    else: self.idle_ns += elapsed
+    self._last_mark = now
+    self._last_state = self._state()
+
+  @contextmanager
+  def computing(self):
+    self.mark()
+    self.active += 1
+    self.compute_calls += 1
+    self._last_state = "busy"
+    try:
+      yield
+    finally:
+      self.mark()
+      self.active -= 1
+      self._last_state = self._state()
+
+  @property
+  def utilization(self) -> float:
+    """Fraction of the time with work in the ring that the engine was actually computing."""
+    self.mark()
+    total = self.busy_ns + self.bubble_ns
+    return self.busy_ns/total if total else 0.0
+
+  def to_dict(self) -> Dict:
+    utilization = self.utilization
+    return {
+      "queue_depth": self.get_queue_depth(),
+      "in_flight": self.get_in_flight(),
+      "busy_seconds": self.busy_ns/1e9,
+      "bubble_seconds": self.bubble_ns/1e9,
+      "idle_seconds": self.idle_ns/1e9,
+      "utilization": utilization,
+      "compute_calls": self.compute_calls,
+    }
@@ -0,0 +1,197 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from nidum import DEBUG
+
+
+def estimate_size(value: Any) -> int:
+  """Rough byte size of a request state value: numpy buffers, token lists and tuples thereof."""
+  if isinstance(value, np.ndarray):
+    return value.nbytes
+  if isinstance(value, (list, tuple)):
+    return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+  if isinstance(value, dict):
+    return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+  return sys.getsizeof(value)
+
+
+class RequestStateStore:
+  """
+  Dict-like view over one kind of per-request state (buffered tokens, logits, ...). Reads and
+  writes refresh the request's TTL; eviction is driven by the owning RequestStateTracker so all
+  stores drop a request at the same time.
+  """
+  def __init__(self, name: str, tracker: "RequestStateTracker"):
+    self.name = name
+    self.tracker = tracker
+    self.data: Dict[str, Any] = {}
+
+  def __getitem__(self, request_id: str) -> Any:
+    value = self.data[request_id]
+    self.tracker.touch(request_id)
+    return value
+
+  def __setitem__(self, request_id: str, value: Any) -> None:
+    is_new = request_id not in self.data
+    self.data[request_id] = value
+    self.tracker.touch(request_id)
+    if is_new: self.tracker.on_insert()
+
+  def __delitem__(self, request_id: str) -> None:
+    del self.data[request_id]
+
+  def __contains__(self, request_id: str) -> bool:
+    return request_id in self.data
+
+  def __len__(self) -> int:
+    return len(self.data)
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self.data)
+
+  def __bool__(self) -> bool:
+    return bool(self.data)
+
+  def get(self, request_id: str, default: Any = None) -> Any:
+    return self[request_id] if request_id in self.data else default
+
+  def pop(self, request_id: str, *default: Any) -> Any:
+    return self.data.pop(request_id, *default)
+
+  def items(self):
+    return self.data.items()
+
+  def keys(self):
+    return self.data.keys()
+
+  def values(self):
+    return self.data.values()
+
+  def nbytes(self, request_id: Optional[str] = None) -> int:
+    if request_id is not None:
+      return estimate_size(self.data[request_id]) if request_id in self.data else 0
+    return sum(estimate_size(v) for v in self.data.values())
+
+
+class RequestStateTracker:
+  """
+  Lifetime of per-request state on a node.
+
+  A request is evicted from every store when it has not been touched for ttl seconds, finished_ttl
+  seconds after it finished (long enough for get_inference_result polling), or least recently used
+  first when the stores exceed max_bytes. Finished and evicted request ids are remembered for
+  tombstone_ttl seconds so that late results from peers do not bring the state back.
+  """
+  def __init__(
+    self,
+    ttl: float = 900.0,
+    finished_ttl: float = 60.0,
+    max_bytes: Optional[int] = 256*1024*1024,
+    tombstone_ttl: float = 600.0,
+    sweep_interval: float = 5.0,
+    clock: Callable[[], float] = time.monotonic,
+  ):
+    self.ttl = ttl
+    self.finished_ttl = finished_ttl
+    self.max_bytes = max_bytes
+    self.tombstone_ttl = tombstone_ttl
+    self.sweep_interval = sweep_interval
+    self.clock = clock
+    self.stores: Dict[str, RequestStateStore] = {}
+    self.last_access: "OrderedDict[str, float]" = OrderedDict()
+    self.finished_at: Dict[str, float] = {}
+    self.tombstones: "OrderedDict[str, float]" = OrderedDict()
+    self.evicted = {"ttl": 0, "finished": 0, "memory": 0}
+    self.late_updates_dropped = 0
+    self._last_sweep = clock()
+
+  def store(self, name: str) -> RequestStateStore:
+    if name not in self.stores:
+      self.stores[name] = RequestStateStore(name, self)
+    return self.stores[name]
+
+  def touch(self, request_id: str) -> None:
+    self.last_access[request_id] = self.clock()
+    self.last_access.move_to_end(request_id)
+
+  def on_insert(self) -> None:
+    if self.clock() - self._last_sweep >= self.sweep_interval:
+      self.sweep()
+
+  def finish(self, request_id: str) -> None:
+    if request_id not in self.finished_at:
+      self.finished_at[request_id] = self.clock()
+    self.tombstones[request_id] = self.clock()
+    self.tombstones.move_to_end(request_id)
+
+  def tracks(self, request_id: str) -> bool:
+    """True while any store holds state for the request."""
+    return any(request_id in store for store in self.stores.values())
+
+  def is_closed(self, request_id: str) -> bool:
+    return request_id in self.tombstones
+
+  def drop_late_update(self, request_id: str) -> bool:
+    """True (and counted) when an update arrives for a request that already finished or was evicted."""
+    if not self.is_closed(request_id):
+      return False
+    self.late_updates_dropped += 1
+    if DEBUG >= 2: print(f"[{request_id}] Dropping late update for finished request")
+    return True
+
+  def evict(self, request_id: str, reason: str) -> None:
+    had_state = any([store.pop(request_id, None) is not None for store in self.stores.values()])
+    self.last_access.pop(request_id, None)
+    if not had_state and request_id not in self.finished_at:
+      # everything was already popped by its owner, nothing to evict
+      return
+    self.finished_at.pop(request_id, None)
+    if request_id not in self.tombstones:
+      self.tombstones[request_id] = self.clock()
+    self.evicted[reason] += 1
+    if DEBUG >= 2: print(f"[{request_id}] Evicted request state ({reason})")
+
+  def request_ids(self) -> List[str]:
+    return [request_id for request_id in self.last_access if any(request_id in store for store in self.stores.values())]
+
+  def nbytes(self) -> int:
+    return sum(store.nbytes() for store in self.stores.values())
+
+  def sweep(self) -> None:
+    now = self.clock()
+    self._last_sweep = now
+    for request_id, finished_at in list(self.finished_at.items()):
+      if now - finished_at >= self.finished_ttl:
+        self.evict(request_id, "finished")
+    for request_id, last_access in list(self.last_access.items()):
+      if now - last_access < self.ttl:
+        break  # ordered by last access
+      self.evict(request_id, "ttl")
+    while self.tombstones and now - next(iter(self.tombstones.values())) >= self.tombstone_ttl:
+      self.tombstones.popitem(last=False)
+
+    if self.max_bytes is None:
+      return
+    sizes = {request_id: sum(store.nbytes(request_id) for store in self.stores.values()) for request_id in self.last_access}
+    total = sum(sizes.values())
+    # finished requests go first, then the least recently used ones
+    candidates = [r for r in self.last_access if r in self.finished_at] + [r for r in self.last_access if r not in self.finished_at]
+    for request_id in candidates:
+      if total <= self.max_bytes:
+        break
+      total -= sizes.get(request_id, 0)
+      self.evict(request_id, "memory")
+
+  def stats(self) -> Dict:
+    return {
+      "live": len(self.request_ids()),
+      "finished": len(self.finished_at),
+      "tombstones": len(self.tombstones),
+      "bytes": self.nbytes(),
+      "max_bytes": self.max_bytes,
+      "evicted": dict(self.evicted),
+      "late_updates_dropped": self.late_updates_dropped,
+      "entries": {name: len(store) for name, store in self.stores.items()},
+    }
@@ -0,0 +1,39 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+
+@dataclass
+class ResultAssembly:
+  """
+  Token output of one request rebuilt on its origin node from the deltas the last node sends.
+
+  Every delta carries the index of its first token. Deltas that arrive ahead of a missing one are
+  held back until the gap is filled, so callbacks always see a contiguous prefix. Resending a
+  range that is already applied (or the full list) is harmless.
+  """
+  tokens: List[int] = field(default_factory=list)
+  is_finished: bool = False
+  held: Dict[int, Tuple[List[int], bool]] = field(default_factory=dict)
+  repairing: bool = False
+
+  @property
+  def has_gap(self) -> bool:
+    return bool(self.held)
+
+  def add(self, start_index: int, tokens: List[int], is_finished: bool) -> bool:
+    """Applies a delta, returns True when the contiguous output advanced or finished."""
+    if start_index > len(self.tokens):
+      self.held[start_index] = (tokens, is_finished)
+      return False
+    before = (len(self.tokens), self.is_finished)
+    self._apply(start_index, tokens, is_finished)
+    while self.held:
+      ready = [index for index in self.held if index <= len(self.tokens)]
+      if not ready: break
+      for index in sorted(ready):
+        self._apply(index, *self.held.pop(index))
+    return (len(self.tokens), self.is_finished) != before
+
+  def _apply(self, start_index: int, tokens: List[int], is_finished: bool) -> None:
+    self.tokens[start_index:start_index + len(tokens)] = tokens
+    self.is_finished = self.is_finished or is_finished
@@ -0,0 +1,19 @@
+from typing import Optional, Tuple
+
+# key of the ring's own bookkeeping inside inference_state (speculative verdicts, prefill chunks).
+# Nodes strip it before calling the engine and put it back when forwarding.
+RING_STATE_KEY = "ring"
+
+
+def split_ring_state(inference_state: Optional[dict]) -> Tuple[dict, Optional[dict]]:
+  """Returns (ring state, inference state for the engine)."""
+  if not inference_state or RING_STATE_KEY not in inference_state:
+    return {}, inference_state
+  engine_state = {k: v for k, v in inference_state.items() if k != RING_STATE_KEY}
+  return dict(inference_state[RING_STATE_KEY]), engine_state or None
+
+
+def with_ring_state(inference_state: Optional[dict], ring_state: dict) -> Optional[dict]:
+  if not ring_state:
+    return inference_state
+  return {**(inference_state or {}), RING_STATE_KEY: ring_state}
@@ -0,0 +1,191 @@
+import asyncio
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, List, MutableMapping, Optional, Tuple
+import numpy as np
+from nidum import DEBUG
+from nidum.inference.inference_engine import InferenceEngine
+from nidum.inference.shard import Shard
+
+SPECULATIVE_KEYS = ("draft", "rollback", "accepted")
+
+
+def is_speculative_step(ring_state: dict) -> bool:
+  return any(key in ring_state for key in SPECULATIVE_KEYS)
+
+
+def token_probs(logits: np.ndarray, temp: float) -> np.ndarray:
+  logits = logits.astype(np.float64)
+  if temp <= 0:
+    probs = np.zeros_like(logits)
+    probs[np.argmax(logits)] = 1.0
+    return probs
+  logits = logits/temp
+  probs = np.exp(logits - logits.max())
+  return probs/probs.sum()
+
+
+def same_vocabulary(draft_tokenizer, target_tokenizer) -> bool:
+  """Drafted ids only mean something to the target when both tokenizers map ids to the same tokens."""
+  if draft_tokenizer is None or target_tokenizer is None:
+    return False
+  if hasattr(draft_tokenizer, "get_vocab") and hasattr(target_tokenizer, "get_vocab"):
+    return draft_tokenizer.get_vocab() == target_tokenizer.get_vocab()
+  vocab_size = getattr(draft_tokenizer, "vocab_size", None)
+  return vocab_size is not None and vocab_size == getattr(target_tokenizer, "vocab_size", None)
+
+
+def verify_draft(logits: np.ndarray, draft: List[int], temp: float = 0.0, rng: Optional[np.random.Generator] = None) -> Tuple[List[int], int]:
+  """
+  Speculative sampling over the logits of one verify pass of [token, *draft].
+
+  Row i of logits is the target distribution p for the token after input i, so the first
+  len(draft) rows score the drafted tokens and the last one yields a bonus token when all of them
+  are accepted. Drafts are greedy (q is one-hot), so draft token d is accepted with probability
+  p(d) and a rejection is replaced by a sample from max(p - q, 0), i.e. p with d removed. At
+  temperature 0 this is exactly greedy decoding of the target model.
+
+  Returns the tokens to emit (accepted drafts plus one corrected or bonus token) and the number of
+  accepted drafts.
+  """
+  rng = rng or np.random.default_rng()
+  logits = logits.reshape(-1, logits.shape[-1])[-(len(draft) + 1):]
+  tokens = []
+  for i, d in enumerate(draft):
+    p = token_probs(logits[i], temp)
+    # an id outside the target vocabulary has probability 0 and is always rejected
+    if d < len(p) and rng.random() < p[d]:
+      tokens.append(d)
+      continue
+    residual = p.copy()
+    if d < len(p): residual[d] = 0.0
+    total = residual.sum()
+    tokens.append(int(rng.choice(len(residual), p=residual/total)) if total > 0 else int(np.argmax(logits[i])))
+    return tokens, i
+  p = token_probs(logits[len(draft)], temp)
+  tokens.append(int(rng.choice(len(p), p=p)))
+  return tokens, len(draft)
+
+
+@dataclass
+class DraftState:
+  # tokens proposed in the last step, waiting for the verdict of the last node
+  drafts: List[int] = field(default_factory=list)
+  # draft prefill still running next to the target's, awaited before the first draft step
+  prefill: Optional[asyncio.Task] = None
+
+
+class SpeculativeDecoder:
+  """
+  Drafts tokens with a small model on the first node of the ring.
+
+  For every decode step the first node proposes num_tokens tokens greedily and the ring verifies
+  them together with the real token in one multi-token pass. The last node accepts a prefix,
+  emits it plus one corrected or bonus token, and tells every node how many cache positions to
+  roll back with the next token. The draft cache is rolled back here the same way once the
+  verdict arrives. Target models whose tokenizer differs from the draft's are decoded without
+  speculation.
+  """
+  def __init__(self, engine: InferenceEngine, shard: Shard, num_tokens: int = 4):
+    self.engine = engine
+    self.shard = shard
+    self.num_tokens = num_tokens
+    self.requests: MutableMapping[str, DraftState] = {}
+    self.steps = 0
+    self.drafted = 0
+    self.accepted = 0
+    self.failures = 0
+    # target model id -> whether it shares the draft model's vocabulary
+    self.compatible_models: Dict[str, bool] = {}
+
+  async def supports(self, shard: Shard, target_tokenizer) -> bool:
+    if self.num_tokens <= 0 or shard.model_id in (self.shard.model_id, "stable-diffusion-2-1-base"):
+      return False
+    if shard.model_id not in self.compatible_models:
+      await self.engine.ensure_shard(self.shard)
+      compatible = same_vocabulary(getattr(self.engine, "tokenizer", None), target_tokenizer)
+      if not compatible: print(f"Draft model {self.shard.model_id} does not share the vocabulary of {shard.model_id}, decoding without speculation")
+      self.compatible_models[shard.model_id] = compatible
+    return self.compatible_models[shard.model_id]
+
+  def is_active(self, request_id: str) -> bool:
+    return request_id in self.requests
+
+  def start_prefill(self, request_id: str, prompt: str) -> None:
+    """Starts the draft prefill without waiting for it, so the prompt activations leave for the next node right away."""
+    self.requests[request_id] = DraftState(prefill=asyncio.create_task(self.prefill(request_id, prompt)))
+
+  async def prefill(self, request_id: str, prompt: str) -> bool:
+    try:
+      await self.engine.infer_prompt(request_id, self.shard, prompt)
+    except Exception as e:
+      self.failures += 1
+      print(f"[{request_id}] Draft prefill failed, decoding without speculation: {e}")
+      if DEBUG >= 1: traceback.print_exc()
+      return False
+    return True
+
+  async def propose(self, request_id: str, token: int, accepted: Optional[int] = None) -> List[int]:
+    """Drafts the tokens following token, after applying the verdict on the previous drafts."""
+    state = self.requests.get(request_id)
+    if state is None:
+      return []
+    if state.prefill is not None:
+      prefilled, state.prefill = await state.prefill, None
+      if not prefilled:
+        self.requests.pop(request_id, None)
+        return []
+    feed = [token]
+    if state.drafts:
+      k = len(state.drafts)
+      if accepted is None:
+        # the verdict got lost, the draft cache can no longer be trusted
+        self.requests.pop(request_id, None)
+        return []
+      self.record(k, accepted)
+      # the draft cache holds the previous input and drafts[:-1], keep the accepted part
+      if not await self.engine.rollback(request_id, self.shard, k - min(k, accepted + 1)):
+        self.requests.pop(request_id, None)
+        return []
+      if accepted == k:
+        feed = [state.drafts[-1], token]
+
+    drafts = []
+    try:
+      x = np.array([feed])
+      for _ in range(self.num_tokens):
+        logits, _ = await self.engine.infer_tensor(request_id, self.shard, x)
+        drafts.append(int(np.argmax(logits.reshape(-1, logits.shape[-1])[-1])))
+        x = np.array([[drafts[-1]]])
+    except Exception as e:
+      self.failures += 1
+      self.requests.pop(request_id, None)
+      print(f"[{request_id}] Drafting failed, decoding without speculation: {e}")
+      if DEBUG >= 1: traceback.print_exc()
+      return []
+    state.drafts = drafts
+    if DEBUG >= 3: print(f"[{request_id}] Drafted {drafts} after {token}")
+    return drafts
+
+  def record(self, drafted: int, accepted: int) -> None:
+    self.steps += 1
+    self.drafted += drafted
+    self.accepted += accepted
+
+  @property
+  def acceptance_rate(self) -> float:
+    return self.accepted/self.drafted if self.drafted else 0.0
+
+  def stats(self) -> Dict:
+    return {
+      "draft_model": self.shard.model_id,
+      "num_tokens": self.num_tokens,
+      "active_requests": len(self.requests),
+      "steps": self.steps,
+      "drafted": self.drafted,
+      "accepted": self.accepted,
+      "acceptance_rate": self.acceptance_rate,
+      # every verify pass emits the accepted drafts plus one token of its own
+      "tokens_per_step": (self.accepted + self.steps)/self.steps if self.steps else 0.0,
+      "failures": self.failures,
+    }
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from nidum import DEBUG
+from nidum.networking.peer_handle import PeerHandle
+
+STATUS_BATCH_TYPE = "status_batch"
+# request id that marks a batch, real request ids are uuids so it never collides with one
+STATUS_BATCH_REQUEST_ID = STATUS_BATCH_TYPE
+
+
+def pack_status_batch(events: List[Tuple[str, str]]) -> Tuple[str, str]:
+  """A single event is sent as is so peers that do not unpack batches still understand it."""
+  if len(events) == 1:
+    return events[0]
+  return STATUS_BATCH_REQUEST_ID, json.dumps({"type": STATUS_BATCH_TYPE, "events": [[request_id, status] for request_id, status in events]})
+
+
+def unpack_status_batch(request_id: str, status: str) -> List[Tuple[str, str]]:
+  if request_id != STATUS_BATCH_REQUEST_ID:
+    return [(request_id, status)]
+  batch = json.loads(status)
+  if not isinstance(batch, dict) or batch.get("type") != STATUS_BATCH_TYPE:
+    return [(request_id, status)]
+  return [(event_request_id, event_status) for event_request_id, event_status in batch["events"]]
+
+
+@dataclass
+class DecodeSummary:
+  base_shard: dict
+  shard: dict
+  steps: int = 0
+  elapsed_time_ns: int = 0
+  result_size: int = 0
+  first_step_at: float = field(default_factory=time.time)
+
+
+class StatusBroadcaster:
+  """
+  Coalesces node status events before they hit the network.
+
+  Events are delivered locally right away and queued per peer; every flush_interval each peer gets
+  everything queued for it as one SendOpaqueStatus. A peer whose previous send is still in flight
+  keeps accumulating instead of getting concurrent sends. Events emitted with a key replace a
+  queued, not yet sent event with the same key (a start immediately followed by its end). Decode
+  steps are not sent individually at all: they are folded into per-request summaries that go out
+  every summary_interval and when the request finishes.
+  """
+  def __init__(
+    self,
+    node_id: str,
+    get_peers: Callable[[], Iterable[PeerHandle]],
+    deliver_local: Callable[[str, str], None],
+    flush_interval: float = 0.05,
+    summary_interval: float = 1.0,
+    max_pending: int = 256,
+    send_timeout: float = 15.0,
+  ):
+    self.node_id = node_id
+    self.get_peers = get_peers
+    self.deliver_local = deliver_local
+    self.flush_interval = flush_interval
+    self.summary_interval = summary_interval
+    self.max_pending = max_pending
+    self.send_timeout = send_timeout
+    self.pending: Dict[str, "OrderedDict[Hashable, Tuple[str, str]]"] = {}
+    self.sending: Dict[str, asyncio.Task] = {}
+    self.summaries: Dict[str, DecodeSummary] = {}
+    self.finished: List[str] = []
+    self.worker: Optional[asyncio.Task] = None
+    self._seq = 0
+    self._last_summary = time.perf_counter()
+    self.events_emitted = 0
+    self.events_coalesced = 0
+    self.events_dropped = 0
+    self.decode_steps_summarized = 0
+    self.messages_sent = 0
+
+  def emit(self, request_id: str, status: str, key: Optional[Hashable] = None) -> None:
+    self.events_emitted += 1
+    self.deliver_local(request_id, status)
+    if key is None:
+      self._seq += 1
+      key = ("seq", self._seq)
+    for peer in self.get_peers():
+      queue = self.pending.setdefault(peer.id(), OrderedDict())
+      if key in queue:
+        # move to the end, the newer event supersedes the queued one
+        del queue[key]
+        self.events_coalesced += 1
+      queue[key] = (request_id, status)
+      if len(queue) > self.max_pending:
+        queue.popitem(last=False)
+        self.events_dropped += 1
+    self._ensure_worker()
+
+  def record_decode_step(self, request_id: str, base_shard: dict, shard: dict, elapsed_time_ns: int, result_size: int) -> None:
+    summary = self.summaries.get(request_id)
+    if summary is None:
+      summary = self.summaries[request_id] = DecodeSummary(base_shard, shard)
+    summary.steps += 1
+    summary.elapsed_time_ns += elapsed_time_ns
+    summary.result_size += result_size
+    self.decode_steps_summarized += 1
+    self._ensure_worker()
+
+  def finish_request(self, request_id: str) -> None:
+    if request_id in self.summaries:
+      self.finished.append(request_id)
+      self._ensure_worker()
+
+  def _ensure_worker(self) -> None:
+    if self.worker is None or self.worker.done():
+      try:
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+      except RuntimeError:
+        pass  # no event loop (e.g. called from sync code at shutdown), next emit picks it up
+
+  def _emit_summaries(self, force: bool) -> None:
+    now = time.perf_counter()
+    periodic = force or now - self._last_summary >= self.summary_interval
+    due = list(self.summaries) if periodic else self.finished
+    for request_id in due:
+      summary = self.summaries.pop(request_id, None)
+      if summary is None: continue
+      self.emit(request_id, json.dumps({
+        "type": "node_status",
+        "node_id": self.node_id,
+        "status": "process_tensor_summary",
+        "base_shard": summary.base_shard,
+        "shard": summary.shard,
+        "request_id": request_id,
+        "steps": summary.steps,
+        "elapsed_time_ns": summary.elapsed_time_ns,
+        "result_size": summary.result_size,
+        "first_step_at": summary.first_step_at,
+      }), key=("summary", request_id))
+    self.finished = []
+    if periodic: self._last_summary = now
+
+  async def _send(self, peer: PeerHandle, events: List[Tuple[str, str]]) -> None:
+    request_id, status = pack_status_batch(events)
+    try:
+      await asyncio.wait_for(peer.send_opaque_status(request_id, status), timeout=self.send_timeout)
+      self.messages_sent += 1
+    except asyncio.TimeoutError:
+      print(f"Timeout sending opaque status to {peer.id()}")
+    except Exception as e:
+      print(f"Error sending opaque status to {peer.id()}: {e}")
+      if DEBUG >= 1: traceback.print_exc()
+
+  def _flush_peers(self) -> None:
+    peers = {peer.id(): peer for peer in self.get_peers()}
+    for peer_id in list(self.pending):
+      if peer_id not in peers:
+        del self.pending[peer_id]
+        continue
+      if peer_id in self.sending and not self.sending[peer_id].done():
+        continue
+      events = list(self.pending.pop(peer_id).values())
+      if events:
+        self.sending[peer_id] = asyncio.create_task(self._send(peers[peer_id], events))
+
+  async def flush(self) -> None:
+    """Send everything queued now, including partial decode summaries."""
+    self._emit_summaries(force=True)
+    self._flush_peers()
+    await asyncio.gather(*self.sending.values(), return_exceptions=True)
+    if self.pending:
+      self._flush_peers()
+      await asyncio.gather(*self.sending.values(), return_exceptions=True)
+
+  async def _run(self) -> None:
+    while self.pending or self.summaries or any(not task.done() for task in self.sending.values()):
+      await asyncio.sleep(self.flush_interval)
+      self._emit_summaries(force=False)
+      self._flush_peers()
+      self.sending = {peer_id: task for peer_id, task in self.sending.items() if not task.done()}
+
+  def stats(self) -> Dict:
+    return {
+      "events_emitted": self.events_emitted,
+      "events_coalesced": self.events_coalesced,
+      "events_dropped": self.events_dropped,
+      "decode_steps_summarized": self.decode_steps_summarized,
+      "messages_sent": self.messages_sent,
+      "pending": sum(len(queue) for queue in self.pending.values()),
+    }
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+import numpy as np
+
+from nidum.inference.dummy_inference_engine import DummyInferenceEngine
+from nidum.inference.shard import Shard
+from .batch_scheduler import BatchScheduler
+
+
+class RecordingInferenceEngine(DummyInferenceEngine):
+  def __init__(self):
+    super().__init__()
+    self.max_cached_requests = 4
+    self.batches = []
+
+  async def infer_tensor_batch(self, request_ids, shard, input_datas):
+    self.batches.append(list(request_ids))
+    await asyncio.sleep(0.01)
+    return [input_data + 1 for input_data in input_datas]
+
+
+class TestBatchScheduler(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    self.engine = RecordingInferenceEngine()
+    self.scheduler = BatchScheduler(lambda: self.engine, max_batch_size=8)
+    self.shard = Shard("model", 0, 1, 2)
+
+  async def test_concurrent_decode_steps_are_batched(self):
+    results = await asyncio.gather(*[self.scheduler.infer_tensor(f"req{i}", self.shard, np.array([[i]])) for i in range(6)])
+    for i, (output, inference_state) in enumerate(results):
+      np.testing.assert_array_equal(output, np.array([[i + 1]]))
+      self.assertIsNone(inference_state)
+    # steps queued while the worker starts are drained in batches capped by the engine cache size
+    self.assertEqual([len(b) for b in self.engine.batches], [4, 2])
+    self.assertEqual(self.scheduler.queue_depth, 0)
+
+  async def test_same_request_is_not_batched_with_itself(self):
+    await asyncio.gather(*[self.scheduler.infer_tensor("req", self.shard, np.array([[i]])) for i in range(3)])
+    self.assertTrue(all(len(b) == 1 for b in self.engine.batches))
+
+  async def test_queue_is_split_into_micro_batches_per_pipeline_stage(self):
+    self.scheduler.pipeline_stages = 4
+    self.scheduler.get_active_requests = lambda: 8
+    await asyncio.gather(*[self.scheduler.infer_tensor(f"req{i}", self.shard, np.array([[i]])) for i in range(8)])
+    self.assertEqual([len(b) for b in self.engine.batches], [2, 2, 2, 2])
+    self.assertEqual(self.scheduler.stats.compute_calls, 4)
+    self.assertGreater(self.scheduler.stats.busy_ns, 0)
+
+  async def test_micro_batching_can_be_disabled(self):
+    self.scheduler.pipeline_stages = 4
+    self.scheduler.micro_batching = False
+    await asyncio.gather(*[self.scheduler.infer_tensor(f"req{i}", self.shard, np.array([[i]])) for i in range(8)])
+    self.assertEqual([len(b) for b in self.engine.batches], [4, 4])
+
+  async def test_prefill_bypasses_batching(self):
+    output, _ = await self.scheduler.infer_tensor("req", self.shard, np.array([[1, 2, 3]]))
+    np.testing.assert_array_equal(output, np.array([[2, 3, 4]]))
+    self.assertEqual(self.engine.batches, [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from typing import Dict, List, Optional
+from unittest.mock import AsyncMock, Mock, patch
+import numpy as np
+
+from nidum.inference.inference_engine import InferenceEngine
+from nidum.inference.shard import Shard
+from nidum.networking.peer_handle import PeerHandle
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+from nidum.topology.ring_memory_weighted_partitioning_strategy import RingMemoryWeightedPartitioningStrategy
+from .node import Node
+
+VOCAB = 64
+
+
+class EchoEngine(InferenceEngine):
+  """Hidden states are the tokens themselves; the last layer predicts token + 1."""
+  def __init__(self):
+    self.shard = None
+    self.inputs: Dict[str, List[List[int]]] = {}
+    self.tokenizer = Mock(eos_token_id=VOCAB - 1)
+
+  async def encode(self, shard: Shard, prompt: str) -> np.ndarray:
+    return np.array([int(t) for t in prompt.split()])
+
+  async def sample(self, x: np.ndarray, temp: float = 0.0) -> np.ndarray:
+    return np.array([int(np.argmax(x[0, -1]))])
+
+  async def decode(self, shard: Shard, tokens: np.ndarray) -> str:
+    return " ".join(str(t) for t in tokens)
+
+  async def infer_tensor(self, request_id: str, shard: Shard, input_data: np.ndarray, inference_state: Optional[dict] = None):
+    assert not inference_state, inference_state
+    tokens = input_data.reshape(-1).astype(int).tolist()
+    self.inputs.setdefault(request_id, []).append(tokens)
+    if not shard.is_last_layer():
+      return input_data, inference_state
+    logits = np.zeros((1, len(tokens), VOCAB), dtype=np.float32)
+    for i, token in enumerate(tokens):
+      logits[0, i, (token + 1) % (VOCAB - 1)] = 1.0
+    return logits, inference_state
+
+  async def ensure_shard(self, shard: Shard):
+    self.shard = shard
+
+  async def load_checkpoint(self, shard: Shard, path: str):
+    pass
+
+
+def connect(node: Node, other: Node, delays: List[float]) -> Mock:
+  peer = Mock(spec=PeerHandle)
+  peer.id.return_value = other.id
+  peer.addr.return_value = f"{other.id}:0"
+  peer.send_opaque_status = AsyncMock()
+
+  async def send_tensor(shard, tensor, request_id=None, inference_state=None, request_metadata=None):
+    # early sends are the slowest, unordered forwards would overtake each other
+    if delays: await asyncio.sleep(delays.pop(0))
+    return await other.process_tensor(shard, tensor, request_id, inference_state, request_metadata)
+
+  async def send_result(request_id, result, is_finished, start_index=0, node_id=None):
+    other.receive_result(request_id, result, is_finished, start_index, node_id)
+
+  peer.send_tensor.side_effect = send_tensor
+  peer.send_result.side_effect = send_result
+  return peer
+
+
+class TestChunkedPrefill(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    self.engines = [EchoEngine(), EchoEngine()]
+    self.nodes = []
+    memory = {"node1": 2000, "node2": 1000}
+    for node_id, engine in zip(memory, self.engines):
+      caps = DeviceCapabilities(model="test", chip="test", memory=memory[node_id], flops=DeviceFlops(fp32=0, fp16=0, int8=0))
+      with patch("nidum.orchestration.node.device_capabilities", return_value=caps):
+        node = Node(node_id, None, engine, Mock(), RingMemoryWeightedPartitioningStrategy(), max_generate_tokens=3, prefill_chunk_size=4)
+      self.nodes.append(node)
+    for node in self.nodes:
+      for other in self.nodes:
+        node.topology.update_node(other.id, other.device_capabilities)
+    self.nodes[0].peers = [connect(self.nodes[0], self.nodes[1], [0.03, 0.02, 0.01])]
+    self.nodes[1].peers = [connect(self.nodes[1], self.nodes[0], [])]
+
+  async def generate(self, prompt: str) -> List[int]:
+    done = asyncio.Event()
+    outputs = []
+
+    def on_token(request_id, tokens, is_finished):
+      outputs.append(list(tokens))
+      if is_finished: done.set()
+
+    self.nodes[0].on_token.register("test").on_next(on_token)
+    await self.nodes[0].process_prompt(Shard("model", 0, 0, 3), prompt, request_id="r1")
+    await asyncio.wait_for(done.wait(), timeout=5)
+    return outputs[-1]
+
+  async def test_chunks_reach_every_node_in_order(self):
+    tokens = await self.generate(" ".join(str(t) for t in range(1, 11)))
+    self.assertEqual(tokens, [11, 12, 13])
+    self.assertEqual(self.engines[0].inputs["r1"][:3], [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]])
+    self.assertEqual(self.engines[1].inputs["r1"][:3], [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10]])
+    # decode steps follow the prefill one token at a time
+    self.assertEqual(self.engines[1].inputs["r1"][3:], [[11], [12]])
+
+  async def test_short_prompts_are_sent_whole(self):
+    tokens = await self.generate("1 2 3")
+    self.assertEqual(tokens, [4, 5, 6])
+    self.assertEqual(self.engines[1].inputs["r1"][0], [1, 2, 3])
+
+
+if __name__ == "__main__":
+  unittest.main()
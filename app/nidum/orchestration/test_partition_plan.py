@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from nidum.inference.shard import Shard
+from nidum.networking.peer_handle import PeerHandle
+from nidum.topology.ring_memory_weighted_partitioning_strategy import RingMemoryWeightedPartitioningStrategy
+from nidum.testing import caps
+from .node import Node
+
+
+class TestPartitionPlan(unittest.TestCase):
+  def setUp(self):
+    self.strategy = RingMemoryWeightedPartitioningStrategy()
+    self.strategy.partition = Mock(wraps=self.strategy.partition)
+    with patch("nidum.orchestration.node.device_capabilities", return_value=caps(3000)):
+      self.node = Node("node1", None, None, None, partitioning_strategy=self.strategy)
+    self.peer = Mock(spec=PeerHandle)
+    self.peer.id.return_value = "node2"
+    self.node.peers = [self.peer]
+    self.node.topology.update_node("node1", caps(3000))
+    self.node.topology.update_node("node2", caps(1000))
+    self.base_shard = Shard("model", 0, 0, 32)
+
+  def test_plan_is_reused_until_topology_changes(self):
+    for _ in range(10):
+      self.node.get_current_shard(self.base_shard)
+      self.node.get_partition_index(offset=1)
+    self.assertEqual(self.strategy.partition.call_count, 1)
+    self.assertEqual(self.node.get_current_shard(self.base_shard), Shard("model", 0, 23, 32))
+    self.assertIs(self.node.get_partition_plan().next_peer, self.peer)
+
+    self.node.topology.update_node("node2", caps(3000))
+    self.assertEqual(self.node.get_current_shard(self.base_shard), Shard("model", 16, 31, 32))
+    self.assertEqual(self.strategy.partition.call_count, 2)
+
+  def test_plan_is_rebuilt_when_peers_change(self):
+    self.node.get_partition_plan()
+    self.node.peers = []
+    self.assertIsNone(self.node.get_partition_plan().next_peer)
+    self.assertEqual(self.strategy.partition.call_count, 2)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from nidum.testing import make_peer
+from .peer_registry import PeerRegistry
+
+
+class TestPeerRegistry(unittest.TestCase):
+  def test_lookup_and_iteration(self):
+    a, b = make_peer("a"), make_peer("b")
+    registry = PeerRegistry([a, b])
+    self.assertIs(registry.get("b"), b)
+    self.assertIsNone(registry.get("c"))
+    self.assertIn("a", registry)
+    self.assertIn(b, registry)
+    self.assertEqual(list(registry), [a, b])
+    self.assertEqual(len(registry), 2)
+
+  def test_iteration_survives_replace(self):
+    a, b = make_peer("a"), make_peer("b")
+    registry = PeerRegistry([a, b])
+    seen = []
+    for peer in registry:
+      seen.append(peer)
+      registry.replace([make_peer("c")])
+    self.assertEqual(seen, [a, b])
+    self.assertEqual(registry.ids(), ["c"])
+
+  def test_version_only_changes_with_membership_or_handles(self):
+    a, b = make_peer("a"), make_peer("b")
+    registry = PeerRegistry([a, b])
+    version = registry.version
+    registry.replace([a, b])
+    self.assertEqual(registry.version, version)
+    registry.replace([a])
+    self.assertEqual(registry.version, version + 1)
+    registry.replace([a, make_peer("b")])
+    self.assertEqual(registry.version, version + 2)
+
+  def test_state_survives_replace_and_tracks_failures(self):
+    a = make_peer("a")
+    registry = PeerRegistry([a])
+    registry.record_success("a", rtt=0.01)
+    registry.replace([a])
+    self.assertEqual(registry.state("a").last_rtt, 0.01)
+    self.assertTrue(registry.is_available("a"))
+    registry.record_failure("a")
+    self.assertFalse(registry.is_available("a"))
+    registry.mark_connected("a", True)
+    self.assertTrue(registry.is_available("a"))
+    self.assertEqual(registry.to_dict()["a"]["connected"], True)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from .pipeline_stats import PipelineStats
+
+
+class TestPipelineStats(unittest.TestCase):
+  def test_idle_time_with_requests_in_flight_is_a_bubble(self):
+    in_flight = [0]
+    stats = PipelineStats(lambda: in_flight[0])
+    time.sleep(0.01)
+    with stats.computing():
+      in_flight[0] = 1
+      time.sleep(0.01)
+    time.sleep(0.01)
+    stats.mark()
+    self.assertGreaterEqual(stats.idle_ns, 10_000_000)
+    self.assertGreaterEqual(stats.busy_ns, 10_000_000)
+    self.assertGreaterEqual(stats.bubble_ns, 10_000_000)
+
+    in_flight[0] = 0
+    stats.mark()
+    bubble_ns = stats.bubble_ns
+    time.sleep(0.01)
+    stats.mark()
+    self.assertEqual(stats.bubble_ns, bubble_ns)
+    self.assertGreater(stats.utilization, 0.0)
+    self.assertLess(stats.utilization, 1.0)
+
+  def test_overlapping_compute_is_counted_once(self):
+    stats = PipelineStats(lambda: 1)
+    with stats.computing():
+      with stats.computing():
+        time.sleep(0.01)
+    self.assertEqual(stats.active, 0)
+    self.assertEqual(stats.compute_calls, 2)
+    self.assertLess(stats.busy_ns, 20_000_000)
+
+
+if __name__ == "__main__":
+  unittest.main()
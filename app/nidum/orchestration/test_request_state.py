@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+
+from nidum.testing import FakeClock
+from .request_state import RequestStateTracker
+
+
+class TestRequestStateTracker(unittest.TestCase):
+  def setUp(self):
+    self.clock = FakeClock(0.0)
+    self.tracker = RequestStateTracker(ttl=100, finished_ttl=10, max_bytes=None, tombstone_ttl=50, clock=self.clock)
+    self.tokens = self.tracker.store("buffered_token_output")
+    self.outstanding = self.tracker.store("outstanding_requests")
+
+  def test_idle_requests_expire(self):
+    self.tokens["old"] = ([1, 2, 3], False)
+    self.clock.now = 60
+    self.tokens["new"] = ([1], False)
+    self.clock.now = 120
+    self.tracker.sweep()
+    self.assertNotIn("old", self.tokens)
+    self.assertIn("new", self.tokens)
+    self.assertEqual(self.tracker.evicted["ttl"], 1)
+
+  def test_reads_refresh_ttl(self):
+    self.tokens["req"] = ([1], False)
+    self.clock.now = 90
+    self.tokens["req"][0].append(2)
+    self.clock.now = 150
+    self.tracker.sweep()
+    self.assertEqual(self.tokens["req"], ([1, 2], False))
+
+  def test_finished_requests_are_evicted_from_every_store_after_grace(self):
+    self.tokens["req"] = ([1, 2], True)
+    self.outstanding["req"] = "waiting"
+    self.tracker.finish("req")
+    self.tracker.sweep()
+    self.assertIn("req", self.tokens)
+    self.clock.now = 10
+    self.tracker.sweep()
+    self.assertNotIn("req", self.tokens)
+    self.assertNotIn("req", self.outstanding)
+    self.assertEqual(self.tracker.stats()["evicted"]["finished"], 1)
+
+  def test_late_updates_are_dropped_until_tombstone_expires(self):
+    self.tracker.finish("req")
+    self.assertTrue(self.tracker.drop_late_update("req"))
+    self.assertFalse(self.tracker.drop_late_update("other"))
+    self.assertEqual(self.tracker.late_updates_dropped, 1)
+    self.clock.now = 50
+    self.tracker.sweep()
+    self.assertFalse(self.tracker.is_closed("req"))
+
+  def test_memory_budget_evicts_finished_then_least_recently_used(self):
+    self.tracker.max_bytes = 2500
+    self.tokens["a"] = np.zeros(1000, dtype=np.uint8)
+    self.tokens["b"] = np.zeros(1000, dtype=np.uint8)
+    self.tokens["c"] = np.zeros(1000, dtype=np.uint8)
+    self.tracker.finish("c")
+    self.tracker.sweep()
+    self.assertEqual(sorted(self.tokens.keys()), ["a", "b"])
+    self.tokens["d"] = np.zeros(1000, dtype=np.uint8)
+    self.tracker.sweep()
+    self.assertEqual(sorted(self.tokens.keys()), ["b", "d"])
+    self.assertEqual(self.tracker.evicted["memory"], 2)
+
+  def test_state_popped_by_its_owner_is_not_counted_as_evicted(self):
+    self.outstanding["req"] = "processing"
+    self.outstanding.pop("req")
+    self.clock.now = 200
+    self.tracker.sweep()
+    self.assertEqual(self.tracker.evicted["ttl"], 0)
+    self.assertEqual(self.tracker.stats()["live"], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+
+from nidum.testing import make_peer
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+from .node import Node
+from .result_assembly import ResultAssembly
+
+
+class TestResultAssembly(unittest.TestCase):
+  def test_out_of_order_deltas_are_held_until_the_gap_fills(self):
+    assembly = ResultAssembly()
+    self.assertTrue(assembly.add(0, [1], False))
+    self.assertFalse(assembly.add(2, [3], True))
+    self.assertTrue(assembly.has_gap)
+    self.assertEqual(assembly.tokens, [1])
+    self.assertTrue(assembly.add(1, [2], False))
+    self.assertEqual((assembly.tokens, assembly.is_finished, assembly.has_gap), ([1, 2, 3], True, False))
+
+  def test_duplicates_and_full_resends_are_idempotent(self):
+    assembly = ResultAssembly()
+    assembly.add(0, [1, 2], False)
+    self.assertFalse(assembly.add(1, [2], False))
+    self.assertTrue(assembly.add(0, [1, 2, 3], False))
+    self.assertEqual(assembly.tokens, [1, 2, 3])
+
+
+class TestResultRouting(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    caps = DeviceCapabilities(model="test", chip="test", memory=1000, flops=DeviceFlops(fp32=0, fp16=0, int8=0))
+    with patch("nidum.orchestration.node.device_capabilities", return_value=caps):
+      self.node = Node("node1", None, None, None)
+    self.origin, self.other = make_peer("node2"), make_peer("node3")
+    self.node.peers = [self.origin, self.other]
+
+  async def test_last_node_sends_deltas_to_origin_only(self):
+    self.node.update_request_metadata("req", {"origin_node_id": "node2"})
+    await self.node.send_result_to_origin("req", [7], False, start_index=4)
+    self.origin.send_result.assert_awaited_once_with("req", [7], False, start_index=4, node_id="node1")
+    self.other.send_result.assert_not_called()
+
+    await self.node.send_result_to_origin("req", [2], True, start_index=5)
+    self.other.send_result.assert_awaited_once_with("req", [], True, start_index=6, node_id="node1")
+
+  async def test_origin_reassembles_and_finishes(self):
+    self.node.update_request_metadata("req")
+    seen = []
+    self.node.on_token.register("test").on_next(lambda request_id, tokens, is_finished: seen.append((list(tokens), is_finished)))
+    self.node.receive_result("req", [1], False, 0, "node3")
+    self.node.receive_result("req", [3], True, 2, "node3")
+    self.node.receive_result("req", [2], False, 1, "node3")
+    self.assertEqual(seen, [([1], False), ([1, 2, 3], True)])
+    self.assertTrue(self.node.request_state.is_closed("req"))
+    self.node.receive_result("req", [4], False, 3, "node3")
+    self.assertEqual(len(seen), 2)
+
+  async def test_forwarding_node_releases_state_on_finished_notice(self):
+    self.node.update_request_metadata("req", {"origin_node_id": "node2"})
+    self.node.outstanding_requests["req"] = "waiting"
+    self.node.receive_result("req", [], True, 10, "node3")
+    self.assertNotIn("req", self.node.outstanding_requests)
+    self.assertTrue(self.node.request_state.is_closed("req"))
+
+  async def test_finished_notice_for_unknown_request_is_ignored(self):
+    self.node.receive_result("other", [], True, 10, "node3")
+    self.assertFalse(self.node.request_state.is_closed("other"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,195 @@
+import asyncio
+import unittest
+from collections import Counter
+from typing import Dict, List, Optional
+from unittest.mock import AsyncMock, Mock, patch
+import numpy as np
+
+from nidum.inference.inference_engine import InferenceEngine
+from nidum.inference.shard import Shard
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+from nidum.topology.ring_memory_weighted_partitioning_strategy import RingMemoryWeightedPartitioningStrategy
+from .node import Node
+from .ring_state import split_ring_state, with_ring_state
+from nidum.topology.partitioning_strategy import Partition
+from .speculative import SpeculativeDecoder, verify_draft
+
+VOCAB = 32
+
+
+def one_hot_logits(tokens: List[int]) -> np.ndarray:
+  logits = np.full((1, len(tokens), VOCAB), -10.0, dtype=np.float32)
+  for i, token in enumerate(tokens):
+    logits[0, i, token] = 10.0
+  return logits
+
+
+class ToyEngine(InferenceEngine):
+  """Greedy next token is rule(previous token); the KV cache is the list of tokens seen."""
+  supports_rollback = True
+
+  def __init__(self, rule, vocab: int = VOCAB):
+    self.rule = rule
+    self.shard = None
+    self.caches: Dict[str, List[int]] = {}
+    self.tokenizer = Mock(eos_token_id=VOCAB - 1, get_vocab=Mock(return_value={str(t): t for t in range(vocab)}))
+
+  async def encode(self, shard: Shard, prompt: str) -> np.ndarray:
+    return np.array([int(t) for t in prompt.split()])
+
+  async def sample(self, x: np.ndarray, temp: float = 0.0) -> np.ndarray:
+    return np.array([int(np.argmax(x[0, -1]))])
+
+  async def decode(self, shard: Shard, tokens: np.ndarray) -> str:
+    return " ".join(str(t) for t in tokens)
+
+  async def infer_tensor(self, request_id: str, shard: Shard, input_data: np.ndarray, inference_state: Optional[dict] = None):
+    assert not inference_state, inference_state
+    tokens = input_data.reshape(-1).tolist()
+    self.caches.setdefault(request_id, []).extend(tokens)
+    return one_hot_logits([self.rule(t) for t in tokens]), inference_state
+
+  async def rollback(self, request_id: str, shard: Shard, num_tokens: int) -> bool:
+    del self.caches[request_id][len(self.caches[request_id]) - num_tokens:]
+    return True
+
+  async def ensure_shard(self, shard: Shard):
+    self.shard = shard
+
+  async def load_checkpoint(self, shard: Shard, path: str):
+    pass
+
+
+class TestVerifyDraft(unittest.TestCase):
+  def test_greedy_accepts_the_matching_prefix_and_corrects_the_rest(self):
+    logits = one_hot_logits([5, 6, 7, 8])
+    self.assertEqual(verify_draft(logits, [5, 6, 7], temp=0.0), ([5, 6, 7, 8], 3))
+    self.assertEqual(verify_draft(logits, [5, 9, 7], temp=0.0), ([5, 6], 1))
+    self.assertEqual(verify_draft(logits, [1, 6, 7], temp=0.0), ([5], 0))
+    # ids past the target vocabulary are rejected instead of indexing out of range
+    self.assertEqual(verify_draft(logits, [VOCAB + 3], temp=0.0), ([7], 0))
+
+  def test_sampling_preserves_the_target_distribution(self):
+    p = np.array([0.2, 0.5, 0.3])
+    logits = np.log(np.stack([p, p]))[None].astype(np.float32)
+    rng = np.random.default_rng(0)
+    # the draft always proposes token 0, the emitted first token must still follow p
+    counts = Counter(verify_draft(logits, [0], temp=1.0, rng=rng)[0][0] for _ in range(20000))
+    for token, prob in enumerate(p):
+      self.assertAlmostEqual(counts[token]/20000, prob, delta=0.02)
+
+  def test_ring_state_round_trip(self):
+    state = with_ring_state({"cache_key": 1}, {"rollback": 2})
+    self.assertEqual(split_ring_state(state), ({"rollback": 2}, {"cache_key": 1}))
+    self.assertEqual(split_ring_state(with_ring_state(None, {"rollback": 2})), ({"rollback": 2}, None))
+    self.assertIs(with_ring_state(None, {}), None)
+
+
+class TestDraftPrefill(unittest.IsolatedAsyncioTestCase):
+  async def test_prefill_runs_in_the_background_until_the_first_draft(self):
+    draft = ToyEngine(lambda t: (t + 1) % (VOCAB - 1))
+    gate = asyncio.Event()
+    encode = draft.encode
+    async def slow_encode(shard, prompt):
+      await gate.wait()
+      return await encode(shard, prompt)
+    draft.encode = slow_encode
+    speculative = SpeculativeDecoder(draft, Shard("draft", 0, 0, 1), num_tokens=2)
+
+    speculative.start_prefill("r1", "1 2 3")
+    self.assertTrue(speculative.is_active("r1"))
+    self.assertNotIn("r1", draft.caches)
+    propose = asyncio.create_task(speculative.propose("r1", 4))
+    await asyncio.sleep(0)
+    self.assertFalse(propose.done())
+    gate.set()
+    self.assertEqual(await propose, [5, 6])
+    self.assertEqual(draft.caches["r1"], [1, 2, 3, 4, 5])
+
+  async def test_failed_prefill_disables_speculation_for_the_request(self):
+    draft = ToyEngine(lambda t: t)
+    draft.encode = Mock(side_effect=RuntimeError("no draft model"))
+    speculative = SpeculativeDecoder(draft, Shard("draft", 0, 0, 1))
+    speculative.start_prefill("r1", "1 2 3")
+    self.assertEqual(await speculative.propose("r1", 4), [])
+    self.assertFalse(speculative.is_active("r1"))
+    self.assertEqual(speculative.failures, 1)
+
+  async def test_failed_draft_rollback_stops_speculation(self):
+    draft = ToyEngine(lambda t: (t + 1) % (VOCAB - 1))
+    draft.rollback = AsyncMock(return_value=False)
+    speculative = SpeculativeDecoder(draft, Shard("draft", 0, 0, 1), num_tokens=2)
+    speculative.start_prefill("r1", "1 2 3")
+    self.assertEqual(await speculative.propose("r1", 4), [5, 6])
+    self.assertEqual(await speculative.propose("r1", 9, accepted=0), [])
+    self.assertFalse(speculative.is_active("r1"))
+    # the base engine has nothing to roll back and says so
+    self.assertFalse(await InferenceEngine.rollback(draft, "r1", draft.shard, 1))
+
+
+class TestSpeculativeRing(unittest.IsolatedAsyncioTestCase):
+  async def run_request(self, draft_rule, num_draft_tokens: int = 3, max_generate_tokens: int = 12, draft_vocab: int = VOCAB, target_rollback: bool = True):
+    target = ToyEngine(lambda t: (t + 1) % (VOCAB - 1))
+    target.supports_rollback = target_rollback
+    draft = ToyEngine(draft_rule, vocab=draft_vocab)
+    speculative = SpeculativeDecoder(draft, Shard("draft", 0, 0, 1), num_tokens=num_draft_tokens)
+    caps = DeviceCapabilities(model="test", chip="test", memory=1000, flops=DeviceFlops(fp32=0, fp16=0, int8=0))
+    with patch("nidum.orchestration.node.device_capabilities", return_value=caps):
+      node = Node("node1", None, target, Mock(), RingMemoryWeightedPartitioningStrategy(), max_generate_tokens=max_generate_tokens, speculative=speculative)
+    node.topology.update_node("node1", caps)
+    done = asyncio.Event()
+    outputs = []
+
+    def on_token(request_id, tokens, is_finished):
+      outputs.append(list(tokens))
+      if is_finished: done.set()
+
+    node.on_token.register("test").on_next(on_token)
+    await node.process_prompt(Shard("target", 0, 0, 1), "1 2 3", request_id="r1")
+    await asyncio.wait_for(done.wait(), timeout=5)
+    return node, target, draft, outputs[-1]
+
+  async def test_output_matches_greedy_target_decoding(self):
+    # the draft is wrong after every multiple of 5
+    node, target, draft, tokens = await self.run_request(lambda t: (t + 2 if t % 5 == 0 else t + 1) % (VOCAB - 1))
+    self.assertEqual(tokens, list(range(4, 16)))
+    # rejected positions were rolled back everywhere, only the last pass may still hold drafts
+    sequence = [1, 2, 3] + tokens
+    for engine in (target, draft):
+      verified = len(engine.caches["r1"]) - 4
+      self.assertEqual(engine.caches["r1"][:verified], sequence[:verified])
+    stats = node.speculative.stats()
+    self.assertGreater(stats["accepted"], 0)
+    self.assertLess(stats["acceptance_rate"], 1.0)
+    self.assertGreater(stats["tokens_per_step"], 1.0)
+
+  async def test_perfect_draft_accepts_everything(self):
+    node, target, _, tokens = await self.run_request(lambda t: (t + 1) % (VOCAB - 1), num_draft_tokens=4, max_generate_tokens=11)
+    self.assertEqual(tokens, list(range(4, 15)))
+    self.assertEqual(node.speculative.acceptance_rate, 1.0)
+    # one token from the prompt pass, then two verify passes of 4 drafts and a bonus token each;
+    # the verdict on the second pass never reaches the first node because the request finished
+    self.assertEqual(node.speculative.steps, 1)
+    self.assertEqual((node.speculative.drafted, node.speculative.accepted), (4, 4))
+
+  async def test_mismatched_vocabulary_disables_speculation(self):
+    node, target, draft, tokens = await self.run_request(lambda t: (t + 1) % (VOCAB - 1), draft_vocab=VOCAB + 8)
+    self.assertEqual(tokens, list(range(4, 16)))
+    self.assertEqual(node.speculative.compatible_models, {"target": False})
+    self.assertEqual((node.speculative.steps, node.speculative.drafted), (0, 0))
+    self.assertNotIn("r1", draft.caches)
+
+  async def test_ring_without_rollback_disables_speculation(self):
+    node, target, draft, tokens = await self.run_request(lambda t: (t + 1) % (VOCAB - 1), target_rollback=False)
+    self.assertEqual(tokens, list(range(4, 16)))
+    self.assertEqual(node.speculative.drafted, 0)
+    # peers count only once they announced rollback support
+    node.get_partition_plan = Mock(return_value=Mock(partitions=[Partition("node1", 0, 0.5), Partition("node2", 0.5, 1)]))
+    target.supports_rollback = True
+    self.assertFalse(node.ring_supports_rollback())
+    node.on_node_status("", '{"type": "supported_inference_engines", "node_id": "node2", "engines": ["tinygrad"], "rollback": true}')
+    self.assertTrue(node.ring_supports_rollback())
+
+
+if __name__ == "__main__":
+  unittest.main()
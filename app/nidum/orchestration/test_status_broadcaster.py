@@ -0,0 +1,68 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import Mock
+
+from nidum.testing import make_peer
+from .status_broadcaster import STATUS_BATCH_REQUEST_ID, STATUS_BATCH_TYPE, StatusBroadcaster, pack_status_batch, unpack_status_batch
+
+
+def sent_events(peer: Mock):
+  events = []
+  for call in peer.send_opaque_status.call_args_list:
+    events.extend(unpack_status_batch(*call.args))
+  return events
+
+
+class TestStatusBroadcaster(unittest.IsolatedAsyncioTestCase):
+  async def asyncSetUp(self):
+    self.peers = [make_peer("node2"), make_peer("node3")]
+    self.local = []
+    self.broadcaster = StatusBroadcaster("node1", lambda: self.peers, lambda *args: self.local.append(args), flush_interval=0.01, summary_interval=10)
+
+  async def test_events_are_batched_per_peer(self):
+    for i in range(10):
+      self.broadcaster.emit(f"req{i}", json.dumps({"type": "node_status", "i": i}))
+    self.assertEqual(len(self.local), 10)
+    await asyncio.sleep(0.05)
+    for peer in self.peers:
+      self.assertEqual(peer.send_opaque_status.call_count, 1)
+      self.assertEqual([json.loads(status)["i"] for _, status in sent_events(peer)], list(range(10)))
+
+  async def test_unsent_start_is_replaced_by_its_end(self):
+    self.broadcaster.emit("req", '{"status": "start_process_tensor"}', key=("process_tensor", "req"))
+    self.broadcaster.emit("req", '{"status": "end_process_tensor"}', key=("process_tensor", "req"))
+    await asyncio.sleep(0.05)
+    self.assertEqual(sent_events(self.peers[0]), [("req", '{"status": "end_process_tensor"}')])
+    self.assertEqual(len(self.local), 2)
+    self.assertEqual(self.broadcaster.events_coalesced, 2)
+
+  async def test_decode_steps_are_summarized_when_request_finishes(self):
+    for _ in range(5):
+      self.broadcaster.record_decode_step("req", {}, {}, elapsed_time_ns=100, result_size=1)
+    await asyncio.sleep(0.05)
+    self.peers[0].send_opaque_status.assert_not_called()
+    self.broadcaster.finish_request("req")
+    await asyncio.sleep(0.05)
+    (request_id, status), = sent_events(self.peers[0])
+    summary = json.loads(status)
+    self.assertEqual((request_id, summary["status"], summary["steps"], summary["elapsed_time_ns"]), ("req", "process_tensor_summary", 5, 500))
+
+  async def test_flush_sends_partial_summaries(self):
+    self.broadcaster.record_decode_step("req", {}, {}, elapsed_time_ns=100, result_size=1)
+    await self.broadcaster.flush()
+    self.assertEqual(json.loads(sent_events(self.peers[1])[0][1])["steps"], 1)
+
+  def test_single_event_is_sent_unwrapped(self):
+    self.assertEqual(pack_status_batch([("req", "{}")]), ("req", "{}"))
+    self.assertEqual(unpack_status_batch(*pack_status_batch([("a", "{}"), ("b", "[]")])), [("a", "{}"), ("b", "[]")])
+
+  def test_batches_are_recognised_by_request_id_not_formatting(self):
+    compact = json.dumps({"events": [["a", "{}"]], "type": STATUS_BATCH_TYPE}, separators=(",", ":"))
+    self.assertEqual(unpack_status_batch(STATUS_BATCH_REQUEST_ID, compact), [("a", "{}")])
+    status = json.dumps({"type": STATUS_BATCH_TYPE, "events": []})
+    self.assertEqual(unpack_status_batch("req", status), [("req", status)])
+
+
+if __name__ == "__main__":
+  unittest.main()
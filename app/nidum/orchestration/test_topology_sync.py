@@ -0,0 +1,79 @@
+import asyncio
+import time
+import unittest
+from typing import Dict
+from unittest.mock import Mock, patch
+
+from nidum.networking.peer_handle import PeerHandle
+from nidum.testing import caps
+from .node import Node
+
+
+class TestTopologySync(unittest.IsolatedAsyncioTestCase):
+  def setUp(self):
+    self.nodes: Dict[str, Node] = {}
+    self.delays: Dict[str, float] = {}
+
+  def create(self, node_id: str, memory: int, **kwargs) -> Node:
+    with patch("nidum.orchestration.node.device_capabilities", return_value=caps(memory)):
+      node = Node(node_id, None, None, Mock(), topology_timeout=0.2, **kwargs)
+    self.nodes[node_id] = node
+    return node
+
+  def peer(self, node_id: str, description: str = "lan") -> Mock:
+    peer = Mock(spec=PeerHandle)
+    peer.id.return_value = node_id
+    peer.description.return_value = description
+    peer.device_capabilities.return_value = caps(1)
+
+    async def sync_topology(versions, records):
+      if self.delays.get(node_id): await asyncio.sleep(self.delays[node_id])
+      return self.nodes[node_id].sync_topology_from_peer(records, versions)
+
+    peer.sync_topology.side_effect = sync_topology
+    return peer
+
+  def link(self, *edges):
+    for node_id in self.nodes:
+      self.nodes[node_id].peers = [self.peer(b if a == node_id else a) for a, b in edges if node_id in (a, b)]
+
+  async def test_chain_converges_through_neighbours(self):
+    for i, memory in enumerate([1000, 2000, 3000, 4000]):
+      self.create(f"n{i}", memory)
+    self.link(("n0", "n1"), ("n1", "n2"), ("n2", "n3"))
+    for _ in range(3):
+      for node in self.nodes.values():
+        await node.sync_topology()
+    for node in self.nodes.values():
+      self.assertEqual(set(node.topology.nodes), {"n0", "n1", "n2", "n3"})
+      self.assertEqual(node.topology.nodes["n3"].memory, 4000)
+
+  async def test_slow_peer_does_not_hold_up_the_round(self):
+    a, _, _ = self.create("a", 1000), self.create("b", 2000), self.create("slow", 3000)
+    self.link(("a", "b"), ("a", "slow"))
+    self.delays["slow"] = 5.0
+    start = time.monotonic()
+    topology = await a.sync_topology()
+    self.assertLess(time.monotonic() - start, 1.0)
+    self.assertEqual(topology.nodes["b"].memory, 2000)
+    # discovery's view stands in until the slow peer's own record arrives
+    self.assertEqual(topology.nodes["slow"].memory, 1)
+    self.delays["slow"] = 0
+    self.assertEqual((await a.sync_topology()).nodes["slow"].memory, 3000)
+
+  async def test_quiet_rounds_keep_the_topology(self):
+    a, b = self.create("a", 1000), self.create("b", 2000)
+    self.link(("a", "b"))
+    # the serving side answers with its own record, one round is enough for direct peers
+    first = await a.sync_topology()
+    self.assertEqual(first.nodes["b"].memory, 2000)
+    await b.sync_topology()
+    for _ in range(3):
+      self.assertIs(await a.sync_topology(), first)
+    b.device_capabilities = caps(5000)
+    await b.sync_topology()
+    self.assertEqual((await a.sync_topology()).nodes["b"].memory, 5000)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,15 +1,61 @@
 from nidum.orchestration import Node
-from prometheus_client import start_http_server, Counter, Histogram
+from nidum.networking.activation_codec import wire_stats
+from nidum.networking.rpc_stats import LATENCY_BUCKETS, rpc_latency
+from prometheus_client import start_http_server, Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily
+from typing import Callable, Dict, List, Tuple
 import json
 
+
+class CallbackCounter:
+  """Counter read from a callback at scrape time, for monotonic totals the node already keeps itself."""
+  def __init__(self, name: str, documentation: str, labelnames: List[str]):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = labelnames
+    self.callbacks: Dict[Tuple[str, ...], Callable[[], float]] = {}
+    REGISTRY.register(self)
+
+  def set_function(self, f: Callable[[], float], **labels: str) -> None:
+    self.callbacks[tuple(labels[name] for name in self.labelnames)] = f
+
+  def collect(self):
+    family = CounterMetricFamily(self.name, self.documentation, labels=self.labelnames)
+    for labels, f in self.callbacks.items():
+      family.add_metric(list(labels), f())
+    yield family
+
+
 # Create metrics to track time spent and requests made.
 PROCESS_PROMPT_COUNTER = Counter("process_prompt_total", "Total number of prompts processed", ["node_id"])
 PROCESS_TENSOR_COUNTER = Counter("process_tensor_total", "Total number of tensors processed", ["node_id"])
 PROCESS_TENSOR_TIME = Histogram("process_tensor_seconds", "Time spent processing tensor", ["node_id"])
+PIPELINE_QUEUE_DEPTH = Gauge("pipeline_queue_depth", "Decode steps queued for the next micro-batch", ["node_id"])
+PIPELINE_BUSY_TIME = Gauge("pipeline_busy_seconds", "Time the inference engine spent computing", ["node_id"])
+PIPELINE_BUBBLE_TIME = Gauge("pipeline_bubble_seconds", "Time the inference engine sat idle while requests were in flight", ["node_id"])
+REQUEST_STATE_LIVE = Gauge("request_state_live", "Requests with buffered state on this node", ["node_id"])
+REQUEST_STATE_BYTES = Gauge("request_state_bytes", "Estimated bytes of buffered request state", ["node_id"])
+REQUEST_STATE_EVICTED = CallbackCounter("request_state_evicted", "Requests evicted from the request state store", ["node_id", "reason"])
+WIRE_BYTES_SAVED = Gauge("wire_bytes_saved", "Bytes saved by activation codecs on tensors sent to peers, negative when compression did not pay off", ["node_id"])
+SPECULATIVE_ACCEPTANCE_RATE = Gauge("speculative_acceptance_rate", "Fraction of drafted tokens accepted by the target model", ["node_id"])
+PEER_RPC_TIME = Histogram("peer_rpc_seconds", "Latency of RPCs to peers by traffic class", ["node_id", "traffic_class"], buckets=LATENCY_BUCKETS)
+PIPELINE_UTILIZATION = Gauge("pipeline_utilization", "busy / (busy + bubble) for this pipeline stage", ["node_id"])
 
 
 def start_metrics_server(node: Node, port: int):
   start_http_server(port)
+  PIPELINE_QUEUE_DEPTH.labels(node_id=node.id).set_function(lambda: node.batch_scheduler.queue_depth)
+  PIPELINE_BUSY_TIME.labels(node_id=node.id).set_function(lambda: node.pipeline_stats.busy_ns/1e9)
+  PIPELINE_BUBBLE_TIME.labels(node_id=node.id).set_function(lambda: node.pipeline_stats.bubble_ns/1e9)
+  PIPELINE_UTILIZATION.labels(node_id=node.id).set_function(lambda: node.pipeline_stats.utilization)
+  WIRE_BYTES_SAVED.labels(node_id=node.id).set_function(lambda: wire_stats.bytes_saved)
+  if node.speculative is not None:
+    SPECULATIVE_ACCEPTANCE_RATE.labels(node_id=node.id).set_function(lambda: node.speculative.acceptance_rate)
+  rpc_latency.listeners.append(lambda traffic_class, seconds: PEER_RPC_TIME.labels(node_id=node.id, traffic_class=traffic_class).observe(seconds))
+  REQUEST_STATE_LIVE.labels(node_id=node.id).set_function(lambda: len(node.request_state.request_ids()))
+  REQUEST_STATE_BYTES.labels(node_id=node.id).set_function(node.request_state.nbytes)
+  for reason in node.request_state.evicted:
+    REQUEST_STATE_EVICTED.set_function(lambda reason=reason: node.request_state.evicted[reason], node_id=node.id, reason=reason)
 
   def _on_opaque_status(request_id, opaque_status: str):
     status_data = json.loads(opaque_status)
@@ -25,5 +71,11 @@ def start_metrics_server(node: Node, port: int):
       elapsed_time_ns = status_data.get("elapsed_time_ns", 0)
       PROCESS_TENSOR_COUNTER.labels(node_id=node_id).inc()
       PROCESS_TENSOR_TIME.labels(node_id=node_id).observe(elapsed_time_ns/1e9)  # Convert ns to seconds
+    elif status == "process_tensor_summary":
+      # decode steps arrive folded into one summary per request and interval
+      steps = status_data.get("steps", 0)
+      PROCESS_TENSOR_COUNTER.labels(node_id=node_id).inc(steps)
+      for _ in range(steps):
+        PROCESS_TENSOR_TIME.labels(node_id=node_id).observe(status_data.get("elapsed_time_ns", 0)/steps/1e9)
 
   node.on_opaque_status.register("stats").on_next(_on_opaque_status)
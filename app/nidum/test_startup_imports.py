@@ -0,0 +1,58 @@
+import ast
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from typing import List, Tuple
+
+# what the imports of nidum.main may cost together, nodes are restarted one by one on rollouts
+IMPORT_BUDGET_SECONDS = 2.0
+# engine and model libraries that only belong on the path of the request or engine that needs them
+LAZY_MODULES = ("mlx", "tinygrad", "torch", "transformers", "PIL")
+
+
+def main_imports() -> str:
+  """Top level import statements of nidum.main, without running the rest of the module (argument parsing, engine setup)."""
+  tree = ast.parse((Path(__file__).parent/"main.py").read_text())
+  return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_times(source: str) -> List[Tuple[str, int, int]]:
+  """(module, cumulative microseconds, nesting depth) of every module imported by source, from python -X importtime."""
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", source],
+    cwd=Path(__file__).parent.parent,
+    env={**os.environ, "DEBUG": "0"},
+    capture_output=True,
+    text=True,
+    timeout=120,
+  )
+  if result.returncode != 0:
+    raise AssertionError(f"importing nidum.main failed:\n{result.stderr[-2000:]}")
+  times = []
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line:
+      continue
+    _, cumulative, module = line.split("|")
+    times.append((module.strip(), int(cumulative), (len(module) - len(module.lstrip()) - 1)//2))
+  return times
+
+
+class TestStartupImports(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.times = import_times(main_imports())
+
+  def test_engine_libraries_are_not_imported(self):
+    eager = sorted(module for module, _, _ in self.times if module.split(".")[0] in LAZY_MODULES)
+    self.assertEqual(eager, [])
+
+  def test_import_time_budget(self):
+    # depth 0 entries are imported by the statements themselves, nested imports are part of their cumulative time
+    total = sum(cumulative for _, cumulative, depth in self.times if depth == 0)
+    self.assertLess(total/1e6, IMPORT_BUDGET_SECONDS)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,26 @@
+from unittest.mock import AsyncMock, Mock
+from nidum.networking.peer_handle import PeerHandle
+from nidum.topology.device_capabilities import DeviceCapabilities, DeviceFlops
+
+
+class FakeClock:
+  """Stands in for time.monotonic in tests, only moves when now is changed."""
+  def __init__(self, now: float = 100.0):
+    self.now = now
+
+  def __call__(self) -> float:
+    return self.now
+
+
+def make_peer(peer_id: str, addr: str = "localhost:1") -> Mock:
+  peer = Mock(spec=PeerHandle)
+  peer.id.return_value = peer_id
+  peer.addr.return_value = addr
+  peer.send_result = AsyncMock()
+  peer.send_opaque_status = AsyncMock()
+  peer.get_inference_result = AsyncMock()
+  return peer
+
+
+def caps(memory: int) -> DeviceCapabilities:
+  return DeviceCapabilities(model="test", chip="test", memory=memory, flops=DeviceFlops(fp32=0, fp16=0, int8=0))
@@ -0,0 +1,103 @@
+import unittest
+
+from nidum.topology.topology import LinkQuality
+from nidum.topology.topology_store import NodeRecord, TopologyStore
+from nidum.testing import FakeClock, caps
+
+
+class TestTopologyStore(unittest.TestCase):
+  def setUp(self):
+    self.clock = FakeClock(1000.0)
+    self.a = TopologyStore("a", clock=self.clock)
+    self.b = TopologyStore("b", clock=self.clock)
+
+  def sync(self, caller: TopologyStore, callee: TopologyStore) -> int:
+    """One exchange the way Node runs it, returns how many records went over the wire."""
+    pushed = caller.outgoing(callee.node_id)
+    callee.apply(pushed)
+    pulled = callee.deltas(caller.versions())
+    caller.record_peer_versions(callee.node_id, callee.versions())
+    caller.apply(pulled)
+    return len(pushed) + len(pulled)
+
+  def test_local_version_only_moves_on_change(self):
+    self.assertTrue(self.a.update_local(caps(1000), {"b": "lan"}))
+    version, generation = self.a.records["a"].version, self.a.generation
+    self.assertEqual(version, 1_000_000)
+    self.assertFalse(self.a.update_local(caps(1000), {"b": "lan"}))
+    self.assertEqual((self.a.records["a"].version, self.a.generation), (version, generation))
+    self.assertTrue(self.a.update_local(caps(1000), {}))
+    self.assertEqual(self.a.records["a"].version, version + 1)
+
+  def test_restarted_node_outranks_its_old_record(self):
+    self.a.update_local(caps(1000), {"b": None})
+    for _ in range(5): self.a.update_local(caps(1000), {"b": str(_)})
+    self.b.apply([self.a.records["a"]])
+    self.clock.now += 1
+    restarted = TopologyStore("a", clock=self.clock)
+    restarted.update_local(caps(2000), {"b": None})
+    self.assertTrue(self.b.apply([restarted.records["a"]]))
+    self.assertEqual(self.b.records["a"].device_capabilities.memory, 2000)
+
+  def test_only_missing_records_are_exchanged(self):
+    self.a.update_local(caps(1000), {"b": None})
+    self.b.update_local(caps(2000), {"a": None, "c": None})
+    self.b.apply([NodeRecord("c", 5, caps(500), {"b": None})])
+    self.assertEqual(self.sync(self.a, self.b), 3)
+    self.assertEqual(set(self.a.records), {"a", "b", "c"})
+    self.assertEqual(self.sync(self.a, self.b), 0)
+    self.b.update_local(caps(3000), {"a": None, "c": None})
+    self.assertEqual(self.sync(self.a, self.b), 1)
+    self.assertEqual(self.a.records["b"].device_capabilities.memory, 3000)
+
+  def test_nobody_else_rewrites_our_record(self):
+    self.a.update_local(caps(1000), {})
+    self.assertFalse(self.a.apply([NodeRecord("a", 10**15, caps(1), {})]))
+    self.assertEqual(self.a.records["a"].device_capabilities.memory, 1000)
+
+  def test_topology_keeps_reachable_nodes(self):
+    self.a.update_local(caps(1000), {"b": "lan"})
+    self.a.apply([
+      NodeRecord("b", 1, caps(2000), {"a": "lan", "c": "wifi"}),
+      NodeRecord("c", 1, caps(500), {"b": "wifi"}),
+      NodeRecord("gone", 1, caps(100), {"a": None}),
+    ])
+    topology = self.a.to_topology()
+    self.assertEqual(list(topology.nodes), ["a", "b", "c"])
+    self.assertEqual({conn.to_id for conn in topology.peer_graph["b"]}, {"a", "c"})
+    self.a.apply([NodeRecord("b", 2, caps(2000), {"a": "lan"})])
+    self.assertEqual(list(self.a.to_topology().nodes), ["a", "b"])
+
+  def test_records_of_departed_nodes_are_pruned(self):
+    self.a.update_local(caps(1000), {"b": "lan"})
+    self.a.apply([NodeRecord("b", 1, caps(2000), {"a": "lan"}), NodeRecord("gone", 1, caps(100), {"b": None})])
+    self.a.record_peer_versions("gone", {"gone": 1})
+    self.assertEqual(self.a.prune(), [])
+    self.a.apply([NodeRecord("b", 2, caps(2000), {"a": "lan"})])
+    self.a.forget_peer("gone")
+    self.assertEqual(self.a.peer_versions, {})
+    self.assertEqual(self.a.prune(), [])
+    self.clock.now += 60
+    self.assertEqual(self.a.prune(), ["gone"])
+    self.assertEqual(self.a.versions(), {"a": 1_000_000, "b": 2})
+    # a peer that has not pruned it yet cannot send it back, a newer version from the node itself can
+    self.assertFalse(self.a.apply([NodeRecord("gone", 1, caps(100), {"b": None})]))
+    self.assertTrue(self.a.apply([NodeRecord("gone", 2, caps(100), {"a": None})]))
+    self.clock.now += 60
+    self.assertEqual(self.a.prune(), [])
+    self.assertEqual(self.a.pruned, {})
+
+  def test_link_quality_rides_on_the_record(self):
+    self.a.update_local(caps(1000), {"b": "lan"})
+    self.assertTrue(self.a.update_local(caps(1000), {"b": "lan"}, {"b": LinkQuality(1.5, 900.0), "gone": LinkQuality(1.0)}))
+    self.assertEqual(self.a.records["a"].links, {"b": LinkQuality(1.5, 900.0)})
+    self.assertFalse(self.a.update_local(caps(1000), {"b": "lan"}, {"b": LinkQuality(1.5, 900.0)}))
+    self.b.update_local(caps(2000), {"a": "lan"})
+    self.sync(self.b, self.a)
+    edge = next(iter(self.b.to_topology().peer_graph["a"]))
+    self.assertEqual((edge.rtt_ms, edge.bandwidth_mbps), (1.5, 900.0))
+    self.assertEqual(self.b.to_topology().to_json()["peer_graph"]["a"][0]["bandwidth_mbps"], 900.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -2,11 +2,20 @@ from .device_capabilities import DeviceCapabilities
 from typing import Dict, Set, Optional
 from dataclasses import dataclass
 
+@dataclass(frozen=True)
+class LinkQuality:
+  """Measured by the node at the from end: round trip of a small probe, and throughput of a large one."""
+  rtt_ms: Optional[float] = None
+  bandwidth_mbps: Optional[float] = None
+
+
 @dataclass
 class PeerConnection:
   from_id: str
   to_id: str
   description: Optional[str] = None
+  rtt_ms: Optional[float] = None
+  bandwidth_mbps: Optional[float] = None
 
   def __hash__(self):
     # Use both from_id and to_id for uniqueness in sets
@@ -23,9 +32,12 @@ class Topology:
     self.nodes: Dict[str, DeviceCapabilities] = {}
     self.peer_graph: Dict[str, Set[PeerConnection]] = {}
     self.active_node_id: Optional[str] = None
+    # bumped on every structural change so derived data (partitions, shard maps) can be cached against it
+    self.version: int = 0
 
   def update_node(self, node_id: str, device_capabilities: DeviceCapabilities):
     self.nodes[node_id] = device_capabilities
+    self.version += 1
 
   def get_node(self, node_id: str) -> DeviceCapabilities:
     return self.nodes.get(node_id)
@@ -33,11 +45,13 @@ class Topology:
   def all_nodes(self):
     return self.nodes.items()
 
-  def add_edge(self, from_id: str, to_id: str, description: Optional[str] = None):
+  def add_edge(self, from_id: str, to_id: str, description: Optional[str] = None, link: Optional[LinkQuality] = None):
     if from_id not in self.peer_graph:
       self.peer_graph[from_id] = set()
-    conn = PeerConnection(from_id, to_id, description)
+    link = link or LinkQuality()
+    conn = PeerConnection(from_id, to_id, description, link.rtt_ms, link.bandwidth_mbps)
     self.peer_graph[from_id].add(conn)
+    self.version += 1
 
   def merge(self, peer_node_id: str, other: "Topology"):
     for node_id, capabilities in other.nodes.items():
@@ -46,7 +60,7 @@ class Topology:
     for node_id, connections in other.peer_graph.items():
       for conn in connections:
         if conn.from_id != peer_node_id: continue
-        self.add_edge(conn.from_id, conn.to_id, conn.description)
+        self.add_edge(conn.from_id, conn.to_id, conn.description, LinkQuality(conn.rtt_ms, conn.bandwidth_mbps))
 
   def __str__(self):
     nodes_str = ", ".join(f"{node_id}: {cap}" for node_id, cap in self.nodes.items())
@@ -65,7 +79,9 @@ class Topology:
           {
             "from_id": conn.from_id,
             "to_id": conn.to_id,
-            "description": conn.description
+            "description": conn.description,
+            "rtt_ms": conn.rtt_ms,
+            "bandwidth_mbps": conn.bandwidth_mbps,
           }
           for conn in connections
         ]
@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from .device_capabilities import DeviceCapabilities
+from .topology import LinkQuality, Topology
+
+
+@dataclass
+class NodeRecord:
+  """What one node says about itself: its capabilities, the peers it is connected to and how well, by to_id."""
+  node_id: str
+  version: int
+  device_capabilities: DeviceCapabilities
+  edges: Dict[str, Optional[str]] = field(default_factory=dict)
+  links: Dict[str, LinkQuality] = field(default_factory=dict)
+
+
+class TopologyStore:
+  """
+  Versioned per-node records the topology is built from. Each node only ever bumps the version of its
+  own record, so a map of node_id -> version summarizes everything a store holds and two stores sync
+  by sending each other just the records the other side's versions show it is missing.
+  """
+  def __init__(self, node_id: str, clock: Callable[[], float] = time.time, prune_after: float = 60.0):
+    self.node_id = node_id
+    self.clock = clock
+    self.prune_after = prune_after
+    self.records: Dict[str, NodeRecord] = {}
+    # versions each peer reported in its last exchange, what we push to it is the difference
+    self.peer_versions: Dict[str, Dict[str, int]] = {}
+    # when each record stopped being reachable, it is dropped once it stays that way for prune_after
+    self.unreachable_since: Dict[str, float] = {}
+    # version and time of dropped records, so peers that still hold them cannot send them back
+    self.pruned: Dict[str, Tuple[int, float]] = {}
+    # bumped whenever any record changes, the topology is rebuilt only then
+    self.generation = 0
+
+  def update_local(self, device_capabilities: DeviceCapabilities, edges: Dict[str, Optional[str]], links: Optional[Dict[str, LinkQuality]] = None) -> bool:
+    links = {to_id: link for to_id, link in (links or {}).items() if to_id in edges}
+    current = self.records.get(self.node_id)
+    if current is not None and current.device_capabilities == device_capabilities and current.edges == edges and current.links == links:
+      return False
+    # milliseconds since the epoch, so a restarted node outranks the record the cluster kept of its last run
+    version = max(current.version + 1 if current is not None else 0, int(self.clock()*1000))
+    self.records[self.node_id] = NodeRecord(self.node_id, version, device_capabilities, dict(edges), links)
+    self.generation += 1
+    return True
+
+  def versions(self) -> Dict[str, int]:
+    return {node_id: record.version for node_id, record in self.records.items()}
+
+  def deltas(self, versions: Dict[str, int]) -> List[NodeRecord]:
+    return [record for node_id, record in self.records.items() if record.version > versions.get(node_id, -1)]
+
+  def outgoing(self, peer_id: str) -> List[NodeRecord]:
+    """Records to push to peer_id, only our own until it has told us what it holds."""
+    if peer_id not in self.peer_versions:
+      return [self.records[self.node_id]] if self.node_id in self.records else []
+    return self.deltas(self.peer_versions[peer_id])
+
+  def record_peer_versions(self, peer_id: str, versions: Dict[str, int]) -> None:
+    self.peer_versions[peer_id] = dict(versions)
+
+  def forget_peer(self, peer_id: str) -> None:
+    self.peer_versions.pop(peer_id, None)
+
+  def apply(self, records: List[NodeRecord]) -> bool:
+    changed = False
+    for record in records:
+      # nobody but the node itself gets to say what it looks like
+      if record.node_id == self.node_id:
+        continue
+      if record.version <= self.pruned.get(record.node_id, (-1, 0.0))[0]:
+        continue
+      current = self.records.get(record.node_id)
+      if current is None or record.version > current.version:
+        self.records[record.node_id] = record
+        changed = True
+    if changed:
+      self.generation += 1
+    return changed
+
+  def reachable(self) -> List[str]:
+    """Node ids connected to this node through the edges of their records, breadth first."""
+    order, queue = [self.node_id], deque([self.node_id])
+    while queue:
+      record = self.records.get(queue.popleft())
+      for to_id in (record.edges if record is not None else ()):
+        if to_id not in order:
+          order.append(to_id)
+          queue.append(to_id)
+    return [node_id for node_id in order if node_id in self.records]
+
+  def prune(self) -> List[str]:
+    """Drops the records of nodes that have been unreachable for prune_after, returns their ids."""
+    now, reachable = self.clock(), set(self.reachable())
+    self.unreachable_since = {node_id: self.unreachable_since.get(node_id, now) for node_id in self.records if node_id not in reachable}
+    dropped = [node_id for node_id, since in self.unreachable_since.items() if now - since >= self.prune_after]
+    for node_id in dropped:
+      self.pruned[node_id] = (self.records.pop(node_id).version, now)
+      del self.unreachable_since[node_id]
+    # by the time a tombstone expires the peers have pruned the record as well
+    self.pruned = {node_id: (version, at) for node_id, (version, at) in self.pruned.items() if now - at < self.prune_after}
+    return dropped
+
+  def to_topology(self) -> Topology:
+    """Records of nodes that left stay in the store until pruned but drop out here once nobody has an edge to them."""
+    topology = Topology()
+    for node_id in self.reachable():
+      record = self.records[node_id]
+      topology.update_node(node_id, record.device_capabilities)
+      for to_id, description in record.edges.items():
+        topology.add_edge(node_id, to_id, description, record.links.get(to_id))
+    return topology
@@ -38,6 +38,11 @@ extras_require = {
     "mlx==0.20.0",
     "mlx-lm==0.19.3",
   ],
+  # activation compression between peers on slow links, see nidum/networking/activation_codec.py
+  "compression": [
+    "zstandard==0.23.0",
+    "lz4==4.3.3",
+  ],
 }
 
 # Check if running on macOS with Apple Silicon